@@ -11,7 +11,6 @@
 1. 意图识别和query分析 → 2. 初始双引擎搜索 → 3. 实体扩展 → 4. 扩展搜索 → 5. 结果合并
 """
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from re import S
 from typing import List, Dict, Any, TypedDict, Optional
 
@@ -26,7 +25,11 @@ from Config.llm_config import get_chat_tongyi
 # 项目内部模块
 from Config.embedding_config import get_embeddings
 from Control.control_search import CControl as ControlSearch
+from Control.control_retrieval import CControl as ControlRetrieval, get_search_engine_executor, get_table_query_executor
+from Config.retrieval_config import get_retrieval_config
+from Utils.search_fusion import fuse_results, dedupe_results
 from Db.sqlite_db import cSingleSqlite
+from Agent.AgenticRagAgent.table_router import get_table_router
 
 # ============================================================================
 # 大模型配置
@@ -34,6 +37,10 @@ from Db.sqlite_db import cSingleSqlite
 
 llm = get_chat_tongyi(temperature=0.7, streaming=False, enable_thinking=False)
 
+# 智能问数：交给意图分析大模型的候选表数、SQL 结果每批读取的行数
+TABLE_INTENT_CANDIDATES = 5
+TABLE_FETCH_BATCH_SIZE = 50
+
 # ============================================================================
 # 工具定义
 # ============================================================================
@@ -182,6 +189,10 @@ class IntentRecognitionAgent:
     def __init__(self):
         self.llm = llm  # 使用配置的大模型
         self.search_obj = ControlSearch()  # 统一搜索控制器
+        self.retrieval_obj = ControlRetrieval(get_search_engine_executor())  # 共享的有界搜索线程池
+        self.retrieval_config = get_retrieval_config()
+        self.table_router = get_table_router()  # 智能问数表格路由与SQL缓存（进程内共享）
+        self.table_llm = get_chat_tongyi(temperature=0.1, streaming=False, enable_thinking=False)  # 智能问数大模型
 
     def simple_tool_judgment(self, query: str, intent_analysis: Dict[str, Any]) -> Dict[str, Any]:
         """基于关键词的简单工具判断
@@ -582,6 +593,10 @@ class IntentRecognitionAgent:
     def search_triple_engines_with_graph(self, state: IntentSearchState, query_text: str) -> List[Dict[str, Any]]:
         """同时使用 Milvus、Elasticsearch、图数据和CSV/Excel进行四引擎搜索
 
+        四个引擎提交到进程内共享的有界线程池，每个引擎有独立的超时时间，超时或出错的引擎被跳过；
+        各引擎结果按 SEARCH_FUSION_METHOD（加权RRF或加权CombSUM）融合，同一或近重复的内容只保留一条。
+        四引擎搜索出错或融合结果为空时，依次回退到三引擎（按原始得分合并）和Milvus单引擎。
+
         Args:
             state: 智能体状态
             query_text: 搜索查询文本
@@ -589,88 +604,88 @@ class IntentRecognitionAgent:
         Returns:
             合并的搜索结果列表
         """
+        engine_results = None
+        skipped = []
         try:
             print("🔍 执行四引擎并行搜索（Milvus + Elasticsearch + Graph + CSV/Excel）...")
 
-            # 使用 ThreadPoolExecutor 并行执行四个搜索引擎
-            with ThreadPoolExecutor(max_workers=4) as executor:
-                milvus_future = executor.submit(self.search_milvus, state, query_text)
-                elastic_future = executor.submit(self.search_elasticsearch, state, query_text)
-                graph_future = executor.submit(self.search_graph_data, state, query_text)
-                csv_excel_future = executor.submit(self.search_csv_excel_data, state, query_text)
-
-                # 等待结果
-                milvus_results = milvus_future.result()
-                elastic_results = elastic_future.result()
-                graph_results = graph_future.result()
-                csv_excel_results = csv_excel_future.result()
-
-            # 合并结果
-            combined_results = milvus_results + elastic_results + graph_results + csv_excel_results
-
-            # 统一得分处理
-            for result in combined_results:
-                if result.get("search_engine") == "elasticsearch":
-                    result["combined_score"] = result.get("_score", 0) * 10  # 文本搜索权重最高
-                elif result.get("search_engine") == "graph_data":
-                    result["combined_score"] = result.get("score", 0) * 12  # 图数据权重最高，因为包含关系信息
-                elif result.get("search_engine") == "csv_excel":
-                    result["combined_score"] = result.get("score", 0) * 15  # CSV/Excel表格数据权重最高
-                else:
-                    result["combined_score"] = result.get("score", 0)  # Milvus保持原权重
-
-            # 按组合得分排序
-            combined_results.sort(key=lambda x: x.get("combined_score", 0), reverse=True)
+            sources = {
+                "milvus": (self.search_milvus, (state, query_text)),
+                "elasticsearch": (self.search_elasticsearch, (state, query_text)),
+                "graph": (self.search_graph_data, (state, query_text)),
+                "table": (self.search_csv_excel_data, (state, query_text)),
+            }
+            engine_results, metadata = self.retrieval_obj.run_sources(
+                sources, timeouts=self.retrieval_config.get_engine_timeouts())
+            skipped = metadata["skipped"]
+
+            combined_results = fuse_results(
+                engine_results,
+                self.retrieval_config.get_engine_weights(),
+                method=self.retrieval_config.fusion_method,
+                k=self.retrieval_config.rrf_k,
+                normalization=self.retrieval_config.score_normalization,
+                dedupe_threshold=self.retrieval_config.dedupe_threshold)
 
             # 限制结果数量
             max_results = 15  # 增加结果数量以适应四引擎
             combined_results = combined_results[:max_results]
 
-            print(f"✅ 四引擎搜索完成，获得 {len(combined_results)} 个结果")
-            print(f"   - Milvus: {len(milvus_results)} 个结果")
-            print(f"   - Elasticsearch: {len(elastic_results)} 个结果")
-            print(f"   - 图数据: {len(graph_results)} 个结果")
-            print(f"   - CSV/Excel: {len(csv_excel_results)} 个结果")
+            print(f"✅ 四引擎搜索完成，获得 {len(combined_results)} 个结果，耗时 {metadata['elapsed']} 秒")
+            print(f"   - Milvus: {len(engine_results['milvus'])} 个结果")
+            print(f"   - Elasticsearch: {len(engine_results['elasticsearch'])} 个结果")
+            print(f"   - 图数据: {len(engine_results['graph'])} 个结果")
+            print(f"   - CSV/Excel: {len(engine_results['table'])} 个结果")
+            if metadata["skipped"]:
+                print(f"⚠️ 以下引擎超时或失败已跳过: {metadata['skipped']}")
 
-            return combined_results
+            if combined_results:
+                return combined_results
+            print("⚠️ 四引擎融合结果为空，回退到三引擎搜索")
 
         except Exception as e:
             print(f"❌ 四引擎搜索失败: {e}，回退到三引擎搜索")
-            # 回退到三引擎搜索
-            try:
-                with ThreadPoolExecutor(max_workers=3) as executor:
-                    milvus_future = executor.submit(self.search_milvus, state, query_text)
-                    elastic_future = executor.submit(self.search_elasticsearch, state, query_text)
-                    graph_future = executor.submit(self.search_graph_data, state, query_text)
-
-                    milvus_results = milvus_future.result()
-                    elastic_results = elastic_future.result()
-                    graph_results = graph_future.result()
-
-                combined_results = milvus_results + elastic_results + graph_results
-                for result in combined_results:
-                    if result.get("search_engine") == "elasticsearch":
-                        result["combined_score"] = result.get("_score", 0) * 10
-                    elif result.get("search_engine") == "graph_data":
-                        result["combined_score"] = result.get("score", 0) * 12
-                    else:
-                        result["combined_score"] = result.get("score", 0)
-
-                combined_results.sort(key=lambda x: x.get("combined_score", 0), reverse=True)
+
+        # 回退到三引擎搜索：已取得各引擎结果时直接使用，否则重新搜索
+        try:
+            if engine_results is None:
+                engine_results, metadata = self.retrieval_obj.run_sources(
+                    {"milvus": (self.search_milvus, (state, query_text)),
+                     "elasticsearch": (self.search_elasticsearch, (state, query_text)),
+                     "graph": (self.search_graph_data, (state, query_text))},
+                    timeouts=self.retrieval_config.get_engine_timeouts())
+                skipped = metadata["skipped"]
+            combined_results = []
+            for engine in ("milvus", "elasticsearch", "graph"):
+                combined_results.extend(engine_results.get(engine) or [])
+            for result in combined_results:
+                result["combined_score"] = result.get("score", result.get("_score", 0)) or 0
+            combined_results.sort(key=lambda x: x["combined_score"], reverse=True)
+            if combined_results:
                 return combined_results[:30]
+            # Milvus已正常返回空结果时无需再单独搜索
+            if engine_results and "milvus" not in skipped:
+                return []
+            print("⚠️ 三引擎搜索结果为空，使用Milvus单引擎")
+        except Exception as fallback_e:
+            print(f"❌ 回退搜索也失败: {fallback_e}，使用Milvus单引擎")
 
-            except Exception as fallback_e:
-                print(f"❌ 回退搜索也失败: {fallback_e}，使用Milvus单引擎")
-                return self.search_milvus(state, query_text)
+        try:
+            return self.search_milvus(state, query_text)
+        except Exception as e:
+            print(f"❌ Milvus单引擎搜索失败: {e}")
+            return []
 
     def search_csv_excel_data(self, state: IntentSearchState, query_text: str) -> List[Dict[str, Any]]:
         """在CSV/Excel表格数据中进行智能问数查询（第四数据源）
         
         通过智能问数智能体流程：
         1. 查找 file/file_id 目录下的目录文件（_catalog.md）和 SQLite 数据库（_data.db）
-        2. 意图分析智能体：分析用户问题 + 目录内容，找到对应的 SQLite 表
-        3. SQL 生成智能体：根据列描述生成 SQL、语法检查、校验、修改
-        4. 运行 SQL 查询
+        2. 表格路由：按问题与预先计算的表格画像向量的相似度筛选前 k 个文件（不调用大模型）
+        3. 入选文件提交到共享线程池并发查询，大模型调用受全局并发上限约束：
+           意图分析智能体找到对应的 SQLite 表，SQL 生成智能体生成、检查、校验 SQL；
+           已校验的 SQL 按 (文件指纹, 归一化问题) 缓存
+        4. 运行 SQL 查询（fetchmany 分批读取，最多读取配置的行数）
         5. 数据分析智能体：对文本数据统计，对数值数据基础分析
 
         Args:
@@ -678,9 +693,10 @@ class IntentRecognitionAgent:
             query_text: 搜索查询文本
 
         Returns:
-            CSV/Excel搜索结果列表，包含表格数据和分析结果
+            CSV/Excel搜索结果列表，包含表格数据和分析结果，按路由相似度排序
         """
         import os
+        import glob
         from pathlib import Path
         
         results = []
@@ -696,6 +712,7 @@ class IntentRecognitionAgent:
                 return results
             
             processed_files = set()
+            candidates = []
             
             for file_info in files:
                 file_id = file_info.get("file_id", "")
@@ -716,8 +733,35 @@ class IntentRecognitionAgent:
                 if not os.path.exists(file_dir):
                     continue
                 
-                # 使用智能问数智能体进行查询
-                smart_query_result = self._smart_table_query(file_dir, file_id, file_name, query_text)
+                sqlite_files = glob.glob(os.path.join(file_dir, "*_data.db"))
+                if not sqlite_files:
+                    print(f"⚠️ 未找到 SQLite 数据库: {file_dir}")
+                    continue
+                
+                candidates.append({
+                    "file_id": file_id,
+                    "file_name": file_name,
+                    "file_dir": file_dir,
+                    "sqlite_path": sqlite_files[0]  # 使用第一个找到的数据库
+                })
+            
+            if not candidates:
+                return results
+            
+            # 表格路由：只对最相关的前 k 个文件执行智能问数
+            selected = self.table_router.route(query_text, candidates)
+            print(f"📊 表格路由: {len(candidates)} 个表格文件中选取 {len(selected)} 个")
+            
+            futures = [
+                get_table_query_executor().submit(self._smart_table_query, candidate, query_text)
+                for candidate in selected
+            ]
+            for future in futures:
+                try:
+                    smart_query_result = future.result()
+                except Exception as e:
+                    print(f"⚠️ 智能问数失败: {e}")
+                    continue
                 if smart_query_result:
                     results.append(smart_query_result)
             
@@ -728,13 +772,12 @@ class IntentRecognitionAgent:
             
         return results
     
-    def _smart_table_query(self, file_dir: str, file_id: str, file_name: str, query: str) -> Optional[Dict[str, Any]]:
+    def _smart_table_query(self, candidate: Dict[str, Any], query: str) -> Optional[Dict[str, Any]]:
         """智能问数智能体主流程
         
         Args:
-            file_dir: 文件目录路径（file/file_id）
-            file_id: 文件ID
-            file_name: 文件名
+            candidate: 表格路由选出的文件，包含 file_id、file_name、file_dir、sqlite_path、
+                profiles（表格元数据与画像）和 ranked_tables（按相似度排序的表名）
             query: 用户查询问题
             
         Returns:
@@ -743,40 +786,53 @@ class IntentRecognitionAgent:
         import os
         import glob
         
+        file_name = candidate.get("file_name", "")
         try:
-            # 步骤1: 查找目录文件和 SQLite 数据库
-            catalog_files = glob.glob(os.path.join(file_dir, "*_catalog.md"))
-            sqlite_files = glob.glob(os.path.join(file_dir, "*_data.db"))
-            
-            if not sqlite_files:
-                print(f"⚠️ 未找到 SQLite 数据库: {file_dir}")
-                return None
-            
-            sqlite_path = sqlite_files[0]  # 使用第一个找到的数据库
-            
-            # 读取目录文件内容（用于意图分析）
-            catalog_content = ""
-            if catalog_files:
-                try:
-                    with open(catalog_files[0], "r", encoding="utf-8") as f:
-                        catalog_content = f.read()
-                except Exception:
-                    pass
-            
-            # 步骤2: 意图分析智能体 - 分析用户问题，找到对应表
-            intent_result = self._analyze_table_intent(sqlite_path, catalog_content, query)
-            if not intent_result:
-                return None
-            
-            target_table = intent_result.get("target_table", "")
-            column_descriptions = intent_result.get("column_descriptions", [])
-            
-            # 步骤3: SQL 生成智能体 - 生成、检查、校验 SQL
-            sql_result = self._generate_and_validate_sql(
-                sqlite_path, target_table, column_descriptions, query
-            )
-            if not sql_result or not sql_result.get("sql"):
-                return None
+            file_id = candidate.get("file_id", "")
+            sqlite_path = candidate["sqlite_path"]
+            profiles = candidate["profiles"]
+            table_info = profiles["tables"]
+            fingerprint = profiles["fingerprint"]
+            
+            # 步骤1: 命中已校验SQL缓存时跳过意图分析和SQL生成
+            cached = self.table_router.get_cached_sql(fingerprint, query)
+            if cached:
+                intent_result = cached["intent_result"]
+                sql_result = cached["sql_result"]
+                target_table = intent_result.get("target_table", "")
+            else:
+                # 读取目录文件内容（用于意图分析）
+                catalog_content = ""
+                catalog_files = glob.glob(os.path.join(candidate.get("file_dir", ""), "*_catalog.md"))
+                if catalog_files:
+                    try:
+                        with open(catalog_files[0], "r", encoding="utf-8") as f:
+                            catalog_content = f.read()
+                    except Exception:
+                        pass
+                
+                # 步骤2: 意图分析智能体 - 分析用户问题，找到对应表
+                intent_result = self._analyze_table_intent(
+                    table_info, catalog_content, query, candidate.get("ranked_tables")
+                )
+                if not intent_result:
+                    return None
+                
+                target_table = intent_result.get("target_table", "")
+                column_descriptions = intent_result.get("column_descriptions", [])
+                
+                # 步骤3: SQL 生成智能体 - 生成、检查、校验 SQL
+                sql_result = self._generate_and_validate_sql(
+                    sqlite_path, target_table, column_descriptions, query
+                )
+                if not sql_result or not sql_result.get("sql"):
+                    return None
+                
+                if sql_result.get("validated"):
+                    self.table_router.put_cached_sql(fingerprint, query, {
+                        "intent_result": intent_result,
+                        "sql_result": sql_result
+                    })
             
             # 步骤4: 运行 SQL 查询
             query_result = self._execute_sql_query(sqlite_path, sql_result.get("sql"))
@@ -801,6 +857,7 @@ class IntentRecognitionAgent:
                     "rows": query_result.get("rows", []),
                     "total_rows": len(query_result.get("rows", [])),
                     "total_columns": len(query_result.get("headers", [])),
+                    "truncated": query_result.get("truncated", False),
                     "markdown_table": self._generate_markdown_table(
                         query_result.get("headers", []),
                         query_result.get("rows", [])
@@ -811,6 +868,8 @@ class IntentRecognitionAgent:
                     "query": query,
                     "target_table": target_table,
                     "generated_sql": sql_result.get("sql", ""),
+                    "route_score": candidate.get("route_score"),
+                    "sql_cache_hit": bool(cached),
                     "intent_analysis": intent_result,
                     "data_analysis": analysis_result
                 }
@@ -822,66 +881,49 @@ class IntentRecognitionAgent:
             print(f"⚠️ 智能问数失败 ({file_name}): {e}")
             return None
     
-    def _analyze_table_intent(self, sqlite_path: str, catalog_content: str, query: str) -> Optional[Dict[str, Any]]:
+    def _analyze_table_intent(self, table_info: Dict[str, Dict[str, Any]], catalog_content: str, query: str,
+                              ranked_tables: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
         """意图分析智能体：分析用户问题，找到对应的 SQLite 表
         
+        只有一个表时直接选中该表，不调用大模型；多个表时只把表格路由排序靠前的表交给大模型判断。
+        
         Args:
-            sqlite_path: SQLite 数据库路径
+            table_info: 表名 -> 表格与列的元数据
             catalog_content: 目录文件内容
             query: 用户查询问题
+            ranked_tables: 按与问题相似度降序排列的表名，缺省按元数据顺序
             
         Returns:
             意图分析结果，包含目标表和列描述
         """
-        import sqlite3
         import json
         
         try:
-            conn = sqlite3.connect(sqlite_path)
-            cursor = conn.cursor()
-            
-            # 获取所有表的元数据
-            cursor.execute("SELECT table_name, sheet_name, description FROM _table_metadata")
-            tables = cursor.fetchall()
-            
-            # 获取所有列的元数据
-            cursor.execute("SELECT table_name, column_name, description, sample_values FROM _column_metadata")
-            columns = cursor.fetchall()
-            
-            conn.close()
-            
-            if not tables:
+            if not table_info:
                 return None
             
-            # 构建表和列信息
-            table_info = {}
-            for table_name, sheet_name, description in tables:
-                table_info[table_name] = {
-                    "sheet_name": sheet_name,
-                    "description": description,
-                    "columns": []
+            ranked_tables = [name for name in (ranked_tables or table_info.keys()) if name in table_info]
+            first_table = ranked_tables[0] if ranked_tables else list(table_info.keys())[0]
+            
+            if len(table_info) == 1:
+                return {
+                    "target_table": first_table,
+                    "confidence": 1.0,
+                    "reason": "文件中只有一个表",
+                    "relevant_columns": [],
+                    "column_descriptions": table_info[first_table]["columns"]
                 }
             
-            for table_name, column_name, description, sample_values in columns:
-                if table_name in table_info:
-                    table_info[table_name]["columns"].append({
-                        "name": column_name,
-                        "description": description,
-                        "sample_values": sample_values
-                    })
+            shortlist = {name: table_info[name] for name in ranked_tables[:TABLE_INTENT_CANDIDATES]}
             
             # 使用 LLM 进行意图分析
-            from Config.llm_config import get_chat_tongyi
-            
-            llm = get_chat_tongyi(temperature=0.1, streaming=False, enable_thinking=False)
-            
             prompt = f"""你是一个数据分析意图识别专家。根据用户的问题和可用的表格信息，分析用户想查询哪个表。
 
 ## 用户问题
 {query}
 
 ## 可用表格信息
-{json.dumps(table_info, ensure_ascii=False, indent=2)}
+{json.dumps(shortlist, ensure_ascii=False, indent=2)}
 
 ## 目录信息（如有）
 {catalog_content if catalog_content else "无"}
@@ -899,7 +941,7 @@ class IntentRecognitionAgent:
 
 只返回 JSON，不要其他内容。"""
 
-            response = llm.invoke(prompt)
+            response = self.table_router.invoke_llm(self.table_llm, prompt)
             response_text = response.content if hasattr(response, 'content') else str(response)
             
             # 解析 JSON 响应
@@ -918,12 +960,11 @@ class IntentRecognitionAgent:
                         "column_descriptions": table_info[target_table]["columns"]
                     }
             
-            # 如果 LLM 分析失败，使用第一个表
-            first_table = list(table_info.keys())[0]
+            # 如果 LLM 分析失败，使用相似度最高的表
             return {
                 "target_table": first_table,
                 "confidence": 0.3,
-                "reason": "默认选择第一个表",
+                "reason": "默认选择相似度最高的表",
                 "relevant_columns": [],
                 "column_descriptions": table_info[first_table]["columns"]
             }
@@ -945,13 +986,10 @@ class IntentRecognitionAgent:
         Returns:
             SQL 生成结果，包含最终 SQL 语句
         """
-        import sqlite3
         import json
         
         try:
-            from Config.llm_config import get_chat_tongyi
-            
-            llm = get_chat_tongyi(temperature=0.1, streaming=False, enable_thinking=False)
+            max_rows = self.retrieval_config.table_query_max_rows
             
             # 构建列信息
             columns_info = "\n".join([
@@ -975,7 +1013,7 @@ class IntentRecognitionAgent:
 2. 只返回 SELECT 查询语句，禁止 INSERT/UPDATE/DELETE
 3. 如果是统计类问题，使用 COUNT/SUM/AVG/MAX/MIN 等聚合函数
 4. 如果是筛选问题，使用 WHERE 条件
-5. 限制返回行数不超过 100 行（使用 LIMIT）
+5. 限制返回行数不超过 {max_rows} 行（使用 LIMIT）
 
 ## 输出格式
 ```json
@@ -987,7 +1025,7 @@ class IntentRecognitionAgent:
 
 只返回 JSON，不要其他内容。"""
 
-            response = llm.invoke(prompt)
+            response = self.table_router.invoke_llm(self.table_llm, prompt)
             response_text = response.content if hasattr(response, 'content') else str(response)
             
             # 解析 JSON 响应
@@ -1005,11 +1043,11 @@ class IntentRecognitionAgent:
                             "sql": validated_sql,
                             "original_sql": sql,
                             "explanation": sql_data.get("explanation", ""),
-                            "validated": True
+                            "validated": validated_sql != self._fallback_sql(table_name)
                         }
             
             # 如果生成失败，返回简单的全表查询
-            fallback_sql = f'SELECT * FROM "{table_name}" LIMIT 50'
+            fallback_sql = self._fallback_sql(table_name)
             return {
                 "sql": fallback_sql,
                 "original_sql": fallback_sql,
@@ -1021,6 +1059,11 @@ class IntentRecognitionAgent:
             print(f"⚠️ SQL 生成失败: {e}")
             return None
     
+    @staticmethod
+    def _fallback_sql(table_name: str) -> str:
+        """SQL 生成或校验失败时使用的全表查询"""
+        return f'SELECT * FROM "{table_name}" LIMIT 50'
+    
     def _validate_sql(self, sqlite_path: str, sql: str, table_name: str) -> Optional[str]:
         """校验和修正 SQL 语句
         
@@ -1048,7 +1091,7 @@ class IntentRecognitionAgent:
             
             # 确保有 LIMIT 限制
             if "LIMIT" not in sql_upper:
-                sql = sql.rstrip(";") + " LIMIT 100"
+                sql = sql.rstrip(";") + f" LIMIT {self.retrieval_config.table_query_max_rows}"
             
             # 尝试执行 EXPLAIN 检查语法
             conn = sqlite3.connect(sqlite_path)
@@ -1062,7 +1105,7 @@ class IntentRecognitionAgent:
                 conn.close()
                 print(f"⚠️ SQL 语法错误: {e}")
                 # 返回简单的全表查询作为回退
-                return f'SELECT * FROM "{table_name}" LIMIT 50'
+                return self._fallback_sql(table_name)
                 
         except Exception as e:
             print(f"⚠️ SQL 校验失败: {e}")
@@ -1071,36 +1114,46 @@ class IntentRecognitionAgent:
     def _execute_sql_query(self, sqlite_path: str, sql: str) -> Optional[Dict[str, Any]]:
         """执行 SQL 查询
         
+        用 fetchmany 分批读取，最多读取 TABLE_QUERY_MAX_ROWS 行，超出部分不再读取。
+        
         Args:
             sqlite_path: SQLite 数据库路径
             sql: SQL 查询语句
             
         Returns:
-            查询结果，包含 headers 和 rows
+            查询结果，包含 headers、rows 以及是否被截断
         """
         import sqlite3
         
+        max_rows = self.retrieval_config.table_query_max_rows
         try:
             conn = sqlite3.connect(sqlite_path)
-            cursor = conn.cursor()
-            
-            cursor.execute(sql)
-            
-            # 获取列名
-            headers = [description[0] for description in cursor.description]
-            
-            # 获取数据
-            rows = cursor.fetchall()
-            
-            conn.close()
-            
-            # 转换为字符串列表
-            rows = [[str(cell) if cell is not None else "" for cell in row] for row in rows]
+            try:
+                cursor = conn.cursor()
+                cursor.arraysize = min(max_rows, TABLE_FETCH_BATCH_SIZE)
+                cursor.execute(sql)
+                
+                # 获取列名
+                headers = [description[0] for description in cursor.description]
+                
+                # 分批获取数据并转换为字符串列表
+                rows = []
+                truncated = False
+                while len(rows) < max_rows:
+                    batch = cursor.fetchmany(min(cursor.arraysize, max_rows - len(rows)))
+                    if not batch:
+                        break
+                    rows.extend([str(cell) if cell is not None else "" for cell in row] for row in batch)
+                else:
+                    truncated = cursor.fetchone() is not None
+            finally:
+                conn.close()
             
             return {
                 "headers": headers,
                 "rows": rows,
                 "row_count": len(rows),
+                "truncated": truncated,
                 "sql": sql
             }
             
@@ -1269,6 +1322,8 @@ class IntentRecognitionAgent:
     def merge_search_results(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """合并和去重搜索结果
 
+        按稳定的内容哈希精确去重，并用MinHash折叠近重复内容，每组保留融合得分最高的一条
+
         Args:
             results: 搜索结果列表
 
@@ -1277,20 +1332,7 @@ class IntentRecognitionAgent:
         """
         if not results:
             return []
-
-        seen = set()
-        unique_results = []
-
-        for result in results:
-            # 创建唯一标识符，基于内容和标题
-            content_hash = hash((result.get("content", "") + result.get("title", "")).strip())
-            if content_hash not in seen:
-                seen.add(content_hash)
-                unique_results.append(result)
-
-        # 按得分排序
-        unique_results.sort(key=lambda x: x.get("score", x.get("_score", 0)), reverse=True)
-        return unique_results
+        return dedupe_results(results, threshold=self.retrieval_config.dedupe_threshold)
 
     def search_only(self, query: str, knowledge_id: str, user_id: str = "", flag: bool = True, 
                    intent_result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
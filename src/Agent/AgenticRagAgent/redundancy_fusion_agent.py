@@ -12,6 +12,9 @@ from Config.embedding_config import get_embeddings
 from Control.control_milvus import CControl as MilvusController
 from Config.milvus_config import is_milvus_enabled
 
+# 中文句子分割：。！？；\n
+_SENTENCE_SPLIT_RE = re.compile(r'[。！？；\n]+')
+
 
 class RedundancyFusionAgent:
     """文本冗余信息融合智能体：句子级检索 + 三层图结构"""
@@ -50,8 +53,7 @@ class RedundancyFusionAgent:
         Returns:
             句子列表
         """
-        # 中文句子分割：。！？；\n
-        sentences = re.split(r'[。！？；\n]+', text)
+        sentences = _SENTENCE_SPLIT_RE.split(text)
         # 过滤空句子和过短句子
         sentences = [s.strip() for s in sentences if s.strip() and len(s.strip()) > 5]
         return sentences
@@ -0,0 +1,335 @@
+"""
+智能问数表格路由
+
+功能特性：
+1. 表格画像：由 _table_metadata / _column_metadata 中的表描述、列名、列描述和示例值生成文本并向量化，
+   向量保存在文件自身的 SQLite 数据库（_table_profile 表）中，入库时预先计算，查询时不再调用大模型
+2. 表格路由：按问题向量与表格画像向量的余弦相似度，从知识库的所有表格文件中筛选最相关的前 k 个
+3. SQL 缓存：按 (文件指纹, 归一化问题) 缓存已校验的目标表与 SQL，相同问题不再重复调用大模型
+4. 大模型并发控制：所有文件的智能问数共用一个信号量，限制同时进行的大模型调用数
+"""
+
+import os
+import re
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from Config.retrieval_config import get_retrieval_config
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TABLE = "_table_profile"
+# 画像文本中每列最多保留的示例值个数
+PROFILE_SAMPLE_VALUES = 5
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s。？?！!，,；;.]+$")
+
+
+def file_fingerprint(sqlite_path: str) -> str:
+    """文件指纹：路径 + 大小 + 修改时间，文件重新生成后指纹随之变化"""
+    stat = os.stat(sqlite_path)
+    raw = f"{os.path.abspath(sqlite_path)}\x00{stat.st_size}\x00{stat.st_mtime_ns}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def normalize_question(question: str) -> str:
+    """归一化问题：合并空白、转小写、去掉末尾标点"""
+    text = _WHITESPACE_RE.sub(" ", str(question)).strip().lower()
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+
+def load_table_info(conn: sqlite3.Connection) -> Dict[str, Dict[str, Any]]:
+    """读取表格与列的元数据
+
+    Returns:
+        表名 -> {sheet_name, description, columns: [{name, description, sample_values}]}
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT table_name, sheet_name, description FROM _table_metadata")
+    tables = cursor.fetchall()
+    cursor.execute("SELECT table_name, column_name, description, sample_values FROM _column_metadata")
+    columns = cursor.fetchall()
+
+    table_info = {}
+    for table_name, sheet_name, description in tables:
+        table_info[table_name] = {
+            "sheet_name": sheet_name,
+            "description": description,
+            "columns": []
+        }
+    for table_name, column_name, description, sample_values in columns:
+        if table_name in table_info:
+            table_info[table_name]["columns"].append({
+                "name": column_name,
+                "description": description,
+                "sample_values": sample_values
+            })
+    return table_info
+
+
+def build_profile_text(table_name: str, info: Dict[str, Any]) -> str:
+    """生成表格画像文本：表名、工作表名、表描述，以及每列的列名、描述和少量示例值"""
+    lines = [f"表名: {table_name}", f"工作表: {info.get('sheet_name') or ''}",
+             f"描述: {info.get('description') or ''}"]
+    for col in info.get("columns", []):
+        samples = col.get("sample_values") or ""
+        try:
+            parsed = json.loads(samples) if isinstance(samples, str) else samples
+            if isinstance(parsed, list):
+                samples = "、".join(str(v) for v in parsed[:PROFILE_SAMPLE_VALUES])
+        except (ValueError, TypeError):
+            pass
+        lines.append(f"列 {col.get('name', '')}: {col.get('description') or ''} 示例: {samples}")
+    return "\n".join(lines)
+
+
+class TableRouter:
+    """智能问数表格路由器（进程内共享，线程安全）"""
+
+    def __init__(self):
+        self.config = get_retrieval_config()
+        self.embeddings = None
+        self.lock = threading.Lock()
+        # 文件指纹 -> {"tables": 表格元数据, "names": 表名列表, "vectors": 归一化后的画像向量矩阵}
+        self.profiles = OrderedDict()
+        self.max_profiles = 256
+        # (文件指纹, 归一化问题) -> 已校验的目标表与SQL
+        self.sql_cache = OrderedDict()
+        self.sql_cache_lock = threading.Lock()
+        self.llm_semaphore = threading.BoundedSemaphore(self.config.table_llm_concurrency)
+
+    def _get_embeddings(self):
+        if self.embeddings is None:
+            from Config.embedding_config import get_embeddings
+            self.embeddings = get_embeddings()
+        return self.embeddings
+
+    # ------------------------------------------------------------------
+    # 表格画像
+    # ------------------------------------------------------------------
+
+    def build_profiles(self, sqlite_path: str) -> bool:
+        """入库时预先计算并保存文件中所有表的画像向量
+
+        Args:
+            sqlite_path: 文件的 SQLite 数据库路径
+
+        Returns:
+            是否成功
+        """
+        return self.get_profiles(sqlite_path) is not None
+
+    def get_profiles(self, sqlite_path: str) -> Optional[Dict[str, Any]]:
+        """获取文件的表格元数据与画像向量
+
+        优先使用进程内缓存，其次读取 _table_profile 表；画像文本发生变化或模型不同时重新向量化并写回
+
+        Returns:
+            {"fingerprint", "tables", "names", "vectors"}，失败返回 None
+        """
+        try:
+            fingerprint = file_fingerprint(sqlite_path)
+        except OSError:
+            return None
+        with self.lock:
+            cached = self.profiles.get(fingerprint)
+            if cached is not None:
+                self.profiles.move_to_end(fingerprint)
+                return cached
+
+        try:
+            conn = sqlite3.connect(sqlite_path)
+            try:
+                tables = load_table_info(conn)
+                if not tables:
+                    return None
+                names = list(tables.keys())
+                texts = [build_profile_text(name, tables[name]) for name in names]
+                vectors = self._load_or_embed(conn, names, texts)
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.warning(f"加载表格画像失败 ({sqlite_path}): {e}")
+            return None
+
+        matrix = None
+        if vectors is not None:
+            matrix = np.asarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms == 0, 1.0, norms)
+
+        # 写回画像会改变文件修改时间，缓存键使用写回后的指纹
+        try:
+            fingerprint = file_fingerprint(sqlite_path)
+        except OSError:
+            pass
+        entry = {"fingerprint": fingerprint, "tables": tables, "names": names, "vectors": matrix}
+        with self.lock:
+            self.profiles[fingerprint] = entry
+            while len(self.profiles) > self.max_profiles:
+                self.profiles.popitem(last=False)
+        return entry
+
+    def _load_or_embed(self, conn: sqlite3.Connection, names: List[str], texts: List[str]) -> Optional[List[List[float]]]:
+        """读取已保存的画像向量，缺失或过期的部分批量向量化后写回"""
+        embeddings = self._get_embeddings()
+        model_name = str(getattr(embeddings, "model_name", ""))
+        text_hashes = [hashlib.sha1(text.encode("utf-8")).hexdigest() for text in texts]
+
+        stored = {}
+        try:
+            rows = conn.execute(
+                f"SELECT table_name, text_hash, model_name, vector FROM {PROFILE_TABLE}").fetchall()
+            for table_name, text_hash, stored_model, blob in rows:
+                stored[table_name] = (text_hash, stored_model, blob)
+        except sqlite3.OperationalError:
+            pass
+
+        vectors = [None] * len(names)
+        missing = []
+        for i, name in enumerate(names):
+            item = stored.get(name)
+            if item and item[0] == text_hashes[i] and item[1] == model_name:
+                vec = array("f")
+                vec.frombytes(item[2])
+                vectors[i] = vec.tolist()
+            else:
+                missing.append(i)
+
+        if missing:
+            try:
+                new_vectors = embeddings.embed_documents([texts[i] for i in missing])
+            except Exception as e:
+                logger.warning(f"表格画像向量化失败: {e}")
+                return None
+            if len(new_vectors) != len(missing):
+                return None
+            for i, vec in zip(missing, new_vectors):
+                vectors[i] = vec
+            try:
+                conn.execute(f'''CREATE TABLE IF NOT EXISTS {PROFILE_TABLE} (
+                                    table_name TEXT PRIMARY KEY,
+                                    text_hash TEXT,
+                                    model_name TEXT,
+                                    vector BLOB
+                                 )''')
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO {PROFILE_TABLE} (table_name, text_hash, model_name, vector) VALUES (?, ?, ?, ?)",
+                    [(names[i], text_hashes[i], model_name, array("f", vectors[i]).tobytes()) for i in missing])
+                conn.commit()
+            except sqlite3.Error as e:
+                # 只读文件等情况下只使用内存中的画像
+                logger.warning(f"保存表格画像失败: {e}")
+        return vectors
+
+    # ------------------------------------------------------------------
+    # 路由
+    # ------------------------------------------------------------------
+
+    def route(self, query: str, candidates: List[Dict[str, Any]], top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按问题与表格画像的相似度筛选候选文件
+
+        Args:
+            query: 用户问题
+            candidates: [{"file_id", "file_name", "sqlite_path", ...}]
+            top_k: 保留的文件数，缺省使用配置
+
+        Returns:
+            入选的候选文件（补充 profiles、route_score、ranked_tables 字段），按相似度降序；
+            问题向量化失败时按原顺序返回前 top_k 个
+        """
+        top_k = top_k or self.config.table_router_top_k
+        loaded = []
+        for candidate in candidates:
+            profiles = self.get_profiles(candidate["sqlite_path"])
+            if profiles is None:
+                continue
+            loaded.append(dict(candidate, profiles=profiles))
+        if len(loaded) <= 1 and all(c["profiles"]["vectors"] is None for c in loaded):
+            return loaded[:top_k]
+
+        try:
+            query_vec = np.asarray(self._get_embeddings().embed_query(query), dtype=np.float32)
+            norm = np.linalg.norm(query_vec)
+            query_vec = query_vec / (norm if norm else 1.0)
+        except Exception as e:
+            logger.warning(f"问题向量化失败，表格路由退化为按顺序选取: {e}")
+            return loaded[:top_k]
+
+        scored = []
+        for candidate in loaded:
+            matrix = candidate["profiles"]["vectors"]
+            if matrix is None or matrix.shape[1] != query_vec.shape[0]:
+                # 画像缺失的文件不参与排序，但不丢弃
+                candidate["route_score"] = 0.0
+                candidate["ranked_tables"] = candidate["profiles"]["names"]
+                scored.append(candidate)
+                continue
+            sims = matrix @ query_vec
+            order = np.argsort(-sims)
+            candidate["route_score"] = float(sims[order[0]])
+            candidate["ranked_tables"] = [candidate["profiles"]["names"][i] for i in order]
+            scored.append(candidate)
+
+        scored.sort(key=lambda c: c["route_score"], reverse=True)
+        selected = [c for c in scored if c["route_score"] >= self.config.table_router_min_score][:top_k]
+        # 所有文件都低于阈值时仍保留最相关的一个
+        return selected or scored[:1]
+
+    # ------------------------------------------------------------------
+    # SQL 缓存
+    # ------------------------------------------------------------------
+
+    def get_cached_sql(self, fingerprint: str, query: str) -> Optional[Dict[str, Any]]:
+        """读取已校验的SQL缓存"""
+        if self.config.table_sql_cache_size <= 0:
+            return None
+        key = (fingerprint, normalize_question(query))
+        with self.sql_cache_lock:
+            item = self.sql_cache.get(key)
+            if item is not None:
+                self.sql_cache.move_to_end(key)
+            return item
+
+    def put_cached_sql(self, fingerprint: str, query: str, item: Dict[str, Any]):
+        """写入已校验的SQL缓存"""
+        if self.config.table_sql_cache_size <= 0:
+            return
+        key = (fingerprint, normalize_question(query))
+        with self.sql_cache_lock:
+            self.sql_cache[key] = item
+            self.sql_cache.move_to_end(key)
+            while len(self.sql_cache) > self.config.table_sql_cache_size:
+                self.sql_cache.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # 大模型调用
+    # ------------------------------------------------------------------
+
+    def invoke_llm(self, llm, prompt: str):
+        """在全局并发上限内调用大模型"""
+        with self.llm_semaphore:
+            return llm.invoke(prompt)
+
+
+_table_router: Optional[TableRouter] = None
+_table_router_lock = threading.Lock()
+
+
+def get_table_router() -> TableRouter:
+    """获取进程内共享的表格路由器"""
+    global _table_router
+    if _table_router is None:
+        with _table_router_lock:
+            if _table_router is None:
+                _table_router = TableRouter()
+    return _table_router
@@ -25,7 +25,8 @@ class DatabaseAnalysisAgent:
         self.embedding = get_embeddings()
         self.milvus_control = CControl()
 
-    def analyze_database_descriptions(self, des_list: List[List[str]], sql_id: str = None) -> Dict[str, Any]:
+    def analyze_database_descriptions(self, des_list: List[List[str]], sql_id: str = None,
+                                      context_list: Optional[List[List[str]]] = None) -> Dict[str, Any]:
         """
         分析数据库描述文本，进行分类、分词去重和向量存储
 
@@ -34,6 +35,8 @@ class DatabaseAnalysisAgent:
                 [["table_id", "title", "content"], ["table_id", "title", "content"], ...]
                 每个元素是一个包含三个元素的列表：[表格ID, 表格标题, 文本内容]
             sql_id: 数据库ID，用于milvus分区
+            context_list: 同一数据库中其余表的描述，格式同des_list；只作为整体分析的上下文，
+                不输出分类结果也不保存向量（表结构增量刷新时传入未变化的表）
 
         Returns:
             分类分析结果，包含:
@@ -126,6 +129,12 @@ class DatabaseAnalysisAgent:
                     user_prompt += f": {title}\n{content}\n"
                     all_texts.append({"index": i, "title": title, "content": content, "table_id": table_id})
 
+            if context_list:
+                user_prompt += "\n## 同一数据库中其余的表（仅作为整体分析的上下文，不需要输出这些表的分类结果）：\n"
+                for item in context_list:
+                    if isinstance(item, list) and len(item) >= 3:
+                        user_prompt += f"\n- {item[1] or ''}: {item[2] or ''}\n"
+
             user_prompt += """
 
 ## 分析要求
@@ -6,7 +6,7 @@
 
 from typing import Dict, Any, List, Optional
 from Db.sqlite_db import cSingleSqlite
-from Control.control_sql import CControl
+from Db.source_db_pool import get_source_pool
 
 
 def query_database_info(sql_id: str) -> Dict[str, Any]:
@@ -127,9 +127,9 @@ def execute_sql(sql_id: str, sql: str) -> Dict[str, Any]:
             result["error"] = "未找到数据库连接信息"
             return result
         
-        # 使用CControl执行SQL
-        sql_control = CControl()
-        conn, db_type = sql_control.connect_database(
+        # 从该数据源的连接池取出只读连接执行SQL
+        pool = get_source_pool(
+            sql_id,
             ip=database_info.get("ip", ""),
             port=database_info.get("port", ""),
             sql_type=database_info.get("sql_type", "mysql"),
@@ -137,6 +137,8 @@ def execute_sql(sql_id: str, sql: str) -> Dict[str, Any]:
             sql_user_name=database_info.get("sql_user_name", ""),
             sql_user_password=database_info.get("sql_user_password", "")
         )
+        db_type = pool.db_type
+        conn = pool.acquire()
         
         try:
             cursor = conn.cursor()
@@ -165,7 +167,7 @@ def execute_sql(sql_id: str, sql: str) -> Dict[str, Any]:
             result["success"] = True
             
         finally:
-            conn.close()
+            pool.release(conn)
             
     except Exception as e:
         result["error"] = str(e)
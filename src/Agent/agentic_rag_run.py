@@ -20,6 +20,7 @@ RAG Agentic 智能体运行模块（增强版）
 """
 
 import os
+import threading
 from typing import Dict, Any, Optional, List, Generator
 from langchain_core.messages import BaseMessage
 
@@ -34,10 +35,85 @@ from Agent.AgenticRagAgent.result_evaluator_agent import ResultEvaluatorAgent
 from Agent.AgenticRagAgent.artifact_handler import ArtifactHandler
 from Db.sqlite_db import cSingleSqlite
 
+# 大模型流式回答块（rag_agentic_agent.rag_stream 生成）与兜底回答块的id前缀
+ANSWER_CHUNK_PREFIX = "rag_chunk_"
+FALLBACK_CHUNK_PREFIX = "rag_default_"
+
+
+class RagAgentRegistry:
+    """
+    常驻的智能体注册表：进程内只创建一次，持有各智能体及其LLM客户端、Milvus连接等构造期资源。
+    注册表中的智能体在请求处理过程中不保存状态，可被并发请求共享；
+    每个请求的可变状态放在 RagRequestContext 中。
+    """
+
+    def __init__(self):
+        self.enhanced_intent_agent = EnhancedIntentAgent()
+        self.tool_agent = ToolAgent()
+        self.redundancy_fusion_agent = RedundancyFusionAgent()
+        self.reflection_agent = ReflectionAgent()
+        self.orchestrator_agent = OrchestratorAgent(max_expansions=2)
+        self.evaluator_agent = ResultEvaluatorAgent()
+        self.artifact_handler = ArtifactHandler()
+
+    def warm_up(self):
+        """预加载分词词典，避免首个请求承担加载耗时"""
+        try:
+            import jieba
+            jieba.initialize()
+        except Exception as e:
+            print(f"⚠️ jieba词典预加载失败: {e}")
+
+
+class RagRequestContext:
+    """单次RAG请求的上下文，保存该请求在各步骤之间传递的可变状态"""
+
+    def __init__(self, query: str, knowledge_id: str, user_id: str,
+                 history_list: Optional[List[Dict[str, str]]] = None, flag: bool = True):
+        self.query = query
+        self.knowledge_id = knowledge_id
+        self.user_id = user_id
+        self.history_list = history_list
+        self.flag = flag
+
+        self.intent_result: Dict[str, Any] = {}
+        self.intent_analysis: Dict[str, Any] = {}
+        self.final_results: List[Dict[str, Any]] = []
+        self.fused_result: Dict[str, Any] = {}
+        self.system_prompt = ""
+        self.expansion_count = 0
+
+
+_agent_registry: Optional[RagAgentRegistry] = None
+_agent_registry_lock = threading.Lock()
+
+
+def get_agent_registry() -> RagAgentRegistry:
+    """获取常驻智能体注册表（首次调用时创建并预热）"""
+    global _agent_registry
+    if _agent_registry is None:
+        with _agent_registry_lock:
+            if _agent_registry is None:
+                registry = RagAgentRegistry()
+                registry.warm_up()
+                _agent_registry = registry
+    return _agent_registry
+
+
+def is_answer_chunk(chunk) -> bool:
+    """是否为大模型流式生成的回答块（不含工具结果、兜底回答与结束标记）"""
+    return isinstance(chunk, dict) and str(chunk.get("id", "")).startswith(ANSWER_CHUNK_PREFIX)
+
+
+def is_fallback_chunk(chunk) -> bool:
+    """是否为大模型没有产生输出时的兜底回答块"""
+    return isinstance(chunk, dict) and str(chunk.get("id", "")).startswith(FALLBACK_CHUNK_PREFIX)
+
 
 def run_rag_agentic_stream(query: str, knowledge_id: str, user_id: str, 
                           chat_history: Optional[List[BaseMessage]] = None,
-                          flag: bool = True) -> Generator[Dict[str, Any], None, None]:
+                          flag: bool = True,
+                          registry: Optional[RagAgentRegistry] = None) -> Generator[Dict[str, Any], None, None]:
     """
     运行RAG Agentic智能体（增强版），采用自适应框架进行流式回答生成。
 
@@ -61,19 +137,21 @@ def run_rag_agentic_stream(query: str, knowledge_id: str, user_id: str,
         user_id (str): 用户ID。
         chat_history (Optional[List[BaseMessage]]): 聊天历史（可选）。
         flag (bool): 权限标志，指示是否进行意图识别。
+        registry (Optional[RagAgentRegistry]): 智能体注册表（可选，默认使用进程内常驻注册表）。
 
     返回:
         Generator[Dict[str, Any], None, None]: 响应流生成器。
     """
     
-    # 初始化组件
-    enhanced_intent_agent = EnhancedIntentAgent()
-    tool_agent = ToolAgent()
-    redundancy_fusion_agent = RedundancyFusionAgent()
-    reflection_agent = ReflectionAgent()
-    orchestrator_agent = OrchestratorAgent(max_expansions=2)
-    evaluator_agent = ResultEvaluatorAgent()
-    artifact_handler = ArtifactHandler()
+    # 复用常驻的智能体
+    registry = registry or get_agent_registry()
+    enhanced_intent_agent = registry.enhanced_intent_agent
+    tool_agent = registry.tool_agent
+    redundancy_fusion_agent = registry.redundancy_fusion_agent
+    reflection_agent = registry.reflection_agent
+    orchestrator_agent = registry.orchestrator_agent
+    evaluator_agent = registry.evaluator_agent
+    artifact_handler = registry.artifact_handler
     
     # 步骤1: 获取知识库元数据
     print("📚 步骤1: 获取知识库元数据...")
@@ -89,23 +167,26 @@ def run_rag_agentic_stream(query: str, knowledge_id: str, user_id: str,
             for msg in chat_history[-5:]  # 只使用最近5轮
         ]
     
+    # 本次请求的可变状态
+    ctx = RagRequestContext(query, knowledge_id, user_id, history_list, flag)
+    
     # 步骤2: 增强的意图识别智能体
     print("🎯 步骤2: 增强的意图识别（语义提纯 + 逻辑提纯）...")
-    intent_result = enhanced_intent_agent.analyze_intent(
+    ctx.intent_result = enhanced_intent_agent.analyze_intent(
         query=query,
         knowledge_description=knowledge_description,
         chat_history=history_list
     )
     
-    action = intent_result.get("action", "retrieve")
-    core_intent = intent_result.get("core_intent", "")
-    semantic_purified_query = intent_result.get("semantic_purified_query", query)
+    action = ctx.intent_result.get("action", "retrieve")
+    core_intent = ctx.intent_result.get("core_intent", "")
+    semantic_purified_query = ctx.intent_result.get("semantic_purified_query", query)
     
     # 咨询本源识别结果
-    consultation_root_cause = intent_result.get("consultation_root_cause", "")
-    consultation_essence = intent_result.get("consultation_essence", "")
-    consultation_core_issue = intent_result.get("consultation_core_issue", "")
-    consultation_source = intent_result.get("consultation_source", "")
+    consultation_root_cause = ctx.intent_result.get("consultation_root_cause", "")
+    consultation_essence = ctx.intent_result.get("consultation_essence", "")
+    consultation_core_issue = ctx.intent_result.get("consultation_core_issue", "")
+    consultation_source = ctx.intent_result.get("consultation_source", "")
     
     print(f"✅ 意图识别结果: {action}")
     print(f"✅ 核心意图: {core_intent}")
@@ -120,12 +201,12 @@ def run_rag_agentic_stream(query: str, knowledge_id: str, user_id: str,
     if action == "tool":
         # 工具调用路径
         print("🔧 执行工具调用...")
-        tool_name = intent_result.get("tool_name", "")
+        tool_name = ctx.intent_result.get("tool_name", "")
         print(f"🛠️ 工具名称: {tool_name}")
         
         # 使用工具智能体根据 intent_result 执行工具
         tool_execution_result = tool_agent.execute_tool_by_intent(
-            intent_result=intent_result,
+            intent_result=ctx.intent_result,
             query=query,
             knowledge_id=knowledge_id
         )
@@ -140,13 +221,13 @@ def run_rag_agentic_stream(query: str, knowledge_id: str, user_id: str,
             # 流式输出工具结果
             chunk = create_chunk(f"tool_result_{hash(query)}", int(os.times()[4]), 
                                default_content=formatted_content, _type="text", 
-                               intent_analysis=intent_result, search_results="", finish_reason=None)
+                               intent_analysis=ctx.intent_result, search_results="", finish_reason=None)
             yield chunk
             
             # 发送结束标记
             chunk = create_chunk(f"tool_end_{hash(query)}", int(os.times()[4]), 
                                default_content="", _type="text", 
-                               intent_analysis=intent_result, search_results="", finish_reason="stop")
+                               intent_analysis=ctx.intent_result, search_results="", finish_reason="stop")
             yield chunk
             return
         else:
@@ -165,13 +246,13 @@ def run_rag_agentic_stream(query: str, knowledge_id: str, user_id: str,
         knowledge_id=knowledge_id, 
         user_id=user_id, 
         flag=flag, 
-        intent_result=intent_result  # 传入增强的意图识别结果
+        intent_result=ctx.intent_result  # 传入增强的意图识别结果
     )
     
     initial_results = intent_search_result.get("search_results", [])
     # 合并增强意图识别的结果
-    intent_analysis = {
-        **intent_result,
+    ctx.intent_analysis = {
+        **ctx.intent_result,
         **intent_search_result.get("intent_analysis", {})
     }
     
@@ -182,7 +263,7 @@ def run_rag_agentic_stream(query: str, knowledge_id: str, user_id: str,
     evaluation = evaluator_agent.evaluate_results(
         query=query,
         search_results=initial_results,
-        intent_analysis=intent_analysis
+        intent_analysis=ctx.intent_analysis
     )
     
     print(f"✅ 质量评分: {evaluation.get('quality_score', 0):.2f}")
@@ -190,35 +271,35 @@ def run_rag_agentic_stream(query: str, knowledge_id: str, user_id: str,
     
     # 步骤5: 文本冗余信息融合智能体（不用大模型）
     print("🔗 步骤5: 文本冗余信息融合（拆句、找关系、架桥梁）...")
-    fused_result = redundancy_fusion_agent.fuse_redundant_information(initial_results)
+    ctx.fused_result = redundancy_fusion_agent.fuse_redundant_information(initial_results)
     
-    if fused_result.get("success"):
-        print(f"✅ 融合完成：{len(fused_result.get('core_sentences', []))} 个核心句子")
-        print(f"✅ 主题桥梁：{len(fused_result.get('topic_bridges', []))} 个")
+    if ctx.fused_result.get("success"):
+        print(f"✅ 融合完成：{len(ctx.fused_result.get('core_sentences', []))} 个核心句子")
+        print(f"✅ 主题桥梁：{len(ctx.fused_result.get('topic_bridges', []))} 个")
     
     # 步骤6: 自我反思智能体 + 调度智能体（循环最多2次）
     print("🤔 步骤6: 自我反思 + 调度扩展搜索...")
-    final_results = initial_results
-    expansion_count = 0
-    system_prompt = ""
+    ctx.final_results = initial_results
+    ctx.expansion_count = 0
+    ctx.system_prompt = ""
     
-    while expansion_count < 2:
+    while ctx.expansion_count < 2:
         # 自我反思
         reflection_result = reflection_agent.reflect_and_generate_prompt(
             query=query,
-            fused_content=fused_result,
-            search_results=final_results,
-            intent_analysis=intent_analysis
+            fused_content=ctx.fused_result,
+            search_results=ctx.final_results,
+            intent_analysis=ctx.intent_analysis
         )
         
         if reflection_result.get("success"):
-            system_prompt = reflection_result.get("system_prompt", "")
-            print(f"✅ 反思完成，生成System Prompt: {len(system_prompt)} 字符")
+            ctx.system_prompt = reflection_result.get("system_prompt", "")
+            print(f"✅ 反思完成，生成System Prompt: {len(ctx.system_prompt)} 字符")
         
         # 调度智能体判断是否扩展
         expansion_decision = orchestrator_agent.should_expand_search(
             reflection_result=reflection_result,
-            expansion_count=expansion_count
+            expansion_count=ctx.expansion_count
         )
         
         if not expansion_decision.get("should_expand", False):
@@ -226,8 +307,8 @@ def run_rag_agentic_stream(query: str, knowledge_id: str, user_id: str,
             break
         
         # 执行扩展搜索
-        expansion_count += 1
-        print(f"🚀 执行第 {expansion_count} 次扩展搜索...")
+        ctx.expansion_count += 1
+        print(f"🚀 执行第 {ctx.expansion_count} 次扩展搜索...")
         
         suggested_queries = expansion_decision.get("suggested_queries", [])
         expanded_results = []
@@ -281,21 +362,21 @@ def run_rag_agentic_stream(query: str, knowledge_id: str, user_id: str,
             expanded_results.extend(expanded_result.get("search_results", []))
         
         # 合并结果
-        final_results = final_results + expanded_results
-        print(f"📈 扩展后共获得 {len(final_results)} 个结果")
+        ctx.final_results = ctx.final_results + expanded_results
+        print(f"📈 扩展后共获得 {len(ctx.final_results)} 个结果")
         
         # 重新融合信息
-        fused_result = redundancy_fusion_agent.fuse_redundant_information(final_results)
+        ctx.fused_result = redundancy_fusion_agent.fuse_redundant_information(ctx.final_results)
     
     # 步骤7: Artifact 处理
     print("🎨 步骤7: 处理 Artifact...")
-    artifact_data = artifact_handler.process_search_results(final_results)
+    artifact_data = artifact_handler.process_search_results(ctx.final_results)
     cleaned_content = artifact_data["cleaned_content"]
     artifacts = artifact_data["artifacts"]
     
     # 如果没有生成System Prompt，使用融合后的内容
-    if not system_prompt:
-        system_prompt = f"""你是一个专业的AI助手。请基于以下信息回答用户的问题。
+    if not ctx.system_prompt:
+        ctx.system_prompt = f"""你是一个专业的AI助手。请基于以下信息回答用户的问题。
 
 用户查询：{query}
 核心意图：{core_intent}
@@ -310,7 +391,7 @@ def run_rag_agentic_stream(query: str, knowledge_id: str, user_id: str,
     
     # 步骤8: 构建搜索结果文本（用于RAG）
     # 优先使用融合后的内容
-    search_content = fused_result.get("fused_content", cleaned_content) if fused_result.get("success") else cleaned_content
+    search_content = ctx.fused_result.get("fused_content", cleaned_content) if ctx.fused_result.get("success") else cleaned_content
     
     # 步骤9: 调用RAG流式处理（传入动态System Prompt）
     print("🎯 步骤9: 流式生成回答...")
@@ -322,7 +403,7 @@ def run_rag_agentic_stream(query: str, knowledge_id: str, user_id: str,
         int(os.times()[4]),
         default_content="",
         _type="artifacts",
-        intent_analysis=intent_analysis,
+        intent_analysis=ctx.intent_analysis,
         search_results=artifact_handler.format_artifacts_for_frontend(artifacts),
         finish_reason=None
     )
@@ -331,10 +412,10 @@ def run_rag_agentic_stream(query: str, knowledge_id: str, user_id: str,
     # 然后流式生成回答
     for chunk in rag_agentic_agent.rag_stream(
         query=query,
-        intent_analysis=intent_analysis,
-        search_results=final_results,
+        intent_analysis=ctx.intent_analysis,
+        search_results=ctx.final_results,
         search_content=search_content,
-        system_prompt=system_prompt  # 传入动态生成的System Prompt
+        system_prompt=ctx.system_prompt  # 传入动态生成的System Prompt
     ):
         chunk_count += 1
         yield chunk
@@ -343,15 +424,15 @@ def run_rag_agentic_stream(query: str, knowledge_id: str, user_id: str,
     if chunk_count == 0:
         print("⚠️ RAG流式处理没有产生任何chunk，生成默认响应")
         default_content = ""
-        if not final_results:
+        if not ctx.final_results:
             default_content = "抱歉，基于您的查询没有找到相关信息。请尝试重新表述您的问题，或者检查知识库中是否有相关内容。"
         else:
-            default_content = f"已找到 {len(final_results)} 条相关信息，但生成回答时出现问题。请稍后重试。"
+            default_content = f"已找到 {len(ctx.final_results)} 条相关信息，但生成回答时出现问题。请稍后重试。"
         
-        _id = f"rag_default_{hash(query)}"
+        # 来源已在artifacts块中发送，兜底回答不再附带原始检索结果
+        _id = f"{FALLBACK_CHUNK_PREFIX}{hash(query)}"
         chunk = create_chunk(_id, int(os.times()[4]), default_content, 
-                           intent_analysis=intent_analysis, 
-                           search_results=final_results,
+                           intent_analysis=ctx.intent_analysis, 
                            finish_reason="stop")
         yield chunk
 
@@ -5,9 +5,20 @@
 """
 
 import os
+import json
+import time
+import asyncio
+import logging
+import threading
+import weakref
 from typing import Optional
 from dotenv import load_dotenv
 
+from Emb.embedding_batch import MicroBatcher
+from Emb.embedding_batch import backoff_delay
+from Emb.embedding_batch import is_retryable_error
+from Emb.embedding_batch import pack_batches
+
 # 加载.env文件
 load_dotenv()
 
@@ -15,7 +26,7 @@ load_dotenv()
 class EmbeddingsWrapper:
     """
     Embeddings包装类，使用OpenAI SDK直接调用API
-    兼容LangChain的embed_query和embed_documents接口
+    兼容LangChain的embed_query和embed_documents接口，并提供异步的aembed_query和aembed_documents
     """
     
     def __init__(self, config: 'EmbeddingConfig'):
@@ -29,6 +40,17 @@ class EmbeddingsWrapper:
         self.client = config.get_openai_client()
         self.model_name = config.model_name
         self.vector_length = config.vector_length
+        
+        # 每个事件循环各自持有异步客户端与并发信号量（二者都不能跨事件循环使用）
+        self._async_states = weakref.WeakKeyDictionary()
+        self._async_states_lock = threading.Lock()
+        
+        # 不同线程的单条embed_query在窗口期内合并为一次批量请求
+        self.micro_batcher = None
+        if config.micro_batch_ms > 0:
+            self.micro_batcher = MicroBatcher(self._embed_batch_with_retry,
+                                              window=config.micro_batch_ms / 1000.0,
+                                              max_batch=config.batch_size)
     
     def embed_query(self, text: str) -> list:
         """
@@ -43,36 +65,25 @@ class EmbeddingsWrapper:
         if not text or not isinstance(text, str) or not text.strip():
             raise ValueError("输入文本不能为空")
         
-        try:
-            # 调用官方API
-            response = self.client.embeddings.create(
-                model=self.model_name,
-                input=text.strip(),
-                dimensions=self.vector_length,
-                encoding_format="float"
-            )
-            
-            # 从响应中提取embedding向量
-            if response.data and len(response.data) > 0:
-                return response.data[0].embedding
-            else:
-                raise ValueError("API返回的embedding数据为空")
-                
-        except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"生成向量失败: {e}")
-            raise
+        if self.micro_batcher is not None:
+            return self.micro_batcher(text.strip())
+        
+        # 调用官方API，429/5xx时退避重试
+        embeddings = self._embed_batch_with_retry([text.strip()])
+        if not embeddings:
+            raise ValueError("API返回的embedding数据为空")
+        return embeddings[0]
     
     def embed_documents(self, texts: list) -> list:
         """
         批量生成文本向量（兼容LangChain接口）
+        按条数与估算token数打包成多个请求依次发送，429/5xx时退避重试
         
         Args:
             texts: 文本列表
             
         Returns:
-            list: 向量列表，每个元素是一个文本的向量
+            list: 向量列表，与过滤空文本后的输入一一对应
         """
         if not texts:
             return []
@@ -82,28 +93,107 @@ class EmbeddingsWrapper:
         if not valid_texts:
             return []
         
-        try:
-            # 调用官方API（支持批量）
-            response = self.client.embeddings.create(
-                model=self.model_name,
-                input=valid_texts,
-                dimensions=self.vector_length,
-                encoding_format="float"
-            )
-            
-            # 从响应中提取所有embedding向量
-            embeddings = []
-            if response.data:
-                for item in response.data:
-                    embeddings.append(item.embedding)
+        embeddings = []
+        for batch in pack_batches(valid_texts, self.config.batch_size, self.config.max_tokens_per_request):
+            embeddings.extend(self._embed_batch_with_retry([valid_texts[i] for i in batch]))
+        return embeddings
+    
+    def _embed_batch_with_retry(self, texts: list) -> list:
+        """同步批量请求，429/5xx时按带抖动的指数退避重试"""
+        logger = logging.getLogger(__name__)
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                response = self.client.embeddings.create(
+                    model=self.model_name,
+                    input=texts,
+                    dimensions=self.vector_length,
+                    encoding_format="float"
+                )
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except Exception as e:
+                if attempt >= self.config.max_retries or not is_retryable_error(e):
+                    logger.error(f"批量生成向量失败: {e}")
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"生成向量请求失败，{delay:.2f}秒后第{attempt + 1}次重试: {e}")
+                time.sleep(delay)
+    
+    def _get_async_state(self):
+        """获取当前事件循环对应的异步客户端和并发信号量"""
+        loop = asyncio.get_running_loop()
+        with self._async_states_lock:
+            state = self._async_states.get(loop)
+            if state is None:
+                state = (self.config.get_async_openai_client(),
+                         asyncio.Semaphore(self.config.max_concurrency))
+                self._async_states[loop] = state
+        return state
+    
+    async def _aembed_batch(self, texts: list) -> list:
+        """异步批量请求，受并发信号量限制，429/5xx时按带抖动的指数退避重试"""
+        logger = logging.getLogger(__name__)
+        client, semaphore = self._get_async_state()
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                async with semaphore:
+                    response = await client.embeddings.create(
+                        model=self.model_name,
+                        input=texts,
+                        dimensions=self.vector_length,
+                        encoding_format="float"
+                    )
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except Exception as e:
+                if attempt >= self.config.max_retries or not is_retryable_error(e):
+                    logger.error(f"异步生成向量失败: {e}")
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"异步生成向量请求失败，{delay:.2f}秒后第{attempt + 1}次重试: {e}")
+                await asyncio.sleep(delay)
+    
+    async def aembed_query(self, text: str) -> list:
+        """
+        异步生成单个文本的向量
+        
+        Args:
+            text: 输入文本
             
-            return embeddings
+        Returns:
+            list: 向量列表
+        """
+        if not text or not isinstance(text, str) or not text.strip():
+            raise ValueError("输入文本不能为空")
+        embeddings = await self._aembed_batch([text.strip()])
+        if not embeddings:
+            raise ValueError("API返回的embedding数据为空")
+        return embeddings[0]
+    
+    async def aembed_documents(self, texts: list) -> list:
+        """
+        异步批量生成文本向量
+        按条数与估算token数打包成多个请求并发发送，并发数受EMBEDDING_MAX_CONCURRENCY限制
+        
+        Args:
+            texts: 文本列表
             
-        except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"批量生成向量失败: {e}")
-            raise
+        Returns:
+            list: 向量列表，与过滤空文本后的输入一一对应
+        """
+        if not texts:
+            return []
+        
+        valid_texts = [str(text).strip() for text in texts if text and str(text).strip()]
+        if not valid_texts:
+            return []
+        
+        batches = pack_batches(valid_texts, self.config.batch_size, self.config.max_tokens_per_request)
+        results = await asyncio.gather(*[
+            self._aembed_batch([valid_texts[i] for i in batch]) for batch in batches
+        ])
+        embeddings = []
+        for batch_result in results:
+            embeddings.extend(batch_result)
+        return embeddings
 
 
 class EmbeddingConfig:
@@ -115,6 +205,23 @@ class EmbeddingConfig:
         self.model_id = os.getenv("EMBEDDING_MODEL_ID", "")
         self.model_name = os.getenv("EMBEDDING_MODEL_NAME", "")
         self.vector_length = int(os.getenv("EMBEDDING_VECTOR_LENGTH", "2048"))
+        # 批量向量化时单次请求的文本条数
+        self.batch_size = max(1, int(os.getenv("EMBEDDING_BATCH_SIZE", "64")))
+        # 各模型实际向量维度的持久化文件，避免冷启动时探测
+        self.dim_cache_path = os.getenv("EMBEDDING_DIM_CACHE_PATH", "conf/embedding_dim.json")
+        self._dims = None
+        self._dims_lock = threading.Lock()
+        # 向量缓存：内存LRU条目数，以及磁盘缓存开关和路径
+        self.cache_enabled = os.getenv("EMBEDDING_CACHE_FLAG", "True").lower() == "true"
+        self.cache_size = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+        self.cache_disk_enabled = os.getenv("EMBEDDING_CACHE_DISK_FLAG", "True").lower() == "true"
+        self.cache_path = os.getenv("EMBEDDING_CACHE_PATH", "conf/sqlite/embedding_cache.sqlite")
+        # 异步请求的最大并发数、单次请求的估算token上限与可重试错误的重试次数
+        self.max_concurrency = max(1, int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4")))
+        self.max_tokens_per_request = max(1, int(os.getenv("EMBEDDING_MAX_TOKENS_PER_REQUEST", "8192")))
+        self.max_retries = max(0, int(os.getenv("EMBEDDING_MAX_RETRIES", "3")))
+        # 单条请求的微批合并窗口（毫秒），0表示不合并
+        self.micro_batch_ms = max(0.0, float(os.getenv("EMBEDDING_MICRO_BATCH_MS", "0")))
         
         # 验证必要的配置
         if not self.api_key:
@@ -128,7 +235,7 @@ class EmbeddingConfig:
     
     def get_openai_client(self):
         """
-        创建OpenAI客户端实例（直接使用官方SDK）
+        创建OpenAI客户端实例（直接使用官方SDK，重试由EmbeddingsWrapper统一处理，客户端自身不重试）
         
         Returns:
             OpenAI客户端实例
@@ -138,7 +245,26 @@ class EmbeddingConfig:
             
             return OpenAI(
                 api_key=self.api_key,
-                base_url=self.base_url
+                base_url=self.base_url,
+                max_retries=0
+            )
+        except ImportError:
+            raise ImportError("openai not installed. Please install it: pip install openai")
+    
+    def get_async_openai_client(self):
+        """
+        创建异步OpenAI客户端实例（重试由EmbeddingsWrapper统一处理，客户端自身不重试）
+        
+        Returns:
+            AsyncOpenAI客户端实例
+        """
+        try:
+            from openai import AsyncOpenAI
+            
+            return AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=0
             )
         except ImportError:
             raise ImportError("openai not installed. Please install it: pip install openai")
@@ -178,6 +304,22 @@ class EmbeddingConfig:
             logger.warning("openai包未安装，回退到LangChain封装方式")
             return self.get_openai_embeddings()
     
+    def get_cached_embeddings(self):
+        """
+        获取带两级缓存（内存LRU + 磁盘SQLite）的Embeddings实例
+        
+        Returns:
+            CachedEmbeddings实例；未启用缓存时返回get_embeddings()的结果
+        """
+        embeddings = self.get_embeddings()
+        if not self.cache_enabled:
+            return embeddings
+        from Emb.embedding_cache import EmbeddingCache, CachedEmbeddings
+        cache = EmbeddingCache(self.model_name, self.vector_length,
+                               max_size=self.cache_size,
+                               db_path=self.cache_path if self.cache_disk_enabled else None)
+        return CachedEmbeddings(embeddings, cache)
+    
     def get_vector_length(self) -> int:
         """
         获取向量维度长度
@@ -187,9 +329,75 @@ class EmbeddingConfig:
         """
         return self.vector_length
 
+    def get_dimension(self, embeddings=None) -> int:
+        """
+        获取当前模型实际输出的向量维度
+        优先读取内存及持久化文件中记录的维度；都没有时用embeddings探测一次并写入文件
+        
+        Args:
+            embeddings: 用于探测的Embeddings实例（可选，默认使用get_embeddings()）
+            
+        Returns:
+            向量维度
+        """
+        key = f"{self.model_name}@{self.vector_length}"
+        with self._dims_lock:
+            if self._dims is None:
+                self._dims = {}
+                try:
+                    if os.path.exists(self.dim_cache_path):
+                        with open(self.dim_cache_path, "r", encoding="utf-8") as f:
+                            self._dims = json.load(f)
+                except Exception as e:
+                    import logging
+                    logging.getLogger(__name__).warning(f"读取向量维度缓存失败: {e}")
+            if key in self._dims:
+                return self._dims[key]
+        
+        if embeddings is None:
+            embeddings = self.get_embeddings()
+        dim = len(embeddings.embed_query("dimension"))
+        self.remember_dimension(dim)
+        return dim
+    
+    def remember_dimension(self, dim: int):
+        """
+        记录当前模型的向量维度并持久化
+        
+        Args:
+            dim: 向量维度
+        """
+        key = f"{self.model_name}@{self.vector_length}"
+        with self._dims_lock:
+            if self._dims is None:
+                self._dims = {}
+            if self._dims.get(key) == dim:
+                return
+            self._dims[key] = dim
+            try:
+                dir_name = os.path.dirname(self.dim_cache_path)
+                if dir_name:
+                    os.makedirs(dir_name, exist_ok=True)
+                with open(self.dim_cache_path, "w", encoding="utf-8") as f:
+                    json.dump(self._dims, f, ensure_ascii=False)
+            except Exception as e:
+                import logging
+                logging.getLogger(__name__).warning(f"保存向量维度缓存失败: {e}")
+
+    def get_batch_size(self) -> int:
+        """
+        获取批量向量化时单次请求的文本条数
+        
+        Returns:
+            单次请求的文本条数
+        """
+        return self.batch_size
+
 
 # 全局单例
 _embedding_config: Optional[EmbeddingConfig] = None
+_shared_embeddings = None
+_shared_embeddings_lock = threading.Lock()
 
 
 def get_embedding_config() -> EmbeddingConfig:
@@ -201,10 +409,38 @@ def get_embedding_config() -> EmbeddingConfig:
 
 
 def get_embeddings():
-    """便捷函数：获取Embeddings实例"""
-    return get_embedding_config().get_embeddings()
+    """便捷函数：获取进程内共享的带缓存Embeddings实例"""
+    global _shared_embeddings
+    if _shared_embeddings is None:
+        with _shared_embeddings_lock:
+            if _shared_embeddings is None:
+                _shared_embeddings = get_embedding_config().get_cached_embeddings()
+    return _shared_embeddings
+
+
+def get_embedding_cache_stats() -> dict:
+    """便捷函数：获取共享Embeddings实例的缓存命中统计"""
+    embeddings = get_embeddings()
+    if hasattr(embeddings, "get_cache_stats"):
+        return embeddings.get_cache_stats()
+    return {}
 
 
 def get_vector_length() -> int:
     """便捷函数：获取向量维度长度"""
     return get_embedding_config().get_vector_length()
+
+
+def get_embedding_batch_size() -> int:
+    """便捷函数：获取批量向量化时单次请求的文本条数"""
+    return get_embedding_config().get_batch_size()
+
+
+def get_embedding_dimension(embeddings=None) -> int:
+    """便捷函数：获取当前模型实际输出的向量维度（持久化缓存，最多探测一次）"""
+    return get_embedding_config().get_dimension(embeddings)
+
+
+def remember_embedding_dimension(dim: int):
+    """便捷函数：记录当前模型实际输出的向量维度"""
+    get_embedding_config().remember_dimension(dim)
@@ -0,0 +1,92 @@
+# -*- coding:utf-8 -*-
+"""
+统一的文件入库队列配置工具
+从.env文件中读取入库任务队列配置
+"""
+
+import os
+from typing import Optional
+from dotenv import load_dotenv
+
+# 加载.env文件
+load_dotenv()
+
+
+class IngestConfig:
+    """入库队列配置类，统一管理工作线程数、重试次数与重试退避时间"""
+
+    def __init__(self):
+        # 工作线程数量
+        worker_str = os.getenv("INGEST_WORKER_NUM", "2")
+        try:
+            self.worker_num = max(1, int(worker_str))
+        except ValueError:
+            self.worker_num = 2
+
+        # 单个任务失败后的最大重试次数
+        retry_str = os.getenv("INGEST_MAX_RETRIES", "2")
+        try:
+            self.max_retries = max(0, int(retry_str))
+        except ValueError:
+            self.max_retries = 2
+
+        # 队列空闲时工作线程的轮询间隔（秒）
+        poll_str = os.getenv("INGEST_POLL_INTERVAL", "2")
+        try:
+            self.poll_interval = max(0.1, float(poll_str))
+        except ValueError:
+            self.poll_interval = 2.0
+
+        # 失败重试的退避时间（秒）：第n次重试前等待 基数 * 2^n，不超过上限
+        backoff_str = os.getenv("INGEST_RETRY_BACKOFF", "5")
+        try:
+            self.retry_backoff = max(0.0, float(backoff_str))
+        except ValueError:
+            self.retry_backoff = 5.0
+        backoff_max_str = os.getenv("INGEST_RETRY_BACKOFF_MAX", "300")
+        try:
+            self.retry_backoff_max = max(0.0, float(backoff_max_str))
+        except ValueError:
+            self.retry_backoff_max = 300.0
+
+    def get_worker_num(self) -> int:
+        """
+        获取工作线程数量
+
+        Returns:
+            int: 工作线程数量
+        """
+        return self.worker_num
+
+    def get_max_retries(self) -> int:
+        """
+        获取最大重试次数
+
+        Returns:
+            int: 最大重试次数
+        """
+        return self.max_retries
+
+    def get_retry_delay(self, retries: int) -> float:
+        """
+        获取第 retries 次失败后重新排队前的等待时间
+
+        Args:
+            retries: 已重试次数（0表示首次失败）
+
+        Returns:
+            float: 等待秒数
+        """
+        return min(self.retry_backoff_max, self.retry_backoff * (2 ** retries))
+
+
+# 全局单例
+_ingest_config: Optional[IngestConfig] = None
+
+
+def get_ingest_config() -> IngestConfig:
+    """获取入库队列配置单例"""
+    global _ingest_config
+    if _ingest_config is None:
+        _ingest_config = IngestConfig()
+    return _ingest_config
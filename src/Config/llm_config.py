@@ -227,6 +227,30 @@ def get_llm_config() -> LLMConfig:
     return _llm_config
 
 
+class LLMCacheConfig:
+    """LLM响应缓存配置（与模型配置分开读取，未配置模型时也可使用）"""
+
+    def __init__(self):
+        # 总开关：关闭后所有调用都直接请求模型
+        self.enabled = (os.getenv("LLM_CACHE_ENABLED", "true") or "").strip().lower() in ("true", "1", "yes")
+        # 内存缓存条目上限与条目有效期（秒，0表示不过期）
+        self.max_size = max(1, int(os.getenv("LLM_CACHE_SIZE", "2048")))
+        self.ttl = int(os.getenv("LLM_CACHE_TTL", "86400"))
+        # SQLite持久化文件路径，为空时只使用内存缓存
+        self.sqlite_path = (os.getenv("LLM_CACHE_SQLITE_PATH", "") or "").strip() or None
+
+
+_llm_cache_config: Optional[LLMCacheConfig] = None
+
+
+def get_llm_cache_config() -> LLMCacheConfig:
+    """获取LLM响应缓存配置单例"""
+    global _llm_cache_config
+    if _llm_cache_config is None:
+        _llm_cache_config = LLMCacheConfig()
+    return _llm_cache_config
+
+
 def get_chat_tongyi(temperature: float = 0.3, streaming: bool = False, enable_thinking: bool = False):
     """便捷函数：根据 QWEN_TYPE / MINMAX_TYPE 获取当前启用的对话模型"""
     return get_llm_config().get_chat_tongyi(temperature, streaming, enable_thinking)
@@ -52,6 +52,11 @@ class RedisConfig:
         
         # 数据库编号（可选）
         self.db = int(os.getenv("REDIS_DB", "0"))
+
+        # 连接池：最大连接数、读写超时（秒）与空闲连接健康检查间隔（秒）
+        self.max_connections = int(os.getenv("REDIS_MAX_CONNECTIONS", "64"))
+        self.socket_timeout = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+        self.health_check_interval = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
         
         # 验证必要的配置
         if not self.host:
@@ -78,6 +83,19 @@ class RedisConfig:
         
         return params
 
+    def get_pool_params(self) -> dict:
+        """
+        获取Redis连接池参数
+        
+        Returns:
+            dict: 包含max_connections, socket_timeout, health_check_interval的字典
+        """
+        return {
+            "max_connections": self.max_connections,
+            "socket_timeout": self.socket_timeout,
+            "health_check_interval": self.health_check_interval,
+        }
+
 
 # 全局单例
 _redis_config: Optional[RedisConfig] = None
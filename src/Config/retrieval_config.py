@@ -0,0 +1,143 @@
+# -*- coding:utf-8 -*-
+"""
+统一的多路检索配置工具
+从.env文件中读取图谱/向量等检索源的并发与超时配置
+"""
+
+import os
+from typing import Optional
+from dotenv import load_dotenv
+
+# 加载.env文件
+load_dotenv()
+
+
+def _read_float(name: str, default: float, minimum: float = 0.0) -> float:
+    try:
+        return max(minimum, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def _read_int(name: str, default: int, minimum: int = 0) -> int:
+    try:
+        return max(minimum, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+class RetrievalConfig:
+    """多路检索配置类，统一管理检索线程池大小、各检索源超时与提前返回条件"""
+
+    def __init__(self):
+        # 共享检索线程池的线程数
+        self.worker_num = _read_int("RETRIEVAL_WORKER_NUM", 8, minimum=1)
+
+        # 各检索源的超时时间（秒），超时后返回已就绪的部分结果
+        self.graph_timeout = _read_float("RETRIEVAL_GRAPH_TIMEOUT", 15.0, minimum=0.1)
+        self.vector_timeout = _read_float("RETRIEVAL_VECTOR_TIMEOUT", 10.0, minimum=0.1)
+
+        # 向量检索中得分不低于阈值的结果达到该数量时，不再等待其他检索源；0表示关闭
+        self.early_return_hits = _read_int("RETRIEVAL_EARLY_RETURN_HITS", 0)
+        self.early_return_score = _read_float("RETRIEVAL_EARLY_RETURN_SCORE", 0.8, minimum=-1e9)
+
+        # 意图搜索四引擎（Milvus/Elasticsearch/图数据/智能问数）共享线程池的线程数
+        self.engine_worker_num = _read_int("SEARCH_ENGINE_WORKER_NUM", 16, minimum=1)
+
+        # 各搜索引擎的超时时间（秒）
+        self.engine_timeouts = {
+            "milvus": _read_float("SEARCH_MILVUS_TIMEOUT", 10.0, minimum=0.1),
+            "elasticsearch": _read_float("SEARCH_ELASTICSEARCH_TIMEOUT", 10.0, minimum=0.1),
+            "graph": _read_float("SEARCH_GRAPH_TIMEOUT", 15.0, minimum=0.1),
+            "table": _read_float("SEARCH_TABLE_TIMEOUT", 30.0, minimum=0.1),
+        }
+
+        # 多引擎结果融合中各搜索引擎的权重
+        self.engine_weights = {
+            "milvus": _read_float("SEARCH_WEIGHT_MILVUS", 1.0),
+            "elasticsearch": _read_float("SEARCH_WEIGHT_ELASTICSEARCH", 1.0),
+            "graph": _read_float("SEARCH_WEIGHT_GRAPH", 1.2),
+            "table": _read_float("SEARCH_WEIGHT_TABLE", 1.5),
+        }
+
+        # RRF平滑常数k，得分为 权重 / (k + 排名)
+        self.rrf_k = _read_int("SEARCH_RRF_K", 60, minimum=1)
+
+        # 多引擎结果融合方式：rrf（只看排名）或 combsum（归一化得分加权求和）
+        self.fusion_method = os.getenv("SEARCH_FUSION_METHOD", "rrf").strip().lower()
+        if self.fusion_method not in ("rrf", "combsum"):
+            self.fusion_method = "rrf"
+
+        # 引擎内得分归一化方式：minmax 或 zscore（决定combsum的得分；rrf只看排名，不受其影响）
+        self.score_normalization = os.getenv("SEARCH_SCORE_NORMALIZATION", "minmax").strip().lower()
+        if self.score_normalization not in ("minmax", "zscore"):
+            self.score_normalization = "minmax"
+
+        # 近重复折叠的MinHash相似度阈值，大于等于该值视为同一内容；1表示只按内容哈希精确去重
+        self.dedupe_threshold = _read_float("SEARCH_DEDUPE_THRESHOLD", 0.85)
+
+        # 智能问数：表格路由按向量相似度保留的文件数及最低相似度
+        self.table_router_top_k = _read_int("TABLE_ROUTER_TOP_K", 3, minimum=1)
+        self.table_router_min_score = _read_float("TABLE_ROUTER_MIN_SCORE", 0.2, minimum=-1.0)
+
+        # 智能问数：并发查询的文件数、全局大模型并发上限、单次查询读取的最大行数、已校验SQL缓存条数
+        self.table_query_worker_num = _read_int("TABLE_QUERY_WORKER_NUM", 8, minimum=1)
+        self.table_llm_concurrency = _read_int("TABLE_QUERY_LLM_CONCURRENCY", 4, minimum=1)
+        self.table_query_max_rows = _read_int("TABLE_QUERY_MAX_ROWS", 100, minimum=1)
+        self.table_sql_cache_size = _read_int("TABLE_SQL_CACHE_SIZE", 512, minimum=0)
+
+        # 问答结果语义缓存：开关、条目上限、命中所需的最低余弦相似度、有效期（秒，0表示不过期）
+        self.response_cache_enabled = os.getenv("RESPONSE_CACHE_FLAG", "True").lower() == "true"
+        self.response_cache_size = _read_int("RESPONSE_CACHE_SIZE", 1000, minimum=1)
+        self.response_cache_threshold = _read_float("RESPONSE_CACHE_THRESHOLD", 0.95, minimum=-1.0)
+        self.response_cache_ttl = _read_int("RESPONSE_CACHE_TTL", 3600)
+        # 命中缓存时按SSE流回放，每个数据块的字符数
+        self.response_cache_replay_chars = _read_int("RESPONSE_CACHE_REPLAY_CHARS", 32, minimum=1)
+
+    def get_worker_num(self) -> int:
+        """
+        获取检索线程池的线程数
+
+        Returns:
+            int: 线程数
+        """
+        return self.worker_num
+
+    def get_timeouts(self) -> dict:
+        """
+        获取各检索源的超时时间
+
+        Returns:
+            dict: 检索源名称 -> 超时时间（秒）
+        """
+        return {"graph": self.graph_timeout, "vector": self.vector_timeout}
+
+    def get_engine_timeouts(self) -> dict:
+        """
+        获取意图搜索各引擎的超时时间
+
+        Returns:
+            dict: 引擎名称 -> 超时时间（秒）
+        """
+        return dict(self.engine_timeouts)
+
+    def get_engine_weights(self) -> dict:
+        """
+        获取多引擎结果融合中各引擎的权重
+
+        Returns:
+            dict: 引擎名称 -> 权重
+        """
+        return dict(self.engine_weights)
+
+
+# 全局单例
+_retrieval_config: Optional[RetrievalConfig] = None
+
+
+def get_retrieval_config() -> RetrievalConfig:
+    """获取多路检索配置单例"""
+    global _retrieval_config
+    if _retrieval_config is None:
+        _retrieval_config = RetrievalConfig()
+    return _retrieval_config
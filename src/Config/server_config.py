@@ -0,0 +1,82 @@
+# -*- coding:utf-8 -*-
+"""
+统一的服务运行配置工具
+从.env文件中读取服务模式（Flask / ASGI）、监听地址、SSE流式输出与用户认证配置
+"""
+
+import os
+from typing import Optional
+from dotenv import load_dotenv
+
+# 加载.env文件
+load_dotenv()
+
+
+def _read_int(name: str, default: int, minimum: int = 0) -> int:
+    try:
+        return max(minimum, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+class ServerConfig:
+    """服务运行配置类，统一管理服务模式、监听地址、SSE桥接线程池、队列、日志采样与用户认证"""
+
+    def __init__(self):
+        # 服务模式：flask（Werkzeug线程模式）或 asgi（uvicorn + Starlette）
+        self.mode = os.getenv("SERVER_MODE", "flask").strip().lower()
+        if self.mode not in ("flask", "asgi"):
+            self.mode = "flask"
+        self.host = os.getenv("SERVER_HOST", "0.0.0.0")
+        self.port = _read_int("SERVER_PORT", 6199, minimum=1)
+
+        # ASGI模式下运行同步流水线的线程数上限（线程按需创建、空闲线程复用），每个流占用一个线程；
+        # 线程占满后新流排队等待线程，排队的流数达到 SSE_MAX_WAITING_STREAMS 时新请求直接返回503（背压）
+        self.sse_worker_num = _read_int("SSE_WORKER_NUM", 64, minimum=1)
+        self.sse_max_waiting = _read_int("SSE_MAX_WAITING_STREAMS", 256)
+        # 每个流在客户端读取前最多缓冲的数据块数，缓冲满后流水线线程暂停（背压）
+        self.sse_queue_size = _read_int("SSE_QUEUE_SIZE", 32, minimum=1)
+        # 每隔多少个数据块记录一次数据块日志（第一个数据块总是记录），0表示不记录
+        self.sse_log_every = _read_int("SSE_CHUNK_LOG_EVERY", 50)
+
+        # 会话令牌签名密钥（为空时每次启动随机生成）与有效期（秒）
+        self.auth_token_secret = os.getenv("AUTH_TOKEN_SECRET", "")
+        self.auth_token_ttl = _read_int("AUTH_TOKEN_TTL", 7200, minimum=60)
+        # 用户名密码校验结果的缓存时间（秒，0表示不缓存）与条目上限
+        self.auth_cache_ttl = _read_int("AUTH_CACHE_TTL", 30)
+        self.auth_cache_size = _read_int("AUTH_CACHE_SIZE", 1024, minimum=1)
+
+    def is_asgi(self) -> bool:
+        """
+        是否以ASGI模式运行
+
+        Returns:
+            bool: 是否为ASGI模式
+        """
+        return self.mode == "asgi"
+
+    def should_log_chunk(self, chunk_count: int) -> bool:
+        """
+        判断第 chunk_count 个数据块是否需要记录日志
+
+        Args:
+            chunk_count: 从1开始的数据块序号
+
+        Returns:
+            bool: 是否记录
+        """
+        if self.sse_log_every <= 0:
+            return False
+        return chunk_count == 1 or chunk_count % self.sse_log_every == 0
+
+
+# 全局单例
+_server_config: Optional[ServerConfig] = None
+
+
+def get_server_config() -> ServerConfig:
+    """获取服务运行配置单例"""
+    global _server_config
+    if _server_config is None:
+        _server_config = ServerConfig()
+    return _server_config
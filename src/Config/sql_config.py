@@ -0,0 +1,96 @@
+# -*- coding:utf-8 -*-
+"""
+统一的外部数据源（MySQL / PostgreSQL）连接池配置工具
+从.env文件中读取连接池大小、空闲回收、最大存活时间与语句超时配置，查询结果导出配置，以及表关联图缓存配置
+"""
+
+import os
+from typing import Optional
+from dotenv import load_dotenv
+
+# 加载.env文件
+load_dotenv()
+
+
+def _read_number(name: str, default, minimum=0):
+    try:
+        return max(minimum, type(default)(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+class SqlPoolConfig:
+    """数据源连接池配置类，每个sql_id一个连接池"""
+
+    def __init__(self):
+        # 空闲回收时保留的最少连接数与最大连接数
+        self.min_size = _read_number("SQL_POOL_MIN_SIZE", 0)
+        self.max_size = max(1, self.min_size, _read_number("SQL_POOL_MAX_SIZE", 8, minimum=1))
+        # 连接空闲超过该时间（秒）后关闭
+        self.max_idle = _read_number("SQL_POOL_MAX_IDLE", 300.0)
+        # 连接建立超过该时间（秒）后不再复用，0表示不限制
+        self.max_lifetime = _read_number("SQL_POOL_MAX_LIFETIME", 1800.0)
+        # 连接池已满时等待空闲连接的时间（秒）
+        self.checkout_timeout = _read_number("SQL_POOL_CHECKOUT_TIMEOUT", 30.0)
+        # 取出连接时，空闲超过该时间（秒）的连接先做存活检查，0表示每次取出都检查
+        self.ping_interval = _read_number("SQL_POOL_PING_INTERVAL", 5.0)
+        # 建立连接的超时时间（秒）
+        self.connect_timeout = _read_number("SQL_CONNECT_TIMEOUT", 10, minimum=1)
+        # 单条语句的执行超时（秒），0表示不限制
+        self.statement_timeout = _read_number("SQL_STATEMENT_TIMEOUT", 60.0)
+
+
+class SqlResultConfig:
+    """查询结果导出配置类，结果分批流式写入CSV，页面表格只展示前若干行"""
+
+    def __init__(self):
+        # 每批从服务端游标读取的行数
+        self.fetch_batch_size = _read_number("SQL_FETCH_BATCH_SIZE", 5000, minimum=1)
+        # 页面表格预览的最大行数
+        self.preview_rows = _read_number("SQL_PREVIEW_ROWS", 10, minimum=1)
+        # 导出文件的最大行数，超出部分不再写入，0表示不限制
+        self.export_max_rows = _read_number("SQL_EXPORT_MAX_ROWS", 1000000)
+        # 导出文件目录（专用目录，每个用户一个子目录）
+        self.export_dir = os.getenv("SQL_EXPORT_DIR", "conf/tmp/sql_exports")
+        # 导出文件保留时间（秒），过期后删除，0表示不删除
+        self.export_ttl = _read_number("SQL_EXPORT_TTL", 86400)
+
+
+class SchemaGraphConfig:
+    """表关联图配置类，关联图按sql_id缓存，表结构或关联关系变化时失效"""
+
+    def __init__(self):
+        # 最多缓存多少个数据源的关联图，超出后淘汰最久未使用的
+        self.cache_size = _read_number("SCHEMA_GRAPH_CACHE_SIZE", 32, minimum=1)
+        # 表数量不超过该值时建图后预计算全源最短关联路径，更大的库按源点逐个计算并缓存
+        self.apsp_max_tables = _read_number("SCHEMA_GRAPH_APSP_MAX_TABLES", 300)
+
+
+# 全局单例
+_sql_pool_config: Optional[SqlPoolConfig] = None
+_sql_result_config: Optional[SqlResultConfig] = None
+_schema_graph_config: Optional[SchemaGraphConfig] = None
+
+
+def get_sql_pool_config() -> SqlPoolConfig:
+    """获取数据源连接池配置单例"""
+    global _sql_pool_config
+    if _sql_pool_config is None:
+        _sql_pool_config = SqlPoolConfig()
+    return _sql_pool_config
+
+
+def get_sql_result_config() -> SqlResultConfig:
+    """获取查询结果导出配置单例"""
+    global _sql_result_config
+    if _sql_result_config is None:
+        _sql_result_config = SqlResultConfig()
+    return _sql_result_config
+
+
+def get_schema_graph_config() -> SchemaGraphConfig:
+    """获取表关联图配置单例"""
+    global _schema_graph_config
+    if _schema_graph_config is None:
+        _schema_graph_config = SchemaGraphConfig()
+    return _schema_graph_config
@@ -40,6 +40,7 @@ from Control.control_graph import CControl as ControlGraph
 from Control.control_search import CControl as ControlSearch
 from Control.control_sessions import CControl as ControlSessions
 from Control.control_elastic import CControl as ElasticSearchController
+from Control.control_ingest import CControl as ControlIngest
 # from Control.control_chat import CControl as ControlChat
 # from Control.control_graphiti import CControl as ControlGraphiti
 from Graphrag.light_rag import run as graph_run
@@ -63,6 +64,7 @@ from Config.pdf_config import is_pdf_advanced_enabled
 # from Control.control_elastic import get_elastic_controller
 
 from Utils import utils
+from Utils.response_cache import get_response_cache
 
 # 创建线程安全的logger
 logger = logging.getLogger(__name__)
@@ -80,8 +82,14 @@ WORKING_DIR = "lightrag_data"
 
 IAMGES_PATH = "/home/ubumtu/Downloads/Server/tmp_url"
 
-THREAD_LIST = []
-# thread_list = []
+INDEX_PARAMS = {
+    "index_type": "HNSW",
+    "metric_type": "IP",
+    "params": {}
+}
+
+# 短于该长度的文本直接整体写入向量库，不再切分，也不构建图谱
+SHORT_TEXT_LENGTH = 1000
 
 class CControl():
     
@@ -93,6 +101,10 @@ class CControl():
         self.session_obj = ControlSessions()
         self.elasticsearch_obj = ElasticSearchController()
         # self.graphiti_obj = ControlGraphiti()
+        self.ingest_obj = ControlIngest()
+        self.ingest_obj.start(self.run_ingest_job)
+        # 知识库内容变化时使问答语义缓存失效
+        self.response_cache = get_response_cache()
     
     def add_file(self, param):        
         _url = ""
@@ -118,12 +130,6 @@ class CControl():
         if not user_id:
             return {"error_code": 5, "error_msg": "用户ID不能为空"}
         
-        for t in THREAD_LIST:
-            if t.is_alive():
-                return {"error_code":4, "error_msg":"The rag process is running, please try again later."}
-            else:
-                THREAD_LIST.remove(t)
-        
         search_param = {"knowledge_id": knowledge_id, "user_id": user_id}
         res_kb = cSingleSqlite.search_knowledge_base_by_id_and_user_id(search_param)
         if(not res_kb):
@@ -147,13 +153,125 @@ class CControl():
         # if(track_id and track_id.strip() != ""):
        
         file_name = os.path.basename(file_path)
-        _lt = cSingleSqlite.search_file_from_name_userid(file_name, user_id)
-        if(_lt and len(_lt) > 0):
-            return {"error_code":0, "error_msg":"File already exists"}
-        res = self.file_path_analysis(knowledge_id, user_id, user_name, file_id, file_path, permission_level, _url)
-        return res
+        
+        # 文件解析、向量化、图谱构建交给入库队列异步执行，这里只返回任务id
+        job_param = {"knowledge_id": knowledge_id, "user_id": user_id,
+                     "user_name": user_name, "file_id": file_id,
+                     "file_path": file_path, "permission_level": permission_level,
+                     "url": _url}
+        # 文件信息在异步解析阶段才写入，重复检查需同时查看未完成的任务，检查与入队在一个事务内完成
+        try:
+            with cSingleSqlite.transaction():
+                _lt = cSingleSqlite.search_file_from_name_userid(file_name, user_id)
+                if((_lt and len(_lt) > 0) or self.ingest_obj.has_active_file(user_id, file_name)):
+                    return {"error_code":0, "error_msg":"File already exists"}
+                job_id = self.ingest_obj.submit(job_param)
+        except Exception as e:
+            logger.error(f"文件 {file_name} 入队失败: {e}")
+            job_id = None
+        if(not job_id):
+            return {"error_code":6, "error_msg":"Failed to enqueue the file"}
+        self.response_cache.invalidate_knowledge(knowledge_id)
+        return {"error_code":0, "error_msg":"Success", "file_id":file_id, "job_id":job_id}
+    
+    def get_ingest_job(self, param):
+        """查询入库任务状态，按job_id查询单个任务，或按knowledge_id查询任务列表"""
+        user_id = param.get("user_id", "")
+        job_id = param.get("job_id", "")
+        knowledge_id = param.get("knowledge_id", "")
+        if(job_id):
+            job = self.ingest_obj.get_job(job_id)
+            if(not job or job["user_id"] != user_id):
+                return {"error_code":1, "error_msg":"Job does not exist"}
+            return {"error_code":0, "error_msg":"Success", "job":job}
+        if(knowledge_id):
+            jobs = self.ingest_obj.list_jobs(knowledge_id, user_id)
+            return {"error_code":0, "error_msg":"Success", "jobs":jobs}
+        return {"error_code":2, "error_msg":"Lack of job_id or knowledge_id"}
+    
+    def run_ingest_job(self, job):
+        """
+        入库队列的任务处理函数，按 parsing -> embedding -> graphing 顺序执行，
+        重试或进程重启后跳过已完成的阶段，并先清理已开始但未完成的阶段写入的部分数据；
+        各阶段写入的数据陆续可被检索到，结束时（无论成败）再次使该知识库的问答缓存失效
+        """
+        try:
+            return self._run_ingest_stages(job)
+        finally:
+            self.response_cache.invalidate_knowledge(job["payload"]["knowledge_id"])
+    
+    def _run_ingest_stages(self, job):
+        payload = job["payload"]
+        knowledge_id = payload["knowledge_id"]
+        file_id = payload["file_id"]
+        permission_level = payload["permission_level"]
+        completed = job["context"].get("completed_stages", [])
+        
+        if("parsing" not in completed):
+            dirty = self.ingest_obj.stage_started(job, "parsing")
+            self.ingest_obj.enter_stage(job, "parsing")
+            if(dirty):
+                with cSingleSqlite.transaction():
+                    cSingleSqlite.delete_file_basic_info(file_id)
+                    cSingleSqlite.delete_file_detail_info(file_id)
+                if is_elasticsearch_enabled():
+                    self.elasticsearch_obj.delete_file_elasticsearch_data(file_id)
+            res = self.file_path_analysis(knowledge_id, payload["user_id"], payload["user_name"],
+                                          file_id, payload["file_path"], permission_level,
+                                          payload.get("url", ""))
+            if(res["error_code"] != 0):
+                return res
+            self.ingest_obj.complete_stage(job, "parsing", res["context"])
+        
+        context = job["context"]
+        file_md_path = context["file_md_path"]
+        title = context["title"]
+        
+        # 与原流程一致：未启用Milvus时只做解析，短文本只写入向量库，均不构建图谱
+        if not is_milvus_enabled():
+            return {"error_code":0, "error_msg":"Success"}
+        
+        if("embedding" not in completed):
+            dirty = self.ingest_obj.stage_started(job, "embedding")
+            self.ingest_obj.enter_stage(job, "embedding")
+            if(dirty):
+                self.delete_milvus_by_file_id(knowledge_id, file_id)
+            embedding = get_embeddings()
+            if(context["text_len"] < SHORT_TEXT_LENGTH):
+                _txt = self.file_obj.read_txt(file_md_path)
+                param = {"knowledge_partition": file_id,
+                         "knowledge_collection":knowledge_id,
+                         "title": title,
+                         "data": _txt,
+                         "permission_level": permission_level}
+                self.milvus_obj.add_text(param, embedding, INDEX_PARAMS)
+            else:
+                self.save_milvus(file_id, file_md_path, knowledge_id, title,
+                                 context["toc_json"], permission_level,
+                                 embedding, INDEX_PARAMS, job=job)
+            self.ingest_obj.complete_stage(job, "embedding")
+        
+        if(context["text_len"] < SHORT_TEXT_LENGTH or not is_neo4j_enabled()):
+            return {"error_code":0, "error_msg":"Success"}
+        
+        if("graphing" not in completed):
+            dirty = self.ingest_obj.stage_started(job, "graphing")
+            self.ingest_obj.enter_stage(job, "graphing")
+            if(dirty):
+                self.delete_graph_file_id(file_id)
+                self.delete_graph_db_by_file_id(file_id)
+            if(not self.check_graph(file_md_path, knowledge_id, file_id,
+                                    title, context["file_name"], permission_level)):
+                return {"error_code":7, "error_msg":"Graph build failed, the file has been removed"}
+            self.ingest_obj.complete_stage(job, "graphing")
+        
+        return {"error_code":0, "error_msg":"Success"}
     
     def file_path_analysis(self, knowledge_id, user_id, user_name, file_id, file_path, permission_level, _url=""):
+        """
+        解析文件并保存文件基础信息、详细信息及Elasticsearch内容，
+        返回后续向量化和图谱构建阶段需要的中间结果
+        """
         
         # 根据文件类型选择解析方式
         logger.info(f"文件路径: {file_path}")
@@ -195,18 +313,15 @@ class CControl():
             logger.info(f"使用XLSX解析: {file_path}")
             split_result = self.file_obj.split_excel_to_csv(file_path)
             _txt = split_result.get("catalog_text", "")
+        else:
+            logger.error(f"不支持的文件类型: {file_path}")
+            return {"error_code": 1, "error_msg": f"不支持的文件类型: {file_extension}"}
 
         file_name = os.path.basename(file_path)
         txt, _ = os.path.splitext(file_name)
         file_md_path = file_path.replace(file_name, txt + ".md")
         with open(file_md_path, "w", encoding="utf-8") as f:
             f.write(_txt)
-            
-        for t in THREAD_LIST:
-            if t.is_alive():
-                return {"error_code":4, "error_msg":"The rag process is running, please try again later."}
-            else:
-                THREAD_LIST.remove(t)
         
         # file_id = "file_" + utils.generate_secure_string(length=16)
         _dict = self.get_file_info(_txt, file_name)
@@ -224,13 +339,14 @@ class CControl():
                           "permission_level": permission_level, "url":_url, 
                           "upload_time":upload_time}
         
-        cSingleSqlite.insert_file_basic_info(file_info_dict)
-        
         detail_info_dict = {"file_id":file_id,"file_name":file_name,"recognized_title":title,
                             "overview":summary,"authors":authors, "category":doc_type,
                             "create_time":"", "catalog":toc_json}
 
-        cSingleSqlite.insert_file_detail_info(detail_info_dict)
+        # 基本信息与详细信息一起提交
+        with cSingleSqlite.transaction():
+            cSingleSqlite.insert_file_basic_info(file_info_dict)
+            cSingleSqlite.insert_file_detail_info(detail_info_dict)
         logger.info(f"RAG 文件信息: {_txt}")
         logger.info(f"文件内容: {_dict}")
         # 保存 Markdown 内容到 Elasticsearch
@@ -256,77 +372,44 @@ class CControl():
         # except Exception as e:
         #     logger.error(f"保存文件到 Elasticsearch 时出错: {e}")
         
-        embedding = get_embeddings()
-        index_params = {
-            "index_type": "HNSW",
-            "metric_type": "IP",
-            "params": {}
-        }
-        # 保存到Milvus（如果启用）
-        # from Config.milvus_config import is_milvus_enabled
-        if is_milvus_enabled():
-            if(len(_txt) < 1000):
-                param = {"knowledge_partition": file_id,
-                         "knowledge_collection":knowledge_id,
-                         "title": title,
-                         "data": _txt,
-                         "permission_level": permission_level}
-            
-                self.milvus_obj.add_text(param, embedding, index_params)
-                res = {"error_code":0, "error_msg":"Success"}
-                return res
-            
-            # 启动异步线程执行 save_milvus，不阻塞流式响应
-            th_milvus = threading.Thread(target=self.save_milvus, args=(file_id, file_md_path, knowledge_id, 
-                                                                        title, toc_json, permission_level,
-                                                                        embedding, index_params,))
-            THREAD_LIST.append(th_milvus)
-            th_milvus.start()
-        else:
-            res = {"error_code":0, "error_msg":"Success"}
-            return res
-        if is_neo4j_enabled():
-            th_graph = threading.Thread(target=self.check_graph, args=(file_md_path, knowledge_id, file_id,
-                                                                       title, file_name, permission_level,))
-            THREAD_LIST.append(th_graph)
-            th_graph.start()
-        else:
-            res = {"error_code":0, "error_msg":"Success"}
-            return res
-
-        # th_graph = threading.Thread(target=self.check_graph, args=(file_md_path, knowledge_id, file_id,
-        #                                                            title, file_name, permission_level,))
-        # THREAD_LIST.append(th_graph)
-        # th_graph.start()
-        
-        return {"error_code":0, "error_msg":"Success", "file_id":file_id}
+        context = {"file_md_path": file_md_path, "file_name": file_name,
+                   "title": title, "toc_json": toc_json, "text_len": len(_txt)}
+        return {"error_code":0, "error_msg":"Success", "context":context}
     
     def save_milvus(self, file_id, md_path, knowledge_id, title, toc_json, 
-                    permission_level, embedding, index_params):
-        
-        self.save_toc_info(toc_json, file_id, knowledge_id,
-                            title, embedding, index_params,
-                            permission_level)
+                    permission_level, embedding, index_params, job=None):
+        # 目录与正文块一起批量写入，同一文件的标题只向量化一次
+        final_list = self.split_data(md_path)
+        if(toc_json and len(toc_json) > 0):
+            final_list.insert(0, str(toc_json))
         
-        self.save_text_vector(md_path, file_id, knowledge_id, 
+        self.save_text_chunks(final_list, file_id, knowledge_id,
                               title, embedding, index_params,
-                              permission_level)
+                              permission_level, job=job)
     
     
     def save_text_vector(self, md_path, partition_core, database_core,
-                         title, embedding, index_params, permission_level):
+                         title, embedding, index_params, permission_level, job=None):
         final_list = self.split_data(md_path)
-        for _chunk in final_list:
-            modified_text = _chunk
-            param = {"knowledge_partition": partition_core,
-                     "knowledge_collection":database_core,
-                     "title": title,
-                     "data": modified_text,
-                     "permission_level":permission_level}
+        self.save_text_chunks(final_list, partition_core, database_core,
+                              title, embedding, index_params,
+                              permission_level, job=job)
+    
+    def save_text_chunks(self, chunk_list, partition_core, database_core,
+                         title, embedding, index_params, permission_level, job=None):
+        param = {"knowledge_partition": partition_core,
+                 "knowledge_collection":database_core,
+                 "title": title,
+                 "data": chunk_list,
+                 "permission_level":permission_level}
         
-            self.milvus_obj.add_text(param, embedding, index_params)
+        progress_callback = None
+        if(job):
+            progress_callback = lambda done, total: self.ingest_obj.update_progress(job, "embedding", done, total)
+        self.milvus_obj.add_texts(param, embedding, index_params,
+                                  progress_callback=progress_callback)
         
-            # self.graphiti_obj.save_graph(knowledge_id=database_core, file_id=partition_core, title=title, _txt=modified_text, permission_level=permission_level)
+        # self.graphiti_obj.save_graph(knowledge_id=database_core, file_id=partition_core, title=title, _txt=modified_text, permission_level=permission_level)
     
     def save_toc_info(self, toc_json, partition_core, database_core,
                       title, embedding, index_params, permission_level):
@@ -415,6 +498,7 @@ class CControl():
     
     def check_graph(self, md_file, database_core, partition_core, 
                     title, file, permission_level):
+        """构建并保存图谱，构建失败时删除该文件的全部数据并返回False"""
         graph_path = graph_run(md_file, partition_core)
         # graph_path = os.path.join("lightrag_data", "graph_WWVtiSspiCfwAIsW")
         if(graph_path):
@@ -425,22 +509,21 @@ class CControl():
         
             self.graph_obj.save_graph_info(graph_path, database_core, 
                                            partition_core, file, title)
+            return True
         else:
             self.delete_file_by_file_id(database_core, partition_core)
             # self.delete_graph_by_file_id(partition_core)
             self.delete_milvus_by_file_id(database_core, partition_core)
             self.delete_graph_db_by_file_id(partition_core)
             self.delete_graph_file_id(partition_core)
+            return False
             
     def delete_user(self, param):
-        for t in THREAD_LIST:
-            if t.is_alive():
-                return {"error_code":4, "success": False, "error_msg":"The rag process is running, please try again later."}
-            else:
-                THREAD_LIST.remove(t)
         user_id = param.get("user_id")
         if not user_id:
             return {"error_code": 3, "success": False, "message": "用户ID不能为空"}
+        if self.ingest_obj.has_active_jobs(user_id=user_id):
+            return {"error_code":4, "success": False, "error_msg":"The rag process is running, please try again later."}
 
         # 1. 查询用户的所有知识库
         knowledge_bases = cSingleSqlite.query_knowledge_base_by_user_id({"user_id": user_id})
@@ -500,9 +583,10 @@ class CControl():
         return True
         
     def delete_graph_db_by_file_id(self, file_id):
-        cSingleSqlite.delete_graph_chunk_table(file_id)
-        cSingleSqlite.delete_graph_node_table(file_id)
-        cSingleSqlite.delete_graph_relation_table(file_id)
+        with cSingleSqlite.transaction():
+            cSingleSqlite.delete_graph_chunk_table(file_id)
+            cSingleSqlite.delete_graph_node_table(file_id)
+            cSingleSqlite.delete_graph_relation_table(file_id)
         return True
     
     def delete_graph_file_id(self, file_id):
@@ -512,11 +596,13 @@ class CControl():
             self.graph_obj.delete_node(chunk_id)
 
     def delete_knowledge_base_by_id(self, param):
-        cSingleSqlite.delete_graph_relation_by_knowledge_id(param)
-        cSingleSqlite.delete_graph_node_by_knowledge_id(param)
-        cSingleSqlite.delete_graph_chunk_by_knowledge_id(param)
         knowledge_id = param["knowledge_id"]
-        cSingleSqlite.delete_knowledge_base_by_id(knowledge_id)
+        with cSingleSqlite.transaction():
+            cSingleSqlite.delete_graph_relation_by_knowledge_id(param)
+            cSingleSqlite.delete_graph_node_by_knowledge_id(param)
+            cSingleSqlite.delete_graph_chunk_by_knowledge_id(param)
+            cSingleSqlite.delete_knowledge_base_by_id(knowledge_id)
+        self.response_cache.invalidate_knowledge(knowledge_id)
         
     def delete_file_by_file_id(self, knowledge_id, file_id):
         param = {"file_id":file_id}
@@ -541,10 +627,12 @@ class CControl():
             img_path = os.path.join(IAMGES_PATH, path)
             utils.remove_path(img_path)
 
-        cSingleSqlite.delete_image_file(param)
-        cSingleSqlite.delete_table_data(param)
-        cSingleSqlite.delete_file_basic_info(file_id)
-        cSingleSqlite.delete_file_detail_info(file_id)
+        with cSingleSqlite.transaction():
+            cSingleSqlite.delete_image_file(param)
+            cSingleSqlite.delete_table_data(param)
+            cSingleSqlite.delete_file_basic_info(file_id)
+            cSingleSqlite.delete_file_detail_info(file_id)
+        self.response_cache.invalidate_knowledge(knowledge_id)
 
         # 删除 Elasticsearch 中的相关数据
         try:
@@ -562,14 +650,12 @@ class CControl():
         return True
 
     def delete_all_data(self):
-        for t in THREAD_LIST:
-            if t.is_alive():
-                return {"error_code":4, "error_msg":"The rag process is running, please try again later."}
-            else:
-                THREAD_LIST.remove(t)
+        if self.ingest_obj.has_active_jobs():
+            return {"error_code":4, "error_msg":"The rag process is running, please try again later."}
         self.delete_all_graph()
         self.delete_all_milvus()
         self.delete_all_elasticsearch()
+        self.response_cache.clear()
         # self.graphiti_obj.delete_all_graphiti()
         return {"error_code":0, "error_msg":"SUCCESS"}
     
@@ -585,11 +671,8 @@ class CControl():
 
     def delete_all_graph(self):
         """删除所有图数据"""
-        for t in THREAD_LIST:
-            if t.is_alive():
-                return {"error_code":4, "error_msg":"The rag process is running, please try again later."}
-            else:
-                THREAD_LIST.remove(t)
+        if self.ingest_obj.has_active_jobs():
+            return {"error_code":4, "error_msg":"The rag process is running, please try again later."}
         self.graph_obj.delete_all_graph()
         return {"error_code":0, "error_msg":"SUCCESS"}
 
@@ -711,14 +794,11 @@ class CControl():
         return _content
                 
     def delete_file(self, param):
-        for t in THREAD_LIST:
-            if t.is_alive():
-                return {"error_code":4, "error_msg":"The rag process is running, please try again later."}
-            else:
-                THREAD_LIST.remove(t)
         if("file_id" not in param.keys()):
             return {"error_code":3, "error_msg":"Error, lack of file."}
         file_id = param["file_id"]
+        if self.ingest_obj.has_active_jobs(file_id=file_id):
+            return {"error_code":4, "error_msg":"The rag process is running, please try again later."}
         user_id = param["user_id"]
         #search_param = {"file_id":file_id, "user_id":user_id}
         file_dict = cSingleSqlite.search_file_basic_info_by_file_id(file_id)
@@ -5,6 +5,7 @@ import re
 import json
 import shutil
 import csv
+import html
 import time
 import logging
 import copy
@@ -12,7 +13,8 @@ import uuid
 import threading
 import queue
 import traceback
-from typing import Dict, Any
+from itertools import islice
+from typing import Dict, Any, Iterator
 from datetime import datetime
 
 from bs4 import BeautifulSoup
@@ -30,6 +32,7 @@ from Control.control_milvus import CControl as ControlMilvus
 from Control.control_file import CControl as CFileControl
 from Control.control_graph import CControl as ControlGraph
 from Control.control_search import CControl as ControlSearch
+from Control.control_retrieval import CControl as ControlRetrieval
 # from Control.control_graphiti import CControl as ControlGraphiti
 # from Graphrag.light_rag import run as graph_run
 
@@ -57,17 +60,20 @@ from Config.embedding_config import get_embeddings
 from Config.neo4j_config import is_neo4j_enabled
 from Config.pdf_config import is_pdf_advanced_enabled
 from Config.llm_config import get_chat_tongyi
+from Config.sql_config import get_sql_result_config
 
 # 导入圆桌讨论系统
 from Roles import RoundtableDiscussion
 
 from Utils import utils
+from Utils.response_cache import get_response_cache, make_scope, normalize_question
 
 from Control.control_sessions import CControl as ControlSessions
 from Control.control_sql import CControl as ControlSql
 from Control.control_discussion import DiscussionControl
 # from Sql.vanna_manager import get_vanna_manager
 from Sql.Graph.graph import Graph
+from Db.source_db_export import stream_query_to_csv, new_export_path, cleanup_expired_exports
 
 # from pbox import CodeSandBox
 # sandbox = CodeSandBox()
@@ -100,6 +106,11 @@ class CControl():
         self.sess_obj = ControlSessions()
         self.sql_obj = ControlSql()
         self.discussion_obj = DiscussionControl()
+        self.retrieval_obj = ControlRetrieval()
+        # 服务启动时创建常驻的RAG智能体，请求处理时直接复用
+        self.rag_agents = agentic_rag_run.get_agent_registry()
+        # 进程内共享的问答结果语义缓存
+        self.response_cache = get_response_cache()
     
     def content_list_to_json(self, content_list, file_id):
         _json = json.loads(content_list)
@@ -277,25 +288,29 @@ class CControl():
         query = param.get("query", "")
         if(not query or query.strip() == ""):
             return {"error_code":3, "error_msg":"Error, lack of query."}
-        start_time = time.time()
-        graph_data = self.query_graph_neo4j(param, merge_result=True)
-        end_time = time.time()
-        print(f"Graph query time: {end_time - start_time} seconds")
-        
-        milvus_data = self.query_milvus(param)
-        end_time_2 = time.time()
-        print(f"Milvus query time: {end_time_2 - end_time} seconds")
+        # 图谱与向量检索并发执行，各自超时后跳过，返回已就绪的结果
+        sources = {"graph": (self.query_graph_neo4j, (param, True)),
+                   "vector": (self.query_milvus, (param,))}
+        retrieval, metadata = self.retrieval_obj.run_sources(
+            sources, early_return=self.retrieval_obj.vector_early_return("vector"))
+        print(f"Retrieval time: {metadata['sources']}")
+        graph_data = retrieval["graph"]
+        milvus_data = retrieval["vector"]
         
         result = self.search_obj.search_graph_emb(query, graph_data, milvus_data)
         
         # param = {"query":query, "graph_data":graph_data, "emb_data":milvus_data}
         # result = self.chat_obj.answer_question(param)
         
-        res = {"error_code":0, "error_msg":"Success", "data": result}
+        res = {"error_code":0, "error_msg":"Success", "data": result, "metadata": metadata}
         return res
     
     def chat_with_rag(self, param):
-        """RAG Agentic智能体流式聊天"""
+        """RAG Agentic智能体流式聊天
+
+        相同或相近的问题（同一知识库、同一权限范围）命中问答语义缓存时，直接按SSE数据块回放缓存的回答与来源，
+        未命中时运行完整流程；只有大模型实际生成了回答、且没有走兜底回答或出错时才写入缓存
+        """
         knowledge_id = param.get("knowledge_id")
         user_id = param.get("user_id")
         flag = True
@@ -318,18 +333,55 @@ class CControl():
                 yield {"error_code": 2, "error_msg": "查询内容不能为空"}
                 return
 
+            # 有权限的用户按用户隔离缓存，无权限的用户只能看到公共知识，共用公共范围的缓存
+            scope = make_scope([knowledge_id], f"owner:{user_id}" if flag else "public")
+            query_vector = None
+            if self.retrieval_obj.config.response_cache_enabled:
+                query_vector = self._embed_question(query)
+                cached = self.response_cache.lookup(scope, query, query_vector)
+                if cached:
+                    logger.info(f"问答缓存命中 - knowledge_id: {knowledge_id}, similarity: {cached['similarity']}")
+                    yield from self._replay_cached_response(cached, query)
+                    return
+
             logger.info(f"开始RAG Agentic处理 - knowledge_id: {knowledge_id}, query: {query}")
 
             # 转换聊天历史格式（如果需要）
             chat_history = []  # 暂时为空，后续可以从 param 中提取
             
-            # 获取流式结果，图数据通过三引擎搜索内部获取
+            # 获取流式结果，图数据通过三引擎搜索内部获取，同时记录回答片段与来源用于写入缓存
             chunk_count = 0
+            segments = []
+            sources = []
+            failed = False
+            llm_answered = False
             for chunk in agentic_rag_run.run_rag_agentic_stream(query, knowledge_id, user_id,
                                                                 chat_history,
-                                                                flag):
+                                                                flag,
+                                                                registry=self.rag_agents):
                 chunk_count += 1
+                if isinstance(chunk, dict) and "error_code" in chunk:
+                    failed = True
+                elif agentic_rag_run.is_fallback_chunk(chunk):
+                    failed = True
+                elif isinstance(chunk, dict) and chunk.get("choices"):
+                    if agentic_rag_run.is_answer_chunk(chunk):
+                        llm_answered = True
+                    delta = chunk["choices"][0].get("delta", {})
+                    type_con = delta.get("type", "text")
+                    content = delta.get("content", "")
+                    if type_con == "artifacts":
+                        sources = delta.get("artifacts") or delta.get("search_results") or []
+                    elif content:
+                        if segments and type_con == "text" and segments[-1]["type"] == "text":
+                            segments[-1]["content"] += content
+                        else:
+                            segments.append({"type": type_con, "content": content})
                 yield chunk
+
+            answer = "".join(seg["content"] for seg in segments if seg["type"] == "text")
+            if query_vector is not None and llm_answered and not failed and answer.strip():
+                self.response_cache.store(scope, query, query_vector, answer, sources, segments)
             return
         except Exception as e:
             error_traceback = traceback.format_exc()
@@ -342,6 +394,40 @@ class CControl():
                 "traceback": error_traceback
             }
 
+    # /api/execute_stream_chat 与 /api/chat 共用同一条带缓存的RAG流程
+    chat_rag_stream = chat_with_rag
+
+    def _embed_question(self, query):
+        """计算归一化问题的向量，失败时返回None（只按问题文本精确匹配缓存）"""
+        try:
+            return get_embeddings().embed_query(normalize_question(query))
+        except Exception as e:
+            logger.warning(f"问题向量化失败，问答缓存只按问题文本匹配: {e}")
+            return None
+
+    def _replay_cached_response(self, cached, query):
+        """把缓存的回答按与实时生成相同的数据块格式回放：先发送来源，再分段发送回答，最后发送结束标记"""
+        _id = f"rag_cache_{hash(query)}"
+        if cached["sources"]:
+            yield agentic_rag_run.create_chunk(_id, int(time.time()), default_content="", _type="artifacts",
+                                               search_results=cached["sources"], finish_reason=None)
+        step = self.retrieval_obj.config.response_cache_replay_chars
+        for segment in cached["segments"]:
+            content = segment["content"]
+            if segment["type"] != "text":
+                yield agentic_rag_run.create_chunk(_id, int(time.time()), default_content=content,
+                                                   _type=segment["type"], finish_reason=None)
+                continue
+            for i in range(0, len(content), step):
+                yield agentic_rag_run.create_chunk(_id, int(time.time()), default_content=content[i:i + step],
+                                                   _type="text", finish_reason=None)
+        yield agentic_rag_run.create_chunk(_id, int(time.time()), default_content="", _type="text",
+                                           finish_reason="stop")
+
+    def get_response_cache_stats(self):
+        """获取问答语义缓存的命中率等统计信息"""
+        return self.response_cache.get_stats()
+
     def execute_all_chat(self, param):
         
         logger.info(f"execute_all_chat called with param: {param}")
@@ -1527,17 +1613,16 @@ class CControl():
             if not columns_used:
                 logger.warning("⚠️ 无法从columns_with_description获取列信息，将从SQL执行结果中获取")
                 try:
-                    sql_url = db_info.get("db_host", "")
-                    sql_port = str(db_info.get("db_port", ""))
-                    sql_user = db_info.get("db_user", "")
-                    sql_password = db_info.get("db_password", "")
-                    sql_database = db_info.get("db_name", "")
-                    sql_type = db_info.get("db_type")
-                    conn, _ = self.sql_obj.connect_database(sql_url, sql_port, sql_type, sql_database, sql_user, sql_password)
-                    cursor = conn.cursor()
-                    cursor.execute(sql)
+                    pool = self._get_source_pool(db_info)
+                    conn = pool.acquire()
+                    try:
+                        cursor = conn.cursor()
+                        cursor.execute(sql)
+                        description = cursor.description
+                    finally:
+                        pool.release(conn)
                     
-                    if cursor.description:
+                    if description:
                         col_name_mapping = {}
                         for col in columns_with_description:
                             orig_col = col.get("col_name", "")
@@ -1545,14 +1630,12 @@ class CControl():
                             if orig_col:
                                 col_name_mapping[orig_col.lower()] = col_with_table
                         
-                        for desc in cursor.description:
+                        for desc in description:
                             orig_col_name = desc[0]
                             mapped_col_name = col_name_mapping.get(orig_col_name.lower(), orig_col_name)
                             columns_used.append(mapped_col_name)
                             columns_types.append(desc[1] or "unknown")
                             columns_desc.append(mapped_col_name)
-                    
-                    conn.close()
                 except Exception as e:
                     logger.error(f"⚠️ 获取列信息失败: {e}")
                     columns_desc = ["列1", "列2"]
@@ -1561,7 +1644,7 @@ class CControl():
             logger.info(f"📊 提取到 {len(columns_used)} 个列")
             
             # 执行SQL并保存到CSV
-            file_name = "conf/tmp/sandbox_files/" + uuid.uuid4().hex[:16]
+            file_name = new_export_path(get_sql_result_config().export_dir, user_id)
             read_flag, max_num = self._read_data(sql, db_info, file_name, columns_desc, columns_types)
             
             if not read_flag or max_num == 0:
@@ -1575,13 +1658,17 @@ class CControl():
             
                     # 读取CSV文件并生成HTML表格
             csv_file_path = file_name + ".csv"
-            html_table = self._csv_to_html_table(csv_file_path, max_num, max_rows=10)
+            preview_rows = get_sql_result_config().preview_rows
+            html_table = self._csv_to_html_table(csv_file_path, max_num, max_rows=preview_rows)
             logger.info(f"📊 生成HTML表格: {'成功' if html_table else '失败'}")
             
             # 如果生成了HTML表格，流式返回
             if html_table: 
                 chunk = self._create_chunk(_id, content=html_table, chunk_type="html_table", finish_reason="")
                 yield chunk
+            # 表格只预览前几行，完整结果以文件形式提供下载
+            if max_num > preview_rows:
+                yield self._create_chunk(_id, content=csv_file_path, chunk_type="file", finish_reason="")
             
             # 步骤3: 逻辑计算和解读
             if logical_calculations:
@@ -2296,19 +2383,18 @@ class CControl():
                     logger.warning("⚠️ 无法从columns_with_description获取列信息，将从SQL执行结果中获取")
                     # 先执行SQL获取列信息
                     try:
-                        sql_url = db_info.get("db_host", "")
-                        sql_port = str(db_info.get("db_port", ""))
-                        sql_user = db_info.get("db_user", "")
-                        sql_password = db_info.get("db_password", "")
-                        sql_database = db_info.get("db_name", "")
-                        sql_type = db_info.get("db_type")
-                        conn, _ = self.sql_obj.connect_database(sql_url, sql_port, sql_type, sql_database, sql_user, sql_password)
-                        cursor = conn.cursor()
-                        cursor.execute(sql)
+                        pool = self._get_source_pool(db_info)
+                        conn = pool.acquire()
+                        try:
+                            cursor = conn.cursor()
+                            cursor.execute(sql)
+                            description = cursor.description
+                        finally:
+                            pool.release(conn)
                         
                         # 从cursor.description获取列信息
                         # 尝试从columns_with_description中匹配列名，构建 table.col 格式
-                        if cursor.description:
+                        if description:
                             # 构建列名映射（原始列名 -> table.col）
                             col_name_mapping = {}
                             for col in columns_with_description:
@@ -2317,15 +2403,13 @@ class CControl():
                                 if orig_col:
                                     col_name_mapping[orig_col.lower()] = col_with_table
                             
-                            for desc in cursor.description:
+                            for desc in description:
                                 orig_col_name = desc[0]  # 原始列名
                                 # 尝试映射到 table.col 格式
                                 mapped_col_name = col_name_mapping.get(orig_col_name.lower(), orig_col_name)
                                 columns_used.append(mapped_col_name)  # 使用 table.col 格式的列名
                                 columns_types.append(desc[1] or "unknown")  # 列类型
                                 columns_desc.append(mapped_col_name)  # 使用 table.col 格式作为描述
-                        
-                        conn.close()
                     except Exception as e:
                         logger.error(f"⚠️ 获取列信息失败: {e}")
                         # 如果失败，使用默认值
@@ -2337,7 +2421,7 @@ class CControl():
                 logger.info(f"   - 列类型: {columns_types}")
                 
                 # 执行SQL并保存到CSV
-                file_name = "conf/tmp/sandbox_files/" + uuid.uuid4().hex[:16]
+                file_name = new_export_path(get_sql_result_config().export_dir, user_id)
                 read_flag, max_num = self._read_data(sql, db_info, file_name, columns_desc, columns_types)
                 
                 if not read_flag or max_num == 0:
@@ -2350,13 +2434,17 @@ class CControl():
                     
                     # 读取CSV文件并生成HTML表格
                     csv_file_path = file_name + ".csv"
-                    html_table = self._csv_to_html_table(csv_file_path, max_num, max_rows=10)
+                    preview_rows = get_sql_result_config().preview_rows
+                    html_table = self._csv_to_html_table(csv_file_path, max_num, max_rows=preview_rows)
                     logger.info(f"📊 生成HTML表格: {'成功' if html_table else '失败'}")
                         
                     # 如果生成了HTML表格，流式返回
                     if html_table: 
                         chunk = self._create_chunk(_id, content=html_table, chunk_type="html_table", finish_reason="")
                         yield chunk
+                    # 表格只预览前几行，完整结果以文件形式提供下载
+                    if max_num > preview_rows:
+                        yield self._create_chunk(_id, content=csv_file_path, chunk_type="file", finish_reason="")
 
                     # 逻辑计算
                     if logical_calculations:
@@ -2509,7 +2597,7 @@ class CControl():
 
     def _read_data(self, sql, db_info, file_name, columns_desc, columns_types=None):
         """
-        读取数据库数据并计算统计指标
+        执行查询并把结果分批流式写入CSV（服务端游标 + fetchmany，不在内存中保存完整结果）
         
         Args:
             sql: SQL查询语句
@@ -2521,34 +2609,36 @@ class CControl():
         Returns:
             tuple: (是否成功, 数据行数)
         """        
-        sql_url = db_info.get("db_host", "")
-        sql_port = str(db_info.get("db_port", ""))
-        sql_user = db_info.get("db_user", "")
-        sql_password = db_info.get("db_password", "")
-        sql_database = db_info.get("db_name", "")
-        sql_type = db_info.get("db_type")
-        conn, _ = self.sql_obj.connect_database(sql_url, sql_port, sql_type, sql_database, sql_user, sql_password)      
-        cursor = conn.cursor()
+        result_config = get_sql_result_config()
+        cleanup_expired_exports(result_config.export_dir, result_config.export_ttl)
+        pool = self._get_source_pool(db_info)
+        conn = pool.acquire()
         try:
-            cursor.execute(sql)
+            result = stream_query_to_csv(
+                conn, pool.db_type, sql, file_name + ".csv", columns_desc,
+                batch_size=result_config.fetch_batch_size,
+                preview_rows=result_config.preview_rows,
+                max_rows=result_config.export_max_rows,
+            )
         except Exception as e:
             logger.error(f"执行SQL失败: {e}")
-            if cursor:
-                cursor.close()
+            pool.release(conn)
             return False, 0
-        
-        csv_f = file_name + ".csv"
-        _len = 0
-        with open(csv_f, mode='w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            # 写入表头
-            writer.writerow(columns_desc)
-            # 写入数据行
-            for row in cursor.fetchall():
-                tmp_l = list(row)
-                writer.writerow(tmp_l)
-                _len = _len + 1
-        return True, _len
+        # 截断时服务端游标未读完，连接直接关闭不再复用
+        pool.release(conn, discard=result["truncated"])
+        return True, result["rows"]
+
+    def _get_source_pool(self, db_info):
+        """根据 _get_database_info 返回的连接信息获取数据源连接池"""
+        return self.sql_obj.get_connection_pool(
+            db_info.get("sql_id", ""),
+            db_info.get("db_host", ""),
+            str(db_info.get("db_port", "")),
+            db_info.get("db_type"),
+            db_info.get("db_name", ""),
+            db_info.get("db_user", ""),
+            db_info.get("db_password", ""),
+        )
     
     def statictics_data(self, csv_f, columns_desc, columns_types=None):
         """调用统计函数进行数据分析"""
@@ -2577,9 +2667,35 @@ class CControl():
             logger.error(traceback.format_exc())
             return {}
     
+    def _iter_html_table(self, headers, rows, total_rows, max_rows: int = 50) -> Iterator[str]:
+        """
+        逐段生成HTML表格（单元格内容统一转义），只消费 rows 的前 max_rows 行
+        
+        Args:
+            headers: 表头列表
+            rows: 数据行迭代器
+            total_rows: 数据总行数（用于提示信息）
+            max_rows: 最大显示行数
+        """
+        yield '\n<table style="border-collapse: collapse; width: 100%; font-family: Arial, sans-serif; font-size: 14px;">\n'
+        yield "<thead><tr>"
+        for header in headers:
+            yield f'<th style="border: 1px solid #ddd; padding: 8px; background-color: #f2f2f2; text-align: left;">{html.escape(str(header))}</th>'
+        yield "</tr></thead>\n<tbody>"
+        for row in islice(rows, max_rows):
+            yield "<tr>"
+            for cell in row:
+                cell_str = str(cell) if cell is not None else ""
+                yield f'<td style="border: 1px solid #ddd; padding: 8px;">{html.escape(cell_str)}</td>'
+            yield "</tr>"
+        yield "</tbody>\n</table>\n"
+        # 如果数据超过最大行数，添加提示信息
+        if total_rows > max_rows:
+            yield f'<p style="color: #666; font-size: 12px; margin-top: 10px;">注：数据共 {total_rows} 行，此处仅显示前 {max_rows} 行</p>'
+
     def _csv_to_html_table(self, csv_file_path: str, max_num, max_rows: int = 50) -> str:
         """
-        读取CSV文件并生成HTML表格格式
+        读取CSV文件前 max_rows 行并生成HTML表格格式
         
         Args:
             csv_file_path: CSV文件路径
@@ -2595,7 +2711,7 @@ class CControl():
             
             total_rows = max_num
             
-            with open(csv_file_path, 'r', encoding='utf-8') as f:
+            with open(csv_file_path, 'r', encoding='utf-8', newline='') as f:
                 csv_reader = csv.reader(f)
                 
                 # 读取表头
@@ -2604,38 +2720,7 @@ class CControl():
                     logger.warning(f"CSV文件为空: {csv_file_path}")
                     return ""
                 
-                # 生成表头HTML
-                header_html = "<thead><tr>"
-                for header in headers:
-                    header_html += f'<th style="border: 1px solid #ddd; padding: 8px; background-color: #f2f2f2; text-align: left;">{header}</th>'
-                header_html += "</tr></thead>"
-                # 读取数据行
-                body_html = "<tbody>"
-                for idx, row in enumerate(csv_reader):
-                    if idx < max_rows:
-                        body_html += "<tr>"
-                        for cell in row:
-                            # 转义HTML特殊字符
-                            cell_str = str(cell) if cell is not None else ""
-                            cell_str = cell_str.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
-                            body_html += f'<td style="border: 1px solid #ddd; padding: 8px;">{cell_str}</td>'
-                        body_html += "</tr>"
-                    else:
-                        break
-                
-                body_html += "</tbody>"
-            
-            # 构建完整的HTML表格
-            html_table = f"""
-<table style="border-collapse: collapse; width: 100%; font-family: Arial, sans-serif; font-size: 14px;">
-{header_html}
-{body_html}
-</table>
-"""
-            
-            # 如果数据超过最大行数，添加提示信息
-            if total_rows > max_rows:
-                html_table += f'<p style="color: #666; font-size: 12px; margin-top: 10px;">注：数据共 {total_rows} 行，此处仅显示前 {max_rows} 行</p>'
+                html_table = "".join(self._iter_html_table(headers, csv_reader, total_rows, max_rows))
             
             logger.info(f"✅ HTML表格生成成功: {csv_file_path}，共 {total_rows} 行，显示 {min(max_rows, total_rows)} 行")
             return html_table
@@ -2677,6 +2762,7 @@ class CControl():
             relations = cSingleSqlite.query_rel_sql_by_sql_id(sql_id)
 
             db_info = {
+                "sql_id": sql_id,
                 "db_type": base_sql_info.get("sql_type", "mysql"),
                 "db_name": base_sql_info.get("sql_name", ""),
                 "db_host": base_sql_info.get("ip", ""),
@@ -178,6 +178,45 @@ class CControl():
             logger.error(f"保存文档到 Elasticsearch 失败: {e}")
             return False
 
+    def save_documents_to_elastic(self, knowledge_id: str, user_id: str, permission_level: str,
+                                  items: List[Tuple[str, str, str]], batch_size: int = 500) -> bool:
+        """
+        批量保存文档到 Elasticsearch（文档格式与 save_document_to_elastic 相同，每 batch_size 个文档一次bulk请求）
+
+        Args:
+            knowledge_id: 知识库ID
+            user_id: 用户ID
+            permission_level: 权限级别
+            items: 文档列表 [(file_id, title, content), ...]
+            batch_size: 单次bulk请求的文档数
+
+        Returns:
+            bool: 是否全部保存成功
+        """
+        if not self.enabled:
+            logger.debug("Elasticsearch已禁用，跳过批量保存文档操作")
+            return False
+
+        upload_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        success = True
+        for start in range(0, len(items), batch_size):
+            bulk_docs = []
+            for file_id, title, content in items[start:start + batch_size]:
+                bulk_docs.append((f"{knowledge_id}_{file_id}", {
+                    "knowledge_id": knowledge_id,
+                    "file_id": file_id,
+                    "user_id": user_id,
+                    "permission_level": permission_level,
+                    "title": title,
+                    "content": content,
+                    "upload_time": upload_time,
+                    "content_hash": hashlib.md5(content.encode('utf-8')).hexdigest(),
+                }))
+            if not self.es_db.bulk_index_documents(self.index_name, bulk_docs):
+                success = False
+        logger.info(f"批量保存 {len(items)} 个文档到 Elasticsearch {'成功' if success else '部分失败'}")
+        return success
+
     def save_markdown_content(self, knowledge_id: str, file_id: str,
                              user_id: str, permission_level: str,
                              file_name: str, markdown_content: str,
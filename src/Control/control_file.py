@@ -258,10 +258,23 @@ class CControl():
             conn.commit()
             conn.close()
             logger.info(f"CSV SQLite 数据库已创建: {sqlite_path}")
+            self._build_table_profiles(sqlite_path)
         except Exception as e:
             logger.warning(f"创建 CSV SQLite 数据库失败: {e}")
 
 
+    def _build_table_profiles(self, sqlite_path):
+        """
+        预先计算表格画像向量并保存到 SQLite（_table_profile 表），供智能问数的表格路由使用。
+        失败时只记录日志，查询时会重新计算。
+        """
+        try:
+            from Agent.AgenticRagAgent.table_router import get_table_router
+            if get_table_router().build_profiles(sqlite_path):
+                logger.info(f"表格画像已生成: {sqlite_path}")
+        except Exception as e:
+            logger.warning(f"生成表格画像失败: {e}")
+
     def split_excel_to_csv(self, file_path):
         """
         将Excel文件拆分为多个CSV文件，并为每个sheet生成描述信息。
@@ -466,6 +479,7 @@ class CControl():
                         logger.info(f"SQLite 数据库已保存: {sqlite_path}")
                     except Exception:
                         pass
+                    self._build_table_profiles(sqlite_path)
                 
                 # 写整本 Excel 的目录文件，便于大模型/检索使用
                 try:
@@ -622,6 +636,7 @@ class CControl():
                     logger.info(f"SQLite 数据库已保存: {sqlite_path}")
                 except Exception:
                     pass
+                self._build_table_profiles(sqlite_path)
             
             # 写整本 Excel 的目录文件
             try:
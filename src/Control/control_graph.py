@@ -23,8 +23,11 @@ from Sql.schema_vector import SqlSchemaVectorAgent
 
 # from Utils import utils
 
-BATCH_SIZE_NODES = 500
-BATCH_SIZE_EDGES = 100
+BATCH_SIZE_NODES = 5000
+BATCH_SIZE_EDGES = 5000
+
+# 文件图谱实体结点的标签，结点按 entity_id + file_id 唯一
+ENTITY_LABEL = "Entity"
 
 class CControl():
     
@@ -59,13 +62,13 @@ DELETE n, r;"""
     
     def execute_query(self, param):
         """
-        Cypher查询语句
+        Cypher查询语句，parameters 为可选的查询参数
         """
         if not is_neo4j_enabled():
             return []
             
         cypher_query = param.get("cypher_query", "")
-        return cSingleNeo4j.query(cypher_query)
+        return cSingleNeo4j.query(cypher_query, param.get("parameters"))
     
     
     def delete_sql_graph_data(self, sql_id):
@@ -936,6 +939,11 @@ DELETE n, r;"""
     
     def save_graph(self, graph_result, database_graph_code, 
                    partition_core, file, permission_level):
+        """
+        批量保存LightRAG生成的图谱：
+        Neo4j 按 UNWIND 批量 MERGE 结点与关系（每批一次请求），
+        SQLite 的结点表与关系表在同一事务中 executemany 写入
+        """
         if not is_neo4j_enabled():
             print(f"⚠️ Neo4j已禁用，跳过保存图数据")
             return None
@@ -945,16 +953,23 @@ DELETE n, r;"""
     
         if(graph is None):
             return None
-        node_list = []
+        
+        common = {"file_path": file,
+                  "file_id": partition_core,
+                  "knowledge_id": database_graph_code,
+                  "permission_level": permission_level}
+        
+        # 结点名称 -> entity_id，关系端点直接查表
+        node_ids = {}
+        node_rows = []
+        node_params = []
         for node_id, data in graph.nodes(data=True):
             properties = {k: v for k, v in data.items() if k != 'labels'}
-            properties["file_path"] = file
-            properties["file_id"] = partition_core
-            properties["knowledge_id"] = database_graph_code
-            properties["permission_level"] = permission_level
-            node = cSingleNeo4j.create_node(node_id, **properties)
-            node_list.append(node)
-            param = {
+            properties.update(common)
+            properties.setdefault("entity_id", node_id)
+            node_ids[node_id] = properties["entity_id"]
+            node_rows.append({"entity_id": properties["entity_id"], "props": properties})
+            node_params.append({
                 "knowledge_id": database_graph_code,
                 "file_id": partition_core,
                 "entity_id":node_id,
@@ -963,30 +978,24 @@ DELETE n, r;"""
                 "source_id":properties.get("source_id", ""),
                 "entity_description":properties.get("description", ""),
                 "entity_source_file":file,
-                }
-            
-            cSingleSqlite.insert_node_info(param)
-    
+                })
+        
+        # 关系类型不能作为参数，按类型分组后分别批量写入
+        edge_rows = {}
+        relation_params = []
         for source_id, target_id, data in graph.edges(data=True):
+            if source_id not in node_ids or target_id not in node_ids:
+                continue
             rel_type = data.get('type', 'RELATED_TO')
             properties = {k: v for k, v in data.items() if k != 'type'}
-            properties["file_path"] = file
-            properties["file_id"] = partition_core
-            properties["knowledge_id"] = database_graph_code
-            properties["permission_level"] = permission_level
-            start_node = None
-            end_node = None
-            for node in node_list:
-                node_id = node.get("entity_id", "")
-                if(node_id == source_id):
-                    start_node = node
-                if(node_id == target_id):
-                    end_node = node
-            
-            param = {
+            properties.update(common)
+            edge_rows.setdefault(rel_type, []).append({"start": node_ids[source_id],
+                                                       "end": node_ids[target_id],
+                                                       "props": properties})
+            relation_params.append({
                 "knowledge_id": database_graph_code,
                 "file_id": partition_core,
-                "relation_weight": properties.get("weight", 1.0),
+                "weight": properties.get("weight", 1.0),
                 "description": properties.get("description", ""),
                 "keywords": properties.get("keywords", ""),
                 "relation_source_id": properties.get("source_id", ""),
@@ -994,11 +1003,26 @@ DELETE n, r;"""
                 "start_node": source_id,
                 "end_node": target_id,
                 "relation_type":rel_type
-                }
-            
-            cSingleSqlite.insert_graph_relation(param)
-            
-            cSingleNeo4j.create_relationship(start_node, rel_type, end_node, **properties)
+                })
+        
+        cSingleNeo4j.query(f"CREATE INDEX entity_file_index IF NOT EXISTS FOR (n:{ENTITY_LABEL}) ON (n.entity_id, n.file_id)")
+        cSingleNeo4j.run_batches(f"""UNWIND $rows AS r
+MERGE (n:{ENTITY_LABEL} {{entity_id: r.entity_id, file_id: r.props.file_id}})
+SET n += r.props""", node_rows, BATCH_SIZE_NODES)
+        for rel_type, rows in edge_rows.items():
+            rel_label = rel_type.replace("`", "``")
+            cSingleNeo4j.run_batches(f"""UNWIND $rows AS r
+MATCH (a:{ENTITY_LABEL} {{entity_id: r.start, file_id: r.props.file_id}})
+MATCH (b:{ENTITY_LABEL} {{entity_id: r.end, file_id: r.props.file_id}})
+MERGE (a)-[rel:`{rel_label}`]->(b)
+SET rel += r.props""", rows, BATCH_SIZE_EDGES)
+        
+        with cSingleSqlite.transaction():
+            if not cSingleSqlite.insert_node_info_batch(node_params):
+                raise RuntimeError("批量保存图数据节点失败")
+            if not cSingleSqlite.insert_graph_relation_batch(relation_params):
+                raise RuntimeError("批量保存图数据关系失败")
+        return True
             
     def save_graph_info(self, graph_result, database_graph_code, 
                           partition_core, file, title):
@@ -1009,6 +1033,7 @@ DELETE n, r;"""
         
         if(str_json is None or str_json == ""):
             return None
+        chunk_params = []
         for _chunk in str_json.keys():
             chunk = str_json[_chunk]
             content = chunk["content"]
@@ -1021,8 +1046,10 @@ DELETE n, r;"""
                 "chunk_text": content,
                 "file_name":file
             }
-            
-            cSingleSqlite.insert_graph_chunk(param)
+            chunk_params.append(param)
         
+        with cSingleSqlite.transaction():
+            if not cSingleSqlite.insert_graph_chunk_batch(chunk_params):
+                raise RuntimeError("批量保存图数据chunk失败")
         return True
 
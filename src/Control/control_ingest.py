@@ -0,0 +1,189 @@
+# -*- coding:utf-8 -*-
+
+'''
+文件入库任务队列
+
+任务持久化在SQLite的ingest_job表中，由固定数量的工作线程并发消费。
+任务状态：queued -> parsing -> embedding -> graphing -> done / failed
+失败后按指数退避重新排队，重试时从第一个未完成的阶段继续。
+'''
+
+import logging
+import threading
+import time
+import traceback
+
+from Db.sqlite_db import cSingleSqlite, INGEST_STAGES
+from Config.ingest_config import get_ingest_config
+from Utils import utils
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+STATUS_QUEUED = "queued"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# 按执行顺序排列的处理阶段，每个阶段名同时也是任务处于该阶段时的状态
+STAGES = list(INGEST_STAGES)
+
+
+class CControl():
+
+    def __init__(self):
+        ingest_config = get_ingest_config()
+        self.worker_num = ingest_config.get_worker_num()
+        self.max_retries = ingest_config.get_max_retries()
+        self.get_retry_delay = ingest_config.get_retry_delay
+        self.poll_interval = ingest_config.poll_interval
+
+        self.handler = None
+        self.workers = []
+        self.claim_lock = threading.Lock()
+        self.cond = threading.Condition()
+        self.stop_event = threading.Event()
+
+    def start(self, handler):
+        """
+        启动工作线程
+        :param handler: 任务处理函数，签名为 handler(job)，返回 {"error_code":..., "error_msg":...}；
+                        返回非0错误码表示任务失败且不重试，抛出异常表示可重试的失败
+        """
+        if self.workers:
+            return
+        self.handler = handler
+        # 进程重启后，把中断在处理中的任务重新排队，由已完成阶段处继续
+        reset_num = cSingleSqlite.reset_running_ingest_jobs()
+        if reset_num:
+            logger.info(f"重新排队 {reset_num} 个未完成的入库任务")
+        for i in range(self.worker_num):
+            th = threading.Thread(target=self._worker_loop, name=f"ingest-worker-{i}", daemon=True)
+            self.workers.append(th)
+            th.start()
+        logger.info(f"入库队列已启动，工作线程数: {self.worker_num}")
+
+    def stop(self, timeout=None):
+        """停止工作线程（正在处理的任务会执行完当前阶段）"""
+        self.stop_event.set()
+        with self.cond:
+            self.cond.notify_all()
+        for th in self.workers:
+            th.join(timeout)
+        self.workers = []
+        self.stop_event.clear()
+
+    def submit(self, param):
+        """
+        提交入库任务
+        :param param: 任务参数，需包含 knowledge_id、file_id、user_id
+        :return: job_id，入队失败返回None
+        """
+        job_id = "job_" + utils.generate_secure_string(length=16)
+        job = {"job_id": job_id,
+               "knowledge_id": param.get("knowledge_id", ""),
+               "file_id": param.get("file_id", ""),
+               "user_id": param.get("user_id", ""),
+               "max_retries": self.max_retries,
+               "payload": param}
+        if not cSingleSqlite.insert_ingest_job(job):
+            return None
+        with self.cond:
+            self.cond.notify()
+        return job_id
+
+    def get_job(self, job_id):
+        """查询任务状态（不返回内部中间结果）"""
+        job = cSingleSqlite.query_ingest_job_by_job_id(job_id)
+        if job:
+            job.pop("context", None)
+        return job
+
+    def list_jobs(self, knowledge_id, user_id):
+        """查询知识库下用户提交的任务列表"""
+        jobs = cSingleSqlite.query_ingest_jobs_by_knowledge_id(knowledge_id, user_id)
+        for job in jobs:
+            job.pop("context", None)
+        return jobs
+
+    def has_active_jobs(self, user_id=None, file_id=None):
+        """是否存在排队或处理中的任务"""
+        return cSingleSqlite.count_active_ingest_jobs(user_id=user_id, file_id=file_id) > 0
+
+    def has_active_file(self, user_id, file_name):
+        """用户是否有同名文件仍在排队或处理中"""
+        return cSingleSqlite.has_active_ingest_file(user_id, file_name)
+
+    def stage_started(self, job, stage):
+        """该阶段此前是否已开始过（可能留下了部分数据），与重试次数无关，进程重启后重新排队的任务同样适用"""
+        return stage in job["context"].get("started_stages", [])
+
+    def enter_stage(self, job, stage):
+        """任务进入某个处理阶段，并持久化记录该阶段已开始"""
+        job["status"] = stage
+        job["progress"].setdefault(stage, {"done": 0, "total": 0})
+        started = job["context"].setdefault("started_stages", [])
+        if stage not in started:
+            started.append(stage)
+        cSingleSqlite.update_ingest_job(job["job_id"], status=stage, progress=job["progress"],
+                                        context=job["context"])
+
+    def update_progress(self, job, stage, done, total):
+        """更新某个阶段的进度"""
+        job["progress"][stage] = {"done": done, "total": total}
+        cSingleSqlite.update_ingest_job(job["job_id"], progress=job["progress"])
+
+    def complete_stage(self, job, stage, context=None):
+        """
+        标记阶段完成，并保存后续阶段需要的中间结果；重试时已完成的阶段会被跳过
+        """
+        if context:
+            job["context"].update(context)
+        completed = job["context"].setdefault("completed_stages", [])
+        if stage not in completed:
+            completed.append(stage)
+        progress = job["progress"].setdefault(stage, {"done": 0, "total": 0})
+        if progress["total"] == 0:
+            progress["done"] = progress["total"] = 1
+        cSingleSqlite.update_ingest_job(job["job_id"], progress=job["progress"], context=job["context"])
+
+    def _worker_loop(self):
+        while not self.stop_event.is_set():
+            with self.claim_lock:
+                job = cSingleSqlite.claim_next_ingest_job()
+            if job is None:
+                with self.cond:
+                    self.cond.wait(self.poll_interval)
+                continue
+            self._run_job(job)
+
+    def _run_job(self, job):
+        job_id = job["job_id"]
+        logger.info(f"开始处理入库任务 {job_id}，文件: {job['file_id']}，第 {job['retries']} 次重试")
+        try:
+            res = self.handler(job)
+        except Exception as e:
+            logger.error(f"入库任务 {job_id} 在阶段 {job['status']} 出错: {e}")
+            logger.error(traceback.format_exc())
+            if job["retries"] < job["max_retries"]:
+                # 退避等待期间任务不会被取出，避免下游故障时立即重复失败
+                delay = self.get_retry_delay(job["retries"])
+                cSingleSqlite.update_ingest_job(job_id, status=STATUS_QUEUED,
+                                                retries=job["retries"] + 1,
+                                                error_msg=f"{job['status']}: {e}",
+                                                not_before=time.time() + delay)
+                logger.info(f"入库任务 {job_id} 将在 {delay:.1f} 秒后重试")
+                if delay <= 0:
+                    with self.cond:
+                        self.cond.notify()
+            else:
+                cSingleSqlite.update_ingest_job(job_id, status=STATUS_FAILED,
+                                                error_msg=f"{job['status']}: {e}")
+            return
+
+        if res and res.get("error_code", 0) != 0:
+            logger.warning(f"入库任务 {job_id} 失败: {res.get('error_msg', '')}")
+            cSingleSqlite.update_ingest_job(job_id, status=STATUS_FAILED,
+                                            error_msg=res.get("error_msg", ""))
+        else:
+            cSingleSqlite.update_ingest_job(job_id, status=STATUS_DONE, error_msg="")
+            logger.info(f"入库任务 {job_id} 处理完成")
@@ -18,6 +18,7 @@ from pymilvus import WeightedRanker
 
 from Db.milvus_db import MilvusService
 from Config.milvus_config import is_milvus_enabled
+from Config.embedding_config import get_embedding_batch_size, remember_embedding_dimension
 import logging
 # from Db.splite_db import cSingleSqlite
 
@@ -48,24 +49,82 @@ class CControl():
         database_code = param["knowledge_collection"]
         permission_level = param["permission_level"]
         emb = embedding
-        dim = len(emb.embed_query("foo"))
-        schema = self.get_schema(dim)
         doc_id = param.get("doc_id", 1)
         # query_params = {"knowledge_collection":database_code, "knowledge_partition":partition_code}
         
+        # 先计算需要写入的向量，集合不存在时直接用其长度作为维度，不再额外探测
+        docs_embeddings = emb.embed_query(data)
+        title_embedding = emb.embed_query(title)
+        self.ensure_partition(database_code, partition_code, len(docs_embeddings), index_params)
+        self.insert_data_to_partition(database_code, partition_code, title, 
+                                      data, permission_level, emb, doc_id,
+                                      docs_embeddings=docs_embeddings,
+                                      title_embedding=title_embedding)
+
+    def add_texts(self, param, embedding, index_params, batch_size=None, progress_callback=None):
+        """
+        批量写入同一文件的多个文本块
+        标题只向量化一次，文本块按batch_size分批调用embed_documents，每批一次列式insert
+        
+        Args:
+            param: 与add_text相同，但"data"为文本块列表
+            embedding: 向量模型实例
+            index_params: 新建集合时使用的索引参数
+            batch_size: 单批文本块数量，默认读取EMBEDDING_BATCH_SIZE
+            progress_callback: 每批写入后回调 progress_callback(已写入数, 总数)
+            
+        Returns:
+            int: 写入的文本块数量
+        """
+        if not self.enabled:
+            logger.debug("Milvus已禁用，跳过批量添加文本操作")
+            return 0
+        
+        partition_code = param["knowledge_partition"]
+        database_code = param.get("knowledge_collection", "default")
+        title = param["title"]
+        permission_level = param["permission_level"]
+        doc_id = param.get("doc_id", 1)
+        # embed_documents会丢弃空文本，提前过滤以保证向量与文本一一对应
+        chunks = [_chunk for _chunk in param["data"] if _chunk and _chunk.strip()]
+        if not chunks:
+            return 0
+        if batch_size is None:
+            batch_size = get_embedding_batch_size()
+        
+        title_embedding = embedding.embed_query(title)
+        self.ensure_partition(database_code, partition_code, len(title_embedding), index_params)
+        
+        total = len(chunks)
+        for start in range(0, total, batch_size):
+            batch = chunks[start:start + batch_size]
+            docs_embeddings = embedding.embed_documents(batch)
+            if len(docs_embeddings) != len(batch):
+                raise ValueError(f"向量数量({len(docs_embeddings)})与文本块数量({len(batch)})不一致")
+            n = len(batch)
+            batched_entities = [
+                [doc_id] * n,
+                [title] * n,
+                batch,
+                [title_embedding] * n,
+                docs_embeddings,
+                [permission_level] * n,
+            ]
+            self.milvus_service.insert(database_code, batched_entities, partition_code)
+            if progress_callback:
+                progress_callback(start + n, total)
+        return total
+
+    def ensure_partition(self, database_code, partition_code, dim, index_params):
+        """确保集合与分区存在，不存在时按向量维度创建（存在性由MilvusService缓存，不重复请求）"""
         if(self.milvus_service.has_collection(database_code)):
             if(self.milvus_service.has_partition(database_code, partition_code) == False):
                 self.milvus_service.create_partition(database_code, partition_code)
-                self.insert_data_to_partition(database_code, partition_code, title, 
-                                              data, permission_level, emb, doc_id)
-            else:
-                self.insert_data_to_partition(database_code, partition_code, title, 
-                                              data, permission_level, emb, doc_id)
         else:
+            remember_embedding_dimension(dim)
+            schema = self.get_schema(dim)
             self.milvus_service.create_collection(database_code, schema, index_params)
             self.milvus_service.create_partition(database_code, partition_code)
-            self.insert_data_to_partition(database_code, partition_code, title, 
-                                          data, permission_level, emb, doc_id)
 
     def get_schema(self, dim):
         fields = [
@@ -81,9 +140,12 @@ class CControl():
         return schema
 
     def insert_data_to_partition(self, database_code, partition_code, title, 
-                                 _txt, permission_level, embeddings, doc_id=1):
-            docs_embeddings = embeddings.embed_query(_txt)
-            title_embedding = embeddings.embed_query(title)
+                                 _txt, permission_level, embeddings, doc_id=1,
+                                 docs_embeddings=None, title_embedding=None):
+            if docs_embeddings is None:
+                docs_embeddings = embeddings.embed_query(_txt)
+            if title_embedding is None:
+                title_embedding = embeddings.embed_query(title)
             batched_entities = [
                 [doc_id],
                 [title],
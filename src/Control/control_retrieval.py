@@ -0,0 +1,199 @@
+# -*- coding:utf-8 -*-
+
+'''
+多路检索并发执行
+
+各检索源（图谱、向量等）提交到进程内共享的线程池并发执行，每个检索源有独立的截止时间；
+超时或出错的检索源被跳过，返回已就绪的部分结果，并在元数据中记录各检索源的状态。
+'''
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from Config.retrieval_config import get_retrieval_config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+STATUS_OK = "ok"
+STATUS_TIMEOUT = "timeout"
+STATUS_ERROR = "error"
+STATUS_EARLY_RETURN = "early_return"
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+class InstrumentedExecutor():
+    """
+    带运行统计的有界线程池
+    记录提交、排队、运行中、完成、失败、取消与超时的任务数，以及运行中任务数的峰值
+    """
+
+    def __init__(self, max_workers, thread_name_prefix):
+        self.max_workers = max_workers
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.lock = threading.Lock()
+        self.stats = {"submitted": 0, "running": 0, "peak_running": 0, "completed": 0,
+                      "failed": 0, "cancelled": 0, "timeout": 0}
+
+    def submit(self, func, *args, **kwargs):
+        with self.lock:
+            self.stats["submitted"] += 1
+        future = self.pool.submit(self._run, func, args, kwargs)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _run(self, func, args, kwargs):
+        with self.lock:
+            self.stats["running"] += 1
+            self.stats["peak_running"] = max(self.stats["peak_running"], self.stats["running"])
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.stats["running"] -= 1
+
+    def _on_done(self, future):
+        with self.lock:
+            if future.cancelled():
+                self.stats["cancelled"] += 1
+            elif future.exception() is not None:
+                self.stats["failed"] += 1
+            else:
+                self.stats["completed"] += 1
+
+    def record_timeout(self):
+        with self.lock:
+            self.stats["timeout"] += 1
+
+    def get_stats(self):
+        """获取运行统计，queued为已提交但尚未开始运行的任务数"""
+        with self.lock:
+            stats = dict(self.stats)
+        finished = stats["completed"] + stats["failed"] + stats["cancelled"]
+        stats["queued"] = max(0, stats["submitted"] - finished - stats["running"])
+        stats["max_workers"] = self.max_workers
+        return stats
+
+
+def _get_executor(name, max_workers):
+    executor = _executors.get(name)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = InstrumentedExecutor(max_workers, thread_name_prefix=name)
+                _executors[name] = executor
+    return executor
+
+
+def get_retrieval_executor():
+    """获取共享的检索线程池（进程内只创建一次）"""
+    return _get_executor("retrieval", get_retrieval_config().get_worker_num())
+
+
+def get_search_engine_executor():
+    """
+    获取意图搜索四引擎共享的线程池（进程内只创建一次）
+    与检索线程池分开，避免外层检索任务占满线程后内层引擎任务无线程可用
+    """
+    return _get_executor("search-engine", get_retrieval_config().engine_worker_num)
+
+
+def get_table_query_executor():
+    """获取智能问数按文件并发查询的线程池（进程内只创建一次），由智能问数引擎内部提交任务"""
+    return _get_executor("table-query", get_retrieval_config().table_query_worker_num)
+
+
+class CControl():
+
+    def __init__(self, executor=None):
+        self.config = get_retrieval_config()
+        self.executor = executor or get_retrieval_executor()
+
+    def run_sources(self, sources, timeouts=None, defaults=None, early_return=None):
+        """
+        并发执行多个检索源
+
+        :param sources: {名称: (函数, 参数元组)}
+        :param timeouts: {名称: 超时秒数}，缺省使用配置中的超时
+        :param defaults: {名称: 被跳过时使用的结果}，缺省为 []
+        :param early_return: 函数 early_return(名称, 结果)，返回True时不再等待其余检索源
+        :return: (结果字典, 元数据)，元数据包含各检索源的状态、耗时以及被跳过的检索源列表
+        """
+        timeouts = timeouts or self.config.get_timeouts()
+        defaults = defaults or {}
+        start_time = time.time()
+
+        futures = {}
+        for name, (func, args) in sources.items():
+            futures[self.executor.submit(func, *args)] = name
+        deadlines = {name: start_time + timeouts.get(name, max(timeouts.values()))
+                     for name in sources}
+
+        results = {}
+        status = {}
+        pending = set(futures)
+        while pending:
+            now = time.time()
+            # 已超过截止时间的检索源直接跳过
+            for future in [f for f in pending if deadlines[futures[f]] <= now]:
+                pending.discard(future)
+                future.cancel()
+                self.executor.record_timeout()
+                status[futures[future]] = {"status": STATUS_TIMEOUT, "elapsed": round(now - start_time, 3)}
+                logger.warning(f"检索源 {futures[future]} 超过 {timeouts.get(futures[future])} 秒未返回，已跳过")
+            if not pending:
+                break
+
+            next_deadline = min(deadlines[futures[f]] for f in pending)
+            done, pending = wait(pending, timeout=max(0.0, next_deadline - time.time()),
+                                 return_when=FIRST_COMPLETED)
+            stop = False
+            for future in done:
+                name = futures[future]
+                elapsed = round(time.time() - start_time, 3)
+                try:
+                    results[name] = future.result()
+                    status[name] = {"status": STATUS_OK, "elapsed": elapsed}
+                except Exception as e:
+                    logger.error(f"检索源 {name} 执行失败: {e}")
+                    status[name] = {"status": STATUS_ERROR, "elapsed": elapsed, "error_msg": str(e)}
+                    continue
+                if early_return is not None and early_return(name, results[name]):
+                    stop = True
+            if stop and pending:
+                for future in pending:
+                    future.cancel()
+                    status[futures[future]] = {"status": STATUS_EARLY_RETURN,
+                                               "elapsed": round(time.time() - start_time, 3)}
+                pending = set()
+
+        for name in sources:
+            if name not in results:
+                results[name] = defaults.get(name, [])
+        metadata = {"sources": status,
+                    "skipped": [name for name in sources if status[name]["status"] != STATUS_OK],
+                    "elapsed": round(time.time() - start_time, 3)}
+        return results, metadata
+
+    def vector_early_return(self, name="vector"):
+        """
+        生成提前返回判断函数：指定检索源中得分不低于阈值的结果数达到配置数量时返回True；
+        配置数量为0时不提前返回
+        """
+        hits = self.config.early_return_hits
+        score = self.config.early_return_score
+        if hits <= 0:
+            return None
+
+        def check(source_name, result):
+            if source_name != name or not isinstance(result, list):
+                return False
+            good = [item for item in result
+                    if isinstance(item, dict) and (item.get("score") or 0) >= score]
+            return len(good) >= hits
+        return check
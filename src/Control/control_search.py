@@ -461,107 +461,66 @@ class CControl():
             else:
                 return []
         
-        # 执行 Cypher 查询
-        graph_data = []
-        for entity in entity_list:
-            if flag:
-                cypher_query = """MATCH (start_node {entity_id: '"""+entity+"""'})-[relation]-(end_node) RETURN start_node, relation, end_node"""
-            else:
-                cypher_query = """MATCH (start_node {entity_id: '"""+entity+"""', permission_level: 'public'})-[relation]-(end_node {permission_level: 'public'}) RETURN start_node, relation, end_node"""
-            cypher_result = {"cypher_query": cypher_query}
-            if "cypher_query" in cypher_result.keys():
-                cypher_query = cypher_result["cypher_query"]
-                query_dict = {"cypher_query": cypher_query}
-                results = self.graph_obj.execute_query(query_dict)
-                
-                tmp_list = []
-                for _item in results:
-                    _tm_d = {}
-                    s_node = _item.get("start_node")
-                    s_node_d = {}
-                    s_node_d["entity_name"] = s_node.get("entity_id", "")
-                    s_node_d["entity_type"] = s_node.get("entity_type", "")
-                    s_node_d["description"] = s_node.get("description", "")
-                    s_node_d["file"] = s_node.get("file_path", "")
-                    s_node_d["created_at"] = s_node.get("created_at", "")
-                    s_node_d["source_id"] = s_node.get("source_id", "")
-                    
-                    if "source_id" in s_node_d.keys():
-                        chunk_param = {"chunk_id": s_node_d["source_id"],
-                                 "knowledge_id": knowledge_id}
-                        chunk_list = []
-                        if "<SEP>" in s_node_d["source_id"]:
-                            source_id_lt = s_node_d["source_id"].split("<SEP>")
-                            for source_id in source_id_lt:
-                                chunk_param = {"chunk_id": source_id,
-                                     "knowledge_id": knowledge_id}
-                                chunk_lt = cSingleSqlite.query_graph_chunk_by_chunk_id_and_knowledge_id(chunk_param)
-                                for _ch in chunk_lt:
-                                    chunk_list.append(_ch)
-                        else:
-                            chunk_list = cSingleSqlite.query_graph_chunk_by_chunk_id_and_knowledge_id(chunk_param) 
-                        s_node_d["chunks"] = [chunk["chunk_text"] for chunk in chunk_list]
-                        s_node_d["titles"] = [chunk["chunk_summary"] for chunk in chunk_list]
-                       
-                        s_node_d.pop("source_id")
-                    
-                    if "created_at" in s_node_d.keys():
-                        s_node_d.pop("created_at")
-                    _tm_d["start_node"] = s_node_d
-                    
-                    r_node = _item.get("relation")
-                    r_node_d = {}
-                    r_node_d["description"] = r_node.get("description", "")
-                    r_node_d["keywords"] = r_node.get("keywords", "")
-                    r_node_d["file_path"] = r_node.get("file_path", "")
-                    r_node_d["source_id"] = r_node.get("source_id", "")
-                    r_node_d["weight"] = r_node.get("weight", 1.0)
-                    if "source_id" in r_node_d.keys():
-                        r_node_d.pop("source_id")
-                    _tm_d["relation"] = r_node_d
-                    
-                    e_node = _item.get("end_node")
-                    e_node_d = {}
-                    e_node_d["entity_name"] = e_node.get("entity_id", "")
-                    e_node_d["entity_type"] = e_node.get("entity_type", "")
-                    e_node_d["description"] = e_node.get("description", "")
-                    e_node_d["file"] = e_node.get("file_path", "")
-                    e_node_d["created_at"] = e_node.get("created_at", "")
-                    e_node_d["source_id"] = e_node.get("source_id", "")
-                    if "source_id" in e_node_d.keys():
-                        
-                        chunk_param = {"chunk_id": e_node_d["source_id"],
-                                 "knowledge_id": knowledge_id}
-                        chunk_list = []
-                        if "<SEP>" in e_node_d["source_id"]:
-                            source_id_lt = e_node_d["source_id"].split("<SEP>")
-                            for source_id in source_id_lt:
-                                chunk_param = {"chunk_id": source_id,
-                                     "knowledge_id": knowledge_id}
-                                chunk_lt = cSingleSqlite.query_graph_chunk_by_chunk_id_and_knowledge_id(chunk_param)
-                                for _ch in chunk_lt:
-                                    chunk_list.append(_ch)
-                        else:
-                            chunk_list = cSingleSqlite.query_graph_chunk_by_chunk_id_and_knowledge_id(chunk_param)
-                        
-                        e_node_d["chunks"] = [chunk["chunk_text"] for chunk in chunk_list]
-                        e_node_d["titles"] = [chunk["chunk_summary"] for chunk in chunk_list]
-                        
-                        e_node_d.pop("source_id")
-                        
-                    if "created_at" in e_node_d.keys():
-                        e_node_d.pop("created_at")
-                    _tm_d["end_node"] = e_node_d
-                    
-                    tmp_list.append(_tm_d)
-                if len(tmp_list) > 0:
-                    graph_data.append(tmp_list)
+        # 所有实体合并为一次参数化 Cypher 查询
+        if flag:
+            cypher_query = """UNWIND $names AS name
+MATCH (start_node {entity_id: name})-[relation]-(end_node)
+RETURN name, start_node, relation, end_node"""
+        else:
+            cypher_query = """UNWIND $names AS name
+MATCH (start_node {entity_id: name, permission_level: 'public'})-[relation]-(end_node {permission_level: 'public'})
+RETURN name, start_node, relation, end_node"""
+        names = list(dict.fromkeys(entity_list))
+        query_dict = {"cypher_query": cypher_query, "parameters": {"names": names}}
+        results = self.graph_obj.execute_query(query_dict)
+        
+        # 收集全部结点的chunk_id，去重后一次批量查询
+        chunk_ids = []
+        for _item in results:
+            for node_key in ("start_node", "end_node"):
+                source_id = _item.get(node_key).get("source_id", "")
+                if source_id:
+                    chunk_ids.extend(source_id.split("<SEP>"))
+        chunk_map = cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, chunk_ids) if chunk_ids else {}
+        
+        # 按实体顺序分组，与逐个实体查询时的结果结构一致
+        grouped = {name: [] for name in names}
+        for _item in results:
+            _tm_d = {}
+            _tm_d["start_node"] = self._graph_node_to_dict(_item.get("start_node"), chunk_map)
+            
+            r_node = _item.get("relation")
+            r_node_d = {}
+            r_node_d["description"] = r_node.get("description", "")
+            r_node_d["keywords"] = r_node.get("keywords", "")
+            r_node_d["file_path"] = r_node.get("file_path", "")
+            r_node_d["weight"] = r_node.get("weight", 1.0)
+            _tm_d["relation"] = r_node_d
+            
+            _tm_d["end_node"] = self._graph_node_to_dict(_item.get("end_node"), chunk_map)
+            grouped.setdefault(_item.get("name"), []).append(_tm_d)
+        
+        graph_data = [tmp_list for tmp_list in grouped.values() if len(tmp_list) > 0]
                     
         if not merge_result:
             return {"error_code": 0, "error_msg": "Success", "data": graph_data}
         else:
             return graph_data
     
+    def _graph_node_to_dict(self, node, chunk_map):
+        """图结点转换为结果字典，source_id 对应的chunk从批量查询结果中取"""
+        node_d = {}
+        node_d["entity_name"] = node.get("entity_id", "")
+        node_d["entity_type"] = node.get("entity_type", "")
+        node_d["description"] = node.get("description", "")
+        node_d["file"] = node.get("file_path", "")
+        chunk_list = []
+        for source_id in node.get("source_id", "").split("<SEP>"):
+            chunk_list.extend(chunk_map.get(source_id, []))
+        node_d["chunks"] = [chunk["chunk_text"] for chunk in chunk_list]
+        node_d["titles"] = [chunk["chunk_summary"] for chunk in chunk_list]
+        return node_d
+    
     def search_graph_data(self, param: Dict[str, Any]) -> List[Dict[str, Any]]:
         """在图数据中搜索相关内容，并计算相关性分数
         
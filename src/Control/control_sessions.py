@@ -8,38 +8,74 @@ class CControl():
     def __init__(self):
         self.client = cRedisDB.client
 
-    def get_sessions_by_user_id(self, user_id):
+    def get_sessions_by_user_id(self, user_id, page=1, page_size=20, session_lt=None):
         """
-        从会话中获取用户信息
+        分页获取用户的会话列表（按最后更新时间倒序，只读取会话摘要，不加载聊天记录）
+        Redis不可用时根据SQLite中的会话表按创建时间倒序分页（无最后一条消息预览与消息条数）
+        :param user_id: 用户ID
+        :param page: 页码，从1开始
+        :param page_size: 每页条数
+        :param session_lt: 已查询的SQLite会话列表（可选，未提供时按需查询）
+        :return: {"total": 会话总数, "page": 页码, "page_size": 每页条数,
+                  "sessions": [{"session_id", "session_name", "last_message", "updated_at", "message_count"}, ...]}
         """
-        session_id_lt = cSingleSqlite.search_session_by_user_id(user_id)
-        user_sessions = {}
-        for session_info in session_id_lt:
-            session_id = session_info["session_id"]
-            session_name = session_info["session_name"]
-            session = cRedisDB.get_chat_history_by_session_id(session_id)
-            if session:
-                tmp_d = {}
-                tmp_d["session"] = session
-                tmp_d["session_name"] = session_name
-                user_sessions[session_id] = tmp_d
-                
-        return user_sessions
+        page = max(1, int(page))
+        page_size = max(1, int(page_size))
+        offset = (page - 1) * page_size
+        summaries = cRedisDB.get_session_summaries(user_id, offset, page_size)
+        if summaries is not None and not summaries["indexed"]:
+            # 摘要功能上线前写入的会话：首次访问时根据已有聊天记录补建摘要与索引
+            if session_lt is None:
+                session_lt = cSingleSqlite.search_session_by_user_id(user_id)
+            if cRedisDB.rebuild_session_summaries(user_id, session_lt) or not session_lt:
+                summaries = cRedisDB.get_session_summaries(user_id, offset, page_size)
+            else:
+                summaries = None
+        if summaries is None:
+            if session_lt is None:
+                session_lt = cSingleSqlite.search_session_by_user_id(user_id)
+            return self._get_sessions_from_sqlite(session_lt, page, page_size)
+
+        sessions = []
+        for summary in summaries["sessions"]:
+            sessions.append({
+                "session_id": summary["session_id"],
+                "session_name": summary["title"],
+                "last_message": summary["preview"],
+                "updated_at": summary["updated_at"],
+                "message_count": summary["count"],
+            })
+        return {"total": summaries["total"], "page": page, "page_size": page_size, "sessions": sessions}
+
+    @staticmethod
+    def _get_sessions_from_sqlite(session_lt, page, page_size):
+        """Redis不可用时的会话列表：按会话创建时间倒序分页"""
+        ordered = sorted(session_lt, key=lambda session: cRedisDB._parse_time(session.get("session_create_time")),
+                         reverse=True)
+        offset = (page - 1) * page_size
+        sessions = []
+        for session in ordered[offset:offset + page_size]:
+            sessions.append({
+                "session_id": session["session_id"],
+                "session_name": session["session_name"],
+                "last_message": "",
+                "updated_at": cRedisDB._parse_time(session.get("session_create_time")),
+                "message_count": 0,
+            })
+        return {"total": len(ordered), "page": page, "page_size": page_size, "sessions": sessions}
     
     def delete_session_by_id(self, user_id):
-        session_id_lt = cSingleSqlite.search_session_by_user_id(user_id)
-        for session_info in session_id_lt:
-            session_id = session_info["session_id"]
-            cRedisDB.delete_user_session(session_id)
+        session_id_lt = [session_info["session_id"] for session_info in cSingleSqlite.search_session_by_user_id(user_id)]
+        cRedisDB.delete_user_chat_histories(user_id, session_id_lt)
         cSingleSqlite.delete_sessions_by_user_id(user_id)
             
     def delete_session_messages_by_id(self, session_id):
         """
-        删除会话消息
+        删除会话消息（聊天记录、会话摘要及用户会话索引中的条目）
         :param session_id: 会话ID
         :return: 删除结果
         """
-        return cRedisDB.delete_user_session(session_id)
+        return cRedisDB.delete_chat_history(session_id)
 
     def get_session_messages_by_id(self, session_id):
         """
@@ -96,12 +132,14 @@ class CControl():
         :param response: 系统回复，格式为 [{"type":"text/echarts/html_table", "content":"..."}] 或字符串（兼容旧格式）
         :return: 保存结果
         """
-        session = cSingleSqlite.search_session_by_session_id(session_id)
-        if session:
-            session_name = session["session_name"]
-        else:
-            param = {"user_id":user_id, "session_id": session_id, "session_name": session_name}
-            cSingleSqlite.save_session_info(param)
+        # 查询与新建会话在一个事务内完成，避免并发保存时重复创建会话
+        with cSingleSqlite.transaction():
+            session = cSingleSqlite.search_session_by_session_id(session_id)
+            if session:
+                session_name = session["session_name"]
+            else:
+                param = {"user_id":user_id, "session_id": session_id, "session_name": session_name}
+                cSingleSqlite.save_session_info(param)
         
         # 处理 query 参数：如果是字符串，转换为列表格式；如果是列表，直接使用
         if isinstance(query, str):
@@ -124,7 +162,7 @@ class CControl():
             "query": query_formatted,
             "response": response_formatted
         }
-        return cRedisDB.save_chat_history(session_id, chat_record)
+        return cRedisDB.save_chat_history(session_id, chat_record, user_id=user_id, session_name=session_name)
 
     def delete_user_session(self, session_id):
         """
@@ -152,7 +190,11 @@ class CControl():
         :return: 保存结果
         """
         param = {"user_id":user_id, "session_id": session_id, "session_name": session_name, "knowledge_name": knowledge_name}
-        return cSingleSqlite.save_session_info(param)
+        flag = cSingleSqlite.save_session_info(param)
+        if flag:
+            # 登记到会话列表索引，尚未对话的新会话也能被分页列出
+            cRedisDB.register_session(user_id, session_id, session_name)
+        return flag
 
     def update_last_chat_record(self, session_id, updated_query=None, updated_response=None):
         """
@@ -10,8 +10,10 @@ import logging
 import threading
 import uuid
 import json
+import hashlib
 import traceback
 from datetime import datetime
+from collections import OrderedDict
 from pathlib import Path
 from typing import List, Dict, Any, Tuple, Set
 import networkx as nx
@@ -30,7 +32,9 @@ except ImportError:
     POSTGRESQL_AVAILABLE = False
 
 from Db.sqlite_db import cSingleSqlite
+from Db.source_db_pool import open_source_connection, get_source_pool, close_source_pool
 from Sql.schema_vector import SqlSchemaVectorAgent
+from Sql.Graph.join_path import ShortestPathIndex, steiner_arborescence, tree_paths
 # from Sql.vanna_manager import get_vanna_manager
 
 from Control.control_elastic import CControl as ElasticSearchController
@@ -39,6 +43,7 @@ from Control.control_graph import CControl as GraphController
 # from Agent import analysis_schema_run
 from Agent.AgenticSqlAgent.AnalysisSql.database_analysis_agent import DatabaseAnalysisAgent
 from Config.elasticsearch_config import is_elasticsearch_enabled
+from Config.sql_config import get_schema_graph_config
 
 # from Agent.SqlIntelligentAgents.sql_intelligent_workflow import SqlIntelligentWorkflow
 # from Agent.SqlIntelligentAgents.select_sql_agent import SelectSqlAgent
@@ -66,36 +71,16 @@ class CControl:
         return f"{prefix}_{uuid.uuid4().hex[:16]}" if prefix else uuid.uuid4().hex[:16]
     
     def connect_database(self, ip, port, sql_type, sql_name, sql_user_name, sql_user_password):
-        """连接数据库"""
+        """连接数据库（新建独立连接，调用方负责关闭；读取数据请使用 get_connection_pool）"""
         try:
-            if sql_type == 'mysql':
-                if not MYSQL_AVAILABLE:
-                    raise Exception("PyMySQL未安装，无法连接MySQL数据库")
-                conn = pymysql.connect(
-                    host=ip,
-                    port=int(port),
-                    user=sql_user_name,
-                    password=sql_user_password,
-                    database=sql_name,
-                    charset='utf8mb4'
-                )
-                return conn, 'mysql'
-            elif sql_type == 'postgresql':
-                if not POSTGRESQL_AVAILABLE:
-                    raise Exception("psycopg2未安装，无法连接PostgreSQL数据库")
-                conn = psycopg2.connect(
-                    host=ip,
-                    port=int(port),
-                    user=sql_user_name,
-                    password=sql_user_password,
-                    database=sql_name
-                )
-                return conn, 'postgresql'
-            else:
-                raise Exception(f"不支持的数据库类型: {sql_type}")
+            return open_source_connection(ip, port, sql_type, sql_name, sql_user_name, sql_user_password)
         except Exception as e:
             logger.error(f"连接数据库失败: {e}")
             raise
+
+    def get_connection_pool(self, sql_id, ip, port, sql_type, sql_name, sql_user_name, sql_user_password):
+        """获取数据源连接池（按sql_id懒创建，只读会话并带语句超时）"""
+        return get_source_pool(sql_id, ip, port, sql_type, sql_name, sql_user_name, sql_user_password)
     
     def get_tables(self, conn, db_type):
         """获取数据库中的所有表"""
@@ -309,6 +294,155 @@ class CControl:
             logger.error(f"获取外键信息失败: {e}")
             raise
     
+    def get_schema_catalog(self, conn, db_type):
+        """批量获取所有表的描述、列与外键信息（每类信息一条 information_schema 查询）
+        
+        Args:
+            conn: 数据库连接
+            db_type: 数据库类型 ('mysql' 或 'postgresql')
+            
+        Returns:
+            dict: {表名: {"table_description": 表描述, "columns": 列信息列表, "foreign_keys": 外键列表}}
+                列信息与外键的格式分别与 get_table_columns、get_table_foreign_keys 相同
+        """
+        try:
+            cursor = conn.cursor()
+            catalog = {}
+            
+            def table_entry(table_name):
+                if table_name not in catalog:
+                    catalog[table_name] = {"table_description": "", "columns": [], "foreign_keys": []}
+                return catalog[table_name]
+            
+            if db_type == 'mysql':
+                cursor.execute("""
+                    SELECT TABLE_NAME, TABLE_COMMENT
+                    FROM information_schema.TABLES
+                    WHERE TABLE_SCHEMA = DATABASE()
+                """)
+                for row in cursor.fetchall():
+                    table_entry(row[0])["table_description"] = row[1] or ""
+                
+                # 字段顺序与 SHOW FULL COLUMNS 一致
+                cursor.execute("""
+                    SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, COLLATION_NAME, IS_NULLABLE,
+                           COLUMN_KEY, COLUMN_DEFAULT, EXTRA, PRIVILEGES, COLUMN_COMMENT
+                    FROM information_schema.COLUMNS
+                    WHERE TABLE_SCHEMA = DATABASE()
+                    ORDER BY TABLE_NAME, ORDINAL_POSITION
+                """)
+                for row in cursor.fetchall():
+                    table_entry(row[0])["columns"].append({
+                        'col_name': row[1],
+                        'col_type': row[2],
+                        'collation': row[3],
+                        'is_null': row[4],
+                        'key': row[5],
+                        'default': row[6],
+                        'extra': row[7],
+                        'privileges': row[8],
+                        'comment': row[9]
+                    })
+                
+                cursor.execute("""
+                    SELECT 
+                        kcu.TABLE_NAME,
+                        kcu.COLUMN_NAME,
+                        kcu.REFERENCED_TABLE_NAME,
+                        kcu.REFERENCED_COLUMN_NAME
+                    FROM information_schema.KEY_COLUMN_USAGE kcu
+                    WHERE kcu.TABLE_SCHEMA = DATABASE()
+                      AND kcu.REFERENCED_TABLE_NAME IS NOT NULL
+                    ORDER BY kcu.TABLE_NAME, kcu.CONSTRAINT_NAME, kcu.ORDINAL_POSITION
+                """)
+                for row in cursor.fetchall():
+                    table_entry(row[0])["foreign_keys"].append({
+                        'from_table': row[0],
+                        'from_col': row[1],
+                        'to_table': row[2],
+                        'to_col': row[3]
+                    })
+            elif db_type == 'postgresql':
+                cursor.execute("""
+                    SELECT pc.relname, obj_description(pc.oid, 'pg_class') AS table_comment
+                    FROM pg_catalog.pg_class pc
+                    JOIN pg_catalog.pg_namespace pn
+                      ON pn.oid = pc.relnamespace
+                    WHERE pn.nspname = 'public'
+                      AND pc.relkind IN ('r', 'p', 'v', 'm', 'f')
+                """)
+                for row in cursor.fetchall():
+                    table_entry(row[0])["table_description"] = row[1] or ""
+                
+                cursor.execute("""
+                    SELECT 
+                        c.table_name,
+                        c.column_name,
+                        c.data_type,
+                        c.is_nullable,
+                        c.column_default,
+                        pgd.description AS column_comment
+                    FROM information_schema.columns c
+                    LEFT JOIN pg_catalog.pg_namespace pn
+                      ON pn.nspname = c.table_schema
+                    LEFT JOIN pg_catalog.pg_class pc 
+                      ON pc.relname = c.table_name
+                     AND pc.relnamespace = pn.oid
+                    LEFT JOIN pg_catalog.pg_description pgd
+                      ON pgd.objoid = pc.oid 
+                     AND pgd.objsubid = c.ordinal_position
+                    WHERE c.table_schema = 'public'
+                    ORDER BY c.table_name, c.ordinal_position
+                """)
+                for row in cursor.fetchall():
+                    table_entry(row[0])["columns"].append({
+                        'col_name': row[1],
+                        'col_type': row[2],
+                        'is_nullable': row[3],
+                        'column_default': row[4],
+                        'comment': row[5]
+                    })
+                
+                cursor.execute("""
+                    SELECT
+                        tc.table_name AS from_table,
+                        kcu.column_name AS from_column,
+                        ccu.table_name AS to_table,
+                        ccu.column_name AS to_column
+                    FROM information_schema.table_constraints AS tc
+                    JOIN information_schema.key_column_usage AS kcu
+                      ON tc.constraint_name = kcu.constraint_name
+                     AND tc.table_schema = kcu.table_schema
+                    JOIN information_schema.constraint_column_usage AS ccu
+                      ON ccu.constraint_name = tc.constraint_name
+                     AND ccu.table_schema = tc.table_schema
+                    WHERE tc.constraint_type = 'FOREIGN KEY'
+                      AND tc.table_schema = 'public'
+                    ORDER BY tc.table_name, tc.constraint_name, kcu.ordinal_position
+                """)
+                for row in cursor.fetchall():
+                    table_entry(row[0])["foreign_keys"].append({
+                        'from_table': row[0],
+                        'from_col': row[1],
+                        'to_table': row[2],
+                        'to_col': row[3]
+                    })
+            
+            cursor.close()
+            return catalog
+        except Exception as e:
+            logger.error(f"批量获取表结构信息失败: {e}")
+            raise
+    
+    @staticmethod
+    def schema_fingerprint(table_info):
+        """计算表结构指纹（表描述、列信息与外键），用于判断表结构是否变化"""
+        raw = json.dumps([table_info.get("table_description", ""),
+                          table_info.get("columns", []),
+                          table_info.get("foreign_keys", [])],
+                         ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
     def get_relation(self, sql_id):
         all_foreign_keys_map = {}
         relations = cSingleSqlite.query_rel_sql_by_sql_id(sql_id)
@@ -607,6 +741,21 @@ class CControl:
         
         return entity_name, entity_description
     
+    def _describe_table(self, table_name: str, table_info: Dict[str, Any]) -> Tuple[str, str]:
+        """
+        表的描述文本：标题为可读表名（有表注释时附加注释），内容为各列注释（无注释时用可读列名）以分号连接
+        
+        Returns:
+            (table_title, content_str)
+        """
+        table_title = self._parse_table_name(table_name)
+        table_description = table_info.get("table_description", "")
+        if(table_description):
+            table_title = table_title + "\n" + table_description
+        columns_comments = [col.get("comment", "") or self._parse_column_name(col["col_name"])
+                            for col in table_info.get("columns", [])]
+        return table_title, ";".join(columns_comments)
+    
     def _parse_table_name(self, table_name: str) -> str:
         """解析表名（snake_case转成可读文本）"""
         # 移除表名前缀（如：t_, tbl_等）
@@ -694,15 +843,18 @@ class CControl:
             
             # 连接数据库测试
             conn = None
+            pool = None
             try:
-                conn, db_type = self.connect_database(
-                    ip, port, sql_type, sql_name, sql_user_name, sql_user_password
+                pool = self.get_connection_pool(
+                    sql_id, ip, port, sql_type, sql_name, sql_user_name, sql_user_password
                 )
+                db_type = pool.db_type
+                conn = pool.acquire()
                 
                 # 获取所有表
                 tables = self.get_tables(conn, db_type)
                 logger.info(f"获取到{len(tables)}个表")
-                # 保存base_sql信息
+                # 保存base_sql信息；sql_id已存在时只更新连接信息，表结构增量刷新
                 base_sql_param = {
                     "sql_id": sql_id,
                     "user_id": user_id,
@@ -715,32 +867,52 @@ class CControl:
                     "sql_description": sql_description
                 }
                 
-                if not self.db_obj.insert_base_sql(base_sql_param):
+                if self.db_obj.query_base_sql_by_sql_id(sql_id):
+                    if not self.db_obj.update_base_sql(base_sql_param):
+                        raise Exception("更新数据库连接信息失败")
+                elif not self.db_obj.insert_base_sql(base_sql_param):
                     raise Exception("保存数据库连接信息失败")
                 
+                # 一次性获取所有表的描述、列与外键，与已保存的表结构指纹比较
+                catalog = self.get_schema_catalog(conn, db_type)
+                # 之后的处理不再访问源库，提前归还连接
+                pool.release(conn)
+                conn = None
+                previous = self.db_obj.query_table_schema_hashes(sql_id)
+                
+                changed_tables = []
+                # 未变化的表的描述，作为整体分析的上下文
+                context_list = []
+                for table_name in tables:
+                    table_info = catalog.get(table_name, {"table_description": "", "columns": [], "foreign_keys": []})
+                    schema_hash = self.schema_fingerprint(table_info)
+                    old = previous.get(table_name)
+                    if old and old["schema_hash"] == schema_hash:
+                        table_title, content_str = self._describe_table(table_name, table_info)
+                        context_list.append([old["table_id"], table_title, content_str])
+                        continue
+                    table_info["table_name"] = table_name
+                    table_info["schema_hash"] = schema_hash
+                    # 结构变化的表沿用原table_id，ES文档与向量的ID保持不变
+                    table_info["table_id"] = old["table_id"] if old else self.generate_id("table")
+                    changed_tables.append(table_info)
+                table_names = set(tables)
+                removed_tables = [{"table_id": old["table_id"], "table_name": name}
+                                  for name, old in previous.items() if name not in table_names]
+                logger.info(f"表结构变化 {len(changed_tables)} 个，删除 {len(removed_tables)} 个，"
+                            f"未变化 {len(tables) - len(changed_tables)} 个")
+                
                 all_tables_analysis = []
                 des_list = []
-                for table_name in tables:
-                    # 获取表的列信息和描述信息
-                    table_info = self.get_table_columns(conn, db_type, table_name)
-                    columns = table_info.get("columns", [])
+                es_documents = []
+                schema_tables = []
+                for table_info in changed_tables:
+                    table_id = table_info["table_id"]
+                    table_name = table_info["table_name"]
                     table_description = table_info.get("table_description", "")
                     
-                    # 保存表信息
-                    table_id = self.generate_id("table")
-                    table_sql_param = {
-                        "table_id": table_id,
-                        "sql_id": sql_id,
-                        "table_name": table_name,
-                        "table_description": table_description  # 使用获取到的表描述
-                    }
-                    self.db_obj.insert_table_sql(table_sql_param)
-                    
-                    columns_comments = []
-                    # 保存列信息
-                    for col in columns:
-                        col_id = self.generate_id("col")
-                        
+                    saved_columns = []
+                    for col in table_info.get("columns", []):
                         # 判断列类型
                         col_typy_ana = ""
                         col_type = col.get("col_type", "")
@@ -754,74 +926,62 @@ class CControl:
                         if(is_datetime):
                             col_typy_ana = "datetime"
                         
-                        col["ana_type"] = col_typy_ana
-                        col_sql_param = {
-                            "col_id": col_id,
-                            "table_id": table_id,
-                            "col_name": col["col_name"],
-                            "col_type": col.get("col_type", ""),
-                            "col_info": col  # 保存完整的列信息JSON
-                        }
-                        
                         col_name = col["col_name"]
-                        col_comment = col.get("comment", "")
-                        if(col_comment):
-                            columns_comments.append(col_comment)
-                        else:
-                            col_comment = self._parse_column_name(col_name)
-                            columns_comments.append(col_comment)
-                            
-                        self.db_obj.insert_col_sql(col_sql_param)
-                    
-                    table_title = self._parse_table_name(table_name)
-                    
-                    if(table_description):
-                        table_title = table_title + "\n" + table_description
-                        
-                    # 保存外键信息
-                    foreign_keys = self.get_table_foreign_keys(conn, db_type, table_name)
-                    for fk in foreign_keys:
-                        rel_id = self.generate_id("rel")
-                        rel_param = {
-                            "rel_id": rel_id,
-                            "sql_id": sql_id,
-                            "from_table": fk.get("from_table"),
-                            "from_col": fk.get("from_col"),
-                            "to_table": fk.get("to_table"),
-                            "to_col": fk.get("to_col")
-                        }
-                        self.db_obj.insert_rel_sql(rel_param)
-                    
-                    file_id = table_id
-                    content_str = ";".join(columns_comments)
-                    permission_level = "public"
-                    # 保存到Elasticsearch（如果启用）
+                        saved_columns.append({
+                            "col_id": self.generate_id("col"),
+                            "table_id": table_id,
+                            "col_name": col_name,
+                            "col_type": col_type,
+                            "col_info": dict(col, ana_type=col_typy_ana)  # 保存完整的列信息JSON
+                        })
                     
-                    if is_elasticsearch_enabled():
-                        self.elasticsearch_obj.save_document_to_elastic(sql_id, file_id, 
-                                                                        user_id, permission_level,
-                                                                        table_title, content_str)
+                    schema_tables.append({
+                        "table_id": table_id,
+                        "table_name": table_name,
+                        "table_description": table_description,
+                        "schema_hash": table_info["schema_hash"],
+                        "columns": saved_columns,
+                        "foreign_keys": table_info.get("foreign_keys", [])
+                    })
                     
+                    table_title, content_str = self._describe_table(table_name, table_info)
+                    es_documents.append((table_id, table_title, content_str))
                     des_list.append([table_id, table_title, content_str])
-
-                    # 从数据库查询完整的列信息（包含 col_info）
-                    full_columns = self.db_obj.query_col_sql_by_table_id(table_id)
                     
                     if(not table_description):
                         table_description = content_str
                     
-                    # 构建完整的 table_info 用于分析
+                    # 构建完整的 table_info 用于分析（列信息与写入col_sql的内容一致）
                     analysis_table_info = {
                         "table_id": table_id,
                         "sql_id": sql_id,
                         "table_name": table_name,
                         "table_description": table_description,
-                        "columns": full_columns  # 使用完整的列信息，包含 col_info
+                        "columns": saved_columns
                     }
                     
                     analysis_schema = self.analysis_schema(analysis_table_info)
                     all_tables_analysis.append(analysis_schema)
-                    print("analysis_schema:", analysis_schema)
+                
+                # 表、列、外键一个事务批量写入
+                if not self.db_obj.save_sql_schema(sql_id, schema_tables, removed_tables):
+                    raise Exception("保存表结构信息失败")
+                if changed_tables or removed_tables:
+                    invalidate_schema_graph(sql_id)
+                
+                # 保存到Elasticsearch（如果启用）：变化的表批量索引，已删除的表删除文档
+                if is_elasticsearch_enabled():
+                    permission_level = "public"
+                    if es_documents:
+                        self.elasticsearch_obj.save_documents_to_elastic(sql_id, user_id, permission_level, es_documents)
+                    for removed in removed_tables:
+                        self.elasticsearch_obj.delete_document(sql_id, removed["table_id"])
+                
+                # 变化与删除的表的旧表分析向量失效，变化的表由下面的 analyze_database_descriptions 重新生成
+                stale_table_ids = [t["table_id"] for t in changed_tables if t["table_name"] in previous] \
+                    + [t["table_id"] for t in removed_tables]
+                if stale_table_ids:
+                    self.vector_agent.delete_table_analysis_vectors(sql_id, stale_table_ids)
                     
                 logger.info(f"📊 回调函数执行完成，共收集到 {len(all_tables_analysis)} 个表的结果")
                 
@@ -831,9 +991,9 @@ class CControl:
                         
                         logger.info(f"📊 开始分析数据库描述文本，共 {len(des_list)} 个表")
                         
-                        # 直接调用智能体分析整个列表（des_list 格式: [["title", "content"], ...]）
-                        # des_list = des_list[:10]
-                        result = agent.analyze_database_descriptions(des_list, sql_id)
+                        # 只对变化的表分类并保存向量，未变化的表作为上下文一起提供，保证整体分析看到完整的表结构
+                        # （des_list 格式: [["table_id", "title", "content"], ...]）
+                        result = agent.analyze_database_descriptions(des_list, sql_id, context_list=context_list)
                         
                         if result.get("success"):
                             logger.info(f"✅ 数据库描述文本分析完成，共分析 {result.get('total_tables', 0)} 个表")
@@ -849,34 +1009,9 @@ class CControl:
 
                 if all_tables_analysis:
                     try:
-                        # 先保存到 SQLite（批量保存所有表的分析结果）
-                        try:
-                            # 统计测试表和标准命名表的数量
-                            test_tables_count = sum(1 for ta in all_tables_analysis 
-                                                  if ta.get("analysis_result", {}).get("is_test_table", False))
-                            standard_naming_count = sum(1 for ta in all_tables_analysis 
-                                                       if ta.get("analysis_result", {}).get("naming_standard") == "standard")
-                            
-                            # 批量保存所有表的分析结果到 SQLite
-                            for table_analysis in all_tables_analysis:
-                                table_id = table_analysis.get("table_id", "")
-                                table_name = table_analysis.get("table_name", "")
-                                analysis_result = table_analysis.get("analysis_result", {})
-                                
-                                if table_id and table_name and analysis_result:
-                                    self.db_obj.insert_schema_analysis_result(
-                                        sql_id=sql_id,
-                                        table_id=table_id,
-                                        table_name=table_name,
-                                        analysis_result=analysis_result,
-                                        total_tables=len(all_tables_analysis),
-                                        test_tables_count=test_tables_count,
-                                        standard_naming_count=standard_naming_count
-                                    )
-                            logger.info(f"✅ 保存 {len(all_tables_analysis)} 个表的分析结果到SQLite成功")
-                        except Exception as e:
-                            logger.warning(f"批量保存Schema分析结果到SQLite失败: {e}")
-                            traceback.print_exc()
+                        # 先保存到 SQLite（一次批量保存变化表的分析结果）
+                        saved = self.db_obj.save_schema_analysis_results(sql_id, all_tables_analysis)
+                        logger.info(f"✅ 保存 {saved} 个表的分析结果到SQLite成功")
                         
                         logger.info(f"📊 准备保存 {len(all_tables_analysis)} 个表的分析结果到图数据库")
                         
@@ -916,12 +1051,12 @@ class CControl:
                 else:
                     logger.warning(f"⚠️ 没有收集到任何表分析结果，跳过图数据库保存")
                 
-                conn.close()
-                return {"success": True, "message": "数据库信息添加成功", "sql_id": sql_id}
+                return {"success": True, "message": "数据库信息添加成功", "sql_id": sql_id,
+                        "changed_tables": len(changed_tables), "removed_tables": len(removed_tables)}
                 
             except Exception as e:
                 if conn:
-                    conn.close()
+                    pool.release(conn)
                 logger.error(f"插入数据库信息失败: {e}")
                 return {"success": False, "message": f"添加数据库失败: {str(e)}"}
                 
@@ -1012,8 +1147,14 @@ class CControl:
             if not rel_id:
                 return {"success": False, "message": "缺少必要参数"}
             
+            # 删除前查出所属数据源，只让该数据源的关联图缓存失效
+            rel = self.db_obj.query_rel_sql_by_rel_id(rel_id)
+            if rel is None:
+                return {"success": False, "message": "关联关系不存在或删除失败"}
+
             # 删除关联关系
             if self.db_obj.delete_rel_sql_by_rel_id(rel_id):
+                invalidate_schema_graph(rel["sql_id"])
                 return {"success": True, "message": "删除关联关系成功"}
             else:
                 return {"success": False, "message": "关联关系不存在或删除失败"}
@@ -1043,6 +1184,7 @@ class CControl:
                     "to_col": relation.get("to_col")
                 }
                 self.db_obj.insert_rel_sql(rel_param)
+            invalidate_schema_graph(sql_id)
             
             return {"success": True, "message": "插入关联关系成功"}
             
@@ -1059,6 +1201,9 @@ class CControl:
         
         self.vector_agent.delete_vector_store_by_sql_id(sql_id)
         
+        close_source_pool(sql_id)
+        invalidate_schema_graph(sql_id)
+        
         self.elasticsearch_obj.delete_knowledge_elasticsearch_data(knowledge_id=sql_id)
         
         try:
@@ -1073,14 +1218,17 @@ class CControl:
         return {"success": False, "message": "删除数据库信息失败"}
     
     def update_sql_info(self, param):
-        """更新数据库信息 - 保存列关联数据"""
+        """更新数据库信息 - 更新连接信息并增量刷新表结构（只重新处理结构变化的表）"""
         try:
-            success = self.delete_sql_info(param)
-            if(success):
-                self.insert_sql_info(param)
-                return {"success": True, "message": "更新成功"}
+            if not param.get("sql_id"):
+                return {"success": False, "message": "缺少必要参数"}
+            result = self.insert_sql_info(param)
+            if result.get("success"):
+                return {"success": True, "message": "更新成功",
+                        "changed_tables": result.get("changed_tables", 0),
+                        "removed_tables": result.get("removed_tables", 0)}
             else:
-                return {"success": False, "message": "更新失败"}
+                return {"success": False, "message": result.get("message", "更新失败")}
         except Exception as e:
             logger.error(f"更新数据库信息失败: {e}")
             return {"success": False, "message": f"更新数据库信息失败: {str(e)}"}
@@ -1102,6 +1250,36 @@ class CControl:
     #         return {"success": False, "message": f"构建向量库失败: {str(e)}"}
 
 
+# sql_id -> (版本号, 关联图, 最短路径索引)，按最近使用排序
+_schema_graph_cache: "OrderedDict[str, tuple]" = OrderedDict()
+# sql_id -> 失效次数；全部失效时递增全局代数
+_schema_graph_versions: Dict[str, int] = {}
+_schema_graph_generation = 0
+_schema_graph_lock = threading.Lock()
+
+
+def _schema_graph_version(sql_id: str) -> tuple:
+    """在持有 _schema_graph_lock 时调用"""
+    return _schema_graph_generation, _schema_graph_versions.get(sql_id, 0)
+
+
+def invalidate_schema_graph(sql_id: str = None):
+    """
+    使缓存的关联图失效（表结构或关联关系变化时调用）
+
+    Args:
+        sql_id: 数据源ID，为空时全部失效
+    """
+    global _schema_graph_generation
+    with _schema_graph_lock:
+        if sql_id:
+            _schema_graph_versions[sql_id] = _schema_graph_versions.get(sql_id, 0) + 1
+            _schema_graph_cache.pop(sql_id, None)
+        else:
+            _schema_graph_generation += 1
+            _schema_graph_cache.clear()
+
+
 class SchemaGraphBuilder:
     """数据库模式关联图构建器"""
 
@@ -1111,82 +1289,158 @@ class SchemaGraphBuilder:
             # NETWORKX_AVAILABLE = True
         except ImportError:
             raise ImportError("NetworkX未安装，请安装: pip install networkx")
+        self.db_obj = cSingleSqlite
 
-    def build_graph(self, sql_id: str, filtered_tables: List[str] = None) -> Any:
-        """构建数据库模式的关联图"""
-        try:
-            # 创建多重有向图
-            G = self.nx.MultiDiGraph()
-
-            # 获取表信息
-            tables = self.db_obj.query_table_sql_by_sql_id(sql_id)
+    def _load_graph(self, sql_id: str) -> Any:
+        """从SQLite读取表、列与关联关系构建完整关联图（每类数据一次查询）"""
+        # 创建多重有向图
+        G = self.nx.MultiDiGraph()
 
-            # 如果指定了过滤表，则只处理这些表
-            if filtered_tables:
-                table_name_set = set(filtered_tables)
-                tables = [t for t in tables if t["table_name"] in table_name_set]
+        tables = self.db_obj.query_table_sql_by_sql_id(sql_id)
+        columns_by_table = self.db_obj.query_col_sql_by_sql_id(sql_id)
 
-            # 添加表节点
-            for table in tables:
-                table_name = table["table_name"]
-                G.add_node(table_name,
-                          node_type="table",
-                          table_id=table["table_id"],
-                          description=table.get("table_description", ""),
-                          sql_id=sql_id)
-
-                # 获取列信息并添加到节点属性
-                columns = self.db_obj.query_col_sql_by_table_id(table["table_id"])
-                col_info = {}
-                for col in columns:
-                    col_info[col["col_name"]] = {
-                        "col_id": col["col_id"],
-                        "col_type": col.get("col_type", ""),
-                        "col_info": col.get("col_info", {})
-                    }
-                G.nodes[table_name]["columns"] = col_info
+        # 添加表节点，列信息作为节点属性
+        for table in tables:
+            col_info = {}
+            for col in columns_by_table.get(table["table_id"], []):
+                col_info[col["col_name"]] = {
+                    "col_id": col["col_id"],
+                    "col_type": col.get("col_type", ""),
+                    "col_info": col.get("col_info", {})
+                }
+            G.add_node(table["table_name"],
+                       node_type="table",
+                       table_id=table["table_id"],
+                       description=table.get("table_description", ""),
+                       sql_id=sql_id,
+                       columns=col_info)
+
+        # 获取关联关系并添加边
+        for rel in self.db_obj.query_rel_sql_by_sql_id(sql_id):
+            from_table = rel["from_table"]
+            to_table = rel["to_table"]
+            if from_table not in G or to_table not in G:
+                continue
 
-            # 获取关联关系并添加边
-            relations = self.db_obj.query_rel_sql_by_sql_id(sql_id)
+            # 添加有向边（外键关系）
+            G.add_edge(from_table, to_table,
+                       from_col=rel["from_col"],
+                       to_col=rel["to_col"],
+                       relation_type="foreign_key",
+                       weight=1.0)  # 基础权重
+
+            # 同时添加反向边（用于查询路径）
+            G.add_edge(to_table, from_table,
+                       from_col=rel["to_col"],
+                       to_col=rel["from_col"],
+                       relation_type="reverse_foreign_key",
+                       weight=2.0)  # 反向查询权重稍高
+
+        logger.info(f"构建关联图完成: {G.number_of_nodes()} 个节点, {G.number_of_edges()} 条边")
+        return G
+
+    @staticmethod
+    def _build_path_index(graph: Any) -> ShortestPathIndex:
+        """
+        按关联图建立有向最短路索引：u -> v 取该方向权重最小的关联边（外键正向1.0、反向2.0），
+        表数量不超过阈值时预计算全源最短路
+        """
+        adjacency = {node: {} for node in graph.nodes}
+        for u, v, data in graph.edges(data=True):
+            if u == v:
+                continue
+            weight = float(data.get("weight", 1.0))
+            if weight < adjacency[u].get(v, float("inf")):
+                adjacency[u][v] = weight
+        precompute = graph.number_of_nodes() <= get_schema_graph_config().apsp_max_tables
+        return ShortestPathIndex(adjacency, precompute=precompute)
+
+    def _get_cached(self, sql_id: str) -> Tuple[Any, ShortestPathIndex]:
+        """获取缓存的 (完整关联图, 最短路径索引)，未缓存或已失效时重新构建"""
+        with _schema_graph_lock:
+            version = _schema_graph_version(sql_id)
+            entry = _schema_graph_cache.get(sql_id)
+            if entry is not None and entry[0] == version:
+                _schema_graph_cache.move_to_end(sql_id)
+                return entry[1], entry[2]
+
+        graph = self._load_graph(sql_id)
+        index = self._build_path_index(graph)
+
+        with _schema_graph_lock:
+            # 构建期间发生失效则不写入缓存，下次重新构建
+            if _schema_graph_version(sql_id) == version:
+                _schema_graph_cache[sql_id] = (version, graph, index)
+                _schema_graph_cache.move_to_end(sql_id)
+                while len(_schema_graph_cache) > get_schema_graph_config().cache_size:
+                    _schema_graph_cache.popitem(last=False)
+        return graph, index
 
-            for rel in relations:
-                from_table = rel["from_table"]
-                to_table = rel["to_table"]
-                from_col = rel["from_col"]
-                to_col = rel["to_col"]
+    def build_graph(self, sql_id: str, filtered_tables: List[str] = None) -> Any:
+        """
+        构建数据库模式的关联图
 
-                # 只添加在过滤表范围内的关联
-                if filtered_tables:
-                    if from_table not in table_name_set or to_table not in table_name_set:
-                        continue
+        完整关联图按sql_id缓存，调用方不应修改返回的完整图；指定过滤表时返回子图的副本
+        """
+        try:
+            G, _ = self._get_cached(sql_id)
 
-                # 添加有向边（外键关系）
-                G.add_edge(from_table, to_table,
-                          from_col=from_col,
-                          to_col=to_col,
-                          relation_type="foreign_key",
-                          weight=1.0)  # 基础权重
-
-                # 同时添加反向边（用于查询路径）
-                G.add_edge(to_table, from_table,
-                          from_col=to_col,
-                          to_col=from_col,
-                          relation_type="reverse_foreign_key",
-                          weight=2.0)  # 反向查询权重稍高
-
-            logger.info(f"构建关联图完成: {G.number_of_nodes()} 个节点, {G.number_of_edges()} 条边")
+            # 如果指定了过滤表，则只保留这些表及其之间的关联
+            if filtered_tables:
+                G = G.subgraph([t for t in filtered_tables if t in G]).copy()
+                logger.info(f"过滤关联图: {G.number_of_nodes()} 个节点, {G.number_of_edges()} 条边")
             return G
 
         except Exception as e:
             logger.error(f"构建关联图失败: {e}")
             raise
 
+    def get_path_index(self, sql_id: str) -> ShortestPathIndex:
+        """获取数据源完整关联图的最短路径索引"""
+        return self._get_cached(sql_id)[1]
+
+    @staticmethod
+    def _edge_detail(graph: Any, u: str, v: str) -> Dict[str, Any]:
+        """u -> v 方向权重最小的关联边"""
+        edges = graph.get_edge_data(u, v) or {}
+        edge_data = min(edges.values(), key=lambda d: d.get("weight", 1.0)) if edges else {}
+        return {
+            "from_table": u,
+            "to_table": v,
+            "from_col": edge_data.get("from_col", ""),
+            "to_col": edge_data.get("to_col", ""),
+            "relation_type": edge_data.get("relation_type", ""),
+            "weight": edge_data.get("weight", 1.0)
+        }
+
+    def _path_info(self, graph: Any, path: List[str]) -> Dict[str, Any]:
+        edges = [self._edge_detail(graph, u, v) for u, v in zip(path, path[1:])]
+        return {
+            "path": path,
+            "total_weight": sum(edge.pop("weight") for edge in edges),
+            "edges": edges,
+            "start_table": path[0],
+            "end_table": path[-1]
+        }
+
     def find_optimal_paths(self, graph: Any, query_entities: List[str],
-                          max_depth: int = 3) -> Dict[str, Any]:
-        """寻找最优的关联路径"""
+                          max_depth: int = 3, path_index: ShortestPathIndex = None) -> Dict[str, Any]:
+        """
+        寻找最优的关联路径
+
+        1. 多个查询实体：以第一个实体为根，求连接全部实体的近似最小Steiner树（按关联方向计权），返回从根到其余实体的树上路径
+        2. 单个查询实体：返回到 max_depth 跳以内各表的最短关联路径
+        路径的 total_weight 为沿路径方向实际使用的关联边权重之和
+
+        Args:
+            graph: 关联图
+            query_entities: 查询实体（表名，支持模糊匹配）
+            max_depth: 单个实体时的最大跳数
+            path_index: graph 的最短路径索引，为空时按 graph 临时建立
+        """
         try:
             if not query_entities:
-                return {"paths": [], "tables": set(), "columns": set()}
+                return {"paths": [], "tables": [], "columns": []}
 
             # 找到图中存在的查询实体（表名）
             available_entities = []
@@ -1197,39 +1451,50 @@ class SchemaGraphBuilder:
                     # 尝试模糊匹配
                     matches = [n for n in graph.nodes if entity.lower() in n.lower()]
                     available_entities.extend(matches[:1])  # 最多匹配一个
+            available_entities = list(dict.fromkeys(available_entities))
 
             if not available_entities:
-                return {"paths": [], "tables": set(), "columns": set()}
-
-            all_paths = []
-            visited_tables = set()
-            visited_columns = set()
-
-            # 从每个查询实体出发，寻找关联路径
-            for start_entity in available_entities:
-                # BFS搜索关联路径
-                paths_from_start = self._bfs_search(graph, start_entity, max_depth)
-
-                for path_info in paths_from_start:
-                    all_paths.append(path_info)
+                return {"paths": [], "tables": [], "columns": []}
 
-                    # 收集涉及的表和列
-                    for node in path_info["path"]:
-                        visited_tables.add(node)
+            if path_index is None:
+                path_index = self._build_path_index(graph)
 
-                        # 获取该表的所有列
-                        if node in graph.nodes:
-                            columns = graph.nodes[node].get("columns", {})
-                            visited_columns.update(columns.keys())
-
-            # 按路径长度和权重排序
-            all_paths.sort(key=lambda x: (len(x["path"]), x["total_weight"]))
+            all_paths = []
+            visited_tables = set(available_entities)
+
+            if len(available_entities) > 1:
+                tree_edges, _ = steiner_arborescence(path_index, available_entities)
+                # 不连通的实体各自作为一棵树的根
+                covered = set()
+                for root in available_entities:
+                    if root in covered:
+                        continue
+                    covered.add(root)
+                    for target, path in tree_paths(tree_edges, root, available_entities).items():
+                        covered.add(target)
+                        all_paths.append(self._path_info(graph, path))
+                for u, v, _ in tree_edges:
+                    visited_tables.update((u, v))
+            else:
+                start_entity = available_entities[0]
+                dist, _ = path_index.single_source(start_entity)
+                nearest = sorted((d, node) for node, d in dist.items() if node != start_entity)
+                for _, node in nearest:
+                    path = path_index.path(start_entity, node)
+                    if len(path) > max_depth + 1:
+                        continue
+                    all_paths.append(self._path_info(graph, path))
+                    visited_tables.update(path)
+                # 按路径长度和权重排序
+                all_paths.sort(key=lambda x: (len(x["path"]), x["total_weight"]))
 
-            # 去重并保留最优路径
-            unique_paths = self._deduplicate_paths(all_paths)
+            # 收集涉及表的所有列
+            visited_columns = set()
+            for node in visited_tables:
+                visited_columns.update(graph.nodes[node].get("columns", {}).keys())
 
             return {
-                "paths": unique_paths[:10],  # 最多返回10条最优路径
+                "paths": all_paths[:10] if len(available_entities) == 1 else all_paths,  # 单个实体最多返回10条最优路径
                 "tables": list(visited_tables),
                 "columns": list(visited_columns)
             }
@@ -1238,69 +1503,6 @@ class SchemaGraphBuilder:
             logger.error(f"寻找最优路径失败: {e}")
             raise
 
-    def _bfs_search(self, graph: Any, start_node: str, max_depth: int) -> List[Dict[str, Any]]:
-        """BFS搜索从起始节点出发的路径"""
-        from collections import deque
-
-        paths = []
-        visited = set()
-        queue = deque([(start_node, [start_node], 0.0, [])])  # (当前节点, 路径, 总权重, 边信息)
-
-        while queue:
-            current_node, path, total_weight, edge_info = queue.popleft()
-
-            if len(path) > max_depth + 1:  # 路径长度超过最大深度
-                continue
-
-            # 记录路径
-            if len(path) > 1:  # 至少包含两个节点
-                paths.append({
-                    "path": path.copy(),
-                    "total_weight": total_weight,
-                    "edges": edge_info.copy(),
-                    "start_table": start_node,
-                    "end_table": current_node
-                })
-
-            # 避免重复访问
-            if current_node in visited and len(path) > 2:
-                continue
-            visited.add(current_node)
-
-            # 探索邻居节点
-            for neighbor in graph.neighbors(current_node):
-                if neighbor not in path:  # 避免环
-                    # 获取边信息
-                    edges = graph.get_edge_data(current_node, neighbor)
-                    if edges:
-                        for edge_key, edge_data in edges.items():
-                            new_path = path + [neighbor]
-                            new_weight = total_weight + edge_data.get("weight", 1.0)
-                            new_edge_info = edge_info + [{
-                                "from_table": current_node,
-                                "to_table": neighbor,
-                                "from_col": edge_data.get("from_col", ""),
-                                "to_col": edge_data.get("to_col", ""),
-                                "relation_type": edge_data.get("relation_type", "")
-                            }]
-
-                            queue.append((neighbor, new_path, new_weight, new_edge_info))
-
-        return paths
-
-    def _deduplicate_paths(self, paths: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """去重路径，保留权重最小的"""
-        path_dict = {}
-
-        for path_info in paths:
-            path_tuple = tuple(path_info["path"])
-            weight = path_info["total_weight"]
-
-            if path_tuple not in path_dict or weight < path_dict[path_tuple]["total_weight"]:
-                path_dict[path_tuple] = path_info
-
-        return list(path_dict.values())
-
     def get_related_tables_and_columns(self, sql_id: str, related_tables: List[str]) -> Dict[str, Any]:
         """获取关联的表和列信息"""
         try:
@@ -1375,12 +1577,13 @@ def find_schema_paths(self, param):
         if not sql_id:
             return {"success": False, "message": "缺少sql_id"}
 
-        # 先构建完整图
+        # 完整图与最短路径索引按sql_id缓存
         graph_builder = SchemaGraphBuilder()
         graph = graph_builder.build_graph(sql_id)
+        path_index = graph_builder.get_path_index(sql_id)
 
         # 寻找最优路径
-        path_result = graph_builder.find_optimal_paths(graph, query_entities, max_depth)
+        path_result = graph_builder.find_optimal_paths(graph, query_entities, max_depth, path_index)
 
         # 获取详细的表和列信息
         if path_result["tables"]:
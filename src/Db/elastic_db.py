@@ -6,6 +6,9 @@ Elasticsearch 数据库操作类
 
 import json
 import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any, Optional, Tuple
 from elasticsearch import Elasticsearch
 from elasticsearch.exceptions import ConnectionError, NotFoundError
@@ -14,6 +17,13 @@ from Config.elasticsearch_config import get_elasticsearch_connection_params, is_
 
 logger = logging.getLogger(__name__)
 
+# 父文档缓存：最大条数与有效期（秒）
+PARENT_CACHE_SIZE = 1024
+PARENT_CACHE_TTL = 300
+
+# msearch 不可用时，并发执行混合搜索各路查询的线程池
+_search_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="es-hybrid-search")
+
 
 class ElasticSearchDB:
     """Elasticsearch 数据库操作类"""
@@ -31,6 +41,12 @@ class ElasticSearchDB:
             password: 密码（可选，默认从.env读取）
             verify_certs: 是否验证 SSL 证书（可选，默认从.env读取）
         """
+        # (index_name, doc_id) -> (过期时间, 父文档)
+        self.parent_cache = OrderedDict()
+        self.parent_cache_lock = threading.Lock()
+        # 服务端不支持 msearch 时置为False，改用线程池并发查询
+        self.msearch_supported = True
+        
         # 检查是否启用Elasticsearch
         self.enabled = is_elasticsearch_enabled()
         
@@ -216,6 +232,7 @@ class ElasticSearchDB:
                 logger.error("Elasticsearch 连接未建立")
                 return False
 
+            self._invalidate_parent_cache(index_name)
             if self.es.indices.exists(index=index_name):
                 response = self.es.indices.delete(index=index_name)
                 logger.info(f"索引 {index_name} 删除成功")
@@ -256,6 +273,7 @@ class ElasticSearchDB:
             document['create_time'] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
 
             response = self.es.index(index=index_name, id=doc_id, body=document)
+            self._invalidate_parent_cache(index_name, [doc_id])
             logger.info(f"文档 {doc_id} 索引成功")
             return response.get('_shards', {}).get('successful', 0) > 0
 
@@ -322,6 +340,7 @@ class ElasticSearchDB:
             }
 
             response = self.es.update(index=index_name, id=doc_id, body=body)
+            self._invalidate_parent_cache(index_name, [doc_id])
             logger.info(f"文档 {doc_id} 更新成功")
             return response.get('_shards', {}).get('successful', 0) > 0
 
@@ -349,6 +368,7 @@ class ElasticSearchDB:
                 logger.error("Elasticsearch 连接未建立")
                 return False
 
+            self._invalidate_parent_cache(index_name, [doc_id])
             response = self.es.delete(index=index_name, id=doc_id)
             logger.info(f"文档 {doc_id} 删除成功")
             return response.get('_shards', {}).get('successful', 0) > 0
@@ -630,16 +650,27 @@ class ElasticSearchDB:
                     }
                 })
             
+            if not self.es.indices.exists(index=index_name):
+                logger.warning(f"索引 {index_name} 不存在，返回空结果")
+                return []
+            
+            text_body = {
+                "query": text_query,
+                "size": size * 2,
+                "from": 0,
+                "sort": [
+                    {"_score": {"order": "desc"}}
+                ]
+            }
+            search_bodies = [text_body]
+            
             # 2. 向量搜索查询（如果提供了向量）
-            # Elasticsearch 9.2.4+ 使用顶层 knn 选项进行向量搜索
-            vector_results = []
+            # Elasticsearch 9.2.4+ 使用顶层 knn 选项进行向量搜索，分别搜索 content_vector 与 title_vector
             if query_vector:
-                try:
-                    # 使用顶层 knn 选项（推荐方式）
-                    # 先搜索 content_vector
-                    vector_body_content = {
+                for vector_field in ("content_vector", "title_vector"):
+                    search_bodies.append({
                         "knn": {
-                            "field": "content_vector",
+                            "field": vector_field,
                             "query_vector": query_vector,
                             "k": size * 2,
                             "num_candidates": size * 4  # 候选数量应该大于 k
@@ -651,55 +682,35 @@ class ElasticSearchDB:
                         },
                         "size": size * 2,
                         "_source": True
-                    }
-                    
-                    # 再搜索 title_vector
-                    vector_body_title = {
-                        "knn": {
-                            "field": "title_vector",
-                            "query_vector": query_vector,
-                            "k": size * 2,
-                            "num_candidates": size * 4
-                        },
-                        "query": {
-                            "bool": {
-                                "must": must_conditions.copy()
-                            }
-                        },
-                        "size": size * 2,
-                        "_source": True
-                    }
-                    
-                    # 执行两个向量搜索
-                    content_response = self.es.search(index=index_name, body=vector_body_content)
-                    title_response = self.es.search(index=index_name, body=vector_body_title)
-                    
-                    # 合并结果
-                    all_vector_hits = []
-                    all_vector_hits.extend(content_response.get('hits', {}).get('hits', []))
-                    all_vector_hits.extend(title_response.get('hits', {}).get('hits', []))
-                    
-                    # 去重并处理结果
-                    seen_ids = set()
-                    for hit in all_vector_hits:
-                        doc_id = hit.get('_id')
-                        if doc_id and doc_id not in seen_ids:
-                            seen_ids.add(doc_id)
-                            result = hit.get('_source', {})
-                            result['_id'] = doc_id
-                            result['_score'] = hit.get('_score')
-                            result['_search_type'] = 'vector'
-                            vector_results.append(result)
-                            
-                except Exception as e:
-                    logger.warning(f"向量搜索失败: {e}，将仅使用全文搜索")
-                    import traceback
-                    logger.debug(f"向量搜索错误详情: {traceback.format_exc()}")
+                    })
+            
+            # 全文搜索与两路向量搜索合并为一次请求
+            leg_hits = self._multi_search(index_name, search_bodies)
             
-            # 3. 执行全文搜索
-            text_results = self.search_documents(index_name, text_query, size * 2)
-            for result in text_results:
+            # 3. 处理结果
+            text_results = []
+            for hit in leg_hits[0] or []:
+                result = hit.get('_source', {})
+                result['_id'] = hit.get('_id')
+                result['_score'] = hit.get('_score')
                 result['_search_type'] = 'text'
+                text_results.append(result)
+            
+            vector_results = []
+            if query_vector:
+                if leg_hits[1] is None or leg_hits[2] is None:
+                    logger.warning("向量搜索失败，将仅使用全文搜索")
+                # 合并两路向量结果，去重
+                seen_ids = set()
+                for hit in (leg_hits[1] or []) + (leg_hits[2] or []):
+                    doc_id = hit.get('_id')
+                    if doc_id and doc_id not in seen_ids:
+                        seen_ids.add(doc_id)
+                        result = hit.get('_source', {})
+                        result['_id'] = doc_id
+                        result['_score'] = hit.get('_score')
+                        result['_search_type'] = 'vector'
+                        vector_results.append(result)
             
             # 4. 使用 RRF 算法合并结果
             if vector_results:
@@ -708,13 +719,17 @@ class ElasticSearchDB:
                 # 如果没有向量结果，直接返回全文搜索结果
                 merged_results = text_results[:size]
             
-            # 5. 为每个结果添加父文档信息
+            # 5. 为每个结果添加父文档信息（一次 mget 批量获取）
+            parent_docs = self.get_parent_documents(
+                index_name,
+                [result["parent_id"] for result in merged_results
+                 if result.get("doc_type") == "child" and result.get("parent_id")])
             enriched_results = []
             for result in merged_results:
                 enriched_result = result.copy()
                 
                 if result.get("doc_type") == "child" and result.get("parent_id"):
-                    parent_info = self.get_parent_document(index_name, result["parent_id"])
+                    parent_info = parent_docs.get(self._parent_doc_id(result["parent_id"]))
                     if parent_info:
                         enriched_result["parent_title"] = parent_info.get("title", "")
                         enriched_result["parent_summary"] = parent_info.get("summary", "")
@@ -734,6 +749,118 @@ class ElasticSearchDB:
                 index_name, knowledge_id, "", permission_flag, search_query, size, use_hybrid_search=False
             )
     
+    def _multi_search(self, index_name: str, bodies: List[Dict[str, Any]]) -> List[Optional[List[Dict[str, Any]]]]:
+        """
+        执行多个搜索请求：优先使用一次 msearch，不可用时用线程池并发执行
+
+        Args:
+            index_name: 索引名称
+            bodies: 搜索请求体列表
+
+        Returns:
+            List: 与 bodies 一一对应的命中列表，某一路失败时为 None
+        """
+        if self.msearch_supported:
+            try:
+                searches = []
+                for body in bodies:
+                    searches.append({"index": index_name})
+                    searches.append(body)
+                response = self.es.msearch(body=searches)
+                leg_hits = []
+                for item in response.get('responses', []):
+                    if item.get('error'):
+                        logger.warning(f"msearch 子查询失败: {item.get('error')}")
+                        leg_hits.append(None)
+                    else:
+                        leg_hits.append(item.get('hits', {}).get('hits', []))
+                if len(leg_hits) == len(bodies):
+                    return leg_hits
+                logger.warning("msearch 返回结果数量与请求不一致，改为并发查询")
+            except Exception as e:
+                status_code = getattr(e, 'status_code', None) or getattr(getattr(e, 'meta', None), 'status', None)
+                if isinstance(e, AttributeError) or status_code in (400, 404, 405):
+                    # 客户端或服务端不支持 msearch，后续直接并发查询
+                    self.msearch_supported = False
+                logger.warning(f"msearch 失败: {e}，改为并发查询")
+
+        def run_search(body):
+            try:
+                return self.es.search(index=index_name, body=body).get('hits', {}).get('hits', [])
+            except Exception as e:
+                logger.warning(f"搜索失败: {e}")
+                return None
+
+        futures = [_search_executor.submit(run_search, body) for body in bodies]
+        return [future.result() for future in futures]
+
+    def _parent_doc_id(self, child_doc_id: str) -> str:
+        """
+        从子文档ID中提取父文档ID
+        子文档ID格式: {knowledge_id}_{file_id}_chunk_{chunk_index}
+        父文档ID格式: {knowledge_id}_{file_id}
+        """
+        if "_chunk_" in child_doc_id:
+            return child_doc_id.split("_chunk_")[0]
+        return child_doc_id
+
+    def get_parent_documents(self, index_name: str, child_doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量获取父文档：先查TTL缓存，未命中的父文档ID去重后一次 mget
+
+        Args:
+            index_name: 索引名称
+            child_doc_ids: 子文档ID（或父文档ID）列表
+
+        Returns:
+            Dict[str, Dict[str, Any]]: 父文档ID -> 父文档信息，不存在的父文档不在结果中
+        """
+        parent_ids = list(dict.fromkeys(self._parent_doc_id(doc_id) for doc_id in child_doc_ids))
+        if not parent_ids:
+            return {}
+
+        result = {}
+        missing = []
+        now = time.time()
+        with self.parent_cache_lock:
+            for parent_id in parent_ids:
+                cached = self.parent_cache.get((index_name, parent_id))
+                if cached is not None and cached[0] > now:
+                    self.parent_cache.move_to_end((index_name, parent_id))
+                    result[parent_id] = cached[1]
+                else:
+                    missing.append(parent_id)
+        if not missing or not self.es:
+            return result
+
+        try:
+            response = self.es.mget(index=index_name, body={"ids": missing})
+            fetched = {doc.get('_id'): doc.get('_source') for doc in response.get('docs', [])
+                       if doc.get('found')}
+        except Exception as e:
+            logger.error(f"批量获取父文档失败: {e}")
+            return result
+
+        expire_time = time.time() + PARENT_CACHE_TTL
+        with self.parent_cache_lock:
+            for parent_id, doc in fetched.items():
+                self.parent_cache[(index_name, parent_id)] = (expire_time, doc)
+                self.parent_cache.move_to_end((index_name, parent_id))
+            while len(self.parent_cache) > PARENT_CACHE_SIZE:
+                self.parent_cache.popitem(last=False)
+        result.update(fetched)
+        return result
+
+    def _invalidate_parent_cache(self, index_name: str, doc_ids: List[str] = None):
+        """文档写入或删除后清除父文档缓存，doc_ids 为空时清除整个索引的缓存"""
+        with self.parent_cache_lock:
+            if doc_ids is None:
+                for key in [key for key in self.parent_cache if key[0] == index_name]:
+                    self.parent_cache.pop(key, None)
+            else:
+                for doc_id in doc_ids:
+                    self.parent_cache.pop((index_name, doc_id), None)
+
     def _rrf_merge(self, text_results: List[Dict[str, Any]], 
                    vector_results: List[Dict[str, Any]], 
                    size: int = 10, k: int = 60) -> List[Dict[str, Any]]:
@@ -824,6 +951,7 @@ class ElasticSearchDB:
                 ])
 
             if body:
+                self._invalidate_parent_cache(index_name, [doc_id for doc_id, _ in documents])
                 response = self.es.bulk(body=body)
                 successful = response.get('errors', True) is False
                 logger.info(f"批量索引完成，成功: {response.get('items', []).__len__() if successful else 0}")
@@ -1080,15 +1208,9 @@ class ElasticSearchDB:
                 logger.error("Elasticsearch 连接未建立")
                 return None
 
-            # 从子文档ID中提取父文档ID
-            # 子文档ID格式: {knowledge_id}_{file_id}_chunk_{chunk_index}
-            # 父文档ID格式: {knowledge_id}_{file_id}
-            if "_chunk_" in child_doc_id:
-                parent_doc_id = child_doc_id.split("_chunk_")[0]
-                return self.get_document(index_name, parent_doc_id)
-            else:
-                # 如果已经是父文档ID，直接返回
-                return self.get_document(index_name, child_doc_id)
+            # 从子文档ID中提取父文档ID（如果已经是父文档ID，直接使用）
+            parent_doc_id = self._parent_doc_id(child_doc_id)
+            return self.get_parent_documents(index_name, [parent_doc_id]).get(parent_doc_id)
 
         except Exception as e:
             logger.error(f"获取父文档失败: {e}")
@@ -8,6 +8,7 @@ Created on 2024年9月5日
 '''
 
 import os
+import threading
 
 # from Emb.rerankers_embedding import CControl as RerankControl
 
@@ -30,6 +31,58 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+
+class MilvusMetaCache:
+    '''
+    Milvus元数据缓存
+    按集合缓存存在性、Collection句柄、分区列表与向量维度，
+    同一连接别名下的所有MilvusService实例共享，创建/删除集合或分区时同步更新
+    '''
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        # 集合名 -> 是否存在
+        self.exists = {}
+        # 集合名 -> Collection对象
+        self.collections = {}
+        # 集合名 -> 分区名集合
+        self.partitions = {}
+        # 集合名 -> 向量维度
+        self.dims = {}
+
+    def invalidate(self, collection_name=None):
+        '''
+        清除缓存
+
+        Args:
+            collection_name: 集合名称，为None时清除全部缓存
+        '''
+        with self.lock:
+            if collection_name is None:
+                self.exists.clear()
+                self.collections.clear()
+                self.partitions.clear()
+                self.dims.clear()
+            else:
+                self.exists.pop(collection_name, None)
+                self.collections.pop(collection_name, None)
+                self.partitions.pop(collection_name, None)
+                self.dims.pop(collection_name, None)
+
+
+# 连接别名 -> 元数据缓存
+_meta_caches = {}
+_meta_caches_lock = threading.Lock()
+
+
+def get_meta_cache(alias='default'):
+    '''获取指定连接别名的元数据缓存'''
+    with _meta_caches_lock:
+        if alias not in _meta_caches:
+            _meta_caches[alias] = MilvusMetaCache()
+        return _meta_caches[alias]
+
+
 class MilvusService:
     '''
     Milvus向量数据库服务类
@@ -47,6 +100,7 @@ class MilvusService:
         '''
         # 检查是否启用Milvus
         self.enabled = is_milvus_enabled()
+        self.meta_cache = get_meta_cache(alias)
         
         if not self.enabled:
             logger.info("Milvus已禁用（MILVUS_FLAG=False），跳过连接初始化")
@@ -114,6 +168,10 @@ class MilvusService:
         # ]
         # schema = CollectionSchema(fields=fields, description=description)
         collection = Collection(name=collection_name, schema=schema, using=self.alias)
+        with self.meta_cache.lock:
+            self.meta_cache.exists[collection_name] = True
+            self.meta_cache.collections[collection_name] = collection
+            self.meta_cache.partitions[collection_name] = {p.name for p in collection.partitions}
         fields = schema.fields
         self.create_index(collection_name, fields, index_params)
         return collection
@@ -159,12 +217,18 @@ class MilvusService:
             logger.debug("Milvus已禁用，跳过检查集合操作")
             return False
             
+        exists = self.meta_cache.exists.get(collection_name)
+        if exists is not None:
+            return exists
         try:
             # collection = self.get_collection(collection_name)
             # _ = collection.num_entities  # 尝试访问属性以确认集合是否存在
-            return utility.has_collection(collection_name, using=self.alias)
+            exists = utility.has_collection(collection_name, using=self.alias)
         except Exception:
             return False
+        with self.meta_cache.lock:
+            self.meta_cache.exists[collection_name] = exists
+        return exists
 
     def drop_collection(self, collection_name):
         '''
@@ -173,7 +237,10 @@ class MilvusService:
         Args:
             collection_name: 集合名称
         '''
-        utility.drop_collection(collection_name, using=self.alias)
+        try:
+            utility.drop_collection(collection_name, using=self.alias)
+        finally:
+            self.meta_cache.invalidate(collection_name)
 
     def get_collection(self, collection_name):
         '''
@@ -188,8 +255,52 @@ class MilvusService:
         if not self.enabled:
             logger.debug("Milvus已禁用，跳过获取集合操作")
             return None
+        
+        collection = self.meta_cache.collections.get(collection_name)
+        if collection is not None:
+            return collection
+        collection = Collection(collection_name, using=self.alias)
+        with self.meta_cache.lock:
+            self.meta_cache.exists[collection_name] = True
+            self.meta_cache.collections[collection_name] = collection
+        return collection
+    
+    def get_dim(self, collection_name, field_name=None):
+        '''
+        获取集合中向量字段的维度（从缓存的集合schema读取，不产生额外请求）
+        
+        Args:
+            collection_name: 集合名称
+            field_name: 向量字段名（可选，默认取第一个向量字段）
             
-        return Collection(collection_name, using=self.alias)
+        Returns:
+            int: 向量维度，集合不存在或无向量字段时返回None
+        '''
+        if field_name is None:
+            dim = self.meta_cache.dims.get(collection_name)
+            if dim is not None:
+                return dim
+        if not self.has_collection(collection_name):
+            return None
+        collection = self.get_collection(collection_name)
+        for field in collection.schema.fields:
+            if field.dtype == DataType.FLOAT_VECTOR and (field_name is None or field.name == field_name):
+                dim = int(field.params.get("dim"))
+                if field_name is None:
+                    with self.meta_cache.lock:
+                        self.meta_cache.dims[collection_name] = dim
+                return dim
+        return None
+    
+    def _get_partition_names(self, collection_name):
+        '''获取集合的分区名集合，首次访问时从服务端加载'''
+        names = self.meta_cache.partitions.get(collection_name)
+        if names is None:
+            collection = self.get_collection(collection_name)
+            names = {p.name for p in collection.partitions}
+            with self.meta_cache.lock:
+                self.meta_cache.partitions[collection_name] = names
+        return names
 
     def create_partition(self, collection_name, partition_name):
         '''
@@ -201,6 +312,8 @@ class MilvusService:
         '''
         collection = self.get_collection(collection_name)
         collection.create_partition(partition_name)
+        with self.meta_cache.lock:
+            self._get_partition_names(collection_name).add(partition_name)
         
     def get_partitions(self, collection_name):
         '''
@@ -213,7 +326,10 @@ class MilvusService:
             list: 分区列表
         '''
         collection = self.get_collection(collection_name)
-        return collection.partitions
+        partitions = collection.partitions
+        with self.meta_cache.lock:
+            self.meta_cache.partitions[collection_name] = {p.name for p in partitions}
+        return partitions
 
     def has_partition(self, collection_name, partition_name):
         '''
@@ -226,8 +342,7 @@ class MilvusService:
         Returns:
             bool: 存在返回True，否则返回False
         '''
-        collection = self.get_collection(collection_name)
-        return collection.has_partition(partition_name)
+        return partition_name in self._get_partition_names(collection_name)
     
     def release_partition(self, collection_name, partition_name):
         '''
@@ -252,11 +367,18 @@ class MilvusService:
             ValueError: 当分区不存在时抛出异常
         '''
         collection = self.get_collection(collection_name)
-        if not collection.has_partition(partition_name):
+        if not self.has_partition(collection_name, partition_name):
             raise ValueError(f"Partition '{partition_name}' does not exist in collection '{collection_name}'.")
         else:
-            self.release_partition(collection_name, partition_name)
-            collection.drop_partition(partition_name)
+            try:
+                self.release_partition(collection_name, partition_name)
+                collection.drop_partition(partition_name)
+            except Exception:
+                # 缓存可能已过期（例如被其他进程删除），清除后交由下次访问重新加载
+                self.meta_cache.invalidate(collection_name)
+                raise
+            with self.meta_cache.lock:
+                self._get_partition_names(collection_name).discard(partition_name)
 
     def insert(self, collection_name, data, partition_name=None):
         '''
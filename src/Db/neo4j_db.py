@@ -82,6 +82,24 @@ class KnowledgeGraph():
             
         return self.graph.run(cypher_query, parameters).data()    
     
+    def run_batches(self, cypher_query, rows, batch_size=5000):
+        """
+        分批执行 UNWIND $rows 形式的写入语句，每批一次请求、一个事务
+        :param cypher_query: 以 UNWIND $rows AS r 开头的Cypher语句
+        :param rows: 参数行列表
+        :param batch_size: 每批行数
+        :return: 执行的批次数
+        """
+        if not self.enabled or self.graph is None:
+            logger.debug("Neo4j已禁用，跳过批量写入操作")
+            return 0
+            
+        batch_num = 0
+        for i in range(0, len(rows), batch_size):
+            self.graph.run(cypher_query, {"rows": rows[i:i + batch_size]})
+            batch_num += 1
+        return batch_num
+    
     def delete_node(self, query):
         if not self.enabled or self.graph is None:
             logger.debug("Neo4j已禁用，跳过删除节点操作")
@@ -5,12 +5,24 @@ import json
 import os
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
-from Config.redis_config import get_redis_connection_params
+from Config.redis_config import get_redis_connection_params, get_redis_config
+
+# 每个会话保留的聊天记录条数
+CHAT_HISTORY_LIMIT = 100
+# 会话摘要中最后一条消息预览的长度
+PREVIEW_LENGTH = 100
+
 
 class RedisDB():
     """
     Redis数据库服务类
     提供对Redis数据库的基本操作封装，包括会话管理和聊天记录存储等功能
+
+    键结构：
+        chat_history:{session_id}        聊天记录（zset，分数为时间戳，保留最近100条）
+        chat_summary:{session_id}        会话摘要（hash：title、preview、updated_at、count、user_id），写入聊天记录时同步维护
+        user_sessions:{user_id}          用户的会话索引（zset，分数为最后更新时间）
+        user_sessions_indexed:{user_id}  该用户的历史会话已补建摘要与索引的标记
     """
     
     def __init__(self, host=None, port=None, db=None, password=None, username=None):
@@ -53,8 +65,44 @@ class RedisDB():
         if self.username:
             connection_params["username"] = self.username
         
-        # 建立连接
-        self.client = redis.Redis(**connection_params)
+        # 建立连接池（连接数达到上限时等待空闲连接），所有线程共享
+        pool_params = get_redis_config().get_pool_params()
+        self.pool = redis.BlockingConnectionPool(timeout=pool_params["socket_timeout"],
+                                                 **pool_params, **connection_params)
+        self.client = redis.Redis(connection_pool=self.pool)
+
+    @staticmethod
+    def _history_key(session_id: str) -> str:
+        return f"chat_history:{session_id}"
+
+    @staticmethod
+    def _summary_key(session_id: str) -> str:
+        return f"chat_summary:{session_id}"
+
+    @staticmethod
+    def _user_sessions_key(user_id: str) -> str:
+        return f"user_sessions:{user_id}"
+
+    @staticmethod
+    def _parse_time(value: Optional[str]) -> float:
+        """会话表中的时间字符串（%Y-%m-%d %H:%M:%S）转为时间戳，无法解析时返回0"""
+        try:
+            return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").timestamp()
+        except (TypeError, ValueError):
+            return 0.0
+
+    @staticmethod
+    def _preview(chat_record: Dict[str, Any]) -> str:
+        """取聊天记录中回复（无回复时取提问）的文本内容作为最后一条消息预览"""
+        for field in ("response", "query"):
+            items = chat_record.get(field) or []
+            if isinstance(items, str):
+                items = [{"type": "text", "content": items}]
+            text = " ".join(str(item.get("content", "")) for item in items
+                            if isinstance(item, dict) and item.get("type", "text") == "text").strip()
+            if text:
+                return text[:PREVIEW_LENGTH]
+        return ""
     
     def save_user_session(self, session_id: str, user_info: Dict[str, Any]) -> bool:
         """
@@ -115,25 +163,40 @@ class RedisDB():
             print(f"删除用户会话失败: {e}")
             return False
     
-    def save_chat_history(self, session_id: str, chat_record: Dict[str, Any]) -> bool:
+    def save_chat_history(self, session_id: str, chat_record: Dict[str, Any],
+                          user_id: Optional[str] = None, session_name: Optional[str] = None) -> bool:
         """
-        保存用户聊天记录（按session_id保存）
+        保存用户聊天记录（按session_id保存），并在同一事务中更新会话摘要与用户会话索引
         
         Args:
             session_id: 会话ID
             chat_record: 聊天记录字典，应包含timestamp, query, response等字段
+            user_id: 用户ID（可选，提供时更新用户会话索引）
+            session_name: 会话名称（可选，提供时更新摘要标题）
             
         Returns:
             bool: 保存成功返回True，否则返回False
         """
         try:
-            key = f"chat_history:{session_id}"
+            key = self._history_key(session_id)
+            summary_key = self._summary_key(session_id)
             # 添加时间戳作为排序分数
             timestamp = chat_record.get('timestamp', datetime.now().timestamp())
             value = json.dumps(chat_record)
-            self.client.zadd(key, {value: timestamp})
-            # 保留最近100条记录
-            self.client.zremrangebyrank(key, 0, -101)
+            summary = {"updated_at": timestamp, "preview": self._preview(chat_record)}
+            if user_id:
+                summary["user_id"] = user_id
+            if session_name:
+                summary["title"] = session_name
+            with self.client.pipeline(transaction=True) as pipe:
+                pipe.zadd(key, {value: timestamp})
+                # 保留最近100条记录
+                pipe.zremrangebyrank(key, 0, -(CHAT_HISTORY_LIMIT + 1))
+                pipe.hset(summary_key, mapping=summary)
+                pipe.hincrby(summary_key, "count", 1)
+                if user_id:
+                    pipe.zadd(self._user_sessions_key(user_id), {session_id: timestamp})
+                pipe.execute()
             return True
         except Exception as e:
             print(f"保存聊天记录失败: {e}")
@@ -151,7 +214,7 @@ class RedisDB():
         """
         try:
             # 使用session_id直接获取聊天记录
-            chat_history_key = f"chat_history:{session_id}"
+            chat_history_key = self._history_key(session_id)
             records = self.client.zrevrange(chat_history_key, 0, -1)  # 获取所有记录
             return [json.loads(record) for record in records]
         except Exception as e:
@@ -160,7 +223,7 @@ class RedisDB():
 
     def update_last_chat_history(self, session_id: str, updated_record: Dict[str, Any]) -> bool:
         """
-        更新最后一条聊天记录
+        更新最后一条聊天记录，并同步会话摘要
 
         Args:
             session_id: 会话ID
@@ -170,9 +233,13 @@ class RedisDB():
             bool: 更新成功返回True，否则返回False
         """
         try:
-            key = f"chat_history:{session_id}"
-            # 获取最后一条记录（分数最高的，即最新的）
-            last_records = self.client.zrevrange(key, 0, 0, withscores=True)
+            key = self._history_key(session_id)
+            summary_key = self._summary_key(session_id)
+            # 获取最后一条记录（分数最高的，即最新的）及会话所属用户
+            with self.client.pipeline(transaction=False) as pipe:
+                pipe.zrevrange(key, 0, 0, withscores=True)
+                pipe.hget(summary_key, "user_id")
+                last_records, user_id = pipe.execute()
 
             if not last_records:
                 print(f"没有找到session_id为{session_id}的聊天记录")
@@ -185,12 +252,16 @@ class RedisDB():
             if 'timestamp' not in updated_record:
                 updated_record['timestamp'] = last_score
 
-            # 删除旧记录
-            self.client.zrem(key, last_record_json)
-
-            # 添加更新后的记录
+            # 在同一事务中替换旧记录并更新摘要
             updated_value = json.dumps(updated_record)
-            self.client.zadd(key, {updated_value: updated_record['timestamp']})
+            with self.client.pipeline(transaction=True) as pipe:
+                pipe.zrem(key, last_record_json)
+                pipe.zadd(key, {updated_value: updated_record['timestamp']})
+                pipe.hset(summary_key, mapping={"updated_at": updated_record['timestamp'],
+                                                "preview": self._preview(updated_record)})
+                if user_id:
+                    pipe.zadd(self._user_sessions_key(user_id), {session_id: updated_record['timestamp']})
+                pipe.execute()
 
             return True
         except Exception as e:
@@ -208,7 +279,7 @@ class RedisDB():
             Dict: 最后一条聊天记录字典，不存在返回None
         """
         try:
-            key = f"chat_history:{session_id}"
+            key = self._history_key(session_id)
             # 获取最后一条记录（分数最高的，即最新的）
             last_records = self.client.zrevrange(key, 0, 0)
 
@@ -222,6 +293,170 @@ class RedisDB():
             print(f"获取最后一条聊天记录失败: {e}")
             return None
 
+    def register_session(self, user_id: str, session_id: str, session_name: str = "",
+                         timestamp: Optional[float] = None) -> bool:
+        """
+        新建会话时登记会话摘要与用户会话索引（尚无聊天记录的会话也出现在会话列表中）
+
+        Args:
+            user_id: 用户ID
+            session_id: 会话ID
+            session_name: 会话名称
+            timestamp: 创建时间戳（可选，默认当前时间）
+
+        Returns:
+            bool: 登记成功返回True，否则返回False
+        """
+        try:
+            timestamp = timestamp if timestamp is not None else datetime.now().timestamp()
+            summary_key = self._summary_key(session_id)
+            with self.client.pipeline(transaction=True) as pipe:
+                # 已有摘要（已写入过聊天记录）时不覆盖
+                pipe.hsetnx(summary_key, "title", session_name or "")
+                pipe.hsetnx(summary_key, "preview", "")
+                pipe.hsetnx(summary_key, "updated_at", timestamp)
+                pipe.hsetnx(summary_key, "count", 0)
+                pipe.hsetnx(summary_key, "user_id", user_id)
+                pipe.zadd(self._user_sessions_key(user_id), {session_id: timestamp}, nx=True)
+                pipe.execute()
+            return True
+        except Exception as e:
+            print(f"登记会话失败: {e}")
+            return False
+
+    def get_session_summaries(self, user_id: str, offset: int = 0, limit: int = 20) -> Optional[Dict[str, Any]]:
+        """
+        按最后更新时间倒序分页获取用户的会话摘要（只读取摘要，不读取聊天记录）
+
+        Args:
+            user_id: 用户ID
+            offset: 起始位置
+            limit: 条数
+
+        Returns:
+            Dict: {"indexed": 是否已补建历史会话, "total": 会话总数, "sessions": [摘要, ...]}，失败返回None
+                摘要格式: {"session_id", "title", "preview", "updated_at", "count"}
+        """
+        try:
+            user_key = self._user_sessions_key(user_id)
+            with self.client.pipeline(transaction=False) as pipe:
+                pipe.exists(f"user_sessions_indexed:{user_id}")
+                pipe.zcard(user_key)
+                pipe.zrevrange(user_key, offset, offset + limit - 1)
+                indexed, total, session_ids = pipe.execute()
+
+            rows = []
+            if session_ids:
+                with self.client.pipeline(transaction=False) as pipe:
+                    for session_id in session_ids:
+                        pipe.hgetall(self._summary_key(session_id))
+                    rows = pipe.execute()
+
+            sessions = []
+            for session_id, row in zip(session_ids, rows):
+                sessions.append({
+                    "session_id": session_id,
+                    "title": row.get("title", ""),
+                    "preview": row.get("preview", ""),
+                    "updated_at": float(row.get("updated_at", 0)),
+                    # count为累计写入条数，聊天记录只保留最近100条
+                    "count": min(int(row.get("count", 0)), CHAT_HISTORY_LIMIT),
+                })
+            return {"indexed": bool(indexed), "total": total, "sessions": sessions}
+        except Exception as e:
+            print(f"获取会话摘要失败: {e}")
+            return None
+
+    def rebuild_session_summaries(self, user_id: str, sessions: List[Dict[str, str]]) -> int:
+        """
+        根据已有聊天记录补建会话摘要与用户会话索引（用于摘要功能上线前写入的会话）
+
+        Args:
+            user_id: 用户ID
+            sessions: 会话列表，元素包含 session_id、session_name、session_create_time
+
+        Returns:
+            int: 建立索引的会话数（没有聊天记录的会话按创建时间登记）
+        """
+        try:
+            with self.client.pipeline(transaction=False) as pipe:
+                for session in sessions:
+                    key = self._history_key(session["session_id"])
+                    pipe.zrevrange(key, 0, 0, withscores=True)
+                    pipe.zcard(key)
+                results = pipe.execute()
+
+            indexed = 0
+            with self.client.pipeline(transaction=True) as pipe:
+                for i, session in enumerate(sessions):
+                    last_records, count = results[2 * i], results[2 * i + 1]
+                    if last_records:
+                        last_record_json, last_score = last_records[0]
+                        preview = self._preview(json.loads(last_record_json))
+                    else:
+                        last_score, preview = self._parse_time(session.get("session_create_time")), ""
+                    session_id = session["session_id"]
+                    pipe.hset(self._summary_key(session_id), mapping={
+                        "title": session.get("session_name", ""),
+                        "preview": preview,
+                        "updated_at": last_score,
+                        "count": count,
+                        "user_id": user_id,
+                    })
+                    pipe.zadd(self._user_sessions_key(user_id), {session_id: last_score})
+                    indexed += 1
+                pipe.set(f"user_sessions_indexed:{user_id}", 1)
+                pipe.execute()
+            return indexed
+        except Exception as e:
+            print(f"补建会话摘要失败: {e}")
+            return 0
+
+    def delete_chat_history(self, session_id: str) -> bool:
+        """
+        删除会话的聊天记录、摘要及其在用户会话索引中的条目
+
+        Args:
+            session_id: 会话ID
+
+        Returns:
+            bool: 删除成功返回True，否则返回False
+        """
+        try:
+            summary_key = self._summary_key(session_id)
+            user_id = self.client.hget(summary_key, "user_id")
+            with self.client.pipeline(transaction=True) as pipe:
+                pipe.delete(self._history_key(session_id), summary_key)
+                if user_id:
+                    pipe.zrem(self._user_sessions_key(user_id), session_id)
+                pipe.execute()
+            return True
+        except Exception as e:
+            print(f"删除聊天记录失败: {e}")
+            return False
+
+    def delete_user_chat_histories(self, user_id: str, session_ids: List[str]) -> bool:
+        """
+        删除用户所有会话的聊天记录、摘要与会话索引
+
+        Args:
+            user_id: 用户ID
+            session_ids: 会话ID列表
+
+        Returns:
+            bool: 删除成功返回True，否则返回False
+        """
+        try:
+            with self.client.pipeline(transaction=True) as pipe:
+                for session_id in session_ids:
+                    pipe.delete(self._history_key(session_id), self._summary_key(session_id))
+                pipe.delete(self._user_sessions_key(user_id), f"user_sessions_indexed:{user_id}")
+                pipe.execute()
+            return True
+        except Exception as e:
+            print(f"删除用户聊天记录失败: {e}")
+            return False
+
     def clear_chat_history(self, user_id: str) -> bool:
         """
         清除用户聊天历史记录
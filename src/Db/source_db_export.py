@@ -0,0 +1,206 @@
+# -*- coding:utf-8 -*-
+"""
+外部数据源查询结果流式导出
+
+1. MySQL 使用 SSCursor、PostgreSQL 使用命名游标（服务端游标），结果不在客户端整体缓存
+2. 每次 fetchmany 一批写入CSV，内存占用只与批大小有关，与结果总行数无关
+3. 导出时顺带保留前若干行作为预览；超过导出行数上限时停止读取并标记为截断
+4. 导出文件按用户分目录保存（目录名为user_id的摘要），下载时只能取自己目录下的文件；超过保留时间的文件定期删除
+"""
+
+import os
+import csv
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+try:
+    import pymysql
+    import pymysql.cursors
+    MYSQL_AVAILABLE = True
+except ImportError:
+    MYSQL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 过期文件清理最多每隔多少秒执行一次
+CLEANUP_INTERVAL = 60.0
+_last_cleanup = 0.0
+_cleanup_lock = threading.Lock()
+
+
+def _owner_dir_name(user_id) -> str:
+    """用户导出目录名：user_id的摘要，避免路径穿越且不暴露user_id"""
+    return hashlib.sha256(str(user_id).encode("utf-8")).hexdigest()[:32]
+
+
+def new_export_path(export_dir: str, user_id) -> str:
+    """
+    生成新的导出文件路径（不含扩展名）：export_dir/<用户目录>/<随机文件名>
+
+    Args:
+        export_dir: 导出目录
+        user_id: 导出者的用户ID
+    """
+    return os.path.join(export_dir, _owner_dir_name(user_id), uuid.uuid4().hex[:16])
+
+
+def resolve_export_file(export_dir: str, user_id, file_path: str) -> Optional[str]:
+    """
+    校验下载请求的文件是该用户导出的CSV文件
+
+    Returns:
+        文件的绝对路径；路径不在该用户的导出目录下、不是CSV文件时返回None
+    """
+    if not user_id or not file_path:
+        return None
+    owner_dir = os.path.abspath(os.path.join(export_dir, _owner_dir_name(user_id)))
+    file_name = os.path.basename(file_path)
+    resolved = os.path.abspath(os.path.join(owner_dir, file_name))
+    if not file_name.endswith(".csv") or resolved != os.path.abspath(file_path):
+        return None
+    return resolved
+
+
+def cleanup_expired_exports(export_dir: str, ttl: float, force: bool = False) -> int:
+    """
+    删除超过保留时间的导出文件；未指定 force 时最多每 CLEANUP_INTERVAL 秒执行一次
+
+    Args:
+        export_dir: 导出目录
+        ttl: 保留时间（秒），0表示不删除
+
+    Returns:
+        删除的文件数
+    """
+    global _last_cleanup
+    if ttl <= 0 or not os.path.isdir(export_dir):
+        return 0
+    now = time.time()
+    with _cleanup_lock:
+        if not force and now - _last_cleanup < CLEANUP_INTERVAL:
+            return 0
+        _last_cleanup = now
+
+    removed = 0
+    for root, _, files in os.walk(export_dir):
+        for name in files:
+            if not name.endswith(".csv"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                if now - os.path.getmtime(path) > ttl:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                # 文件可能正被其他线程删除
+                pass
+    if removed:
+        logger.info(f"已删除 {removed} 个过期的查询结果文件")
+    return removed
+
+
+def _is_select(sql: str) -> bool:
+    """命名游标只能用于 SELECT / WITH 查询"""
+    head = sql.lstrip().lstrip("(").lstrip()[:6].lower()
+    return head.startswith("select") or head.startswith("with")
+
+
+def open_stream_cursor(conn, db_type: str, sql: str, batch_size: int = 5000):
+    """
+    执行查询并返回服务端游标，无法使用服务端游标时退回普通游标
+
+    Args:
+        conn: 数据库连接
+        db_type: 数据库类型（mysql / postgresql / 其他）
+        sql: 查询SQL
+        batch_size: 每批读取行数（PostgreSQL命名游标的 itersize）
+    """
+    if db_type == 'mysql' and MYSQL_AVAILABLE:
+        cursor = conn.cursor(pymysql.cursors.SSCursor)
+    elif db_type == 'postgresql' and _is_select(sql):
+        cursor = conn.cursor(name=f"export_{uuid.uuid4().hex[:16]}")
+        cursor.itersize = batch_size
+    else:
+        cursor = conn.cursor()
+    try:
+        cursor.execute(sql)
+    except Exception:
+        _close_cursor(cursor)
+        raise
+    return cursor
+
+
+def _close_cursor(cursor):
+    try:
+        cursor.close()
+    except Exception:
+        pass
+
+
+def stream_query_to_csv(conn, db_type: str, sql: str, csv_path: str, header: List[str],
+                        batch_size: int = 5000, preview_rows: int = 10, max_rows: int = 0) -> Dict[str, Any]:
+    """
+    执行查询并分批写入CSV
+
+    Args:
+        conn: 数据库连接
+        db_type: 数据库类型
+        sql: 查询SQL
+        csv_path: CSV文件路径
+        header: CSV表头
+        batch_size: 每批读取行数
+        preview_rows: 保留的预览行数
+        max_rows: 导出行数上限，0表示不限制
+
+    Returns:
+        {"rows": 写入行数, "preview": 前 preview_rows 行, "truncated": 是否因超过上限而截断}
+        截断时服务端游标未读完，调用方应丢弃该连接而不是归还复用
+
+    Raises:
+        执行或读取失败时抛出数据库异常，已写入的CSV文件会被删除
+    """
+    directory = os.path.dirname(csv_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    cursor = open_stream_cursor(conn, db_type, sql, batch_size)
+    rows = 0
+    preview = []
+    truncated = False
+    try:
+        with open(csv_path, mode='w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                if max_rows and rows + len(batch) > max_rows:
+                    batch = batch[:max_rows - rows]
+                    truncated = True
+                writer.writerows(batch)
+                if len(preview) < preview_rows:
+                    preview.extend(list(row) for row in batch[:preview_rows - len(preview)])
+                rows += len(batch)
+                if truncated:
+                    break
+    except Exception:
+        _close_cursor(cursor)
+        try:
+            os.remove(csv_path)
+        except OSError:
+            pass
+        raise
+
+    if truncated:
+        logger.warning(f"查询结果超过导出上限 {max_rows} 行，已截断: {csv_path}")
+        # MySQL 的 SSCursor 关闭时会读完剩余结果，截断时交给调用方直接丢弃连接
+        if db_type != 'mysql':
+            _close_cursor(cursor)
+    else:
+        _close_cursor(cursor)
+    return {"rows": rows, "preview": preview, "truncated": truncated}
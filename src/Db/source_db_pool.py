@@ -0,0 +1,350 @@
+# -*- coding:utf-8 -*-
+"""
+外部数据源（MySQL / PostgreSQL）连接池
+
+1. 每个sql_id一个连接池，首次使用时创建；数据源被删除或连接信息变化时关闭
+2. 池内连接均为只读会话并设置语句超时，用于表结构读取与执行模型生成的查询SQL
+3. 取出时检查连接存活（空闲超过 ping_interval 的连接先ping），空闲超过 max_idle 或存活超过 max_lifetime 的连接被关闭，
+   归还时回滚，避免复用到上一次查询的事务快照
+"""
+
+import time
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from Config.sql_config import get_sql_pool_config
+
+try:
+    import pymysql
+    MYSQL_AVAILABLE = True
+except ImportError:
+    MYSQL_AVAILABLE = False
+
+try:
+    import psycopg2
+    POSTGRESQL_AVAILABLE = True
+except ImportError:
+    POSTGRESQL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class SourcePoolTimeout(Exception):
+    """等待空闲连接超时"""
+    pass
+
+
+def open_source_connection(ip, port, sql_type, sql_name, sql_user_name, sql_user_password,
+                           read_only=False, statement_timeout=0, connect_timeout=10):
+    """
+    建立到外部数据源的连接
+
+    Args:
+        read_only: 是否设置为只读会话
+        statement_timeout: 单条语句执行超时（秒），0表示不限制
+        connect_timeout: 建立连接超时（秒）
+
+    Returns:
+        tuple: (连接, 数据库类型)
+    """
+    timeout_ms = int(statement_timeout * 1000)
+    if sql_type == 'mysql':
+        if not MYSQL_AVAILABLE:
+            raise Exception("PyMySQL未安装，无法连接MySQL数据库")
+        kwargs = {}
+        if statement_timeout:
+            # 套接字读超时作为兜底，语句本身由服务端超时中断
+            kwargs["read_timeout"] = int(statement_timeout) + 5
+        conn = pymysql.connect(
+            host=ip,
+            port=int(port),
+            user=sql_user_name,
+            password=sql_user_password,
+            database=sql_name,
+            charset='utf8mb4',
+            connect_timeout=connect_timeout,
+            **kwargs
+        )
+        with conn.cursor() as cursor:
+            if read_only:
+                cursor.execute("SET SESSION TRANSACTION READ ONLY")
+            if timeout_ms:
+                try:
+                    cursor.execute(f"SET SESSION MAX_EXECUTION_TIME = {timeout_ms}")
+                except pymysql.MySQLError:
+                    # MariaDB 使用 max_statement_time（秒）
+                    try:
+                        cursor.execute(f"SET SESSION max_statement_time = {float(statement_timeout)}")
+                    except pymysql.MySQLError as e:
+                        logger.warning(f"数据库不支持语句超时设置: {e}")
+        return conn, 'mysql'
+    elif sql_type == 'postgresql':
+        if not POSTGRESQL_AVAILABLE:
+            raise Exception("psycopg2未安装，无法连接PostgreSQL数据库")
+        options = []
+        if timeout_ms:
+            options.append(f"-c statement_timeout={timeout_ms}")
+        if read_only:
+            options.append("-c default_transaction_read_only=on")
+        kwargs = {"options": " ".join(options)} if options else {}
+        conn = psycopg2.connect(
+            host=ip,
+            port=int(port),
+            user=sql_user_name,
+            password=sql_user_password,
+            database=sql_name,
+            connect_timeout=connect_timeout,
+            **kwargs
+        )
+        return conn, 'postgresql'
+    else:
+        raise Exception(f"不支持的数据库类型: {sql_type}")
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class SourceConnectionPool:
+    """单个数据源的连接池（线程安全）"""
+
+    def __init__(self, connect: Callable[[], Any], db_type: str, min_size=0, max_size=8, max_idle=300.0,
+                 max_lifetime=1800.0, checkout_timeout=30.0, ping_interval=5.0):
+        """
+        Args:
+            connect: 建立新连接的函数
+            db_type: 数据库类型（mysql / postgresql）
+            min_size: 空闲回收时保留的最少连接数
+            max_size: 最大连接数（含已取出的连接）
+            max_idle: 连接最长空闲时间（秒）
+            max_lifetime: 连接最长存活时间（秒），0表示不限制
+            checkout_timeout: 连接池已满时等待空闲连接的时间（秒）
+            ping_interval: 空闲超过该时间（秒）的连接取出时先做存活检查
+        """
+        self.connect = connect
+        self.db_type = db_type
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.checkout_timeout = checkout_timeout
+        self.ping_interval = ping_interval
+
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_size)
+        # 空闲连接 [(连接, 创建时间, 最后使用时间)]，后进先出
+        self.idle = []
+        # 已取出连接 id -> 创建时间
+        self.in_use = {}
+        self.closed = False
+        self.stats = {"connects": 0, "reuses": 0, "pings": 0, "discarded": 0, "evicted": 0, "timeouts": 0}
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.max_lifetime > 0 and now - created_at > self.max_lifetime
+
+    def _evict_locked(self, now: float) -> list:
+        """在持有 self.lock 时调用，返回需要关闭的连接"""
+        evicted, kept = [], []
+        total = len(self.idle) + len(self.in_use)
+        # 先检查最久未使用的连接
+        for item in self.idle:
+            conn, created_at, last_used = item
+            if self._expired(created_at, now) or (now - last_used > self.max_idle and total > self.min_size):
+                evicted.append(conn)
+                total -= 1
+            else:
+                kept.append(item)
+        self.idle = kept
+        self.stats["evicted"] += len(evicted)
+        return evicted
+
+    def evict_idle(self):
+        """关闭空闲超时或超过最长存活时间的连接"""
+        with self.lock:
+            evicted = self._evict_locked(time.time())
+        for conn in evicted:
+            _close_quietly(conn)
+
+    def _is_alive(self, conn, last_used: float) -> bool:
+        """检查连接是否可用：已关闭的连接直接丢弃，空闲较久的连接先ping"""
+        if getattr(conn, "closed", False) or getattr(conn, "open", True) is False:
+            return False
+        if time.time() - last_used < self.ping_interval:
+            return True
+        with self.lock:
+            self.stats["pings"] += 1
+        try:
+            if self.db_type == 'mysql' and hasattr(conn, "ping"):
+                conn.ping(False)
+            else:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+                cursor.close()
+                conn.rollback()
+            return True
+        except Exception as e:
+            logger.info(f"数据源连接已失效，重新建立: {e}")
+            return False
+
+    def acquire(self):
+        """
+        取出一个连接，连接池已满时最多等待 checkout_timeout 秒
+
+        Raises:
+            SourcePoolTimeout: 等待超时
+        """
+        if not self.slots.acquire(timeout=self.checkout_timeout):
+            with self.lock:
+                self.stats["timeouts"] += 1
+            raise SourcePoolTimeout(f"等待数据库连接超时（{self.checkout_timeout}秒），连接池上限 {self.max_size}")
+        try:
+            while True:
+                with self.lock:
+                    if self.closed:
+                        raise Exception("数据库连接池已关闭")
+                    evicted = self._evict_locked(time.time())
+                    item = self.idle.pop() if self.idle else None
+                for conn in evicted:
+                    _close_quietly(conn)
+                if item is None:
+                    break
+                conn, created_at, last_used = item
+                if self._is_alive(conn, last_used):
+                    with self.lock:
+                        self.in_use[id(conn)] = created_at
+                        self.stats["reuses"] += 1
+                    return conn
+                with self.lock:
+                    self.stats["discarded"] += 1
+                _close_quietly(conn)
+
+            conn = self.connect()
+            with self.lock:
+                self.in_use[id(conn)] = time.time()
+                self.stats["connects"] += 1
+            return conn
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, conn, discard=False):
+        """
+        归还连接：回滚未结束的事务后放回空闲列表；回滚失败、连接池已关闭或连接超过最长存活时间时关闭连接
+        """
+        with self.lock:
+            created_at = self.in_use.pop(id(conn), 0)
+        try:
+            if not discard:
+                try:
+                    conn.rollback()
+                except Exception:
+                    discard = True
+            now = time.time()
+            with self.lock:
+                keep = not discard and not self.closed and not self._expired(created_at, now)
+                if keep:
+                    self.idle.append((conn, created_at, now))
+                else:
+                    self.stats["discarded"] += 1
+            if not keep:
+                _close_quietly(conn)
+        finally:
+            self.slots.release()
+
+    @contextmanager
+    def connection(self):
+        """以上下文管理器方式取出连接，结束时自动归还"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """关闭连接池：立即关闭空闲连接，已取出的连接在归还时关闭"""
+        with self.lock:
+            self.closed = True
+            idle, self.idle = self.idle, []
+        for conn, _, _ in idle:
+            _close_quietly(conn)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池统计"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats["idle"] = len(self.idle)
+            stats["in_use"] = len(self.in_use)
+        stats["db_type"] = self.db_type
+        stats["max_size"] = self.max_size
+        return stats
+
+
+# sql_id -> (连接信息指纹, 连接池)
+_pools: Dict[str, tuple] = {}
+_pools_lock = threading.Lock()
+
+
+def get_source_pool(sql_id, ip, port, sql_type, sql_name, sql_user_name, sql_user_password) -> SourceConnectionPool:
+    """
+    获取数据源的连接池，首次使用时创建；同一sql_id的连接信息变化时关闭旧连接池并重建
+
+    Args:
+        sql_id: 数据源ID，为空时按连接地址区分
+    """
+    fingerprint = (str(ip), str(port), sql_type, sql_name, sql_user_name,
+                   hashlib.sha256(str(sql_user_password).encode("utf-8")).hexdigest())
+    key = sql_id or f"{sql_type}://{sql_user_name}@{ip}:{port}/{sql_name}"
+    stale = None
+    with _pools_lock:
+        entry = _pools.get(key)
+        if entry is not None and entry[0] == fingerprint and not entry[1].closed:
+            pool = entry[1]
+        else:
+            if entry is not None:
+                stale = entry[1]
+            config = get_sql_pool_config()
+            pool = SourceConnectionPool(
+                lambda: open_source_connection(ip, port, sql_type, sql_name, sql_user_name, sql_user_password,
+                                               read_only=True, statement_timeout=config.statement_timeout,
+                                               connect_timeout=config.connect_timeout)[0],
+                sql_type,
+                min_size=config.min_size,
+                max_size=config.max_size,
+                max_idle=config.max_idle,
+                max_lifetime=config.max_lifetime,
+                checkout_timeout=config.checkout_timeout,
+                ping_interval=config.ping_interval,
+            )
+            _pools[key] = (fingerprint, pool)
+        others = [p for _, p in _pools.values() if p is not pool]
+    if stale is not None:
+        stale.close()
+    # 顺带回收其他数据源的空闲连接
+    for other in others:
+        other.evict_idle()
+    return pool
+
+
+def close_source_pool(sql_id) -> bool:
+    """关闭并移除数据源的连接池（数据源删除或更新时调用）"""
+    with _pools_lock:
+        entry = _pools.pop(sql_id, None)
+    if entry is None:
+        return False
+    entry[1].close()
+    logger.info(f"已关闭数据源连接池: {sql_id}")
+    return True
+
+
+def get_source_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """获取所有数据源连接池的统计"""
+    with _pools_lock:
+        pools = {key: pool for key, (_, pool) in _pools.items()}
+    return {key: pool.get_stats() for key, pool in pools.items()}
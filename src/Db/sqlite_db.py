@@ -3,24 +3,257 @@
 import os
 import sqlite3
 import threading
+import time
+import weakref
 # import logging
 import json
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 
 # logger = logging.getLogger('werkzeug')
 
+# 连接参数：WAL模式下读写互不阻塞，写入遇到锁时最多等待BUSY_TIMEOUT_MS
+BUSY_TIMEOUT_MS = 30000
+CACHE_SIZE_KB = 16384
+MMAP_SIZE = 268435456
+# 每个连接缓存的预编译语句数量
+CACHED_STATEMENTS = 256
+# 线程退出后保留的空闲连接数量
+MAX_IDLE_CONNECTIONS = 16
+
+# 第1版迁移：为模块内查询用到的WHERE条件建立索引，(索引名, 表名, 列)
+LOOKUP_INDEXES = [
+    ("idx_knowledge_base_knowledge_id", "knowledge_base", "knowledge_id"),
+    ("idx_knowledge_base_user_name", "knowledge_base", "create_user_id, name"),
+    ("idx_knowledge_base_name", "knowledge_base", "name"),
+    ("idx_file_basic_info_file_id", "file_basic_info", "file_id"),
+    ("idx_file_basic_info_knowledge_permission", "file_basic_info", "knowledge_id, permission_level"),
+    ("idx_file_basic_info_name_user", "file_basic_info", "file_name, upload_user_id"),
+    ("idx_file_basic_info_user", "file_basic_info", "upload_user_id"),
+    ("idx_file_basic_info_session_id", "file_basic_info", "session_id"),
+    ("idx_file_detail_info_file_id", "file_detail_info", "file_id"),
+    ("idx_file_detail_info_file_name", "file_detail_info", "file_name"),
+    ("idx_user_info_user_name", "user_info", "user_name"),
+    ("idx_user_info_user_id", "user_info", "user_id"),
+    ("idx_vector_file_file_id", "vector_file", "file_id"),
+    ("idx_graph_chunk_knowledge_chunk", "graph_chunk", "knowledge_id, chunk_id"),
+    ("idx_graph_chunk_file_id", "graph_chunk", "file_id"),
+    ("idx_graph_node_knowledge_id", "graph_node", "knowledge_id, entity_name"),
+    ("idx_graph_node_file_id", "graph_node", "file_id"),
+    ("idx_graph_relation_knowledge_id", "graph_relation", "knowledge_id"),
+    ("idx_graph_relation_file_id", "graph_relation", "file_id"),
+    ("idx_image_file_file_id", "image_file", "file_id"),
+    ("idx_table_data_file_id", "table_data", "file_id"),
+    ("idx_session_session_id", "session", "session_id"),
+    ("idx_session_user_id", "session", "user_id"),
+    ("idx_discussion_task_record_status", "discussion_task_record", "session_id, task_status"),
+    ("idx_discussion_task_record_discussion_id", "discussion_task_record", "discussion_id"),
+    ("idx_ingest_job_status", "ingest_job", "status, create_time"),
+    ("idx_ingest_job_knowledge_user", "ingest_job", "knowledge_id, user_id, create_time"),
+    ("idx_ingest_job_user_id", "ingest_job", "user_id, status"),
+    ("idx_ingest_job_file_id", "ingest_job", "file_id, status"),
+    ("idx_base_sql_user_id", "base_sql", "user_id, create_time"),
+    ("idx_table_sql_sql_name", "table_sql", "sql_id, table_name"),
+    ("idx_col_sql_table_col", "col_sql", "table_id, col_name"),
+    ("idx_rel_sql_sql_id", "rel_sql", "sql_id"),
+    ("idx_sql_des_sql_id", "sql_des", "sql_id"),
+]
+
+# 结点名称检索：trigram分词至少需要3个字符，更短的查询退回LIKE
+GRAPH_NODE_FTS_MIN_LENGTH = 3
+GRAPH_NODE_SEARCH_LIMIT = 50
+
+# 入库任务按执行顺序排列的处理阶段，每个阶段名同时也是任务处于该阶段时的状态
+INGEST_STAGES = ("parsing", "embedding", "graphing")
+
+# 按chunk_id批量查询时，单条IN语句的参数个数（SQLite默认上限999）
+GRAPH_CHUNK_QUERY_BATCH = 500
+# 热点chunk的LRU缓存条数
+GRAPH_CHUNK_CACHE_SIZE = 2048
+
+_WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "DROP", "ALTER")
+
+
+def _is_write_sql(sql):
+    return sql.lstrip().upper().startswith(_WRITE_PREFIXES)
+
+
+class _CursorProxy():
+    """
+    游标代理：写语句在全局写锁内执行，保证同一时刻只有一个写入者。
+    executemany 在一个事务内执行，整批只提交一次；显式事务内任一语句失败时，即使调用方捕获了异常，事务结束时也整体回滚。
+    """
+    
+    def __init__(self, cursor, db):
+        self._cursor = cursor
+        self._db = db
+    
+    def execute(self, sql, parameters=()):
+        try:
+            if _is_write_sql(sql):
+                with self._db.write_lock:
+                    self._cursor.execute(sql, parameters)
+            else:
+                self._cursor.execute(sql, parameters)
+        except Exception:
+            self._db.mark_transaction_failed()
+            raise
+        return self
+    
+    def executemany(self, sql, seq_of_parameters):
+        try:
+            with self._db.transaction():
+                self._cursor.executemany(sql, seq_of_parameters)
+        except Exception:
+            self._db.mark_transaction_failed()
+            raise
+        return self
+    
+    def __iter__(self):
+        return iter(self._cursor)
+    
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _ConnectionProxy():
+    """
+    连接代理：每个线程使用各自的连接，调用方仍按 cSingleSqlite.conn.cursor()/commit() 使用。
+    连接为自动提交模式：单条写语句自身是原子的；多条写语句需要放在 transaction() 中，
+    显式事务内的commit/rollback由transaction()统一处理。
+    """
+    
+    def __init__(self, db):
+        self._db = db
+    
+    def cursor(self):
+        return _CursorProxy(self._db.get_thread_connection().cursor(), self._db)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+    
+    def commit(self):
+        if not self._db.in_transaction():
+            self._db.get_thread_connection().commit()
+    
+    def rollback(self):
+        if not self._db.in_transaction():
+            self._db.get_thread_connection().rollback()
+    
+    def __getattr__(self, name):
+        return getattr(self._db.get_thread_connection(), name)
+
+
+class _ThreadSlot():
+    """挂在线程本地存储上的占位对象，线程结束被回收时把连接归还连接池"""
+    
+    def __init__(self, conn):
+        self.conn = conn
+        self.tx_depth = 0
+        # 显式事务内是否有语句执行失败
+        self.tx_failed = False
+
+
 class KnowledgeBaseDB():
     
     def __init__(self):
         self.conn = None
         self.db_path = "conf/sqlite/knowledge_base.sqlite"
         
+        self.local = threading.local()
+        self.idle_connections = []
+        self.pool_lock = threading.Lock()
+        # 全局写锁：所有写语句与显式事务按到达顺序串行执行
+        self.write_lock = threading.RLock()
+        # 结点名称全文索引是否可用，首次查询时确定
+        self.graph_node_fts = None
+        # (knowledge_id, chunk_id) -> chunk列表，graph_chunk有删除时整体清空
+        self.graph_chunk_cache = OrderedDict()
+        self.graph_chunk_cache_lock = threading.Lock()
+        
         # 初始化连接
         self.load_db()
         
+    def get_thread_connection(self):
+        """获取当前线程的连接，优先复用已退出线程归还的空闲连接"""
+        slot = getattr(self.local, "slot", None)
+        if slot is None:
+            conn = None
+            with self.pool_lock:
+                if self.idle_connections:
+                    conn = self.idle_connections.pop()
+            if conn is None:
+                conn = self.create_connection(self.db_path)
+            slot = _ThreadSlot(conn)
+            weakref.finalize(slot, self._release_connection, conn)
+            self.local.slot = slot
+        return slot.conn
+    
+    def _release_connection(self, conn):
+        """线程结束时归还连接"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            return
+        with self.pool_lock:
+            if len(self.idle_connections) < MAX_IDLE_CONNECTIONS:
+                self.idle_connections.append(conn)
+                return
+        conn.close()
+    
+    def in_transaction(self):
+        """当前线程是否处于transaction()开启的显式事务中"""
+        slot = getattr(self.local, "slot", None)
+        return slot is not None and slot.tx_depth > 0
+    
+    def mark_transaction_failed(self):
+        """记录当前线程的显式事务中有语句执行失败"""
+        slot = getattr(self.local, "slot", None)
+        if slot is not None and slot.tx_depth > 0:
+            slot.tx_failed = True
+    
+    @contextmanager
+    def transaction(self):
+        """
+        显式事务：持有写锁执行 BEGIN IMMEDIATE，块内所有写操作只在结束时提交一次，出错时回滚。
+        块内有语句执行失败时（包括被调用方捕获的异常）同样整体回滚并抛出 sqlite3.DatabaseError。
+        可嵌套，内层直接并入外层事务。
+        """
+        conn = self.get_thread_connection()
+        slot = self.local.slot
+        if slot.tx_depth > 0:
+            slot.tx_depth += 1
+            try:
+                yield self.conn
+            finally:
+                slot.tx_depth -= 1
+            return
+        with self.write_lock:
+            conn.execute("BEGIN IMMEDIATE;")
+            slot.tx_depth = 1
+            slot.tx_failed = False
+            try:
+                yield self.conn
+                if slot.tx_failed:
+                    raise sqlite3.DatabaseError("事务内有语句执行失败，已回滚")
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+            finally:
+                slot.tx_depth = 0
+                slot.tx_failed = False
+        
     def load_db(self):
         """初始化数据库连接并创建所有表"""
-        self.conn = self.create_connection(self.db_path)
+        self.conn = _ConnectionProxy(self)
         
         # 创建知识库表
         self.create_knowledge_base_table()
@@ -58,6 +291,9 @@ class KnowledgeBaseDB():
         # 创建任务记录表
         self.create_discussion_task_record_table()
         
+        # 创建文件入库任务队列表
+        self.create_ingest_job_table()
+        
         # 创建所有需要的表
         self.create_base_sql_table()
         self.create_table_sql_table()
@@ -66,6 +302,183 @@ class KnowledgeBaseDB():
         self.create_sql_des_table()
         self.create_schema_analysis_table()
         
+        # 执行未应用的数据库迁移
+        self.run_migrations()
+        
+    def get_migrations(self):
+        """按版本号排列的迁移列表：(版本号, 描述, 迁移函数)，迁移函数在事务中执行，参数为游标"""
+        return [
+            (1, "为查询条件列创建索引", self.migrate_v1_lookup_indexes),
+            (2, "创建结点名称trigram全文索引", self.migrate_v2_graph_node_fts),
+            (3, "table_sql增加表结构指纹列", self.migrate_v3_table_schema_hash),
+            (4, "graph_node增加INTEGER主键", self.migrate_v4_graph_node_primary_key),
+            (5, "ingest_job增加重试等待列", self.migrate_v5_ingest_job_not_before),
+            (6, "user_info用户名索引不再包含密码列", self.migrate_v6_user_name_index),
+        ]
+    
+    def create_schema_version_table(self):
+        """创建数据库版本表，记录已执行的迁移"""
+        try:
+            c = self.conn.cursor()
+            sql = '''CREATE TABLE IF NOT EXISTS schema_version (
+                        version INTEGER PRIMARY KEY,
+                        description TEXT,
+                        applied_time TEXT
+                    );'''
+            c.execute(sql)
+            self.conn.commit()
+            return True
+        except Exception as e:
+            print(f"创建数据库版本表失败: {e}")
+            return False
+    
+    def get_schema_version(self):
+        """查询当前数据库版本，未执行过迁移时为0"""
+        try:
+            c = self.conn.cursor()
+            c.execute('''SELECT MAX(version) FROM schema_version;''')
+            row = c.fetchone()
+            return row[0] if row and row[0] is not None else 0
+        except Exception as e:
+            print(f"查询数据库版本失败: {e}")
+            return 0
+    
+    def run_migrations(self):
+        """
+        按版本号依次执行未应用的迁移，每个迁移与版本记录在同一事务中提交
+        多进程同时启动时，事务内会再次确认版本，避免重复执行
+        """
+        if not self.create_schema_version_table():
+            return False
+        for version, description, migrate in self.get_migrations():
+            if version <= self.get_schema_version():
+                continue
+            try:
+                with self.transaction():
+                    if version <= self.get_schema_version():
+                        continue
+                    c = self.conn.cursor()
+                    migrate(c)
+                    c.execute('''INSERT INTO schema_version (version, description, applied_time) VALUES (?, ?, ?);''',
+                              (version, description, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                print(f"数据库迁移成功: v{version} {description}")
+            except Exception as e:
+                print(f"数据库迁移失败: v{version} {description}: {e}")
+                return False
+        return True
+    
+    def migrate_v1_lookup_indexes(self, c):
+        """v1：为各表查询、删除使用的WHERE条件创建（复合）索引"""
+        for index_name, table_name, columns in LOOKUP_INDEXES:
+            c.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({columns});")
+        # 更新统计信息，便于查询规划器选择索引
+        c.execute("ANALYZE;")
+    
+    def migrate_v2_graph_node_fts(self, c):
+        """
+        v2：为graph_node.entity_name建立FTS5 trigram全文索引（外部内容表，不重复存储数据），
+        通过触发器与graph_node保持同步；SQLite不支持FTS5 trigram时跳过，查询继续使用LIKE
+        """
+        try:
+            c.execute("CREATE VIRTUAL TABLE temp.fts_probe USING fts5(x, tokenize='trigram');")
+            c.execute("DROP TABLE temp.fts_probe;")
+        except sqlite3.OperationalError as e:
+            print(f"当前SQLite不支持FTS5 trigram，结点名称检索使用LIKE: {e}")
+            return
+        c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS graph_node_fts USING fts5(
+                        entity_name,
+                        knowledge_id UNINDEXED,
+                        content='graph_node',
+                        content_rowid='rowid',
+                        tokenize='trigram'
+                    );''')
+        self._create_graph_node_fts_triggers(c)
+        # 为已有数据建立索引
+        c.execute("INSERT INTO graph_node_fts(graph_node_fts) VALUES ('rebuild');")
+    
+    def _create_graph_node_fts_triggers(self, c):
+        """创建使graph_node_fts与graph_node保持同步的触发器"""
+        c.execute('''CREATE TRIGGER IF NOT EXISTS graph_node_fts_insert AFTER INSERT ON graph_node BEGIN
+                        INSERT INTO graph_node_fts(rowid, entity_name, knowledge_id)
+                        VALUES (new.rowid, new.entity_name, new.knowledge_id);
+                    END;''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS graph_node_fts_delete AFTER DELETE ON graph_node BEGIN
+                        INSERT INTO graph_node_fts(graph_node_fts, rowid, entity_name, knowledge_id)
+                        VALUES ('delete', old.rowid, old.entity_name, old.knowledge_id);
+                    END;''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS graph_node_fts_update AFTER UPDATE ON graph_node BEGIN
+                        INSERT INTO graph_node_fts(graph_node_fts, rowid, entity_name, knowledge_id)
+                        VALUES ('delete', old.rowid, old.entity_name, old.knowledge_id);
+                        INSERT INTO graph_node_fts(rowid, entity_name, knowledge_id)
+                        VALUES (new.rowid, new.entity_name, new.knowledge_id);
+                    END;''')
+    
+    def migrate_v3_table_schema_hash(self, c):
+        """v3：table_sql增加schema_hash列，记录表结构指纹，用于增量刷新数据源表结构"""
+        c.execute("PRAGMA table_info(table_sql);")
+        if "schema_hash" not in [row[1] for row in c.fetchall()]:
+            c.execute("ALTER TABLE table_sql ADD COLUMN schema_hash TEXT;")
+    
+    def migrate_v4_graph_node_primary_key(self, c):
+        """
+        v4：graph_node增加 node_id INTEGER PRIMARY KEY（rowid的别名）。
+        没有INTEGER主键时VACUUM会重新编号rowid，graph_node_fts按rowid关联会指向错误的行；
+        重建表时保留原rowid作为node_id，并重建索引、触发器与全文索引
+        """
+        c.execute("PRAGMA table_info(graph_node);")
+        if "node_id" in [row[1] for row in c.fetchall()]:
+            return
+        c.execute('''CREATE TABLE graph_node_v4 (
+                        entity_id TEXT NOT NULL,
+                        knowledge_id TEXT NOT NULL,
+                        file_id TEXT NOT NULL,
+                        entity_name TEXT NOT NULL,
+                        entity_type TEXT NOT NULL,
+                        source_id TEXT,
+                        entity_description TEXT,
+                        entity_source_file TEXT,
+                        node_id INTEGER PRIMARY KEY
+                    );''')
+        c.execute('''INSERT INTO graph_node_v4 (entity_id, knowledge_id, file_id, entity_name, entity_type, source_id,
+                                               entity_description, entity_source_file, node_id)
+                     SELECT entity_id, knowledge_id, file_id, entity_name, entity_type, source_id,
+                            entity_description, entity_source_file, rowid FROM graph_node;''')
+        # 旧表上的索引与触发器随表一起删除
+        c.execute("DROP TABLE graph_node;")
+        c.execute("ALTER TABLE graph_node_v4 RENAME TO graph_node;")
+        for index_name, table_name, columns in LOOKUP_INDEXES:
+            if table_name == "graph_node":
+                c.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({columns});")
+        c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'graph_node_fts';")
+        if c.fetchone() is not None:
+            self._create_graph_node_fts_triggers(c)
+            c.execute("INSERT INTO graph_node_fts(graph_node_fts) VALUES ('rebuild');")
+    
+    def migrate_v5_ingest_job_not_before(self, c):
+        """v5：ingest_job增加not_before列（时间戳，秒），失败重试的任务在此之前不会被取出"""
+        c.execute("PRAGMA table_info(ingest_job);")
+        if "not_before" not in [row[1] for row in c.fetchall()]:
+            c.execute("ALTER TABLE ingest_job ADD COLUMN not_before REAL DEFAULT 0;")
+    
+    def migrate_v6_user_name_index(self, c):
+        """v6：idx_user_info_user_name 只索引user_name（v1曾包含password列，密码哈希不应复制到索引中）"""
+        c.execute("PRAGMA index_info(idx_user_info_user_name);")
+        if [row[2] for row in c.fetchall()] != ["user_name"]:
+            c.execute("DROP INDEX IF EXISTS idx_user_info_user_name;")
+            c.execute("CREATE INDEX idx_user_info_user_name ON user_info (user_name);")
+    
+    def has_graph_node_fts(self):
+        """结点名称全文索引是否可用"""
+        if self.graph_node_fts is None:
+            try:
+                c = self.conn.cursor()
+                c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'graph_node_fts';")
+                self.graph_node_fts = c.fetchone() is not None
+            except Exception as e:
+                print(f"查询全文索引失败: {e}")
+                return False
+        return self.graph_node_fts
+        
     def create_schema_analysis_table(self):
         """创建Schema分析结果表"""
         try:
@@ -160,27 +573,27 @@ class KnowledgeBaseDB():
                 print("缺少必要的参数")
                 return False
 
-            # 先删除该sql_id的所有旧数据
-            self.delete_schema_analysis_by_sql_id(sql_id)
-
-            # 批量插入
+            # 删除旧数据与批量插入在同一事务中完成，只提交一次
             success_count = 0
-            for table_analysis in tables_analysis:
-                table_id = table_analysis.get("table_id", "")
-                table_name = table_analysis.get("table_name", "")
-                analysis_result = table_analysis.get("analysis_result", {})
-
-                if table_id and table_name and analysis_result:
-                    if self.insert_schema_analysis_result(
-                        sql_id=sql_id,
-                        table_id=table_id,
-                        table_name=table_name,
-                        analysis_result=analysis_result,
-                        total_tables=total_tables,
-                        test_tables_count=test_tables_count,
-                        standard_naming_count=standard_naming_count
-                    ):
-                        success_count += 1
+            with self.transaction():
+                self.delete_schema_analysis_by_sql_id(sql_id)
+
+                for table_analysis in tables_analysis:
+                    table_id = table_analysis.get("table_id", "")
+                    table_name = table_analysis.get("table_name", "")
+                    analysis_result = table_analysis.get("analysis_result", {})
+
+                    if table_id and table_name and analysis_result:
+                        if self.insert_schema_analysis_result(
+                            sql_id=sql_id,
+                            table_id=table_id,
+                            table_name=table_name,
+                            analysis_result=analysis_result,
+                            total_tables=total_tables,
+                            test_tables_count=test_tables_count,
+                            standard_naming_count=standard_naming_count
+                        ):
+                            success_count += 1
 
             print(f"批量插入Schema分析结果完成: {success_count}/{len(tables_analysis)}")
             return success_count > 0
@@ -714,6 +1127,217 @@ class KnowledgeBaseDB():
             print(f"删除任务记录失败: {e}")
             return False
 
+    def create_ingest_job_table(self):
+        """创建文件入库任务队列表
+            任务id
+            知识库id
+            文件id
+            上传用户id
+            任务状态：queued/parsing/embedding/graphing/done/failed
+            各阶段进度（json）
+            已重试次数
+            最大重试次数
+            任务参数（json）
+            阶段间传递的中间结果（json）
+            错误信息
+            最早可再次取出的时间（时间戳，秒，失败重试时退避）
+        """
+        try:
+            c = self.conn.cursor()
+            sql = '''CREATE TABLE IF NOT EXISTS ingest_job (
+                        job_id TEXT PRIMARY KEY,
+                        knowledge_id TEXT NOT NULL,
+                        file_id TEXT NOT NULL,
+                        user_id TEXT NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'queued',
+                        progress TEXT,
+                        retries INTEGER DEFAULT 0,
+                        max_retries INTEGER DEFAULT 0,
+                        payload TEXT,
+                        context TEXT,
+                        error_msg TEXT,
+                        create_time TEXT,
+                        update_time TEXT,
+                        not_before REAL DEFAULT 0
+                    );'''
+            c.execute(sql)
+            self.conn.commit()
+            print("创建文件入库任务队列表成功")
+            return True
+        except Exception as e:
+            print(f"创建文件入库任务队列表失败: {e}")
+            return False
+
+    def _ingest_job_row_to_dict(self, row):
+        """将ingest_job表的行转换为字典"""
+        return {
+            "job_id": row[0],
+            "knowledge_id": row[1],
+            "file_id": row[2],
+            "user_id": row[3],
+            "status": row[4],
+            "progress": json.loads(row[5]) if row[5] else {},
+            "retries": row[6],
+            "max_retries": row[7],
+            "payload": json.loads(row[8]) if row[8] else {},
+            "context": json.loads(row[9]) if row[9] else {},
+            "error_msg": row[10] or "",
+            "create_time": row[11],
+            "update_time": row[12],
+            "not_before": row[13] or 0
+        }
+
+    def insert_ingest_job(self, param):
+        """插入文件入库任务"""
+        try:
+            c = self.conn.cursor()
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            sql = '''INSERT INTO ingest_job (job_id, knowledge_id, file_id, user_id, status, progress, retries, max_retries, payload, context, error_msg, create_time, update_time) VALUES (?, ?, ?, ?, 'queued', '{}', 0, ?, ?, '{}', '', ?, ?);'''
+            c.execute(sql, (param["job_id"], param.get("knowledge_id", ""), param.get("file_id", ""),
+                            param.get("user_id", ""), param.get("max_retries", 0),
+                            json.dumps(param.get("payload", {}), ensure_ascii=False), now, now))
+            self.conn.commit()
+            return True
+        except Exception as e:
+            print(f"插入文件入库任务失败: {e}")
+            return False
+
+    def claim_next_ingest_job(self):
+        """
+        取出最早排队且已过重试等待时间的入库任务（查询与更新在一个事务内），
+        状态置为第一个尚未完成的阶段，重试时不会回到已完成的阶段
+        """
+        try:
+            with self.transaction():
+                c = self.conn.cursor()
+                sql = '''SELECT * FROM ingest_job WHERE status = 'queued' AND (not_before IS NULL OR not_before <= ?)
+                         ORDER BY create_time, rowid LIMIT 1;'''
+                c.execute(sql, (time.time(),))
+                row = c.fetchone()
+                if not row:
+                    return None
+                job = self._ingest_job_row_to_dict(row)
+                completed = job["context"].get("completed_stages", [])
+                status = next((stage for stage in INGEST_STAGES if stage not in completed), INGEST_STAGES[-1])
+                now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                c.execute('''UPDATE ingest_job SET status = ?, update_time = ? WHERE job_id = ? AND status = 'queued';''',
+                          (status, now, job["job_id"]))
+            if c.rowcount == 0:
+                return None
+            job["status"] = status
+            return job
+        except Exception as e:
+            print(f"获取待处理入库任务失败: {e}")
+            return None
+
+    def update_ingest_job(self, job_id, status=None, progress=None, retries=None,
+                          context=None, error_msg=None, not_before=None):
+        """更新入库任务的状态、进度、重试次数、中间结果、错误信息或最早可再次取出的时间"""
+        fields = []
+        values = []
+        if status is not None:
+            fields.append("status = ?")
+            values.append(status)
+        if progress is not None:
+            fields.append("progress = ?")
+            values.append(json.dumps(progress, ensure_ascii=False))
+        if retries is not None:
+            fields.append("retries = ?")
+            values.append(retries)
+        if context is not None:
+            fields.append("context = ?")
+            values.append(json.dumps(context, ensure_ascii=False))
+        if error_msg is not None:
+            fields.append("error_msg = ?")
+            values.append(error_msg)
+        if not_before is not None:
+            fields.append("not_before = ?")
+            values.append(not_before)
+        fields.append("update_time = ?")
+        values.append(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        values.append(job_id)
+        try:
+            c = self.conn.cursor()
+            sql = f"UPDATE ingest_job SET {', '.join(fields)} WHERE job_id = ?;"
+            c.execute(sql, tuple(values))
+            self.conn.commit()
+            return c.rowcount > 0
+        except Exception as e:
+            print(f"更新文件入库任务失败: {e}")
+            return False
+
+    def reset_running_ingest_jobs(self):
+        """将上次进程退出时仍在处理中的任务重新置为排队状态"""
+        try:
+            c = self.conn.cursor()
+            placeholders = ",".join("?" * len(INGEST_STAGES))
+            sql = f'''UPDATE ingest_job SET status = 'queued', update_time = ? WHERE status IN ({placeholders});'''
+            c.execute(sql, (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),) + INGEST_STAGES)
+            self.conn.commit()
+            return c.rowcount
+        except Exception as e:
+            print(f"重置入库任务状态失败: {e}")
+            return 0
+
+    def query_ingest_job_by_job_id(self, job_id):
+        """根据job_id查询入库任务"""
+        try:
+            c = self.conn.cursor()
+            sql = '''SELECT * FROM ingest_job WHERE job_id = ?;'''
+            c.execute(sql, (job_id,))
+            row = c.fetchone()
+            if row:
+                return self._ingest_job_row_to_dict(row)
+            return None
+        except Exception as e:
+            print(f"查询入库任务失败: {e}")
+            return None
+
+    def query_ingest_jobs_by_knowledge_id(self, knowledge_id, user_id):
+        """根据知识库id和用户id查询入库任务列表（按创建时间倒序）"""
+        try:
+            c = self.conn.cursor()
+            sql = '''SELECT * FROM ingest_job WHERE knowledge_id = ? AND user_id = ? ORDER BY create_time DESC, rowid DESC;'''
+            c.execute(sql, (knowledge_id, user_id))
+            rows = c.fetchall()
+            return [self._ingest_job_row_to_dict(row) for row in rows]
+        except Exception as e:
+            print(f"查询入库任务列表失败: {e}")
+            return []
+
+    def count_active_ingest_jobs(self, user_id=None, file_id=None):
+        """统计未结束（排队或处理中）的入库任务数量，可按用户或文件过滤"""
+        try:
+            c = self.conn.cursor()
+            sql = '''SELECT COUNT(*) FROM ingest_job WHERE status NOT IN ('done', 'failed')'''
+            values = []
+            if user_id:
+                sql += " AND user_id = ?"
+                values.append(user_id)
+            if file_id:
+                sql += " AND file_id = ?"
+                values.append(file_id)
+            c.execute(sql + ";", tuple(values))
+            return c.fetchone()[0]
+        except Exception as e:
+            print(f"统计入库任务失败: {e}")
+            return 0
+
+    def has_active_ingest_file(self, user_id, file_name):
+        """用户是否有同名文件的入库任务仍在排队或处理中"""
+        try:
+            c = self.conn.cursor()
+            sql = '''SELECT payload FROM ingest_job WHERE user_id = ? AND status NOT IN ('done', 'failed');'''
+            c.execute(sql, (user_id,))
+            for row in c.fetchall():
+                payload = json.loads(row[0]) if row[0] else {}
+                if os.path.basename(payload.get("file_path", "")) == file_name:
+                    return True
+            return False
+        except Exception as e:
+            print(f"查询入库任务失败: {e}")
+            return False
+
     def create_image_file_table(self):
         """创建图片数据表"""
         try:
@@ -829,10 +1453,19 @@ class KnowledgeBaseDB():
             return False
         
     def create_connection(self, db_file):
-        """创建数据库连接"""
+        """创建数据库连接（自动提交模式，WAL日志，预编译语句缓存）"""
         conn = None
         try:
-            conn = sqlite3.connect(db_file, check_same_thread=False)
+            conn = sqlite3.connect(db_file, check_same_thread=False,
+                                   isolation_level=None,
+                                   timeout=BUSY_TIMEOUT_MS / 1000.0,
+                                   cached_statements=CACHED_STATEMENTS)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB};")
+            conn.execute(f"PRAGMA mmap_size={MMAP_SIZE};")
+            conn.execute("PRAGMA temp_store=MEMORY;")
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS};")
             return conn
         except Exception as e:
             print(e)
@@ -1339,10 +1972,52 @@ class KnowledgeBaseDB():
             sql = f"""DELETE FROM user_info WHERE user_id = '{user_id}';"""
             c.execute(sql)
             self.conn.commit()
+            self._invalidate_user_auth(user_id)
             return True
         except Exception as e:
             print(f"删除用户失败: {e}")
             return False
+
+    def update_user_password(self, user_id, password):
+        """修改用户密码，该用户的认证缓存与已签发的会话令牌随之失效"""
+        try:
+            c = self.conn.cursor()
+            c.execute("UPDATE user_info SET password = ? WHERE user_id = ?", (password, user_id))
+            self.conn.commit()
+            self._invalidate_user_auth(user_id)
+            return c.rowcount > 0
+        except Exception as e:
+            print(f"修改用户密码失败: {e}")
+            return False
+
+    def update_user_permissions(self, user_id, permissions):
+        """修改用户权限，该用户的认证缓存与已签发的会话令牌随之失效"""
+        try:
+            c = self.conn.cursor()
+            c.execute("UPDATE user_info SET permissions = ? WHERE user_id = ?", (permissions, user_id))
+            self.conn.commit()
+            self._invalidate_user_auth(user_id)
+            return c.rowcount > 0
+        except Exception as e:
+            print(f"修改用户权限失败: {e}")
+            return False
+
+    def query_user_permissions(self, user_id):
+        """查询用户当前权限（直接读库，不经过认证缓存与令牌），用户不存在时返回None"""
+        try:
+            c = self.conn.cursor()
+            c.execute("SELECT permissions FROM user_info WHERE user_id = ?", (user_id,))
+            row = c.fetchone()
+            return (row[0] or "") if row else None
+        except Exception as e:
+            print(f"查询用户权限失败: {e}")
+            return None
+
+    @staticmethod
+    def _invalidate_user_auth(user_id):
+        """用户信息变化后清除认证缓存并撤销该用户的会话令牌"""
+        from Utils.auth_token import get_auth_manager
+        get_auth_manager().invalidate_user(user_id=user_id)
             
     def create_user_table(self):
         """创建用户表
@@ -1421,6 +2096,7 @@ class KnowledgeBaseDB():
             sql = f"""DELETE FROM graph_chunk WHERE file_id='{file_id}';"""
             c.execute(sql)
             self.conn.commit()
+            self.clear_graph_chunk_cache()
         # except Exception as e:
         #     print(f"删除图数据chunk表失败: {e}")
         return True
@@ -1433,6 +2109,7 @@ class KnowledgeBaseDB():
             sql = '''DELETE FROM graph_chunk WHERE knowledge_id = ?;'''
             c.execute(sql, (knowledge_id,))
             self.conn.commit()
+            self.clear_graph_chunk_cache()
             return True
         except Exception as e:
             print(f"删除图数据chunk表失败: {e}")
@@ -1467,11 +2144,25 @@ class KnowledgeBaseDB():
             sql = '''INSERT INTO graph_chunk (knowledge_id, file_id, chunk_id, chunk_summary, chunk_text, file_name) VALUES (?, ?, ?, ?, ?, ?);'''
             c.execute(sql, (param.get("knowledge_id", ""), param.get("file_id", ""), param.get("chunk_id", ""),  param.get("chunk_summary", ""), param.get("chunk_text", ""), param.get("file_name", "")))
             self.conn.commit()
+            self.clear_graph_chunk_cache()
             return True
         except Exception as e:
             print(f"插入图数据chunk表失败: {e}")
             return False
 
+    def insert_graph_chunk_batch(self, params):
+        """批量插入图数据chunk表（一条预编译语句executemany）"""
+        try:
+            c = self.conn.cursor()
+            sql = '''INSERT INTO graph_chunk (knowledge_id, file_id, chunk_id, chunk_summary, chunk_text, file_name) VALUES (?, ?, ?, ?, ?, ?);'''
+            c.executemany(sql, [(param.get("knowledge_id", ""), param.get("file_id", ""), param.get("chunk_id", ""), param.get("chunk_summary", ""), param.get("chunk_text", ""), param.get("file_name", "")) for param in params])
+            self.conn.commit()
+            self.clear_graph_chunk_cache()
+            return True
+        except Exception as e:
+            print(f"批量插入图数据chunk表失败: {e}")
+            return False
+
     def query_graph_chunk_by_chunk_id_and_knowledge_id(self, param):
         """根据chunk_id查询图数据chunk表"""
         chunk_id = param.get("chunk_id", "")
@@ -1497,6 +2188,65 @@ class KnowledgeBaseDB():
             print(f"根据chunk_id查询图数据chunk表失败: {e}")
             return []
 
+    def query_graph_chunks_by_ids(self, knowledge_id, chunk_ids):
+        """
+        按chunk_id批量查询图数据chunk表，先查LRU缓存，未命中的按每批500个用 IN 查询
+
+        Args:
+            knowledge_id: 知识库id
+            chunk_ids: chunk_id列表（可重复）
+
+        Returns:
+            dict: chunk_id -> chunk列表，未找到的chunk_id不在结果中
+        """
+        result = {}
+        missing = []
+        with self.graph_chunk_cache_lock:
+            for chunk_id in dict.fromkeys(chunk_ids):
+                chunks = self.graph_chunk_cache.get((knowledge_id, chunk_id))
+                if chunks is not None:
+                    self.graph_chunk_cache.move_to_end((knowledge_id, chunk_id))
+                    result[chunk_id] = chunks
+                else:
+                    missing.append(chunk_id)
+        if not missing:
+            return result
+
+        fetched = {}
+        try:
+            c = self.conn.cursor()
+            for i in range(0, len(missing), GRAPH_CHUNK_QUERY_BATCH):
+                part = missing[i:i + GRAPH_CHUNK_QUERY_BATCH]
+                placeholders = ",".join("?" * len(part))
+                sql = f'''SELECT knowledge_id, file_id, chunk_id, chunk_summary, chunk_text, file_name
+                          FROM graph_chunk WHERE knowledge_id = ? AND chunk_id IN ({placeholders});'''
+                c.execute(sql, [knowledge_id] + part)
+                for row in c.fetchall():
+                    fetched.setdefault(row[2], []).append({
+                        "knowledge_id": row[0],
+                        "file_id": row[1],
+                        "chunk_id": row[2],
+                        "chunk_summary": row[3],
+                        "chunk_text": row[4],
+                        "file_name": row[5]
+                    })
+        except Exception as e:
+            print(f"批量查询图数据chunk表失败: {e}")
+
+        with self.graph_chunk_cache_lock:
+            for chunk_id, chunks in fetched.items():
+                self.graph_chunk_cache[(knowledge_id, chunk_id)] = chunks
+                self.graph_chunk_cache.move_to_end((knowledge_id, chunk_id))
+            while len(self.graph_chunk_cache) > GRAPH_CHUNK_CACHE_SIZE:
+                self.graph_chunk_cache.popitem(last=False)
+        result.update(fetched)
+        return result
+
+    def clear_graph_chunk_cache(self):
+        """清空chunk缓存"""
+        with self.graph_chunk_cache_lock:
+            self.graph_chunk_cache.clear()
+
     def query_graph_chunk_by_file_id(self, file_id):
         """根据文件id查询图数据chunk表"""
         try: 
@@ -1551,6 +2301,7 @@ class KnowledgeBaseDB():
             结点id
             结点文件来源
             结点对应的chunk的id
+            自增主键node_id（rowid的别名，全文索引按其关联，VACUUM后保持不变）
         """
         try:
             c = self.conn.cursor()
@@ -1562,7 +2313,8 @@ class KnowledgeBaseDB():
                         entity_type TEXT NOT NULL,
                         source_id TEXT,
                         entity_description TEXT,
-                        entity_source_file TEXT
+                        entity_source_file TEXT,
+                        node_id INTEGER PRIMARY KEY
                     );'''
             c.execute(sql)
             self.conn.commit()
@@ -1581,42 +2333,57 @@ class KnowledgeBaseDB():
             print(f"插入图数据节点表失败: {e}")
             return False
 
-    def query_graph_node_by_node_name_public(self, param):
-        """根据结点名称查询图数据节点表，仅查询权限等级为public的文件"""
-        entity_name = param.get("entity_name", "")
-        knowledge_id = param.get("knowledge_id", "")
-        try: 
+    def insert_node_info_batch(self, params):
+        """批量插入图数据节点表（一条预编译语句executemany）"""
+        try:
             c = self.conn.cursor()
-            sql = '''SELECT gn.* FROM graph_node gn 
-                     JOIN file_basic_info fbi ON gn.file_id = fbi.file_id 
-                     WHERE gn.entity_name LIKE ? AND gn.knowledge_id = ? AND fbi.permission_level = 'public' '''
-            c.execute(sql, (f'%{entity_name}%', knowledge_id))
-            rows = c.fetchall()
-            result = []
-            for row in rows:
-                result.append({
-                    "entity_id": row[0],
-                    "knowledge_id": row[1],
-                    "file_id": row[2],
-                    "entity_name": row[3],
-                    "entity_type": row[4],
-                    "source_id": row[5],
-                    "entity_description": row[6],
-                    "entity_source_file": row[7]
-                })
-            return result
+            sql = '''INSERT INTO graph_node (entity_id, knowledge_id, file_id, entity_name, entity_type, source_id, entity_description, entity_source_file) VALUES (?, ?, ?, ?, ?, ?, ?, ?);'''
+            c.executemany(sql, [(param.get("entity_id"), param.get("knowledge_id"), param.get("file_id"), param.get("entity_name"), param.get("entity_type"), param.get("source_id"), param.get("entity_description"), param.get("entity_source_file")) for param in params])
+            self.conn.commit()
+            return True
         except Exception as e:
-            print(f"查询图数据节点失败: {e}")
-            return []
+            print(f"批量插入图数据节点表失败: {e}")
+            return False
+
+    def query_graph_node_by_node_name_public(self, param):
+        """根据结点名称查询图数据节点表，仅查询权限等级为public的文件"""
+        return self._search_graph_node_by_name(param, public_only=True)
 
     def query_graph_node_by_node_name(self, param):
         """根据结点名称查询图数据节点表"""
-        entity_name = param.get("entity_name", "")
+        return self._search_graph_node_by_name(param, public_only=False)
+
+    def _search_graph_node_by_name(self, param, public_only=False):
+        """
+        结点名称子串检索：名称不少于3个字符时走FTS5 trigram索引并按bm25排序，
+        否则（或全文索引不可用时）使用LIKE；均只返回前limit条
+        """
+        entity_name = str(param.get("entity_name", "") or "")
         knowledge_id = param.get("knowledge_id", "")
+        limit = param.get("limit", GRAPH_NODE_SEARCH_LIMIT)
+        if not entity_name.strip():
+            return []
+        public_join = '''JOIN file_basic_info fbi ON gn.file_id = fbi.file_id''' if public_only else ""
+        public_where = "AND fbi.permission_level = 'public'" if public_only else ""
         try: 
             c = self.conn.cursor()
-            sql = f"""SELECT * FROM graph_node WHERE entity_name like '%{entity_name}%' and knowledge_id='{knowledge_id}'"""
-            c.execute(sql)
+            if len(entity_name) >= GRAPH_NODE_FTS_MIN_LENGTH and self.has_graph_node_fts():
+                # 整体作为短语匹配，双引号需转义
+                match = '"' + entity_name.replace('"', '""') + '"'
+                sql = f'''SELECT gn.* FROM graph_node_fts f
+                          JOIN graph_node gn ON gn.rowid = f.rowid
+                          {public_join}
+                          WHERE graph_node_fts MATCH ? AND gn.knowledge_id = ? {public_where}
+                          ORDER BY bm25(graph_node_fts) LIMIT ?;'''
+            else:
+                # 名称中的通配符按字面匹配
+                escaped = entity_name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                match = f"%{escaped}%"
+                sql = f'''SELECT gn.* FROM graph_node gn
+                          {public_join}
+                          WHERE gn.entity_name LIKE ? ESCAPE '\\' AND gn.knowledge_id = ? {public_where}
+                          ORDER BY length(gn.entity_name) LIMIT ?;'''
+            c.execute(sql, (match, knowledge_id, limit))
             rows = c.fetchall()
             result = []
             for row in rows:
@@ -1707,6 +2474,23 @@ class KnowledgeBaseDB():
             print(f"插入图数据关系表失败: {e}")
             return False
 
+    def insert_graph_relation_batch(self, params):
+        """批量插入图数据关系表（一条预编译语句executemany）"""
+        try:
+            c = self.conn.cursor()
+            sql = '''INSERT INTO graph_relation (knowledge_id, file_id, file_name, relation_source_id, relation_type, start_node, end_node, weight, description, keywords) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);'''
+            c.executemany(sql, [(
+                param.get("knowledge_id"), param.get("file_id"), param.get("file_name"), 
+                param.get("relation_source_id"), param.get("relation_type"),
+                param.get("start_node"), param.get("end_node"), 
+                param.get("weight"), param.get("description"), param.get("keywords")
+            ) for param in params])
+            self.conn.commit()
+            return True
+        except Exception as e:
+            print(f"批量插入图数据关系表失败: {e}")
+            return False
+
     # 知识库操作方法
     def insert_knowledge_base(self, kb_info):
         """插入知识库信息"""
@@ -2274,28 +3058,53 @@ class KnowledgeBaseDB():
             # logger.error(f"更新数据库描述失败: {e}")
             return False
 
-    def delete_base_sql(self, sql_id):
-        """删除数据库连接信息（级联删除相关表信息）"""
+    def update_base_sql(self, param):
+        """更新数据库连接信息（增量刷新表结构时使用，保留sql_id及其下的表信息）"""
         try:
             c = self.conn.cursor()
-            # 先删除关联的rel_sql记录
-            c.execute('''DELETE FROM rel_sql WHERE sql_id = ?;''', (sql_id,))
-            # 删除col_sql（通过table_id）
-            c.execute('''DELETE FROM col_sql WHERE table_id IN 
-                         (SELECT table_id FROM table_sql WHERE sql_id = ?);''', (sql_id,))
-            # 删除table_sql
-            c.execute('''DELETE FROM table_sql WHERE sql_id = ?;''', (sql_id,))
-            # 删除base_sql
-            c.execute('''DELETE FROM base_sql WHERE sql_id = ?;''', (sql_id,))
-            
-            # 删除sql_des
-            c.execute('''DELETE FROM sql_des WHERE sql_id = ?;''', (sql_id,))
+            sql = '''UPDATE base_sql SET user_id = ?, ip = ?, port = ?, sql_type = ?, sql_name = ?,
+                     sql_user_name = ?, sql_user_password = ?, sql_description = ?, update_time = ?
+                     WHERE sql_id = ?;'''
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            c.execute(sql, (
+                param.get("user_id"),
+                param.get("ip"),
+                param.get("port"),
+                param.get("sql_type"),
+                param.get("sql_name"),
+                param.get("sql_user_name"),
+                param.get("sql_user_password"),
+                param.get("sql_description", ""),
+                now,
+                param.get("sql_id")
+            ))
             self.conn.commit()
+            return c.rowcount > 0
+        except Exception as e:
+            # logger.error(f"更新数据库连接信息失败: {e}")
+            return False
+
+    def delete_base_sql(self, sql_id):
+        """删除数据库连接信息（级联删除相关表信息）"""
+        try:
+            with self.transaction():
+                c = self.conn.cursor()
+                # 先删除关联的rel_sql记录
+                c.execute('''DELETE FROM rel_sql WHERE sql_id = ?;''', (sql_id,))
+                # 删除col_sql（通过table_id）
+                c.execute('''DELETE FROM col_sql WHERE table_id IN 
+                             (SELECT table_id FROM table_sql WHERE sql_id = ?);''', (sql_id,))
+                # 删除table_sql
+                c.execute('''DELETE FROM table_sql WHERE sql_id = ?;''', (sql_id,))
+                # 删除base_sql
+                c.execute('''DELETE FROM base_sql WHERE sql_id = ?;''', (sql_id,))
+                
+                # 删除sql_des
+                c.execute('''DELETE FROM sql_des WHERE sql_id = ?;''', (sql_id,))
             # logger.info(f"删除数据库连接信息成功: {sql_id}")
             return True
         except Exception as e:
             # logger.error(f"删除数据库连接信息失败: {e}")
-            self.conn.rollback()
             return False
     
     # table_sql表操作
@@ -2460,6 +3269,37 @@ class KnowledgeBaseDB():
             # logger.error(f"查询列信息失败: {e}")
             return []
 
+    def query_col_sql_by_sql_id(self, sql_id):
+        """根据sql_id一次查询数据源下所有表的列信息
+        sql_id: 数据库连接id
+        return: {表id: [列信息, ...]}，列信息格式同 query_col_sql_by_table_id
+        """
+        try:
+            c = self.conn.cursor()
+            sql = '''SELECT c.col_id, c.table_id, c.col_name, c.col_type, c.col_info, c.create_time
+                     FROM col_sql c JOIN table_sql t ON c.table_id = t.table_id WHERE t.sql_id = ?;'''
+            c.execute(sql, (sql_id,))
+            result = {}
+            for row in c.fetchall():
+                col_info = None
+                if row[4]:
+                    try:
+                        col_info = json.loads(row[4])
+                    except (TypeError, ValueError):
+                        col_info = row[4]
+                result.setdefault(row[1], []).append({
+                    "col_id": row[0],
+                    "table_id": row[1],
+                    "col_name": row[2],
+                    "col_type": row[3],
+                    "col_info": col_info,
+                    "create_time": row[5]
+                })
+            return result
+        except Exception as e:
+            # logger.error(f"查询列信息失败: {e}")
+            return {}
+
     def query_col_sql_by_table_id_and_name(self, table_id, col_name):
         """根据table_id和col_name查询列信息"""
         try:
@@ -2643,12 +3483,35 @@ class KnowledgeBaseDB():
             # logger.error(f"删除列关联关系失败: {e}")
             return False
     
+    def query_rel_sql_by_rel_id(self, rel_id):
+        """根据rel_id查询列关联关系，不存在时返回None"""
+        try:
+            c = self.conn.cursor()
+            sql = '''SELECT rel_id, sql_id, from_table, from_col, to_table, to_col, 
+                     create_time, update_time FROM rel_sql WHERE rel_id = ?;'''
+            c.execute(sql, (rel_id,))
+            row = c.fetchone()
+            if not row:
+                return None
+            return {
+                "rel_id": row[0],
+                "sql_id": row[1],
+                "from_table": row[2],
+                "from_col": row[3],
+                "to_table": row[4],
+                "to_col": row[5],
+                "create_time": row[6],
+                "update_time": row[7]
+            }
+        except Exception as e:
+            # logger.error(f"查询列关联关系失败: {e}")
+            return None
+
     def query_rel_sql_by_sql_id(self, sql_id):
         """根据sql_id查询所有列关联关系"""
         try:
             c = self.conn.cursor()
-            sql = '''SELECT rel_id, sql_id, from_ta
-            ble, from_col, to_table, to_col, 
+            sql = '''SELECT rel_id, sql_id, from_table, from_col, to_table, to_col, 
                      create_time, update_time FROM rel_sql WHERE sql_id = ?;'''
             c.execute(sql, (sql_id,))
             rows = c.fetchall()
@@ -2669,5 +3532,112 @@ class KnowledgeBaseDB():
             # logger.error(f"查询列关联关系失败: {e}")
             return []
 
+    def query_table_schema_hashes(self, sql_id):
+        """
+        查询数据源下各表的ID与表结构指纹
+        return: {表名: {"table_id": 表id, "schema_hash": 表结构指纹}}
+        """
+        try:
+            c = self.conn.cursor()
+            c.execute('''SELECT table_name, table_id, schema_hash FROM table_sql WHERE sql_id = ?;''', (sql_id,))
+            return {row[0]: {"table_id": row[1], "schema_hash": row[2] or ""} for row in c.fetchall()}
+        except Exception as e:
+            # logger.error(f"查询表结构指纹失败: {e}")
+            return {}
+
+    def save_sql_schema(self, sql_id, tables, removed_tables=None):
+        """
+        批量保存数据源的表结构（一个事务，每类数据一条executemany）
+        
+        Args:
+            sql_id: 数据库连接id
+            tables: 新增或结构变化的表
+                [{"table_id", "table_name", "table_description", "schema_hash",
+                  "columns": [{"col_id", "col_name", "col_type", "col_info"}],
+                  "foreign_keys": [{"from_table", "from_col", "to_table", "to_col"}]}]
+                变化的表先删除旧的列信息；外键只补充关联关系中还不存在的记录（保留手工维护的关联关系）
+            removed_tables: 源库中已不存在的表 [{"table_id", "table_name"}]，删除其表、列、分析结果与关联关系
+        
+        Returns:
+            bool: 是否成功
+        """
+        removed_tables = removed_tables or []
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            with self.transaction():
+                c = self.conn.cursor()
+                stale_ids = [(t["table_id"],) for t in tables] + [(t["table_id"],) for t in removed_tables]
+                if stale_ids:
+                    c.executemany('''DELETE FROM col_sql WHERE table_id = ?;''', stale_ids)
+                if removed_tables:
+                    c.executemany('''DELETE FROM table_sql WHERE table_id = ?;''',
+                                  [(t["table_id"],) for t in removed_tables])
+                    c.executemany('''DELETE FROM schema_analysis_result WHERE sql_id = ? AND table_id = ?;''',
+                                  [(sql_id, t["table_id"]) for t in removed_tables])
+                    c.executemany('''DELETE FROM rel_sql WHERE sql_id = ? AND (from_table = ? OR to_table = ?);''',
+                                  [(sql_id, t["table_name"], t["table_name"]) for t in removed_tables])
+                
+                # 已有的表只更新结构信息，保留create_time
+                c.executemany('''INSERT INTO table_sql (table_id, sql_id, table_name,
+                                 table_description, schema_hash, create_time, update_time)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?)
+                                 ON CONFLICT(table_id) DO UPDATE SET
+                                 sql_id = excluded.sql_id, table_name = excluded.table_name,
+                                 table_description = excluded.table_description,
+                                 schema_hash = excluded.schema_hash, update_time = excluded.update_time;''',
+                              [(t["table_id"], sql_id, t["table_name"], t.get("table_description", ""),
+                                t.get("schema_hash", ""), now, now) for t in tables])
+                c.executemany('''INSERT OR REPLACE INTO col_sql (col_id, table_id, col_name, col_type, col_info, create_time)
+                                 VALUES (?, ?, ?, ?, ?, ?);''',
+                              [(col["col_id"], t["table_id"], col["col_name"], col.get("col_type"),
+                                json.dumps(col["col_info"]) if col.get("col_info") else None, now)
+                               for t in tables for col in t.get("columns", [])])
+                
+                c.execute('''SELECT from_table, from_col, to_table, to_col FROM rel_sql WHERE sql_id = ?;''', (sql_id,))
+                existing = set(tuple(row) for row in c.fetchall())
+                new_rels = []
+                for t in tables:
+                    for fk in t.get("foreign_keys", []):
+                        key = (fk.get("from_table"), fk.get("from_col"), fk.get("to_table"), fk.get("to_col"))
+                        if key not in existing:
+                            existing.add(key)
+                            new_rels.append((f"rel_{uuid.uuid4().hex[:16]}", sql_id) + key + (now, now))
+                c.executemany('''INSERT INTO rel_sql (rel_id, sql_id, from_table, from_col, to_table, to_col,
+                                 create_time, update_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?);''', new_rels)
+            return True
+        except Exception as e:
+            print(f"批量保存数据源表结构失败: {e}")
+            return False
+
+    def save_schema_analysis_results(self, sql_id, tables_analysis):
+        """
+        批量保存部分表的Schema分析结果（一条executemany），并按该数据源下的全部分析结果重新统计表数量
+        
+        Args:
+            sql_id: 数据库ID
+            tables_analysis: [{"table_id", "table_name", "analysis_result"}]
+        """
+        try:
+            rows = [(sql_id, ta["table_id"], ta["table_name"], json.dumps(ta["analysis_result"], ensure_ascii=False))
+                    for ta in tables_analysis
+                    if ta.get("table_id") and ta.get("table_name") and ta.get("analysis_result")]
+            with self.transaction():
+                c = self.conn.cursor()
+                c.executemany('''INSERT OR REPLACE INTO schema_analysis_result
+                                 (sql_id, table_id, table_name, analysis_result, updated_at)
+                                 VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP);''', rows)
+                c.execute('''SELECT analysis_result FROM schema_analysis_result WHERE sql_id = ?;''', (sql_id,))
+                results = [json.loads(row[0]) for row in c.fetchall()]
+                c.execute('''UPDATE schema_analysis_result SET total_tables = ?, test_tables_count = ?,
+                             standard_naming_count = ? WHERE sql_id = ?;''',
+                          (len(results),
+                           sum(1 for r in results if r.get("is_test_table", False)),
+                           sum(1 for r in results if r.get("naming_standard") == "standard"),
+                           sql_id))
+            return len(rows)
+        except Exception as e:
+            print(f"批量保存Schema分析结果失败: {e}")
+            return 0
+
 # 全局单例实例
 cSingleSqlite = KnowledgeBaseDB()
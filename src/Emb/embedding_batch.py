@@ -0,0 +1,121 @@
+# -*- coding:utf-8 -*-
+"""
+Embedding批量请求工具
+
+1. 按条数与估算token数打包批次
+2. 429/5xx等可重试错误的识别与带抖动的指数退避
+3. 微批合并器：把不同线程在几毫秒内发起的单条请求合并成一次批量请求
+"""
+
+import random
+import logging
+import threading
+from concurrent.futures import Future
+
+from Utils.utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def pack_batches(texts, max_items, max_tokens):
+    """
+    将文本按顺序打包为多个批次，每批不超过max_items条且估算token数不超过max_tokens
+    单条文本超过max_tokens时独占一批（由服务端截断或报错）
+
+    Returns:
+        list: 每个批次为原始下标列表
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def is_retryable_error(e):
+    """判断是否为可重试的错误：429、5xx、连接错误与超时"""
+    status_code = getattr(e, "status_code", None)
+    if status_code is None:
+        response = getattr(e, "response", None)
+        status_code = getattr(response, "status_code", None)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    name = type(e).__name__
+    return name in ("APIConnectionError", "APITimeoutError", "ConnectionError", "TimeoutError")
+
+
+def backoff_delay(attempt, base=0.5, cap=10.0):
+    """带完全抖动的指数退避时长（秒）"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class MicroBatcher:
+    """
+    微批合并器
+    不同线程的单条请求合并为一次batch_fn调用后按顺序分发结果：
+    只有一个请求等待时立即发送，不增加延迟；已有多个请求等待（存在并发）时最多再等待window秒收集更多请求，
+    上一批请求进行期间到达的请求在下一批中一起发送
+    """
+
+    def __init__(self, batch_fn, window=0.005, max_batch=64):
+        """
+        Args:
+            batch_fn: 批量处理函数，输入文本列表，返回等长结果列表
+            window: 合并等待窗口（秒）
+            max_batch: 单次合并的最大条数
+        """
+        self.batch_fn = batch_fn
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.cond = threading.Condition()
+        self.pending = []
+        self.worker = None
+
+    def submit(self, text):
+        """提交单条文本，返回Future"""
+        future = Future()
+        with self.cond:
+            self.pending.append((text, future))
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name="embedding-micro-batcher", daemon=True)
+                self.worker.start()
+            self.cond.notify()
+        return future
+
+    def __call__(self, text):
+        return self.submit(text).result()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    # 空闲一段时间后退出，下次提交时重新创建
+                    if not self.cond.wait(timeout=30):
+                        if not self.pending:
+                            self.worker = None
+                            return
+                # 已有并发请求时收集窗口期内到达的请求，单个请求不等待
+                if 1 < len(self.pending) < self.max_batch:
+                    self.cond.wait_for(lambda: len(self.pending) >= self.max_batch, timeout=self.window)
+                batch = self.pending[:self.max_batch]
+                self.pending = self.pending[self.max_batch:]
+
+            texts = [text for text, _ in batch]
+            try:
+                results = self.batch_fn(texts)
+                if len(results) != len(texts):
+                    raise ValueError(f"批量结果数量({len(results)})与请求数量({len(texts)})不一致")
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
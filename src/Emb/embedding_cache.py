@@ -0,0 +1,320 @@
+# -*- coding:utf-8 -*-
+"""
+Embedding向量缓存
+
+两级缓存：进程内LRU + 磁盘SQLite（float32二进制存储），
+键为 sha256(模型名, 向量维度, 归一化文本)。
+CachedEmbeddings 包装任意兼容LangChain接口（embed_query/embed_documents）的实例，
+同一批次中重复的文本只请求一次，未命中的文本合并为一次批量请求。
+"""
+
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import weakref
+import threading
+from array import array
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """归一化文本：去除首尾空白并合并连续空白"""
+    return _WHITESPACE_RE.sub(" ", str(text).strip())
+
+
+class _ThreadConnection:
+    """挂在线程本地存储上的磁盘缓存连接，线程结束被回收时关闭连接"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+
+class EmbeddingCache:
+    """两级Embedding缓存（内存LRU + 可选的SQLite磁盘存储）"""
+
+    def __init__(self, model_name, dimension, max_size=10000, db_path=None):
+        """
+        Args:
+            model_name: 模型名称，参与缓存键计算
+            dimension: 请求的向量维度，参与缓存键计算
+            max_size: 内存LRU最大条目数
+            db_path: 磁盘缓存SQLite文件路径，为空时只使用内存缓存
+        """
+        self.model_name = model_name
+        self.dimension = dimension
+        self.max_size = max(1, max_size)
+        self.db_path = db_path
+
+        # 只保护内存LRU与命中统计，磁盘读写不持有该锁
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "batch_duplicates": 0}
+
+        # 磁盘缓存每个线程一个连接（WAL模式下读不互相阻塞），写入由write_lock串行
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+        self.disk_enabled = False
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path):
+        try:
+            dir_name = os.path.dirname(db_path)
+            if dir_name:
+                os.makedirs(dir_name, exist_ok=True)
+            conn = sqlite3.connect(db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute('''CREATE TABLE IF NOT EXISTS embedding_cache (
+                                cache_key TEXT PRIMARY KEY,
+                                dim INTEGER NOT NULL,
+                                vector BLOB NOT NULL,
+                                create_time REAL
+                             );''')
+            conn.commit()
+            conn.close()
+            self.disk_enabled = True
+        except Exception as e:
+            logger.warning(f"打开Embedding磁盘缓存失败，仅使用内存缓存: {e}")
+
+    def _get_conn(self):
+        """获取当前线程的磁盘缓存连接"""
+        slot = getattr(self.local, "slot", None)
+        if slot is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            slot = _ThreadConnection(conn)
+            weakref.finalize(slot, conn.close)
+            self.local.slot = slot
+        return slot.conn
+
+    def make_key(self, text):
+        """计算文本的缓存键"""
+        raw = f"{self.model_name}\x00{self.dimension}\x00{normalize_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """
+        批量读取缓存
+
+        Returns:
+            dict: 命中的 key -> 向量
+        """
+        found = {}
+        missing = []
+        with self.lock:
+            for key in keys:
+                vec = self.memory.get(key)
+                if vec is not None:
+                    self.memory.move_to_end(key)
+                    found[key] = vec
+                    self.stats["memory_hits"] += 1
+                else:
+                    missing.append(key)
+
+        disk_found = {}
+        if missing and self.disk_enabled:
+            try:
+                conn = self._get_conn()
+                # SQLite单条语句的参数个数有限，分批查询
+                for i in range(0, len(missing), 500):
+                    part = missing[i:i + 500]
+                    placeholders = ",".join("?" * len(part))
+                    rows = conn.execute(
+                        f"SELECT cache_key, vector FROM embedding_cache WHERE cache_key IN ({placeholders});",
+                        part).fetchall()
+                    for key, blob in rows:
+                        vec = array("f")
+                        vec.frombytes(blob)
+                        disk_found[key] = vec.tolist()
+            except Exception as e:
+                logger.warning(f"读取Embedding磁盘缓存失败: {e}")
+
+        with self.lock:
+            for key, vec in disk_found.items():
+                self._memory_put(key, vec)
+            self.stats["disk_hits"] += len(disk_found)
+            self.stats["misses"] += len(missing) - len(disk_found)
+        found.update(disk_found)
+        return found
+
+    def put_many(self, items):
+        """
+        批量写入缓存
+
+        Args:
+            items: [(key, 向量), ...]
+        """
+        if not items:
+            return
+        with self.lock:
+            for key, vec in items:
+                self._memory_put(key, vec)
+        if self.disk_enabled:
+            try:
+                now = time.time()
+                rows = [(key, len(vec), array("f", vec).tobytes(), now) for key, vec in items]
+                conn = self._get_conn()
+                with self.write_lock:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO embedding_cache (cache_key, dim, vector, create_time) VALUES (?, ?, ?, ?);",
+                        rows)
+                    conn.commit()
+            except Exception as e:
+                logger.warning(f"写入Embedding磁盘缓存失败: {e}")
+
+    def _memory_put(self, key, vec):
+        self.memory[key] = vec
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+    def record_batch_duplicates(self, count):
+        with self.lock:
+            self.stats["batch_duplicates"] += count
+
+    def get_stats(self):
+        """获取命中统计"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats["memory_size"] = len(self.memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        """清空内存与磁盘缓存"""
+        with self.lock:
+            self.memory.clear()
+        if self.disk_enabled:
+            try:
+                conn = self._get_conn()
+                with self.write_lock:
+                    conn.execute("DELETE FROM embedding_cache;")
+                    conn.commit()
+            except Exception as e:
+                logger.warning(f"清空Embedding磁盘缓存失败: {e}")
+
+
+class CachedEmbeddings:
+    """
+    带缓存的Embeddings包装类，兼容LangChain的embed_query和embed_documents接口
+    """
+
+    def __init__(self, embeddings, cache):
+        """
+        Args:
+            embeddings: 实际调用模型的Embeddings实例
+            cache: EmbeddingCache实例
+        """
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def __getattr__(self, name):
+        # 其余属性（model_name、vector_length、client等）透传给被包装的实例
+        return getattr(self.embeddings, name)
+
+    def embed_query(self, text: str) -> list:
+        """
+        生成单个文本的向量，命中缓存时不请求模型
+
+        Args:
+            text: 输入文本
+
+        Returns:
+            list: 向量列表
+        """
+        if not text or not isinstance(text, str) or not text.strip():
+            raise ValueError("输入文本不能为空")
+
+        key = self.cache.make_key(text)
+        found = self.cache.get_many([key])
+        if key in found:
+            return found[key]
+        vec = self.embeddings.embed_query(text)
+        self.cache.put_many([(key, vec)])
+        return vec
+
+    def embed_documents(self, texts: list) -> list:
+        """
+        批量生成文本向量：先查缓存，批内重复文本只请求一次，未命中的文本合并为一次批量请求
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            list: 向量列表，与过滤空文本后的输入一一对应
+        """
+        keys, found, miss_keys, miss_texts = self._lookup(texts)
+        if miss_texts:
+            self._store(found, miss_keys, miss_texts, self.embeddings.embed_documents(miss_texts))
+        return [found[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> list:
+        """异步生成单个文本的向量，命中缓存时不请求模型"""
+        if not text or not isinstance(text, str) or not text.strip():
+            raise ValueError("输入文本不能为空")
+
+        key = self.cache.make_key(text)
+        found = self.cache.get_many([key])
+        if key in found:
+            return found[key]
+        vec = await self.embeddings.aembed_query(text)
+        self.cache.put_many([(key, vec)])
+        return vec
+
+    async def aembed_documents(self, texts: list) -> list:
+        """异步批量生成文本向量，缓存与去重逻辑同embed_documents"""
+        keys, found, miss_keys, miss_texts = self._lookup(texts)
+        if miss_texts:
+            self._store(found, miss_keys, miss_texts, await self.embeddings.aembed_documents(miss_texts))
+        return [found[key] for key in keys]
+
+    def _lookup(self, texts):
+        """
+        过滤空文本并查缓存
+
+        Returns:
+            tuple: (每条文本的缓存键, 已命中的 key -> 向量, 未命中且去重后的键, 对应文本)
+        """
+        if not texts:
+            return [], {}, [], []
+
+        # 与被包装实例保持一致：过滤空文本
+        valid_texts = [str(text).strip() for text in texts if text and str(text).strip()]
+        if not valid_texts:
+            return [], {}, [], []
+
+        keys = [self.cache.make_key(text) for text in valid_texts]
+        unique_keys = list(OrderedDict.fromkeys(keys))
+        self.cache.record_batch_duplicates(len(keys) - len(unique_keys))
+
+        found = self.cache.get_many(unique_keys)
+
+        miss_texts = []
+        miss_keys = []
+        seen = set()
+        for key, text in zip(keys, valid_texts):
+            if key not in found and key not in seen:
+                seen.add(key)
+                miss_keys.append(key)
+                miss_texts.append(text)
+        return keys, found, miss_keys, miss_texts
+
+    def _store(self, found, miss_keys, miss_texts, vectors):
+        """写入新生成的向量并合并到命中结果中"""
+        if len(vectors) != len(miss_texts):
+            raise ValueError(f"向量数量({len(vectors)})与文本数量({len(miss_texts)})不一致")
+        new_items = list(zip(miss_keys, vectors))
+        self.cache.put_many(new_items)
+        found.update(new_items)
+
+    def get_cache_stats(self):
+        """获取缓存命中统计"""
+        return self.cache.get_stats()
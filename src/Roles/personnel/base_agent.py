@@ -9,6 +9,7 @@ import logging
 import sys
 import os
 import time
+import threading
 from typing import Dict, Any, List, Optional, Tuple
 from enum import Enum
 import requests
@@ -18,6 +19,8 @@ from dataclasses import dataclass, field
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 
 from Config.llm_config import get_chat_tongyi
+from Utils.utils import estimate_tokens
+from Utils.llm_cache import get_llm_cache, describe_llm, make_cache_key
 
 # 导入工具系统
 try:
@@ -111,7 +114,8 @@ class BaseAgent:
                  working_style: WorkingStyle,
                  behavior_guidelines: List[str],
                  output_format: str,
-                 llm_instance=None):
+                 llm_instance=None,
+                 llm_cache: Optional[bool] = None):
         """
         初始化智能体
 
@@ -123,6 +127,7 @@ class BaseAgent:
             behavior_guidelines: 行为准则
             output_format: 输出格式规范
             llm_instance: LLM实例，如果为None则使用默认配置
+            llm_cache: 是否使用LLM响应缓存；None表示仅在温度为0时使用，True/False表示强制开启/关闭
         """
         self.name = name
         self.role_definition = role_definition
@@ -154,6 +159,12 @@ class BaseAgent:
         self.retry_delay = 1.0  # 基础延迟时间（秒）
         self.timeout = 30.0  # LLM调用超时时间（秒）
 
+        # LLM响应缓存
+        self.llm_cache = llm_cache
+        self.llm_cache_stats = {"hits": 0, "coalesced": 0, "misses": 0, "saved_tokens": 0}
+        # 同一智能体可能被多个请求线程并发调用
+        self.llm_cache_stats_lock = threading.Lock()
+
         # 错误统计
         self.error_count = 0
         self.last_error_time = None
@@ -596,17 +607,66 @@ class BaseAgent:
                     items.append(item)
         return items
 
-    def _invoke_llm_with_retry(self, prompt: str, operation_name: str = "LLM调用") -> str:
+    def _invoke_llm_with_retry(self, prompt: str, operation_name: str = "LLM调用",
+                               llm_cache: Optional[bool] = None) -> str:
         """
         带重试机制的LLM调用
 
+        温度为0（或显式开启缓存）时先查跨请求共享的响应缓存，相同的并发请求只调用一次模型
+
         Args:
             prompt: 提示文本
             operation_name: 操作名称，用于日志记录
+            llm_cache: 本次调用是否使用缓存，None表示沿用智能体的设置（总结、验证等输出应当确定的提示传True）
 
         Returns:
             LLM响应文本
 
+        Raises:
+            AgentError: 当所有重试都失败时抛出
+        """
+        cache = get_llm_cache()
+        model, temperature, bound_kwargs = describe_llm(self.llm)
+        if llm_cache is None:
+            llm_cache = self.llm_cache
+        use_cache = llm_cache if llm_cache is not None else temperature == 0
+        if cache is None or not use_cache:
+            return self._call_llm_with_retry(prompt, operation_name)["text"]
+
+        key = make_cache_key(model, temperature, bound_kwargs, prompt)
+        result, source = cache.get_or_call(key, lambda: self._call_llm_with_retry(prompt, operation_name))
+        with self.llm_cache_stats_lock:
+            if source == "miss":
+                self.llm_cache_stats["misses"] += 1
+            else:
+                self.llm_cache_stats["hits" if source == "hit" else "coalesced"] += 1
+                self.llm_cache_stats["saved_tokens"] += result.get("tokens", 0)
+        if source != "miss":
+            logger.debug(f"♻️ {self.name} {operation_name} 复用缓存响应 ({source})")
+        return result["text"]
+
+    @staticmethod
+    def _get_token_usage(response, prompt: str, response_text: str) -> int:
+        """获取本次调用消耗的token数，模型未返回用量时按文本长度估算"""
+        usage = getattr(response, 'usage_metadata', None) or {}
+        if usage.get('total_tokens'):
+            return int(usage['total_tokens'])
+        token_usage = (getattr(response, 'response_metadata', None) or {}).get('token_usage') or {}
+        if token_usage.get('total_tokens'):
+            return int(token_usage['total_tokens'])
+        return estimate_tokens(str(prompt)) + estimate_tokens(response_text)
+
+    def _call_llm_with_retry(self, prompt: str, operation_name: str = "LLM调用") -> Dict[str, Any]:
+        """
+        调用LLM（指数退避重试，不经过缓存）
+
+        Args:
+            prompt: 提示文本
+            operation_name: 操作名称，用于日志记录
+
+        Returns:
+            {"text": LLM响应文本, "tokens": 消耗的token数}
+
         Raises:
             AgentError: 当所有重试都失败时抛出
         """
@@ -640,7 +700,7 @@ class BaseAgent:
                 self.consecutive_failures = 0
                 self._update_health_status()
 
-                return response_text
+                return {"text": response_text, "tokens": self._get_token_usage(response, prompt, response_text)}
 
             except TimeoutError as e:
                 last_exception = LLMTimeoutError(f"LLM调用超时: {e}")
@@ -801,9 +861,18 @@ class BaseAgent:
             "error_count": self.error_count,
             "success_rate": success_rate,
             "consecutive_failures": self.consecutive_failures,
-            "last_error_time": self.last_error_time
+            "last_error_time": self.last_error_time,
+            "llm_cache": self.get_llm_cache_stats()
         }
 
+    def get_llm_cache_stats(self) -> Dict[str, Any]:
+        """获取本智能体的LLM响应缓存统计（命中、合并、未命中次数与节省的token数）"""
+        with self.llm_cache_stats_lock:
+            stats = dict(self.llm_cache_stats)
+        lookups = stats["hits"] + stats["coalesced"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0
+        return stats
+
     def reset_error_stats(self):
         """重置错误统计（用于恢复后）"""
         self.error_count = 0
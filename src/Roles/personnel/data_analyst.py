@@ -183,8 +183,8 @@ class DataAnalyst(BaseAgent):
 请保持客观公正的验证态度。
         """
 
-        response = self.llm.invoke(validation_prompt)
-        response_text = self._extract_response_content(response)
+        # 相同声明与数据的验证结果应当一致，使用共享缓存
+        response_text = self._invoke_llm_with_retry(validation_prompt, "验证数据声明", llm_cache=True)
 
         validation_result = self._parse_structured_response(response_text, "validation_report")
 
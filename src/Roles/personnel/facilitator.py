@@ -352,8 +352,8 @@ class Facilitator(BaseAgent):
 
 请客观、全面地总结讨论成果。"""
 
-            response = self.llm.invoke(prompt)
-            summary = self._extract_response_content(response)
+            # 相同交互记录的总结应当一致，使用共享缓存
+            summary = self._invoke_llm_with_retry(prompt, "总结深度讨论", llm_cache=True)
 
             return summary
 
@@ -302,8 +302,8 @@ class Moderator(BaseAgent):
         summary_prompt = self._build_summary_prompt(discussion_history, consensus_tracker)
 
         try:
-            response = self.llm.invoke(summary_prompt)
-            closing_speech = self._extract_response_content(response)
+            # 会议总结的输入相同时结果应当一致，使用共享缓存
+            closing_speech = self._invoke_llm_with_retry(summary_prompt, "会议总结", llm_cache=True)
 
             logger.info("✅ 主持人完成会议总结")
             return closing_speech
@@ -0,0 +1,127 @@
+# -*- coding:utf-8 -*-
+"""
+ASGI服务入口（SERVER_MODE=asgi，uvicorn + Starlette）
+
+- /api/chat 与 /api/execute_stream_chat 以原生异步SSE流提供，请求校验与聊天流程复用 run_server 中的
+  prepare_chat / prepare_execute_stream_chat，数据块通过 sse_stream 在有界线程池中桥接，
+  不再为每个流长期占用一个服务线程，并支持背压与客户端断开取消
+- 其余接口挂载原Flask应用（WSGI），路由与返回格式保持不变
+"""
+
+import shutil
+import logging
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+from Config.server_config import get_server_config
+from Servers import run_server
+from Servers.sse_stream import is_saturated, iterate_in_thread
+from Utils.auth_token import parse_bearer_token, set_request_token
+
+logger = logging.getLogger(__name__)
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'Connection': 'keep-alive',
+    'X-Accel-Buffering': 'no',  # 禁用nginx缓冲
+}
+
+
+class UploadedFile():
+    """把Starlette的UploadFile适配为 prepare_chat 使用的 filename 属性与 save(路径) 方法"""
+
+    def __init__(self, upload):
+        self.upload = upload
+        self.filename = upload.filename
+
+    def save(self, file_path):
+        self.upload.file.seek(0)
+        with open(file_path, "wb") as f:
+            shutil.copyfileobj(self.upload.file, f)
+
+
+def sse_response(request, events, error):
+    """把 prepare_* 的返回值转换为SSE流式响应或JSON错误响应"""
+    headers = run_server.cors_headers(request.headers.get('origin', ''))
+    if error:
+        payload, status = error
+        return JSONResponse(payload, status_code=status, headers=headers)
+    if is_saturated():
+        # 运行与排队的流都已达到上限，直接拒绝，避免排队无限增长
+        close = getattr(events, "close", None)
+        if close is not None:
+            close()
+        logger.warning("SSE并发流数达到上限，拒绝新请求")
+        return JSONResponse({'success': False, 'message': 'Server busy, please retry later'},
+                            status_code=503, headers=headers)
+    headers.update(SSE_HEADERS)
+    return StreamingResponse(iterate_in_thread(lambda: events),
+                             media_type='text/event-stream', headers=headers)
+
+
+def bind_request_token(request, fields):
+    """记录请求携带的会话令牌（Authorization: Bearer 或 token 字段），随上下文传入 run_in_threadpool"""
+    token = parse_bearer_token(request.headers.get('authorization'))
+    if not token and isinstance(fields, dict):
+        token = fields.get('token') or ""
+    set_request_token(token)
+
+
+async def read_json(request):
+    """读取JSON请求体，格式错误时返回None"""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def execute_stream_chat(request: Request):
+    """执行流式聊天，请求参数与返回格式同 run_server.execute_stream_chat"""
+    data = await read_json(request)
+    bind_request_token(request, data)
+    events, error = await run_in_threadpool(run_server.prepare_execute_stream_chat, data)
+    return sse_response(request, events, error)
+
+
+async def chat(request: Request):
+    """聊天接口，请求参数与返回格式同 run_server.chat"""
+    if request.headers.get('content-type', '').startswith('multipart/form-data'):
+        form = await request.form()
+        fields = {key: value for key, value in form.items() if isinstance(value, str)}
+        upload = form.get('file')
+        file = UploadedFile(upload) if upload is not None and not isinstance(upload, str) else None
+    else:
+        data = await read_json(request)
+        if not data:
+            return JSONResponse({'success': False, 'message': 'No data provided'},
+                                headers=run_server.cors_headers(request.headers.get('origin', '')))
+        fields = data
+        file = data.get('file', "")
+    bind_request_token(request, fields)
+    events, error = await run_in_threadpool(run_server.prepare_chat, fields, file)
+    return sse_response(request, events, error)
+
+
+def create_app():
+    """创建ASGI应用：流式接口原生处理，其余路由（含OPTIONS预检）交给Flask应用"""
+    return Starlette(routes=[
+        Route('/api/execute_stream_chat', execute_stream_chat, methods=['POST']),
+        Route('/api/chat', chat, methods=['POST']),
+        Mount('/', app=WSGIMiddleware(run_server.app)),
+    ])
+
+
+app = create_app()
+
+
+def run_asgi(host=None, port=None):
+    """以uvicorn启动ASGI服务"""
+    import uvicorn
+
+    config = get_server_config()
+    uvicorn.run(app, host=host or config.host, port=port or config.port, log_level="warning")
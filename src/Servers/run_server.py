@@ -35,6 +35,7 @@ from flask import make_response
 import sys
 sys.path.append('src')
 from Config import config
+from Config.server_config import get_server_config
 
 import base64
 import mimetypes
@@ -56,6 +57,7 @@ from Control import control_sql
 controller_sql = control_sql.CControl()
 
 from Utils import utils
+from Utils.auth_token import get_auth_manager, get_request_token, set_request_token, reset_request_token, parse_bearer_token
 
 # 创建线程安全的logger
 logger = logging.getLogger('werkzeug')
@@ -71,6 +73,9 @@ if not logger.handlers:
 
 logger_lock = threading.Lock()
 
+# 服务模式与SSE数据块日志采样配置
+server_config = get_server_config()
+
 def thread_safe_log(level_func, message, *args, **kwargs):
     """线程安全的日志记录函数"""
     with logger_lock:
@@ -85,29 +90,35 @@ app.secret_key = 'your_secret_key_here'  # 在实际应用中应该使用更安
 app.permanent_session_lifetime = timedelta(hours=1)
 
 
-# 添加CORS头部的函数
-def add_cors_headers(response):
-    # 获取请求的Origin头部
-    origin = request.headers.get('Origin', '')
-
+# 计算CORS头部的函数，Flask与ASGI两种服务模式共用
+def cors_headers(origin):
     # 允许的Origin列表
     allowed_origins = [
         'http://localhost:5173',      # 本地开发
         'http://127.0.0.1:5173',      # 本地IP
     ]
 
+    headers = {}
     # 如果Origin以5173端口结尾且是http协议，则允许
     if origin and origin.startswith('http://') and origin.endswith(':5173'):
-        response.headers['Access-Control-Allow-Origin'] = origin
+        headers['Access-Control-Allow-Origin'] = origin
     elif origin in allowed_origins:
-        response.headers['Access-Control-Allow-Origin'] = origin
+        headers['Access-Control-Allow-Origin'] = origin
     else:
         # 默认允许localhost
-        response.headers['Access-Control-Allow-Origin'] = 'http://localhost:5173'
+        headers['Access-Control-Allow-Origin'] = 'http://localhost:5173'
 
-    response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
-    response.headers['Access-Control-Allow-Credentials'] = 'true'
+    headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
+    headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+    headers['Access-Control-Allow-Credentials'] = 'true'
+    return headers
+
+# 添加CORS头部的函数
+def add_cors_headers(response):
+    # 获取请求的Origin头部
+    origin = request.headers.get('Origin', '')
+    for key, value in cors_headers(origin).items():
+        response.headers[key] = value
     return response
 
 # 在所有响应中添加CORS头部
@@ -123,9 +134,34 @@ def handle_preflight():
         response = add_cors_headers(response)
         return response
 
-def verify_user_credentials(user_name, password):
+def request_token_from_flask():
+    """从 Authorization: Bearer 请求头或请求体的 token 字段中获取会话令牌"""
+    token = parse_bearer_token(request.headers.get('Authorization'))
+    if token:
+        return token
+    data = request.get_json(silent=True) if request.is_json else None
+    if isinstance(data, dict):
+        return data.get('token') or ""
+    return request.form.get('token', "")
+
+# 记录当前请求携带的会话令牌，供 verify_user_credentials 使用
+@app.before_request
+def bind_request_token():
+    request.environ['auth_token_mark'] = set_request_token(request_token_from_flask())
+
+@app.teardown_request
+def unbind_request_token(exc=None):
+    mark = request.environ.pop('auth_token_mark', None)
+    if mark is not None:
+        reset_request_token(mark)
+
+auth_manager = get_auth_manager()
+# 管理员的用户权限值（可修改其他用户的权限）
+ADMIN_PERMISSION = "admin"
+
+def query_user_credentials(user_name, password):
     """
-    验证用户凭据
+    查询数据库验证用户名密码
     :param user_name: 用户名
     :param password: 密码
     :return: 用户信息字典或None
@@ -148,6 +184,24 @@ def verify_user_credentials(user_name, password):
         logger.error(f"验证用户凭据时出错: {e}")
         return None
 
+def has_credentials(user_name, password):
+    """请求是否携带了凭据（用户名和密码，或会话令牌）"""
+    return bool(user_name and password) or bool(get_request_token())
+
+def verify_user_credentials(user_name, password):
+    """
+    验证用户凭据：优先校验请求携带的会话令牌（纯内存），否则校验用户名密码（结果短期缓存）
+    :param user_name: 用户名
+    :param password: 密码
+    :return: 用户信息字典或None
+    """
+    user_info = auth_manager.verify_token(get_request_token())
+    if user_info:
+        return user_info
+    if not user_name or not password:
+        return None
+    return auth_manager.check_credentials(user_name, password, query_user_credentials)
+
 @app.route('/api/register', methods=['POST'])
 def register():
     """
@@ -238,7 +292,7 @@ def delete_user():
     user_name = data.get('user_name')
     password = data.get('password')
     
-    if not user_name or not password:
+    if not has_credentials(user_name, password):
         return jsonify({'success': False, 'message': '用户名和密码不能为空'})
     
     user_info = verify_user_credentials(user_name, password)
@@ -286,7 +340,9 @@ def add_file():
     }
     返回参数: {
         "success": true/false,
-        "message": "结果信息"
+        "message": "结果信息",
+        "file_id": "文件ID",
+        "job_id": "入库任务ID，可通过 /api/get_ingest_job_status 查询处理进度"
     }
     """
     try:
@@ -316,7 +372,7 @@ def add_file():
             knowledge_name = data.get('knowledge_name')
             file_url = data.get('file_url')  # 通过URL传输时使用此URL
         
-        if not user_name or not password:
+        if not has_credentials(user_name, password):
             return jsonify({'success': False, 'message': '用户名和密码不能为空'})
         
         user_info = verify_user_credentials(user_name, password)
@@ -429,6 +485,8 @@ def add_file():
             response_data = {'success': True, 'message': msg}
             if 'file_id' in result:
                 response_data['file_id'] = result['file_id']
+            if 'job_id' in result:
+                response_data['job_id'] = result['job_id']
             return jsonify(response_data)
         else:
             return jsonify({'success': False, 'message': result.get('error_msg', '文件添加失败')})
@@ -439,6 +497,63 @@ def add_file():
         logger.error(traceback.format_exc())
         return jsonify({'success': False, 'message': f'处理请求时出错: {str(e)}'})
 
+@app.route('/api/get_ingest_job_status', methods=['POST'])
+def get_ingest_job_status():
+    """
+    查询文件入库任务状态接口
+    请求参数: {
+        "user_name": "用户名",
+        "password": "密码",
+        "job_id": "入库任务ID",  # 与knowledge_id二选一
+        "knowledge_id": "知识库ID"  # 查询该知识库下的全部任务
+    }
+    返回参数: {
+        "success": true/false,
+        "message": "结果信息",
+        "job": {  # 按job_id查询时返回
+            "job_id": "",
+            "knowledge_id": "",
+            "file_id": "",
+            "status": "queued/parsing/embedding/graphing/done/failed",
+            "progress": {"parsing": {"done": 1, "total": 1}, "embedding": {"done": 10, "total": 40}},
+            "retries": 0,
+            "max_retries": 2,
+            "error_msg": "",
+            "create_time": "",
+            "update_time": ""
+        },
+        "jobs": []  # 按knowledge_id查询时返回
+    }
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({'success': False, 'message': 'No data provided'})
+    
+    user_name = data.get('user_name')
+    password = data.get('password')
+    if not has_credentials(user_name, password):
+        return jsonify({'success': False, 'message': '用户名和密码不能为空'})
+    
+    user_info = verify_user_credentials(user_name, password)
+    if not user_info:
+        return jsonify({'success': False, 'message': '用户名或密码错误'})
+    
+    param = {
+        "user_id": user_info['user_id'],
+        "job_id": data.get('job_id', ''),
+        "knowledge_id": data.get('knowledge_id', '')
+    }
+    result = controller.get_ingest_job(param)
+    if result.get('error_code') != 0:
+        return jsonify({'success': False, 'message': result.get('error_msg', '查询入库任务失败')})
+    
+    response_data = {'success': True, 'message': '查询入库任务成功'}
+    if 'job' in result:
+        response_data['job'] = result['job']
+    if 'jobs' in result:
+        response_data['jobs'] = result['jobs']
+    return jsonify(response_data)
+
 @app.route('/api/create_knowledge_base', methods=['POST'])
 def create_knowledge_base():
     """
@@ -465,7 +580,7 @@ def create_knowledge_base():
     user_name = data.get('user_name')
     password = data.get('password')
 
-    if not user_name or not password:
+    if not has_credentials(user_name, password):
         return jsonify({'success': False, 'message': '用户名和密码不能为空'})
 
     user_info = verify_user_credentials(user_name, password)
@@ -549,7 +664,7 @@ def delete_knowledge_base():
     user_name = data.get('user_name')
     password = data.get('password')
 
-    if not user_name or not password:
+    if not has_credentials(user_name, password):
         return jsonify({'success': False, 'message': '用户名和密码不能为空'})
 
     user_info = verify_user_credentials(user_name, password)
@@ -696,7 +811,7 @@ def delete_file():
     user_name = data.get('user_name')
     password = data.get('password')
     
-    if not user_name or not password:
+    if not has_credentials(user_name, password):
         return jsonify({'success': False, 'message': '用户名和密码不能为空'})
     
     user_info = verify_user_credentials(user_name, password)
@@ -760,7 +875,7 @@ def get_local_file_content():
         password = data.get('password')
         file_path = data.get('file_path')
         
-        if not user_name or not password:
+        if not has_credentials(user_name, password):
             logger.error('POST请求：用户名或密码为空')
             return jsonify({'success': False, 'message': '用户名和密码不能为空'})
         
@@ -870,7 +985,7 @@ def query_milvus():
     user_name = data.get('user_name')
     password = data.get('password')
     knowledge_name = data.get('knowledge_name')
-    if not user_name or not password:
+    if not has_credentials(user_name, password):
         return jsonify({'success': False, 'message': '用户名和密码不能为空'})
     
     user_info = verify_user_credentials(user_name, password)
@@ -910,7 +1025,7 @@ def query_graph_neo4j():
     password = data.get('password')
     knowledge_name = data.get('knowledge_name')
     
-    if not user_name or not password:
+    if not has_credentials(user_name, password):
         return jsonify({'success': False, 'message': '用户名和密码不能为空'})
     
     user_info = verify_user_credentials(user_name, password)
@@ -938,6 +1053,20 @@ def query_graph_neo4j():
         #     logger.error(f"Error processing data: {e}")
             return jsonify({"error_code":4, "error_msg":"Error, delete keywords file Api."})
         
+def _sse_response(events):
+    """把SSE数据生成器包装为Flask流式响应"""
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    # 手动添加CORS头部，因为@app.after_request装饰器不适用于直接创建的Response对象
+    response.headers['Access-Control-Allow-Origin'] = 'http://localhost:5173'
+    response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+    response.headers['Access-Control-Allow-Credentials'] = 'true'
+    # 添加SSE相关的头部
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Connection'] = 'keep-alive'
+    response.headers['X-Accel-Buffering'] = 'no'  # 禁用nginx缓冲
+    return response
+
 @app.route('/api/execute_stream_chat', methods=['POST'])
 def execute_stream_chat():
     """
@@ -976,10 +1105,20 @@ def execute_stream_chat():
     }
     """
     
-    data = request.get_json()
+    events, error = prepare_execute_stream_chat(request.get_json())
+    if error:
+        payload, status = error
+        return jsonify(payload), status
+    return _sse_response(events)
+
+def prepare_execute_stream_chat(data):
+    """
+    校验 /api/execute_stream_chat 的请求参数并创建RAG流程，Flask与ASGI两种服务模式共用
 
+    返回参数: (SSE数据生成器, None)，参数错误时返回 (None, (错误信息, HTTP状态码))
+    """
     if not data:
-        return jsonify({'success': False, 'message': 'No data provided'})
+        return None, ({'success': False, 'message': 'No data provided'}, 200)
     
     
     user_id = data.get('user_id')
@@ -988,12 +1127,12 @@ def execute_stream_chat():
         user_name = data.get('user_name')
         password = data.get('password')
     
-        if not user_name or not password:
-            return jsonify({'success': False, 'message': '用户名和密码不能为空'})
+        if not has_credentials(user_name, password):
+            return None, ({'success': False, 'message': '用户名和密码不能为空'}, 200)
         
         user_info = verify_user_credentials(user_name, password)
         if not user_info:
-            return jsonify({'success': False, 'message': '用户名或密码错误'})
+            return None, ({'success': False, 'message': '用户名或密码错误'}, 200)
         
         user_id = user_info['user_id']
     else:
@@ -1002,159 +1141,71 @@ def execute_stream_chat():
     knowledge_name = data.get('knowledge_name')
     session_id = data.get('session_id')
     
-    if not data:
-        return jsonify({'error': 'No data provided'})
-    else:
-        # Process the data (example: echo it back)
-        logger.info(f"execute_stream_chat received data: {data}")
-        try:
-            knowledge_id = data.get('knowledge_id')
-            if(not knowledge_id):
-                param = {"name":knowledge_name, "user_id":user_id}
-                kb_info = cSingleSqlite.query_knowledge_by_knowledge_name_and_user_id(param)
-                if(not kb_info):
-                    kb_info = cSingleSqlite.query_knowledge_by_knowledge_name(param)
-                knowledge_id = kb_info[0]["knowledge_id"]
+    # Process the data (example: echo it back)
+    logger.info(f"execute_stream_chat received data: {data}")
+    try:
+        knowledge_id = data.get('knowledge_id')
+        if(not knowledge_id):
+            param = {"name":knowledge_name, "user_id":user_id}
+            kb_info = cSingleSqlite.query_knowledge_by_knowledge_name_and_user_id(param)
+            if(not kb_info):
+                kb_info = cSingleSqlite.query_knowledge_by_knowledge_name(param)
+            knowledge_id = kb_info[0]["knowledge_id"]
 
-            param = {"knowledge_id":knowledge_id, "user_id":user_id, "query":data["query"]}
-            # result = controller_chat.execute_all_chat(param)
-            result = controller_chat.chat_rag_stream(param)
-            
-            def generate():
-                # 添加调试信息
-                logger.info(f"Controller result type: {type(result)}")
-                
-                has_data = False
-                chunk_count = 0
-                full_response = ""  # 用于收集完整响应
-                
-                try:
-                    for chunk in result:
-                        has_data = True
-                        chunk_count += 1
-                        try:
-                            # 添加调试信息
-                            logger.info(f"Processing chunk #{chunk_count}: {chunk}, type: {type(chunk)}")
-
-                            # 检查是否是tool_direct类型的chunk
-                            is_tool_direct = False
-                            if isinstance(chunk, dict) and "choices" in chunk:
-                                delta = chunk["choices"][0].get("delta", {})
-                                if "type" in delta and delta["type"] == "tool_direct_answer":
-                                    is_tool_direct = True
-                                    logger.info(f"检测到tool_direct chunk: {chunk.get('id', 'unknown')}")
-
-                            # 收集响应内容
-                            if isinstance(chunk, dict) and "choices" in chunk:
-                                delta = chunk["choices"][0].get("delta", {})
-                                content = delta.get("content", "")
-                                if content:
-                                    full_response += content
-                                    logger.info(f"Chunk #{chunk_count} content: '{content[:100]}...'")
-
-                            # 直接发送符合OpenAI格式的数据块
-                            if isinstance(chunk, dict):
-                                chunk_json = json.dumps(chunk, ensure_ascii=False)
-                                logger.info(f"Sending SSE data: data: {chunk_json[:200]}...")
-                                yield f"data: {chunk_json}\n\n"
-                            else:
-                                # 如果不是字典，包装成OpenAI格式
-                                wrapped_chunk = {
-                                    "id": "chatcmpl-fallback",
-                                    "object": "chat.completion.chunk",
-                                    "created": int(time.time()),
-                                    "model": "emb-graph-chat-model",
-                                    "choices": [
-                                        {
-                                            "index": 0,
-                                            "delta": {
-                                                "content": str(chunk),
-                                                "type": "text"
-                                            },
-                                            "finish_reason": None
-                                        }
-                                    ]
-                                }
-                                yield f"data: {json.dumps(wrapped_chunk)}\n\n"
-                        except Exception as e:
-                            error_msg = f"Error processing chunk #{chunk_count}: {str(e)}"
-                            logger.error(error_msg)
-                            error_chunk = {
-                                "id": "chatcmpl-error",
-                                "object": "chat.completion.chunk",
-                                "created": int(time.time()),
-                                "model": "emb-graph-chat-model",
-                                "choices": [
-                                    {
-                                        "index": 0,
-                                        "delta": {
-                                            "content": f"Error: {error_msg}",
-                                            "type": "text"
-                                        },
-                                        "finish_reason": None
-                                    }
-                                ]
-                            }
-                            yield f"data: {json.dumps(error_chunk)}\n\n"
-                    
-                    # 保存聊天记录到Redis
-                    if full_response:
-                        # 获取会话名称
-                        session_info = cSingleSqlite.search_session_by_session_id(session_id)
-                        session_name = session_info["session_name"] if session_info else "Unknown Session"
-                        # 用户查询格式化为列表格式
-                        query_list = [{"type":"text", "content":data["query"]}] if data.get("query") else []
-                        # 响应格式化为列表格式
-                        response_list = [{"type":"text", "content":full_response}] if full_response else []
-                        sess_obj.save_chat_history(user_id, session_id, session_name, query_list, response_list)
-                        logger.info(f"Chat history saved for user {user_id}, session {session_id}, query_items={len(query_list)}, response_items={len(response_list)}")
-                    
-                    # 如果没有数据，发送一个测试消息
-                    if not has_data:
-                        logger.warning("No data received from controller")
-                        test_chunk = {
-                            "id": "chatcmpl-test",
-                            "object": "chat.completion.chunk",
-                            "created": int(time.time()),
-                            "model": "emb-graph-chat-model",
-                            "choices": [
-                                {
-                                    "index": 0,
-                                    "delta": {
-                                        "content": "No data received from controller",
-                                        "type": "text"
-                                    },
-                                    "finish_reason": "stop"
-                                }
-                            ]
-                        }
-                        yield f"data: {json.dumps(test_chunk)}\n\n"
-                    else:
-                        logger.info(f"Total chunks sent: {chunk_count}")
-
-                    # 发送流结束信号
-                    logger.info("Sending stream end signal")
-                    yield "data: [DONE]\n\n"
-                except Exception as e:
-                    logger.error(f"Error in generate function: {e}")
-                    # 即使出现异常也尝试保存已有的响应
-                    if full_response:
-                        try:
-                            # 获取会话名称
-                            session_info = cSingleSqlite.search_session_by_session_id(session_id)
-                            session_name = session_info["session_name"] if session_info else "Unknown Session"
-                            # 用户查询格式化为列表格式
-                            query_list = [{"type":"text", "content":data["query"]}] if data.get("query") else []
-                            # 响应格式化为列表格式
-                            response_list = [{"type":"text", "content":full_response}] if full_response else []
-                            sess_obj.save_chat_history(user_id, session_id, session_name, query_list, response_list)
-                            logger.info(f"Partial chat history saved after error for user {user_id}, session {session_id}, query_items={len(query_list)}, response_items={len(response_list)}")
-                        except Exception as save_error:
-                            logger.error(f"Failed to save chat history after error: {save_error}")
-                    
-                    # 向客户端发送错误信息
-                        error_chunk = {
-                        "id": "chatcmpl-final-error",
+        param = {"knowledge_id":knowledge_id, "user_id":user_id, "query":data["query"]}
+        # result = controller_chat.execute_all_chat(param)
+        result = controller_chat.chat_rag_stream(param)
+        return execute_stream_chat_events(result, data, user_id, session_id), None
+    except Exception as e:
+        logger.error(f"Error processing data: {e}")
+        return None, ({"error_code":4, "error_msg":f"Error processing stream query: {str(e)}"}, 500)
+
+def execute_stream_chat_events(result, data, user_id, session_id):
+    """把RAG流程的数据块转换为SSE数据，并在结束后保存聊天记录"""
+    # 添加调试信息
+    logger.info(f"Controller result type: {type(result)}")
+
+    has_data = False
+    chunk_count = 0
+    full_response = ""  # 用于收集完整响应
+
+    try:
+        for chunk in result:
+            has_data = True
+            chunk_count += 1
+            # 按配置采样记录数据块日志，避免每个数据块都序列化输出
+            log_chunk = server_config.should_log_chunk(chunk_count)
+            try:
+                if log_chunk:
+                    logger.info(f"Processing chunk #{chunk_count}: {chunk}, type: {type(chunk)}")
+
+                # 检查是否是tool_direct类型的chunk
+                is_tool_direct = False
+                if isinstance(chunk, dict) and "choices" in chunk:
+                    delta = chunk["choices"][0].get("delta", {})
+                    if "type" in delta and delta["type"] == "tool_direct_answer":
+                        is_tool_direct = True
+                        logger.info(f"检测到tool_direct chunk: {chunk.get('id', 'unknown')}")
+
+                # 收集响应内容
+                if isinstance(chunk, dict) and "choices" in chunk:
+                    delta = chunk["choices"][0].get("delta", {})
+                    content = delta.get("content", "")
+                    if content:
+                        full_response += content
+                        if log_chunk:
+                            logger.info(f"Chunk #{chunk_count} content: '{content[:100]}...'")
+
+                # 直接发送符合OpenAI格式的数据块
+                if isinstance(chunk, dict):
+                    chunk_json = json.dumps(chunk, ensure_ascii=False)
+                    if log_chunk:
+                        logger.info(f"Sending SSE data: data: {chunk_json[:200]}...")
+                    yield f"data: {chunk_json}\n\n"
+                else:
+                    # 如果不是字典，包装成OpenAI格式
+                    wrapped_chunk = {
+                        "id": "chatcmpl-fallback",
                         "object": "chat.completion.chunk",
                         "created": int(time.time()),
                         "model": "emb-graph-chat-model",
@@ -1162,27 +1213,108 @@ def execute_stream_chat():
                             {
                                 "index": 0,
                                 "delta": {
-                                    "content": f"Final error in processing: {str(e)}",
+                                    "content": str(chunk),
                                     "type": "text"
                                 },
-                                "finish_reason": "stop"
+                                "finish_reason": None
                             }
                         ]
                     }
-                    yield f"data: {json.dumps(error_chunk)}\n\n"
-            response = Response(stream_with_context(generate()), mimetype='text/event-stream')
-            # 手动添加CORS头部，因为@app.after_request装饰器不适用于直接创建的Response对象
-            response.headers['Access-Control-Allow-Origin'] = 'http://localhost:5173'
-            response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-            response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
-            response.headers['Access-Control-Allow-Credentials'] = 'true'
-            # 添加SSE相关的头部
-            response.headers['Cache-Control'] = 'no-cache'
-            response.headers['Connection'] = 'keep-alive'
-            return response
-        except Exception as e:
-            logger.error(f"Error processing data: {e}")
-            return jsonify({"error_code":4, "error_msg":f"Error processing stream query: {str(e)}"}), 500
+                    yield f"data: {json.dumps(wrapped_chunk)}\n\n"
+            except Exception as e:
+                error_msg = f"Error processing chunk #{chunk_count}: {str(e)}"
+                logger.error(error_msg)
+                error_chunk = {
+                    "id": "chatcmpl-error",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": "emb-graph-chat-model",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "delta": {
+                                "content": f"Error: {error_msg}",
+                                "type": "text"
+                            },
+                            "finish_reason": None
+                        }
+                    ]
+                }
+                yield f"data: {json.dumps(error_chunk)}\n\n"
+
+        # 保存聊天记录到Redis
+        if full_response:
+            # 获取会话名称
+            session_info = cSingleSqlite.search_session_by_session_id(session_id)
+            session_name = session_info["session_name"] if session_info else "Unknown Session"
+            # 用户查询格式化为列表格式
+            query_list = [{"type":"text", "content":data["query"]}] if data.get("query") else []
+            # 响应格式化为列表格式
+            response_list = [{"type":"text", "content":full_response}] if full_response else []
+            sess_obj.save_chat_history(user_id, session_id, session_name, query_list, response_list)
+            logger.info(f"Chat history saved for user {user_id}, session {session_id}, query_items={len(query_list)}, response_items={len(response_list)}")
+
+        # 如果没有数据，发送一个测试消息
+        if not has_data:
+            logger.warning("No data received from controller")
+            test_chunk = {
+                "id": "chatcmpl-test",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": "emb-graph-chat-model",
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {
+                            "content": "No data received from controller",
+                            "type": "text"
+                        },
+                        "finish_reason": "stop"
+                    }
+                ]
+            }
+            yield f"data: {json.dumps(test_chunk)}\n\n"
+        else:
+            logger.info(f"Total chunks sent: {chunk_count}")
+
+        # 发送流结束信号
+        logger.info("Sending stream end signal")
+        yield "data: [DONE]\n\n"
+    except Exception as e:
+        logger.error(f"Error in generate function: {e}")
+        # 即使出现异常也尝试保存已有的响应
+        if full_response:
+            try:
+                # 获取会话名称
+                session_info = cSingleSqlite.search_session_by_session_id(session_id)
+                session_name = session_info["session_name"] if session_info else "Unknown Session"
+                # 用户查询格式化为列表格式
+                query_list = [{"type":"text", "content":data["query"]}] if data.get("query") else []
+                # 响应格式化为列表格式
+                response_list = [{"type":"text", "content":full_response}] if full_response else []
+                sess_obj.save_chat_history(user_id, session_id, session_name, query_list, response_list)
+                logger.info(f"Partial chat history saved after error for user {user_id}, session {session_id}, query_items={len(query_list)}, response_items={len(response_list)}")
+            except Exception as save_error:
+                logger.error(f"Failed to save chat history after error: {save_error}")
+
+        # 向客户端发送错误信息
+            error_chunk = {
+            "id": "chatcmpl-final-error",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": "emb-graph-chat-model",
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {
+                        "content": f"Final error in processing: {str(e)}",
+                        "type": "text"
+                    },
+                    "finish_reason": "stop"
+                }
+            ]
+        }
+        yield f"data: {json.dumps(error_chunk)}\n\n"
 
 @app.route('/api/execute_query', methods=['POST'])
 def execute_query():
@@ -1196,7 +1328,7 @@ def execute_query():
     password = data.get('password')
     knowledge_name = data.get('knowledge_name')
     
-    if not user_name or not password:
+    if not has_credentials(user_name, password):
         return jsonify({'success': False, 'message': '用户名和密码不能为空'})
     
     user_info = verify_user_credentials(user_name, password)
@@ -1264,6 +1396,8 @@ def user_login():
         "success": true/false,
         "message": "登录结果信息",
         "user_id": "用户ID",
+        "token": "会话令牌",  # 之后的请求可通过 Authorization: Bearer <token> 或 token 字段代替用户名密码
+        "expires_at": 令牌过期时间戳
     }
     """
     data = request.get_json()
@@ -1296,11 +1430,14 @@ def user_login():
             }
             
             sess_obj.save_user_session(session_id, user_session_info)
+            token_info = auth_manager.issue_token({'user_id': user_id, 'user_name': user_name, 'permissions': row[3]})
             
             return jsonify({
                 'success': True,
                 'message': '登录成功',
                 'user_id': user_id,
+                'token': token_info['token'],
+                'expires_at': token_info['expires_at'],
             })
         else:
             return jsonify({'success': False, 'message': '用户名或密码错误'})
@@ -1317,6 +1454,7 @@ def user_logout():
         "session_id": "会话ID" # 可选
         "user_name": "用户名"
         "password": "密码"
+        "token": "会话令牌" # 可选，登出后该令牌失效
     }
     返回参数: {
         "success": true/false,
@@ -1330,7 +1468,7 @@ def user_logout():
     user_name = data.get('user_name')
     password = data.get('password')
     
-    if not user_name or not password:
+    if not has_credentials(user_name, password):
         return jsonify({'success': False, 'message': '用户名和密码不能为空'})
     
     user_info = verify_user_credentials(user_name, password)
@@ -1340,7 +1478,8 @@ def user_logout():
     user_id = user_info['user_id']
     
     try:
-        
+        # 撤销本次请求携带的会话令牌
+        auth_manager.revoke_token(get_request_token())
         if(user_id):
             return jsonify({'success': True, 'message': '登出成功'})
         else:
@@ -1349,6 +1488,91 @@ def user_logout():
         logger.error(f"登出过程中发生错误: {e}")
         return jsonify({'success': False, 'message': '登出过程中发生错误'})
 
+@app.route('/api/change_password', methods=['POST'])
+def change_password():
+    """
+    修改密码接口，修改后该用户已签发的会话令牌全部失效，需要重新登录
+    请求参数: {
+        "user_name": "用户名",
+        "password": "原密码",
+        "new_password": "新密码",
+        "confirm_password": "确认新密码"
+    }
+    返回参数: {
+        "success": true/false,
+        "message": "结果信息"
+    }
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({'success': False, 'message': 'No data provided'})
+    
+    user_name = data.get('user_name')
+    password = data.get('password')
+    new_password = data.get('new_password')
+    confirm_password = data.get('confirm_password')
+    
+    if not user_name or not password or not new_password or not confirm_password:
+        return jsonify({'success': False, 'message': '用户名、原密码、新密码和确认密码不能为空'})
+    
+    if new_password != confirm_password:
+        return jsonify({'success': False, 'message': '新密码和确认密码不一致'})
+    
+    if len(new_password) < 6:
+        return jsonify({'success': False, 'message': '密码长度不能少于6位'})
+    
+    # 修改密码必须校验原密码，不使用令牌与缓存
+    user_info = query_user_credentials(user_name, password)
+    if not user_info:
+        return jsonify({'success': False, 'message': '用户名或密码错误'})
+    
+    if cSingleSqlite.update_user_password(user_info['user_id'], new_password):
+        logger.info(f"用户修改密码: {user_name} (ID: {user_info['user_id']})")
+        return jsonify({'success': True, 'message': '密码修改成功，请重新登录'})
+    return jsonify({'success': False, 'message': '密码修改失败'})
+
+@app.route('/api/update_user_permissions', methods=['POST'])
+def update_user_permissions():
+    """
+    修改用户权限接口（仅管理员），修改后该用户的认证缓存与已签发的会话令牌全部失效，需要重新登录
+    请求参数: {
+        "user_name": "管理员用户名",
+        "password": "管理员密码",
+        "target_user_id": "被修改权限的用户ID",
+        "permissions": "新权限"
+    }
+    返回参数: {
+        "success": true/false,
+        "message": "结果信息"
+    }
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({'success': False, 'message': 'No data provided'})
+
+    user_name = data.get('user_name')
+    password = data.get('password')
+    target_user_id = data.get('target_user_id')
+    permissions = data.get('permissions')
+
+    if not has_credentials(user_name, password):
+        return jsonify({'success': False, 'message': '用户名和密码不能为空'})
+    if not target_user_id or permissions is None:
+        return jsonify({'success': False, 'message': '用户ID和权限不能为空'})
+
+    user_info = verify_user_credentials(user_name, password)
+    if not user_info:
+        return jsonify({'success': False, 'message': '用户名或密码错误'})
+
+    # 管理员身份按数据库中的当前权限判断，不使用令牌或缓存中可能过期的权限
+    if cSingleSqlite.query_user_permissions(user_info['user_id']) != ADMIN_PERMISSION:
+        return jsonify({'success': False, 'message': '没有修改用户权限的权限'})
+
+    if cSingleSqlite.update_user_permissions(target_user_id, str(permissions)):
+        logger.info(f"用户权限修改: {target_user_id} -> {permissions} (操作人: {user_info['user_id']})")
+        return jsonify({'success': True, 'message': '权限修改成功，该用户需要重新登录'})
+    return jsonify({'success': False, 'message': '用户不存在或权限修改失败'})
+
 # 新增清除聊天历史记录的API接口
 @app.route('/api/clear_chat_history', methods=['POST'])
 def clear_chat_history():
@@ -1371,7 +1595,7 @@ def clear_chat_history():
     user_name = data.get('user_name')
     password = data.get('password')
     
-    if not user_name or not password:
+    if not has_credentials(user_name, password):
         return jsonify({'success': False, 'message': '用户名和密码不能为空'})
     
     user_info = verify_user_credentials(user_name, password)
@@ -1422,42 +1646,39 @@ def delete_sessions_by_session_id():
     # print(session_id)
     # sess_obj.get_session_messages_by_id(session_id)
     sess_obj.delete_session_messages_by_id(session_id)
-    cSingleSqlite.delete_sessions_by_session_id(session_id)
     
-    # 删除圆桌讨论相关文件
+    # 通过 session_id 获取所有相关的 discussion_id 与上传文件
     try:
-        # 通过 session_id 获取所有相关的 discussion_id
         task_stats = cSingleSqlite.count_discussion_tasks_by_session_id(session_id)
-        tasks_list = task_stats.get('tasks', [])
-        
-        # 遍历所有任务，删除对应的 discussion 文件夹和数据库记录
-        for task in tasks_list:
-            discussion_id = task.get('discussion_id')
-            if discussion_id:
-                # 删除 discussion 文件夹
-                discussion_path = os.path.join("discussion", discussion_id)
-                if os.path.exists(discussion_path):
-                    shutil.rmtree(discussion_path)
-                    print(f"删除圆桌讨论文件夹成功: {discussion_path}")
-                
-                # 删除数据库中的任务记录
+        discussion_id_list = [task.get('discussion_id') for task in task_stats.get('tasks', []) if task.get('discussion_id')]
+    except Exception as e:
+        print(f"查询圆桌讨论任务时出错: {e}")
+        discussion_id_list = []
+    file_info_list = cSingleSqlite.search_file_basic_info_by_session_id(session_id)
+    
+    # 会话、圆桌讨论任务与文件记录在一个事务内删除
+    try:
+        with cSingleSqlite.transaction():
+            cSingleSqlite.delete_sessions_by_session_id(session_id)
+            for discussion_id in discussion_id_list:
                 cSingleSqlite.delete_discussion_task_by_discussion_id(discussion_id)
-                print(f"删除圆桌讨论任务记录成功: discussion_id={discussion_id}")
+            for file_info in file_info_list:
+                cSingleSqlite.delete_file_basic_info(file_info["file_id"])
     except Exception as e:
-        print(f"删除圆桌讨论文件时出错: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.error(f"删除会话 {session_id} 时出错: {e}")
+        return jsonify({'success': False, 'message': f'删除失败: {str(e)}'})
+    
+    # 删除圆桌讨论文件夹
+    for discussion_id in discussion_id_list:
+        discussion_path = os.path.join("discussion", discussion_id)
+        if os.path.exists(discussion_path):
+            shutil.rmtree(discussion_path)
+            print(f"删除圆桌讨论文件夹成功: {discussion_path}")
     
-    file_info_list = cSingleSqlite.search_file_basic_info_by_session_id(session_id)
     for file_info in file_info_list:
-        print("file_info")
-        print(file_info)
-        file_path = file_info["file_path"]
         # 从文件路径中提取目录路径（删除文件名，保留文件夹路径）
         # 例如：conf/file/file_22814796fd3d46e0/流浪地球.txt -> conf/file/file_22814796fd3d46e0
-        file_dir = os.path.dirname(file_path)
-        file_id = file_info["file_id"]
-        cSingleSqlite.delete_file_basic_info(file_id)
+        file_dir = os.path.dirname(file_info["file_path"])
         # 删除整个文件夹
         if os.path.exists(file_dir):
             shutil.rmtree(file_dir)
@@ -1550,16 +1771,30 @@ def get_user_session_messages():
         "user_name": "管理员用户名",
         "password": "密码"
         "user_id": "用户ID" #可选
+        "page": 1, #可选，sessions的页码，从1开始
+        "page_size": 20 #可选，sessions的每页条数
     }
     返回参数: {
         "success": true/false,
         "message": "结果信息",
-        "messages": [
+        "messages": [ #用户的全部会话
             {
                 "session_id":"", #对话ID
                 "session_name": "", #对话名
                 "session_desc": "", #对话描述
             }
+        ],
+        "total": 会话总数,
+        "page": 页码,
+        "page_size": 每页条数,
+        "sessions": [ #按最后更新时间倒序分页的会话摘要（Redis不可用时按创建时间倒序，无消息预览）
+            {
+                "session_id":"", #对话ID
+                "session_name": "", #对话名
+                "last_message": "", #最后一条消息预览
+                "updated_at": 0, #最后更新时间戳
+                "message_count": 0 #消息条数
+            }
         ]
     }
     """
@@ -1579,8 +1814,13 @@ def get_user_session_messages():
         
         user_id = user_info['user_id']
 
-    if(True):
-    #try:
+    try:
+        page = int(data.get('page', 1))
+        page_size = int(data.get('page_size', 20))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'page和page_size必须为整数'})
+
+    try:
         messages_list = cSingleSqlite.search_session_by_user_id(user_id)
         result = []
         for message in messages_list:
@@ -1590,15 +1830,15 @@ def get_user_session_messages():
             tmp['session_desc'] = message['session_desc']
             result.append(tmp)
         
+        page_result = sess_obj.get_sessions_by_user_id(user_id, page, page_size, session_lt=messages_list)
         return jsonify({
             'success': True,
             'message': '获取聊天记录成功',
-            'messages': result
+            'messages': result,
+            **page_result
         })
-    #except Exception as e:
-    #    logger.error(f"获取聊天记录时出错: {e}")
-    else:
-        e = ""
+    except Exception as e:
+        logger.error(f"获取聊天记录时出错: {e}")
         return jsonify({
             'success': False,
             'message': f'获取聊天记录时出错: {str(e)}'
@@ -1696,6 +1936,22 @@ def get_knowledge_base_file_list():
     file_list = cSingleSqlite.search_file_by_knowledge_id(knowledge_id)
     return jsonify({'success': True, 'message': '获取知识库文件列表成功', 'file_list': file_list})
 
+@app.route('/api/get_response_cache_stats', methods=['GET', 'POST'])
+def get_response_cache_stats():
+    """
+    获取问答语义缓存统计接口
+    返回参数: {
+        "success": true,
+        "message": "结果信息",
+        "stats": {
+            "hits": 0, "misses": 0, "hit_rate": 0.0, "stores": 0, "evictions": 0,
+            "expired": 0, "invalidations": 0, "size": 0, "partitions": 0
+        }
+    }
+    """
+    stats = controller_chat.get_response_cache_stats()
+    return jsonify({'success': True, 'message': '获取问答缓存统计成功', 'stats': stats})
+
 # @app.route('/api/chat_discussion', methods=['POST'])
 # def chat_discussion():
 #     """
@@ -2009,55 +2265,46 @@ def chat():
     # 处理 multipart/form-data 和 application/json 两种情况
     if request.content_type.startswith('multipart/form-data'):
         # 获取表单数据
-        user_name = request.form.get('user_name')
-        password = request.form.get('password')
-        session_id = request.form.get('session_id')
-        knowledge_name = request.form.get('knowledge_name', "")
-        knowledge_id = request.form.get('knowledge_id', "")
-        query = request.form.get('query', "")
-        permission_level = request.form.get('permission_level', "")
-        sql_id = request.form.get('sql_id', "")
+        fields = request.form.to_dict()
         # 获取上传的文件
         file = request.files.get('file')
-        choice = request.form.get('choice', "")
     else:
         # 原有的 JSON 数据处理方式
         data = request.get_json()
         if not data:
-            response = jsonify({'success': False, 'message': 'No data provided'})
-            response.headers['Access-Control-Allow-Origin'] = 'http://localhost:5173'
-            response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-            response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
-            response.headers['Access-Control-Allow-Credentials'] = 'true'
-            return response
-        
-        user_name = data.get('user_name')
-        password = data.get('password')
-        session_id = data.get('session_id')
-        knowledge_name = data.get('knowledge_name', "")
-        knowledge_id = data.get('knowledge_id', "")
-        sql_id = data.get('sql_id', "")
-        query = data.get('query', "")
-        permission_level = data.get('permission_level', "")
+            return jsonify({'success': False, 'message': 'No data provided'})
+        fields = data
         file = data.get('file', "")
-        choice = data.get('choice', "")
+    
+    events, error = prepare_chat(fields, file)
+    if error:
+        payload, status = error
+        return jsonify(payload), status
+    return _sse_response(events)
+
+def prepare_chat(fields, file):
+    """
+    校验 /api/chat 的请求参数、保存上传文件并创建对应的聊天流程，Flask与ASGI两种服务模式共用
+
+    请求参数: fields 为表单或JSON中的字段，file 为上传的文件（需提供 filename 属性和 save(路径) 方法）
+    返回参数: (SSE数据生成器, None)，参数错误时返回 (None, (错误信息, HTTP状态码))
+    """
+    user_name = fields.get('user_name')
+    password = fields.get('password')
+    session_id = fields.get('session_id')
+    knowledge_name = fields.get('knowledge_name', "")
+    knowledge_id = fields.get('knowledge_id', "")
+    sql_id = fields.get('sql_id', "")
+    query = fields.get('query', "")
+    permission_level = fields.get('permission_level', "")
+    choice = fields.get('choice', "")
     print(f"query: {query}")
-    if not user_name or not password:
-        response = jsonify({'success': False, 'message': '用户名和密码不能为空'})
-        response.headers['Access-Control-Allow-Origin'] = 'http://localhost:5173'
-        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
-        response.headers['Access-Control-Allow-Credentials'] = 'true'
-        return response
+    if not has_credentials(user_name, password):
+        return None, ({'success': False, 'message': '用户名和密码不能为空'}, 200)
 
     user_info = verify_user_credentials(user_name, password)
     if not user_info:
-        response = jsonify({'success': False, 'message': '用户名或密码错误'})
-        response.headers['Access-Control-Allow-Origin'] = 'http://localhost:5173'
-        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
-        response.headers['Access-Control-Allow-Credentials'] = 'true'
-        return response
+        return None, ({'success': False, 'message': '用户名或密码错误'}, 200)
     
     user_id = user_info['user_id']
     try:
@@ -2068,17 +2315,17 @@ def chat():
                 if(not kb_info):
                     kb_info = cSingleSqlite.query_knowledge_by_knowledge_name(param)
                 knowledge_id = kb_info[0]["knowledge_id"]
-
+    
         # 处理文件上传
         file_path = ""
         if file and file.filename:  # 检查是否有上传文件且有文件名
             # 生成文件ID
             file_id = f"file_{uuid.uuid4().hex[:16]}"
-            
+    
             # 创建文件保存目录 conf/file/file_id/
             file_dir = os.path.join("conf", "file", file_id)
             os.makedirs(file_dir, exist_ok=True)
-            
+    
             # 保存文件到指定目录
             file_path = os.path.join(file_dir, file.filename)
             file.save(file_path)
@@ -2095,7 +2342,7 @@ def chat():
                 "query":query, "file":file_path}
         if(choice == "discussion"):
             # 若请求中带 discussion_id（如前端「重启指定任务」），则沿用原任务ID与文件夹
-            request_discussion_id = (data.get("discussion_id") or "").strip() or None
+            request_discussion_id = (fields.get("discussion_id") or "").strip() or None
             result = controller_chat.chat_with_discussion(
                 user_id, session_id, query, file_path,
                 discussion_id=request_discussion_id
@@ -2120,206 +2367,143 @@ def chat():
                     param = {"knowledge_id":knowledge_id, "user_id":user_id, "query":query}
                     # result = controller_chat.execute_all_chat(param)
                     result = controller_chat.chat_with_rag(param)
+        return chat_events(result, user_id, session_id, query), None
+    except Exception as e:
+        logger.error(f"Error processing data: {e}")
+        return None, ({"error_code":4, "error_msg":f"Error processing stream query: {str(e)}"}, 500)
+
+def chat_events(result, user_id, session_id, query):
+    """把聊天流程的数据块转换为SSE数据，并实时更新聊天记录"""
+    # 添加调试信息
+    # logger.info(f"Controller result type: {type(result)}")
+    logger.info("开始处理流式响应chunks")
+
+    has_data = False
+    chunk_count = 0
+    full_flag = False
+    full_response = ""  # 用于收集完整响应
+    full_response_list = []  # 用于收集完整响应（列表形式）
+    try:
+        # 在开始处理前，先保存初始聊天记录（只有query）
+        if query:
+            session_info = cSingleSqlite.search_session_by_session_id(session_id)
+            session_name = session_info["session_name"] if session_info else "Unknown Session"
+            query_list = [{"type":"text", "content":query}]
+            initial_response_list = []  # 初始时response为空
+            sess_obj.save_chat_history(user_id, session_id, session_name, query_list, initial_response_list)
+            logger.info(f"Initial chat record saved for user {user_id}, session {session_id}")
+
+        logger.info(f"开始处理圆桌会议流式响应，session_id={session_id}, user_id={user_id}")
+
+        last_heartbeat = time.time()
+        for chunk in result:
+            # print("chunk")
+            # print(chunk)
+            current_time = time.time()
+            has_data = True
+            chunk_count += 1
+            # 按配置采样记录数据块日志，避免每个数据块都序列化输出
+            log_chunk = server_config.should_log_chunk(chunk_count)
+            if log_chunk:
+                logger.info(f"开始处理chunk #{chunk_count} (距上次心跳: {current_time - last_heartbeat:.1f}秒)")
+
+            # 每10个chunk发送一次心跳
+            if chunk_count % 10 == 0:
+                logger.info(f"❤️ 心跳: 已处理 {chunk_count} 个chunks")
+                last_heartbeat = current_time
 
-        def generate():
-            # 添加调试信息
-            # logger.info(f"Controller result type: {type(result)}")
-            logger.info("开始处理流式响应chunks")
-
-            has_data = False
-            chunk_count = 0
-            full_flag = False
-            full_response = ""  # 用于收集完整响应
-            full_response_list = []  # 用于收集完整响应（列表形式）
             try:
-                # 在开始处理前，先保存初始聊天记录（只有query）
-                if query:
-                    session_info = cSingleSqlite.search_session_by_session_id(session_id)
-                    session_name = session_info["session_name"] if session_info else "Unknown Session"
-                    query_list = [{"type":"text", "content":query}]
-                    initial_response_list = []  # 初始时response为空
-                    sess_obj.save_chat_history(user_id, session_id, session_name, query_list, initial_response_list)
-                    logger.info(f"Initial chat record saved for user {user_id}, session {session_id}")
-
-                logger.info(f"开始处理圆桌会议流式响应，session_id={session_id}, user_id={user_id}")
-
-                last_heartbeat = time.time()
-                for chunk in result:
-                    # print("chunk")
-                    # print(chunk)
-                    current_time = time.time()
-                    logger.info(f"开始处理chunk #{chunk_count + 1} (距上次心跳: {current_time - last_heartbeat:.1f}秒)")
-                    has_data = True
-                    chunk_count += 1
-
-                    # 每10个chunk发送一次心跳
-                    if chunk_count % 10 == 0:
-                        logger.info(f"❤️ 心跳: 已处理 {chunk_count} 个chunks")
-                        last_heartbeat = current_time
-
-                    try:
-                        # print(chunk)
-                        # 添加调试信息
-                        logger.info(f"Processing chunk #{chunk_count}: type={type(chunk)}")
-
-                        # 调试：记录chunk的详细内容（前200字符）
-                        chunk_str = str(chunk)[:200] + "..." if len(str(chunk)) > 200 else str(chunk)
-                        logger.info(f"Chunk content preview: {chunk_str}")
-
-                        # 收集响应内容
-                        if isinstance(chunk, dict) and "choices" in chunk:
-                            delta = chunk["choices"][0].get("delta", {})
-                            content = delta.get("content", "")
-                            type_con = delta.get("type", "")
-
-                            # 如果遇到特殊类型（echarts或html_table），先保存之前的文本内容
-                            if type_con == "echarts" or type_con == "html_table":
-                                # 如果有累积的文本内容，先添加到列表
-                                if full_response and full_response.strip():
-                                    full_response_list.append({"type":"text", "content":full_response})
-                                    full_response = ""
-                                # 添加当前的特殊类型内容
-                                if content and content.strip():
-                                    full_response_list.append({"type":type_con, "content":content})
-                            elif(type_con == "file"):
-                                if full_response and full_response.strip():
-                                    full_response_list.append({"type":"text", "content":full_response})
-                                    full_response = ""
-                                # 添加当前的特殊类型内容
-                                if content and content.strip():
-                                    full_response_list.append({"type":type_con, "content":content})
-                            else:
-                                # 普通文本内容，累积到 full_response
-                                if content:
-                                    full_response += content
-
-                        # 每次处理chunk后，实时更新最后一条聊天记录
-                        if isinstance(chunk, dict) and "choices" in chunk:
-                            delta = chunk["choices"][0].get("delta", {})
-                            content = delta.get("content", "")
-                            type_con = delta.get("type", "")
-
-                            # 只有当有实际内容时才更新
-                            if content or type_con:
-                                # 处理最后剩余的文本内容到列表
-                                current_full_response = full_response
-                                current_full_response_list = full_response_list.copy()
-
-                                if current_full_response and current_full_response.strip():
-                                    current_full_response_list.append({"type":"text", "content":current_full_response})
-
-                                # 更新最后一条聊天记录
-                                if current_full_response_list:
-                                    sess_obj.update_last_chat_record(session_id, updated_response=current_full_response_list)
-                                    logger.info(f"Updated last chat record for session {session_id} with {len(current_full_response_list)} response items")
-
-                        # 直接发送符合OpenAI格式的数据块
-                        if isinstance(chunk, dict):
-                            sse_data = f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
-                            logger.info(f"发送SSE数据: {len(sse_data)} 字符")
-                            logger.info(f"SSE数据内容: {sse_data[:200]}...")
-                            yield sse_data
-                        else:
-                            # 如果不是字典，包装成OpenAI格式
-                            wrapped_chunk = {
-                                "id": "chatcmpl-fallback",
-                                "object": "chat.completion.chunk",
-                                "created": int(time.time()),
-                                "model": "emb-graph-chat-model",
-                                "choices": [
-                                    {
-                                        "index": 0,
-                                        "delta": {
-                                            "content": str(chunk),  # 修复了这里的错误
-                                            "type": "text"
-                                        },
-                                        "finish_reason": None
-                                    }
-                                ]
-                            }
-                            # 对于非字典类型的chunk，也累积到full_response
-                            if not isinstance(chunk, dict):
-                                full_response = full_response + str(chunk)
-                            yield f"data: {json.dumps(wrapped_chunk)}\n\n"
-                    except Exception as e:
-                        error_msg = f"Error processing chunk #{chunk_count}: {str(e)}"
-                        logger.error(error_msg)
-                        error_chunk = {
-                            "id": "chatcmpl-error",
-                            "object": "chat.completion.chunk",
-                            "created": int(time.time()),
-                            "model": "emb-graph-chat-model",
-                            "choices": [
-                                {
-                                    "index": 0,
-                                    "delta": {
-                                        "content": f"Error: {error_msg}",
-                                        "type": "text"
-                                    },
-                                    "finish_reason": None
-                                }
-                            ]
-                        }
-                        yield f"data: {json.dumps(error_chunk)}\n\n"
-                
-                # 处理最后剩余的文本内容并进行最终更新
-                if full_response and full_response.strip():
-                    full_response_list.append({"type":"text", "content":full_response})
-
-                # 最终更新一次，确保所有内容都被保存
-                if full_response_list:
-                    sess_obj.update_last_chat_record(session_id, updated_response=full_response_list)
-                    logger.info(f"Final update of last chat record for session {session_id} with {len(full_response_list)} response items")
-                # 如果没有数据，发送一个测试消息
-                if not has_data:
-                    logger.warning("No data received from controller")
-                    test_chunk = {
-                        "id": "chatcmpl-test",
+                # print(chunk)
+                if log_chunk:
+                    # 添加调试信息
+                    logger.info(f"Processing chunk #{chunk_count}: type={type(chunk)}")
+
+                    # 调试：记录chunk的详细内容（前200字符）
+                    chunk_str = str(chunk)[:200] + "..." if len(str(chunk)) > 200 else str(chunk)
+                    logger.info(f"Chunk content preview: {chunk_str}")
+
+                # 收集响应内容
+                if isinstance(chunk, dict) and "choices" in chunk:
+                    delta = chunk["choices"][0].get("delta", {})
+                    content = delta.get("content", "")
+                    type_con = delta.get("type", "")
+
+                    # 如果遇到特殊类型（echarts或html_table），先保存之前的文本内容
+                    if type_con == "echarts" or type_con == "html_table":
+                        # 如果有累积的文本内容，先添加到列表
+                        if full_response and full_response.strip():
+                            full_response_list.append({"type":"text", "content":full_response})
+                            full_response = ""
+                        # 添加当前的特殊类型内容
+                        if content and content.strip():
+                            full_response_list.append({"type":type_con, "content":content})
+                    elif(type_con == "file"):
+                        if full_response and full_response.strip():
+                            full_response_list.append({"type":"text", "content":full_response})
+                            full_response = ""
+                        # 添加当前的特殊类型内容
+                        if content and content.strip():
+                            full_response_list.append({"type":type_con, "content":content})
+                    else:
+                        # 普通文本内容，累积到 full_response
+                        if content:
+                            full_response += content
+
+                # 每次处理chunk后，实时更新最后一条聊天记录
+                if isinstance(chunk, dict) and "choices" in chunk:
+                    delta = chunk["choices"][0].get("delta", {})
+                    content = delta.get("content", "")
+                    type_con = delta.get("type", "")
+
+                    # 只有当有实际内容时才更新
+                    if content or type_con:
+                        # 处理最后剩余的文本内容到列表
+                        current_full_response = full_response
+                        current_full_response_list = full_response_list.copy()
+
+                        if current_full_response and current_full_response.strip():
+                            current_full_response_list.append({"type":"text", "content":current_full_response})
+
+                        # 更新最后一条聊天记录
+                        if current_full_response_list:
+                            sess_obj.update_last_chat_record(session_id, updated_response=current_full_response_list)
+                            if log_chunk:
+                                logger.info(f"Updated last chat record for session {session_id} with {len(current_full_response_list)} response items")
+
+                # 直接发送符合OpenAI格式的数据块
+                if isinstance(chunk, dict):
+                    sse_data = f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                    if log_chunk:
+                        logger.info(f"发送SSE数据: {len(sse_data)} 字符")
+                        logger.info(f"SSE数据内容: {sse_data[:200]}...")
+                    yield sse_data
+                else:
+                    # 如果不是字典，包装成OpenAI格式
+                    wrapped_chunk = {
+                        "id": "chatcmpl-fallback",
                         "object": "chat.completion.chunk",
                         "created": int(time.time()),
                         "model": "emb-graph-chat-model",
                         "choices": [
                             {
                                 "index": 0,
-                            "delta": {
-                                    "content": "No data received from controller",
+                                "delta": {
+                                    "content": str(chunk),  # 修复了这里的错误
                                     "type": "text"
                                 },
-                                "finish_reason": "stop"
+                                "finish_reason": None
                             }
                         ]
                     }
-                    yield f"data: {json.dumps(test_chunk)}\n\n"
-                else:
-                    logger.info(f"Total chunks sent: {chunk_count}")
-
-                # 发送流结束信号
-                logger.info("Sending stream end signal [DONE]")
-                yield "data: [DONE]\n\n"
+                    # 对于非字典类型的chunk，也累积到full_response
+                    if not isinstance(chunk, dict):
+                        full_response = full_response + str(chunk)
+                    yield f"data: {json.dumps(wrapped_chunk)}\n\n"
             except Exception as e:
-                logger.error(f"Error in generate function: {e}")
-                # 即使出现异常也尝试保存已有的响应
-                # 处理最后剩余的文本内容
-                if full_response and full_response.strip():
-                    full_response_list.append({"type":"text", "content":full_response})
-                
-                if full_response_list or full_response:
-                    try:
-                        # 获取会话名称
-                        session_info = cSingleSqlite.search_session_by_session_id(session_id)
-                        session_name = session_info["session_name"] if session_info else "Unknown Session"
-                        # 用户查询格式化为列表格式
-                        query_list = [{"type":"text", "content":query}] if query else []
-                        # 响应格式化为列表格式
-                        response_list = full_response_list if full_response_list else ([{"type":"text", "content":full_response}] if full_response else [])
-                        sess_obj.save_chat_history(user_id, session_id, session_name, query_list, response_list)
-                        logger.info(f"Partial chat history saved after error for user {user_id}, session {session_id}, query_items={len(query_list)}, response_items={len(response_list)}")
-                    except Exception as save_error:
-                        logger.error(f"Failed to save chat history after error: {save_error}")
-                
-                # 向客户端发送错误信息
+                error_msg = f"Error processing chunk #{chunk_count}: {str(e)}"
+                logger.error(error_msg)
                 error_chunk = {
-                    "id": "chatcmpl-final-error",
+                    "id": "chatcmpl-error",
                     "object": "chat.completion.chunk",
                     "created": int(time.time()),
                     "model": "emb-graph-chat-model",
@@ -2327,28 +2511,88 @@ def chat():
                         {
                             "index": 0,
                             "delta": {
-                                "content": f"Final error in processing: {str(e)}",
+                                "content": f"Error: {error_msg}",
                                 "type": "text"
                             },
-                            "finish_reason": "stop"
+                            "finish_reason": None
                         }
                     ]
                 }
                 yield f"data: {json.dumps(error_chunk)}\n\n"
-        response = Response(stream_with_context(generate()), mimetype='text/event-stream')
-        # 手动添加CORS头部，因为@app.after_request装饰器不适用于直接创建的Response对象
-        response.headers['Access-Control-Allow-Origin'] = 'http://localhost:5173'
-        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
-        response.headers['Access-Control-Allow-Credentials'] = 'true'
-        # 添加SSE相关的头部
-        response.headers['Cache-Control'] = 'no-cache'
-        response.headers['Connection'] = 'keep-alive'
-        response.headers['X-Accel-Buffering'] = 'no'  # 禁用nginx缓冲
-        return response
+
+        # 处理最后剩余的文本内容并进行最终更新
+        if full_response and full_response.strip():
+            full_response_list.append({"type":"text", "content":full_response})
+
+        # 最终更新一次，确保所有内容都被保存
+        if full_response_list:
+            sess_obj.update_last_chat_record(session_id, updated_response=full_response_list)
+            logger.info(f"Final update of last chat record for session {session_id} with {len(full_response_list)} response items")
+        # 如果没有数据，发送一个测试消息
+        if not has_data:
+            logger.warning("No data received from controller")
+            test_chunk = {
+                "id": "chatcmpl-test",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": "emb-graph-chat-model",
+                "choices": [
+                    {
+                        "index": 0,
+                    "delta": {
+                            "content": "No data received from controller",
+                            "type": "text"
+                        },
+                        "finish_reason": "stop"
+                    }
+                ]
+            }
+            yield f"data: {json.dumps(test_chunk)}\n\n"
+        else:
+            logger.info(f"Total chunks sent: {chunk_count}")
+
+        # 发送流结束信号
+        logger.info("Sending stream end signal [DONE]")
+        yield "data: [DONE]\n\n"
     except Exception as e:
-        logger.error(f"Error processing data: {e}")
-        return jsonify({"error_code":4, "error_msg":f"Error processing stream query: {str(e)}"}), 500
+        logger.error(f"Error in generate function: {e}")
+        # 即使出现异常也尝试保存已有的响应
+        # 处理最后剩余的文本内容
+        if full_response and full_response.strip():
+            full_response_list.append({"type":"text", "content":full_response})
+
+        if full_response_list or full_response:
+            try:
+                # 获取会话名称
+                session_info = cSingleSqlite.search_session_by_session_id(session_id)
+                session_name = session_info["session_name"] if session_info else "Unknown Session"
+                # 用户查询格式化为列表格式
+                query_list = [{"type":"text", "content":query}] if query else []
+                # 响应格式化为列表格式
+                response_list = full_response_list if full_response_list else ([{"type":"text", "content":full_response}] if full_response else [])
+                sess_obj.save_chat_history(user_id, session_id, session_name, query_list, response_list)
+                logger.info(f"Partial chat history saved after error for user {user_id}, session {session_id}, query_items={len(query_list)}, response_items={len(response_list)}")
+            except Exception as save_error:
+                logger.error(f"Failed to save chat history after error: {save_error}")
+
+        # 向客户端发送错误信息
+        error_chunk = {
+            "id": "chatcmpl-final-error",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": "emb-graph-chat-model",
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {
+                        "content": f"Final error in processing: {str(e)}",
+                        "type": "text"
+                    },
+                    "finish_reason": "stop"
+                }
+            ]
+        }
+        yield f"data: {json.dumps(error_chunk)}\n\n"
 
 @app.route('/api/insert_sql_info', methods=['POST'])
 def insert_sql_info():
@@ -2367,7 +2611,7 @@ def insert_sql_info():
     user_name = data.get('user_name')
     password = data.get('password')
     
-    if not user_name or not password:
+    if not has_credentials(user_name, password):
         response = jsonify({'success': False, 'message': '用户名和密码不能为空'})
         response.headers['Access-Control-Allow-Origin'] = 'http://localhost:5173'
         response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
@@ -2422,7 +2666,7 @@ def get_sql_info_list():
     user_name = data.get('user_name')
     password = data.get('password')
     
-    if not user_name or not password:
+    if not has_credentials(user_name, password):
         response = jsonify({'success': False, 'message': '用户名和密码不能为空'})
         response.headers['Access-Control-Allow-Origin'] = 'http://localhost:5173'
         response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
@@ -2479,7 +2723,7 @@ def get_table_info():
     user_name = data.get('user_name')
     password = data.get('password')
     
-    if not user_name or not password:
+    if not has_credentials(user_name, password):
         response = jsonify({'success': False, 'message': '用户名和密码不能为空'})
         response.headers['Access-Control-Allow-Origin'] = 'http://localhost:5173'
         response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
@@ -2725,6 +2969,43 @@ def get_file_content():
     response.headers['Access-Control-Allow-Credentials'] = 'true'
     return response
 
+@app.route('/api/download_query_result', methods=['GET'])
+def download_query_result():
+    """
+    下载数据查询结果文件（CSV），文件按块流式发送，不整体读入内存
+    请求参数:
+        user_name / password: 用户名和密码（或通过 Authorization: Bearer <token> 携带会话令牌）
+        file_path: 问答接口返回的结果文件路径（只能下载本人导出的文件）
+    """
+    from Config.sql_config import get_sql_result_config
+    from Db.source_db_export import resolve_export_file
+    user_name = request.args.get('user_name')
+    password = request.args.get('password')
+    file_path = request.args.get('file_path', '')
+
+    if not has_credentials(user_name, password):
+        response = jsonify({'success': False, 'message': '用户名和密码不能为空'})
+    else:
+        user_info = verify_user_credentials(user_name, password)
+        resolved = None
+        if user_info:
+            resolved = resolve_export_file(get_sql_result_config().export_dir, user_info['user_id'], file_path)
+        if not user_info:
+            response = jsonify({'success': False, 'message': '用户名或密码错误'})
+        elif not resolved:
+            response = jsonify({'success': False, 'message': '文件路径无效或无权下载该文件'})
+        elif not os.path.isfile(resolved):
+            response = jsonify({'success': False, 'message': '文件不存在或已过期'})
+        else:
+            response = send_from_directory(os.path.dirname(resolved), os.path.basename(resolved), as_attachment=True,
+                                           download_name=f"query_result_{os.path.basename(resolved)}",
+                                           mimetype='text/csv')
+    response.headers['Access-Control-Allow-Origin'] = 'http://localhost:5173'
+    response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+    response.headers['Access-Control-Allow-Credentials'] = 'true'
+    return response
+
 @app.route('/api/delete_sql_info', methods=['POST'])
 def delete_sql_info():
     """删除数据库信息"""
@@ -2743,7 +3024,7 @@ def delete_sql_info():
     password = data.get('password')
     sql_id = data.get('sql_id')
     
-    if not user_name or not password:
+    if not has_credentials(user_name, password):
         response = jsonify({'success': False, 'message': '用户名和密码不能为空'})
         response.headers['Access-Control-Allow-Origin'] = 'http://localhost:5173'
         response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
@@ -2825,8 +3106,14 @@ def run_model():
         console_handler.setFormatter(console_formatter)
         logger.addHandler(console_handler)
 
+    # ASGI模式：uvicorn + Starlette，流式接口在有界线程池中运行，其余接口复用Flask应用
+    if server_config.is_asgi():
+        from Servers import run_asgi_server
+        run_asgi_server.run_asgi(server_config.host, server_config.port)
+        return
+
     # 启动Flask应用
-    app.run(host='0.0.0.0', port=6199, debug=False, threaded=True)
+    app.run(host=server_config.host, port=server_config.port, debug=False, threaded=True)
 
 if __name__ == '__main__':
     run_model()
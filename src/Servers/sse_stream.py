@@ -0,0 +1,143 @@
+# -*- coding:utf-8 -*-
+"""
+同步流水线到异步SSE流的桥接
+
+ASGI模式下，聊天流水线（LangChain智能体、数据库访问）仍是同步生成器。
+每个流在有界线程池中的一个线程上逐块迭代同步生成器，数据块通过 asyncio 队列交给事件循环：
+1. 并发上限：线程池最多 SSE_WORKER_NUM 个线程，超出的流排队等待线程；排队的流数达到
+   SSE_MAX_WAITING_STREAMS 时 is_saturated() 返回True，调用方应直接拒绝新请求（返回503）
+2. 背压：每个流最多缓冲 SSE_QUEUE_SIZE 个数据块，客户端读取变慢时流水线线程暂停在下一个数据块之前
+3. 取消：客户端断开时异步生成器被关闭，流水线线程在下一个数据块处停止，并关闭同步生成器，
+   GeneratorExit 逐层传递到正在进行的大模型流式调用，释放其HTTP连接。
+   取消只在数据块边界生效：线程无法被强行中断，同步生成器阻塞在两个数据块之间（例如等待检索结果
+   或大模型的下一个token）时，要等它产生下一个数据块后才会停止，这段时间内线程仍被占用
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterator, Optional
+
+from Config.server_config import get_server_config
+
+logger = logging.getLogger(__name__)
+
+_ITEM = 0
+_ERROR = 1
+_DONE = 2
+
+# 等待缓冲空位时检查取消标志的间隔（秒）
+_SLOT_WAIT_INTERVAL = 0.5
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+# 共享线程池上正在运行或排队的流数
+_active_streams = 0
+
+
+def get_sse_executor() -> ThreadPoolExecutor:
+    """获取运行同步流水线的共享线程池（进程内只创建一次）"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=get_server_config().sse_worker_num,
+                                               thread_name_prefix="sse-stream")
+    return _executor
+
+
+def _track_stream(delta: int):
+    """更新共享线程池上的流数，流数刚超过线程数上限（新流开始排队等待线程）时记录警告"""
+    global _active_streams
+    with _executor_lock:
+        _active_streams += delta
+        active = _active_streams
+    worker_num = get_server_config().sse_worker_num
+    if delta > 0 and active == worker_num + 1:
+        logger.warning(f"SSE并发流数 {active} 超过线程数上限 {worker_num}，新流排队等待，可调大 SSE_WORKER_NUM")
+
+
+def is_saturated() -> bool:
+    """共享线程池上的流数（运行中与排队中）是否已达到上限，达到时新流应被拒绝"""
+    config = get_server_config()
+    with _executor_lock:
+        active = _active_streams
+    return active >= config.sse_worker_num + config.sse_max_waiting
+
+
+def _untrack_after(produce: Callable[[], None]) -> Callable[[], None]:
+    def run():
+        try:
+            produce()
+        finally:
+            _track_stream(-1)
+    return run
+
+
+async def iterate_in_thread(make_iterator: Callable[[], Iterator], executor=None,
+                            queue_size: Optional[int] = None) -> AsyncIterator:
+    """
+    在线程池中迭代同步生成器，并以异步生成器的形式逐个返回数据块
+
+    Args:
+        make_iterator: 返回同步迭代器的函数，在线程池线程中调用
+        executor: 线程池，缺省使用共享的SSE线程池
+        queue_size: 缓冲的数据块数上限，缺省使用配置
+
+    Yields:
+        同步迭代器产生的数据块；同步迭代器抛出的异常原样抛出
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    slots = threading.BoundedSemaphore(queue_size or get_server_config().sse_queue_size)
+    cancelled = threading.Event()
+
+    def send(kind, value):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (kind, value))
+        except RuntimeError:
+            # 事件循环已关闭
+            cancelled.set()
+
+    def produce():
+        iterator = None
+        try:
+            if cancelled.is_set():
+                return
+            iterator = make_iterator()
+            for item in iterator:
+                while not slots.acquire(timeout=_SLOT_WAIT_INTERVAL):
+                    if cancelled.is_set():
+                        return
+                if cancelled.is_set():
+                    return
+                send(_ITEM, item)
+        except BaseException as e:
+            send(_ERROR, e)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    logger.warning(f"关闭流水线生成器失败: {e}")
+            send(_DONE, None)
+
+    if executor is None:
+        executor = get_sse_executor()
+        _track_stream(1)
+        produce = _untrack_after(produce)
+    loop.run_in_executor(executor, produce)
+    try:
+        while True:
+            kind, value = await queue.get()
+            if kind == _DONE:
+                break
+            if kind == _ERROR:
+                raise value
+            slots.release()
+            yield value
+    finally:
+        # 正常结束、客户端断开（任务被取消）或异常时都通知流水线线程停止
+        cancelled.set()
@@ -1,159 +1,232 @@
 # -*- coding:utf-8 -*-
 
+from collections import deque
+
+from Sql.Graph.join_path import INF, ShortestPathIndex, prim_forest
+
+# 必经节点数不超过该值时用 Held-Karp 动态规划求精确最优访问顺序，更多时用最小生成树先序遍历近似
+HELD_KARP_MAX_NODES = 15
+
 
 class Graph:
     def __init__(self):
         self.nodes = set()
         self.edges = {}
+        # 最短路索引，图变化时重建
+        self._index = None
 
     def add_node(self, value):
         self.nodes.add(value)
         self.edges[value] = []
+        self._index = None
 
     def add_edge(self, from_node, to_node, weight, description):
         self.edges[from_node].append({"node": to_node, "weight": weight, "description": description})
         self.edges[to_node].append({"node": from_node, "weight": weight, "description": description})
+        self._index = None
+
+    def _path_index(self):
+        """按当前的边建立最短路索引（两节点之间取权重最小的边），单源最短路按源点缓存"""
+        if self._index is None:
+            adjacency = {node: {} for node in self.nodes}
+            for node, neighbors in self.edges.items():
+                row = adjacency.setdefault(node, {})
+                for edge in neighbors:
+                    if edge["weight"] < row.get(edge["node"], INF):
+                        row[edge["node"]] = edge["weight"]
+            self._index = ShortestPathIndex(adjacency)
+        return self._index
+
+    def _edge(self, node1, node2):
+        """两节点之间权重最小的边"""
+        return min((edge for edge in self.edges[node1] if edge["node"] == node2), key=lambda edge: edge["weight"])
+
+    def _detailed_path(self, path):
+        detailed_path = []
+        for node1, node2 in zip(path, path[1:]):
+            edge = self._edge(node1, node2)
+            detailed_path.append({
+                "from": node1,
+                "to": node2,
+                "weight": edge["weight"],
+                "description": edge["description"]
+            })
+        return detailed_path
 
     def bfs(self, start_node, end_node):
-        queue = [[start_node]]
-        visited = {start_node}
+        previous_nodes = {start_node: None}
+        queue = deque([start_node])
 
         while queue:
-            path = queue.pop(0)
-            node = path[-1]
+            node = queue.popleft()
 
             if node == end_node:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = previous_nodes[node]
+                path.reverse()
                 return path
 
             for neighbor_info in self.edges.get(node, []):
                 neighbor = neighbor_info["node"]
-                if neighbor not in visited:
-                    visited.add(neighbor)
-                    new_path = list(path)
-                    new_path.append(neighbor)
-                    queue.append(new_path)
+                if neighbor not in previous_nodes:
+                    previous_nodes[neighbor] = node
+                    queue.append(neighbor)
 
         return None
 
     def find_paths_for_nodes(self, nodes_to_visit):
+        index = self._path_index()
         nodes_to_visit = set(nodes_to_visit)
         paths = []
 
         while nodes_to_visit:
             start_node = nodes_to_visit.pop()
             current_path = [start_node]
-            
+
             while True:
                 last_node_in_path = current_path[-1]
                 nearest_neighbor = None
-                shortest_distance = float('inf')
+                shortest_distance = INF
 
                 # Find the nearest neighbor from the remaining nodes to visit
-                for neighbor in nodes_to_visit:
-                    path_to_neighbor = self.dijkstra(last_node_in_path, neighbor)
-                    if path_to_neighbor:
-                        # Calculate path length
-                        distance = 0
-                        for i in range(len(path_to_neighbor) - 1):
-                            for edge in self.edges[path_to_neighbor[i]]:
-                                if edge['node'] == path_to_neighbor[i+1]:
-                                    distance += edge['weight']
-                                    break
-                        
+                if last_node_in_path in index:
+                    distances = index.single_source(last_node_in_path)[0]
+                    for neighbor in nodes_to_visit:
+                        distance = distances.get(neighbor, INF)
                         if distance < shortest_distance:
                             shortest_distance = distance
-                            nearest_neighbor = path_to_neighbor
-
-                if nearest_neighbor:
-                    # Extend the current path with the path to the nearest neighbor
-                    current_path.extend(nearest_neighbor[1:])
-                    # Remove the visited nodes from the set
-                    for node in nearest_neighbor[1:]:
-                        if node in nodes_to_visit:
-                            nodes_to_visit.remove(node)
-                else:
+                            nearest_neighbor = neighbor
+
+                if nearest_neighbor is None:
                     # No more reachable nodes from the current path
                     break
-            
+
+                # Extend the current path with the path to the nearest neighbor
+                path_to_neighbor = index.path(last_node_in_path, nearest_neighbor)
+                current_path.extend(path_to_neighbor[1:])
+                # Remove the visited nodes from the set
+                nodes_to_visit.difference_update(path_to_neighbor[1:])
+
             paths.append(current_path)
-            
+
         return paths
 
     def find_optimal_path_for_nodes(self, nodes_to_visit):
-        import itertools
+        """
+        依次经过全部必经节点的最短路线（起点与终点不限）
 
-        nodes_to_visit = list(nodes_to_visit)
-        best_path = None
-        min_distance = float('inf')
+        Returns:
+            按顺序拼接的边列表 [{"from", "to", "weight", "description"}]；有节点不可达时返回None
+        """
+        nodes_to_visit = list(dict.fromkeys(nodes_to_visit))
+        if len(nodes_to_visit) < 2:
+            return []
+        if any(node not in self.nodes for node in nodes_to_visit):
+            return None
 
-        for permutation in itertools.permutations(nodes_to_visit):
-            current_path = []
-            current_distance = 0
-            possible = True
+        index = self._path_index()
+        distances = [[index.distance(a, b) for b in nodes_to_visit] for a in nodes_to_visit]
+        if len(nodes_to_visit) <= HELD_KARP_MAX_NODES:
+            order = self._held_karp_order(distances)
+        else:
+            order = self._mst_order(distances)
+        if order is None:
+            return None
 
-            for i in range(len(permutation) - 1):
-                path_segment = self.dijkstra(permutation[i], permutation[i+1])
-                if not path_segment:
-                    possible = False
-                    break
-                
-                for step in path_segment:
-                    current_distance += step['weight']
-                
-                current_path.extend(path_segment)
-
-            if possible and current_distance < min_distance:
-                min_distance = current_distance
-                best_path = current_path
-        
+        best_path = []
+        for i, j in zip(order, order[1:]):
+            best_path.extend(self._detailed_path(index.path(nodes_to_visit[i], nodes_to_visit[j])))
         return best_path
 
-    def dijkstra(self, start_node, end_node):
-        distances = {node: float('inf') for node in self.nodes}
-        distances[start_node] = 0
-        priority_queue = [(0, start_node)]
-        previous_nodes = {node: None for node in self.nodes}
+    @staticmethod
+    def _held_karp_order(distances):
+        """
+        Held-Karp 动态规划求经过全部节点的最短路线（起点与终点不限），O(2^n * n^2)
 
-        while priority_queue:
-            priority_queue.sort()
-            current_distance, current_node = priority_queue.pop(0)
+        Returns:
+            节点下标顺序，不连通时返回None
+        """
+        n = len(distances)
+        full = (1 << n) - 1
+        # cost[mask][j]: 恰好经过 mask 中的节点且停在 j 的最短距离
+        cost = [[INF] * n for _ in range(1 << n)]
+        parent = [[-1] * n for _ in range(1 << n)]
+        for j in range(n):
+            cost[1 << j][j] = 0.0
 
-            if current_distance > distances[current_node]:
-                continue
+        for mask in range(1, full):
+            row = cost[mask]
+            remaining = [k for k in range(n) if not mask >> k & 1]
+            for j in range(n):
+                current = row[j]
+                if current == INF:
+                    continue
+                distance_row = distances[j]
+                for k in remaining:
+                    candidate = current + distance_row[k]
+                    next_mask = mask | (1 << k)
+                    if candidate < cost[next_mask][k]:
+                        cost[next_mask][k] = candidate
+                        parent[next_mask][k] = j
 
-            if current_node == end_node:
-                path = []
-                while current_node is not None:
-                    path.insert(0, current_node)
-                    current_node = previous_nodes[current_node]
-                
-                detailed_path = []
-                for i in range(len(path) - 1):
-                    node1 = path[i]
-                    node2 = path[i+1]
-                    for edge in self.edges[node1]:
-                        if edge['node'] == node2:
-                            detailed_path.append({
-                                "from": node1,
-                                "to": node2,
-                                "weight": edge['weight'],
-                                "description": edge['description']
-                            })
-                            break
-                return detailed_path
-
-            for neighbor_info in self.edges.get(current_node, []):
-                neighbor = neighbor_info["node"]
-                weight = neighbor_info["weight"]
-                distance = current_distance + weight
+        last = min(range(n), key=lambda j: cost[full][j])
+        if cost[full][last] == INF:
+            return None
+        order = []
+        mask = full
+        while last != -1:
+            order.append(last)
+            mask, last = mask ^ (1 << last), parent[mask][last]
+        order.reverse()
+        return order
 
-                if distance < distances[neighbor]:
-                    distances[neighbor] = distance
-                    previous_nodes[neighbor] = current_node
-                    priority_queue.append((distance, neighbor))
+    @staticmethod
+    def _mst_order(distances):
+        """
+        最短距离构成的完全图上求最小生成树，按先序遍历得到访问顺序（不超过最优路线的2倍），取各起点中最短的一条
+
+        Returns:
+            节点下标顺序，不连通时返回None
+        """
+        n = len(distances)
+        tree_edges = prim_forest(range(n), lambda u: [(v, distances[u][v]) for v in range(n) if v != u])
+        if len(tree_edges) != n - 1:
+            return None
+        children = {u: [] for u in range(n)}
+        for u, v, _ in tree_edges:
+            children[u].append(v)
+            children[v].append(u)
+
+        best_order, best_cost = None, INF
+        # 从叶子出发的先序遍历更接近一条路线
+        for root in (u for u in range(n) if len(children[u]) == 1):
+            order = []
+            visited = {root}
+            stack = [root]
+            while stack:
+                u = stack.pop()
+                order.append(u)
+                # 先走较近的子节点
+                for v in sorted(children[u], key=lambda v: -distances[u][v]):
+                    if v not in visited:
+                        visited.add(v)
+                        stack.append(v)
+            cost = sum(distances[a][b] for a, b in zip(order, order[1:]))
+            if cost < best_cost:
+                best_order, best_cost = order, cost
+        return best_order
+
+    def dijkstra(self, start_node, end_node):
+        index = self._path_index()
+        if start_node not in index:
+            return None
+        path = index.path(start_node, end_node)
+        if path is None:
+            return None
+        return self._detailed_path(path)
 
-        return None
-    
 
 def main():
     g = Graph()
@@ -186,4 +259,3 @@ def main():
 
 # if __name__ == "__main__":
 #     main()
-    
\ No newline at end of file
@@ -0,0 +1,209 @@
+# -*- coding:utf-8 -*-
+"""
+表关联路径求解
+
+1. 带权邻接表 {节点: {邻居: 权重}}（有向；无向图两个方向都登记），堆优化的Dijkstra，单源最短路结果按源点缓存；
+   节点数不超过阈值时可一次预计算全源最短路
+2. 多个目标表之间的连接路径按Steiner树近似求解（最短路启发式）：
+   从根节点出发，每次把离当前树最近的目标表沿有向最短路接入树，边的方向与权重保持不变（例如外键正向与反向关联的权重不同）；
+   无向图上结果不超过最优Steiner树权重的 2(1 - 1/目标数) 倍
+"""
+
+import heapq
+import itertools
+import threading
+from collections import deque
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+INF = float("inf")
+
+
+def dijkstra(adjacency: Dict[Hashable, Dict[Hashable, float]], source) -> Tuple[Dict, Dict]:
+    """
+    堆优化的单源最短路
+
+    Args:
+        adjacency: 邻接表 {节点: {邻居: 权重}}，权重非负；节点之间需可比较（距离相同时按节点排序）
+        source: 源点
+
+    Returns:
+        (距离, 前驱)：{节点: 最短距离}、{节点: 最短路上的前一个节点}，只包含可达节点
+    """
+    dist = {source: 0.0}
+    prev = {source: None}
+    heap = [(0.0, source)]
+    pop, push = heapq.heappop, heapq.heappush
+    while heap:
+        d, node = pop(heap)
+        if d > dist[node]:
+            continue
+        for neighbor, weight in adjacency.get(node, {}).items():
+            nd = d + weight
+            if nd < dist.get(neighbor, INF):
+                dist[neighbor] = nd
+                prev[neighbor] = node
+                push(heap, (nd, neighbor))
+    return dist, prev
+
+
+class ShortestPathIndex:
+    """最短路索引：单源最短路按源点缓存（线程安全），可预计算全源最短路"""
+
+    def __init__(self, adjacency: Dict[Hashable, Dict[Hashable, float]], precompute: bool = False):
+        """
+        Args:
+            adjacency: 邻接表 {节点: {邻居: 权重}}，有向；无向图两个方向都需要登记
+            precompute: 是否立即计算全源最短路
+        """
+        self.adjacency = adjacency
+        self.lock = threading.Lock()
+        # 源点 -> (距离, 前驱)
+        self.sources: Dict[Hashable, Tuple[Dict, Dict]] = {}
+        if precompute:
+            for node in adjacency:
+                self.sources[node] = dijkstra(adjacency, node)
+
+    def __contains__(self, node) -> bool:
+        return node in self.adjacency
+
+    def single_source(self, source) -> Tuple[Dict, Dict]:
+        """获取源点的 (距离, 前驱)，未缓存时计算"""
+        with self.lock:
+            result = self.sources.get(source)
+        if result is None:
+            result = dijkstra(self.adjacency, source)
+            with self.lock:
+                self.sources[source] = result
+        return result
+
+    def distance(self, source, target) -> float:
+        """最短距离，不可达时返回 inf"""
+        return self.single_source(source)[0].get(target, INF)
+
+    def path(self, source, target) -> Optional[List]:
+        """最短路节点序列（含两端），不可达时返回None"""
+        prev = self.single_source(source)[1]
+        if target not in prev:
+            return None
+        path = []
+        node = target
+        while node is not None:
+            path.append(node)
+            node = prev[node]
+        path.reverse()
+        return path
+
+    def weight(self, u, v) -> float:
+        return self.adjacency[u][v]
+
+
+def prim_forest(nodes: Iterable, weight_of) -> List[Tuple]:
+    """
+    Prim算法求最小生成森林
+
+    Args:
+        nodes: 节点列表
+        weight_of: weight_of(u) 返回 [(邻居, 权重), ...]
+
+    Returns:
+        [(u, v, 权重), ...]
+    """
+    nodes = list(nodes)
+    visited = set()
+    edges = []
+    counter = itertools.count()
+    for root in nodes:
+        if root in visited:
+            continue
+        visited.add(root)
+        heap = [(w, next(counter), root, v) for v, w in weight_of(root) if w < INF]
+        heapq.heapify(heap)
+        while heap:
+            w, _, u, v = heapq.heappop(heap)
+            if v in visited:
+                continue
+            visited.add(v)
+            edges.append((u, v, w))
+            for x, wx in weight_of(v):
+                if x not in visited and wx < INF:
+                    heapq.heappush(heap, (wx, next(counter), v, x))
+    return edges
+
+
+def steiner_arborescence(index: ShortestPathIndex, terminals: Iterable) -> Tuple[List[Tuple], float]:
+    """
+    有向图上以第一个目标节点为根、连接全部目标节点的近似最小Steiner树（最短路启发式）
+
+    每轮在当前树的全部节点到剩余目标节点的有向最短距离中取最小者，把这条最短路上的新节点接入树；
+    最短路在树内的部分从最后一个树节点截断，因此每个新节点只有一个父节点
+
+    Args:
+        index: 最短路索引（有向邻接表）
+        terminals: 目标节点，不在图中的节点被忽略
+
+    Returns:
+        (有向边列表 [(u, v, 权重)], 总权重)；从根不可达的目标节点依次作为新的根，返回森林
+    """
+    terminals = [t for t in dict.fromkeys(terminals) if t in index]
+    if len(terminals) < 2:
+        return [], 0.0
+
+    edges = []
+    remaining = terminals
+    while remaining:
+        root, remaining = remaining[0], remaining[1:]
+        tree_nodes = [root]
+        in_tree = {root}
+        while remaining:
+            best_distance, best_source, best_target = INF, None, None
+            for source in tree_nodes:
+                distances = index.single_source(source)[0]
+                for target in remaining:
+                    distance = distances.get(target, INF)
+                    if distance < best_distance:
+                        best_distance, best_source, best_target = distance, source, target
+            if best_target is None:
+                # 剩余目标从当前树都不可达
+                break
+            path = index.path(best_source, best_target)
+            start = max(i for i, node in enumerate(path) if node in in_tree)
+            for u, v in zip(path[start:], path[start + 1:]):
+                edges.append((u, v, index.weight(u, v)))
+                tree_nodes.append(v)
+                in_tree.add(v)
+            remaining = [t for t in remaining if t not in in_tree]
+
+    return edges, sum(w for _, _, w in edges)
+
+
+def tree_paths(edges: List[Tuple], root, targets: Iterable) -> Dict[Hashable, List]:
+    """
+    树（森林）上从根节点到各目标节点的路径
+
+    Returns:
+        {目标节点: 节点序列}，与根节点不连通的目标不在结果中
+    """
+    neighbors: Dict[Hashable, List] = {}
+    for u, v, _ in edges:
+        neighbors.setdefault(u, []).append(v)
+        neighbors.setdefault(v, []).append(u)
+    parent = {root: None}
+    queue = deque([root])
+    while queue:
+        node = queue.popleft()
+        for other in neighbors.get(node, []):
+            if other not in parent:
+                parent[other] = node
+                queue.append(other)
+    paths = {}
+    for target in targets:
+        if target == root or target not in parent:
+            continue
+        path = []
+        node = target
+        while node is not None:
+            path.append(node)
+            node = parent[node]
+        path.reverse()
+        paths[target] = path
+    return paths
@@ -9,6 +9,7 @@ SQL Schema Vector Agent - 基于Milvus的向量搜索代理
 4. 使用WeightedRanker组合搜索结果
 """
 
+import json
 import logging
 from typing import List, Dict, Any, Tuple
 
@@ -20,13 +21,17 @@ from pymilvus import WeightedRanker
 
 from Db.milvus_db import MilvusService
 from Db.sqlite_db import cSingleSqlite
-from Config.embedding_config import get_embeddings
+from Config.embedding_config import get_embeddings, get_embedding_dimension
 from Config.milvus_config import is_milvus_enabled
 
 # 创建线程安全的logger
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# DatabaseAnalysisAgent 保存表分析向量使用的集合
+TABLE_ANALYSIS_COLLECTION = "database_table_analysis"
+
+
 class SqlSchemaVectorAgent:
     """数据库模式向量代理 - 负责将数据库元数据向量化并存储到milvus向量库中，使用partition按sql_id隔离数据"""
 
@@ -53,7 +58,7 @@ class SqlSchemaVectorAgent:
         # 检查集合是否存在
         if not self.milvus_service.has_collection(self.graph_nodes_collection_name):
             # 创建集合
-            dim = len(self.embedding_model.embed_query("test"))
+            dim = get_embedding_dimension(self.embedding_model)
             schema = self.get_graph_nodes_schema(dim)
             index_params = self.get_index_params()
             self.milvus_service.create_collection(self.graph_nodes_collection_name, schema, index_params)
@@ -256,7 +261,7 @@ class SqlSchemaVectorAgent:
                 "tables_with_description": tables_with_description,
                 "tables_with_columns": tables_with_columns,
                 "vector_mode": "dual_vector",
-                "embedding_dims": len(self.embedding_model.embed_query("test"))
+                "embedding_dims": self.milvus_service.get_dim(self.graph_nodes_collection_name)
             }
 
         except Exception as e:
@@ -307,6 +312,35 @@ class SqlSchemaVectorAgent:
                 "sql_id": sql_id
             }
 
+    def delete_table_analysis_vectors(self, sql_id: str, table_ids: List[str]) -> Dict[str, Any]:
+        """
+        删除指定sql_id下部分表的表分析向量（表结构增量刷新时，只清理变化或已删除的表）
+        表分析向量由DatabaseAnalysisAgent写入database_table_analysis集合，partition为sql_id，doc_id为table_id；
+        变化的表随后由analyze_database_descriptions重新生成
+        """
+        if not self.enabled:
+            logger.debug("Milvus已禁用，跳过删除表向量操作")
+            return {"success": False, "message": "Milvus已禁用"}
+        if not table_ids:
+            return {"success": True, "message": "没有需要删除的表", "sql_id": sql_id}
+
+        try:
+            if not self.milvus_service.has_collection(TABLE_ANALYSIS_COLLECTION) \
+                    or not self.milvus_service.has_partition(TABLE_ANALYSIS_COLLECTION, sql_id):
+                return {"success": True, "message": "向量库中没有该数据源的数据", "sql_id": sql_id}
+
+            # 分批拼接表达式，避免单个表达式过长
+            for start in range(0, len(table_ids), 200):
+                ids = ", ".join(json.dumps(table_id) for table_id in table_ids[start:start + 200])
+                self.milvus_service.delete(TABLE_ANALYSIS_COLLECTION, f"doc_id in [{ids}]",
+                                           partition_name=sql_id)
+
+            logger.info(f"删除 {len(table_ids)} 个表的表分析向量 (sql_id: {sql_id})")
+            return {"success": True, "message": "删除成功", "sql_id": sql_id, "table_count": len(table_ids)}
+        except Exception as e:
+            logger.error(f"删除表向量失败 (sql_id: {sql_id}): {e}")
+            return {"success": False, "message": f"删除失败: {str(e)}", "sql_id": sql_id}
+
     def list_available_vector_stores(self) -> Dict[str, Any]:
         """列出所有可用的向量库partition"""
         if not self.enabled:
@@ -0,0 +1,250 @@
+# -*- coding:utf-8 -*-
+"""
+用户认证：会话令牌与凭据校验缓存
+
+1. 会话令牌：登录时签发 base64url(载荷).base64url(HMAC-SHA256签名)，载荷包含用户信息、签发时间与过期时间，
+   校验只做签名与过期判断，不访问数据库
+2. 撤销：单个令牌（登出）按令牌ID记录到其过期为止；用户密码或权限变化、用户删除时，
+   该用户在此之前签发的所有令牌失效
+3. 凭据缓存：仍按用户名密码认证的请求，校验结果在内存LRU中保存较短时间（只缓存成功的结果），
+   用户密码或权限变化、用户删除时立即失效
+
+撤销记录与缓存只保存在当前进程内；未配置 AUTH_TOKEN_SECRET 时每次启动随机生成密钥，重启后旧令牌全部失效
+"""
+
+import hmac
+import json
+import time
+import uuid
+import base64
+import hashlib
+import secrets
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 当前请求携带的会话令牌（Flask在before_request中设置，ASGI接口在处理请求时设置）
+_request_token = contextvars.ContextVar("request_token", default="")
+
+
+def set_request_token(token):
+    """设置当前请求的会话令牌，返回用于 reset_request_token 的标记"""
+    return _request_token.set(token or "")
+
+
+def reset_request_token(mark):
+    """恢复 set_request_token 之前的值"""
+    _request_token.reset(mark)
+
+
+def get_request_token() -> str:
+    """获取当前请求的会话令牌"""
+    return _request_token.get()
+
+
+def parse_bearer_token(authorization: Optional[str]) -> str:
+    """从 Authorization 请求头中解析 Bearer 令牌"""
+    if not authorization:
+        return ""
+    scheme, _, token = authorization.strip().partition(" ")
+    return token.strip() if scheme.lower() == "bearer" else ""
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class AuthManager:
+    """会话令牌签发/校验/撤销，以及用户名密码校验结果的短期缓存（进程内共享，线程安全）"""
+
+    def __init__(self, secret=None, token_ttl=7200, cache_ttl=30, cache_size=1024):
+        """
+        Args:
+            secret: 签名密钥，为空时随机生成
+            token_ttl: 令牌有效期（秒）
+            cache_ttl: 凭据校验结果的缓存时间（秒），0表示不缓存
+            cache_size: 凭据缓存条目上限
+        """
+        self.secret = (secret or secrets.token_hex(32)).encode("utf-8")
+        self.token_ttl = token_ttl
+        self.cache_ttl = cache_ttl
+        self.cache_size = max(1, cache_size)
+
+        self.lock = threading.Lock()
+        # (用户名, 密码摘要) -> (用户信息, 过期时间)
+        self.credentials = OrderedDict()
+        # 令牌ID -> 令牌过期时间
+        self.revoked_tokens = {}
+        # 用户ID -> 撤销时间，此前签发的令牌无效
+        self.revoked_users = {}
+        self.stats = {"token_hits": 0, "token_rejects": 0, "cache_hits": 0, "cache_misses": 0}
+
+    # ------------------------------------------------------------------
+    # 会话令牌
+    # ------------------------------------------------------------------
+
+    def _sign(self, body: str) -> str:
+        return _b64encode(hmac.new(self.secret, body.encode("ascii"), hashlib.sha256).digest())
+
+    def issue_token(self, user_info: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        签发会话令牌
+
+        Args:
+            user_info: 用户信息，需包含 user_id、user_name，可包含 permissions
+
+        Returns:
+            {"token": 令牌, "expires_at": 过期时间戳}
+        """
+        now = time.time()
+        payload = {
+            "jti": uuid.uuid4().hex,
+            "uid": user_info["user_id"],
+            "name": user_info.get("user_name", ""),
+            "perm": user_info.get("permissions", ""),
+            "iat": now,
+            "exp": int(now + self.token_ttl),
+        }
+        body = _b64encode(json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+        return {"token": f"{body}.{self._sign(body)}", "expires_at": payload["exp"]}
+
+    def _decode(self, token: str) -> Optional[Dict[str, Any]]:
+        """校验签名与过期时间，返回载荷"""
+        if not token or token.count(".") != 1:
+            return None
+        body, signature = token.split(".")
+        if not hmac.compare_digest(signature, self._sign(body)):
+            return None
+        try:
+            payload = json.loads(_b64decode(body))
+        except ValueError:
+            return None
+        if not isinstance(payload, dict) or payload.get("exp", 0) < time.time():
+            return None
+        return payload
+
+    def verify_token(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        校验会话令牌（只在内存中计算，不访问数据库）
+
+        Returns:
+            用户信息 {"user_id", "user_name", "permissions"}，令牌无效、过期或已撤销时返回None
+        """
+        if not token:
+            return None
+        payload = self._decode(token)
+        with self.lock:
+            if payload is None or payload["jti"] in self.revoked_tokens \
+                    or payload["iat"] <= self.revoked_users.get(payload["uid"], 0):
+                self.stats["token_rejects"] += 1
+                return None
+            self.stats["token_hits"] += 1
+        return {"user_id": payload["uid"], "user_name": payload["name"], "permissions": payload["perm"]}
+
+    def revoke_token(self, token: str) -> bool:
+        """撤销单个令牌（登出），记录保留到令牌过期为止"""
+        payload = self._decode(token)
+        if payload is None:
+            return False
+        now = time.time()
+        with self.lock:
+            for jti in [k for k, exp in self.revoked_tokens.items() if exp < now]:
+                del self.revoked_tokens[jti]
+            self.revoked_tokens[payload["jti"]] = payload["exp"]
+        return True
+
+    # ------------------------------------------------------------------
+    # 用户名密码校验缓存
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _credential_key(user_name: str, password: str):
+        return user_name, hashlib.sha256(str(password).encode("utf-8")).hexdigest()
+
+    def check_credentials(self, user_name: str, password: str,
+                          lookup: Callable[[str, str], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """
+        校验用户名密码，成功结果缓存 cache_ttl 秒
+
+        Args:
+            user_name: 用户名
+            password: 密码
+            lookup: 缓存未命中时查询数据库的函数，返回用户信息或None
+
+        Returns:
+            用户信息字典或None
+        """
+        key = self._credential_key(user_name, password)
+        now = time.time()
+        if self.cache_ttl > 0:
+            with self.lock:
+                item = self.credentials.get(key)
+                if item is not None and item[1] > now:
+                    self.credentials.move_to_end(key)
+                    self.stats["cache_hits"] += 1
+                    return dict(item[0])
+                self.credentials.pop(key, None)
+                self.stats["cache_misses"] += 1
+
+        user_info = lookup(user_name, password)
+        if user_info and self.cache_ttl > 0:
+            with self.lock:
+                # 查询期间该用户被撤销时不写入缓存
+                if self.revoked_users.get(user_info["user_id"], 0) < now:
+                    self.credentials[key] = (dict(user_info), now + self.cache_ttl)
+                    self.credentials.move_to_end(key)
+                    while len(self.credentials) > self.cache_size:
+                        self.credentials.popitem(last=False)
+        return user_info
+
+    # ------------------------------------------------------------------
+    # 失效
+    # ------------------------------------------------------------------
+
+    def invalidate_user(self, user_id: Optional[str] = None, user_name: Optional[str] = None):
+        """
+        用户密码或权限变化、用户删除时调用：清除该用户的凭据缓存，并撤销此前签发的所有令牌
+        """
+        now = time.time()
+        with self.lock:
+            for key in [k for k, (info, _) in self.credentials.items()
+                        if (user_id and info.get("user_id") == user_id) or (user_name and k[0] == user_name)]:
+                del self.credentials[key]
+            if user_id:
+                self.revoked_users[user_id] = now
+        logger.info(f"用户认证缓存已失效: user_id={user_id}, user_name={user_name}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取认证统计"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats["cached_credentials"] = len(self.credentials)
+            stats["revoked_tokens"] = len(self.revoked_tokens)
+        return stats
+
+
+_auth_manager: Optional[AuthManager] = None
+_auth_manager_lock = threading.Lock()
+
+
+def get_auth_manager() -> AuthManager:
+    """获取进程内共享的认证管理器"""
+    global _auth_manager
+    if _auth_manager is None:
+        with _auth_manager_lock:
+            if _auth_manager is None:
+                from Config.server_config import get_server_config
+                config = get_server_config()
+                _auth_manager = AuthManager(secret=config.auth_token_secret,
+                                            token_ttl=config.auth_token_ttl,
+                                            cache_ttl=config.auth_cache_ttl,
+                                            cache_size=config.auth_cache_size)
+    return _auth_manager
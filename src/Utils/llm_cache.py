@@ -0,0 +1,296 @@
+# -*- coding:utf-8 -*-
+"""
+LLM响应缓存（跨请求共享）
+
+1. 缓存键为 (模型, 温度, 绑定参数, 归一化消息) 的摘要；只应用于确定性调用（温度为0）或显式开启缓存的调用
+2. 内存LRU + 可选SQLite持久化后端（LLM_CACHE_SQLITE_PATH），内存未命中时查SQLite并回填内存
+3. 单飞合并：同一时刻N个相同请求只有一个真正调用模型，其余等待并共享其结果（或异常）
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_TRAILING_SPACE_RE = re.compile(r"[ \t]+\n")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def _normalize_text(text: str) -> str:
+    """归一化文本：统一换行、去掉行尾空白、合并多余空行"""
+    text = str(text).replace("\r\n", "\n")
+    text = _TRAILING_SPACE_RE.sub("\n", text)
+    return _BLANK_LINES_RE.sub("\n\n", text).strip()
+
+
+def normalize_messages(messages) -> list:
+    """
+    把提示文本或消息列表归一化为 [(角色, 内容), ...]
+
+    支持字符串、langchain消息对象、{"role", "content"} 字典与 (角色, 内容) 元组
+    """
+    if isinstance(messages, str):
+        return [("user", _normalize_text(messages))]
+    normalized = []
+    for message in messages:
+        if isinstance(message, dict):
+            role, content = message.get("role", "user"), message.get("content", "")
+        elif isinstance(message, (tuple, list)) and len(message) == 2:
+            role, content = message
+        else:
+            role, content = getattr(message, "type", "user"), getattr(message, "content", message)
+        if not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False, sort_keys=True, default=str)
+        normalized.append((str(role), _normalize_text(content)))
+    return normalized
+
+
+def describe_llm(llm) -> Tuple[str, Optional[float], Dict[str, Any]]:
+    """
+    获取LLM实例的 (模型名, 温度, 绑定参数)，兼容 llm.bind(...) 返回的包装对象
+
+    温度依次取自绑定参数、模型的temperature字段、model_kwargs
+    （ChatTongyi没有temperature字段，构造时传入的温度保存在model_kwargs中），无法识别时返回None
+    """
+    bound_kwargs = {}
+    while hasattr(llm, "bound") and hasattr(llm, "kwargs"):
+        bound_kwargs.update(llm.kwargs or {})
+        llm = llm.bound
+    model = getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+    temperature = bound_kwargs.get("temperature")
+    if temperature is None:
+        temperature = getattr(llm, "temperature", None)
+    if temperature is None:
+        temperature = (getattr(llm, "model_kwargs", None) or {}).get("temperature")
+    return str(model), (float(temperature) if temperature is not None else None), bound_kwargs
+
+
+def make_cache_key(model: str, temperature: Optional[float], bound_kwargs: Dict[str, Any], messages) -> str:
+    """生成缓存键"""
+    raw = json.dumps([model, temperature, bound_kwargs, normalize_messages(messages)],
+                     ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """一次进行中的模型调用，供相同请求等待"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class LLMResponseCache:
+    """LLM响应缓存（进程内共享，线程安全）"""
+
+    def __init__(self, max_size=2048, ttl=86400, sqlite_path=None):
+        """
+        Args:
+            max_size: 内存缓存条目上限，超出后淘汰最久未使用的条目
+            ttl: 条目有效期（秒），0表示不过期
+            sqlite_path: SQLite持久化文件路径，为空时只使用内存
+        """
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+
+        self.lock = threading.Lock()
+        # 缓存键 -> ({"text", "tokens"}, 写入时间)
+        self.entries = OrderedDict()
+        # 缓存键 -> 进行中的调用
+        self.inflight = {}
+        self.stats = {"hits": 0, "disk_hits": 0, "coalesced": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+        self.db = None
+        self.db_lock = threading.Lock()
+        if sqlite_path:
+            self._open_sqlite(sqlite_path)
+
+    def _open_sqlite(self, sqlite_path):
+        try:
+            directory = os.path.dirname(sqlite_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("""CREATE TABLE IF NOT EXISTS llm_cache (
+                                   cache_key TEXT PRIMARY KEY,
+                                   response TEXT NOT NULL,
+                                   tokens INTEGER,
+                                   created_at REAL NOT NULL)""")
+            self.db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"LLM缓存SQLite后端不可用，仅使用内存缓存: {e}")
+            self.db = None
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl > 0 and time.time() - created_at > self.ttl
+
+    def _get_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        """在持有 self.lock 时调用"""
+        item = self.entries.get(key)
+        if item is None:
+            return None
+        if self._expired(item[1]):
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return item[0]
+
+    def _put_memory(self, key: str, value: Dict[str, Any], created_at: float):
+        """在持有 self.lock 时调用"""
+        self.entries[key] = (value, created_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _get_disk(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        if self.db is None:
+            return None
+        try:
+            with self.db_lock:
+                row = self.db.execute("SELECT response, tokens, created_at FROM llm_cache WHERE cache_key = ?",
+                                      (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"读取LLM缓存失败: {e}")
+            return None
+        if row is None or self._expired(row[2]):
+            return None
+        return {"text": row[0], "tokens": row[1] or 0}, row[2]
+
+    def _put_disk(self, key: str, value: Dict[str, Any], created_at: float):
+        if self.db is None:
+            return
+        try:
+            with self.db_lock:
+                self.db.execute("INSERT OR REPLACE INTO llm_cache (cache_key, response, tokens, created_at) "
+                                "VALUES (?, ?, ?, ?)", (key, value["text"], value.get("tokens", 0), created_at))
+                self.db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"写入LLM缓存失败: {e}")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        查找缓存（先内存后SQLite）
+
+        Returns:
+            {"text": 响应文本, "tokens": 该次调用消耗的token数}，未命中返回None
+        """
+        with self.lock:
+            value = self._get_memory(key)
+            if value is not None:
+                self.stats["hits"] += 1
+                return value
+        disk = self._get_disk(key)
+        if disk is None:
+            return None
+        with self.lock:
+            self._put_memory(key, disk[0], disk[1])
+            self.stats["hits"] += 1
+            self.stats["disk_hits"] += 1
+        return disk[0]
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """写入缓存"""
+        now = time.time()
+        with self.lock:
+            self._put_memory(key, value, now)
+            self.stats["stores"] += 1
+        self._put_disk(key, value, now)
+
+    def get_or_call(self, key: str, call: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], str]:
+        """
+        命中缓存时直接返回；否则相同缓存键的并发请求只执行一次 call，结果写入缓存并共享给等待者
+
+        Args:
+            key: 缓存键
+            call: 未命中时执行的调用，返回 {"text", "tokens"}
+
+        Returns:
+            (结果, 来源)，来源为 "hit" / "coalesced" / "miss"
+        """
+        value = self.get(key)
+        if value is not None:
+            return value, "hit"
+
+        with self.lock:
+            # 等锁期间前一个调用可能已经写入缓存
+            value = self._get_memory(key)
+            if value is not None:
+                self.stats["hits"] += 1
+                return value, "hit"
+            flight = self.inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self.inflight[key] = flight
+            else:
+                self.stats["coalesced"] += 1
+            if leader:
+                self.stats["misses"] += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, "coalesced"
+
+        try:
+            value = call()
+            self.put(key, value)
+            flight.value = value
+            return value, "miss"
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+            flight.event.set()
+
+    def clear(self):
+        """清空缓存（内存与SQLite）"""
+        with self.lock:
+            self.entries.clear()
+        if self.db is not None:
+            with self.db_lock:
+                self.db.execute("DELETE FROM llm_cache")
+                self.db.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats["size"] = len(self.entries)
+            stats["inflight"] = len(self.inflight)
+        lookups = stats["hits"] + stats["coalesced"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0
+        return stats
+
+
+_llm_cache: Optional[LLMResponseCache] = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """获取进程内共享的LLM响应缓存，LLM_CACHE_ENABLED=false 时返回None"""
+    global _llm_cache
+    from Config.llm_config import get_llm_cache_config
+    config = get_llm_cache_config()
+    if not config.enabled:
+        return None
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                _llm_cache = LLMResponseCache(max_size=config.max_size, ttl=config.ttl,
+                                              sqlite_path=config.sqlite_path)
+    return _llm_cache
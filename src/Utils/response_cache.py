@@ -0,0 +1,236 @@
+# -*- coding:utf-8 -*-
+"""
+问答结果语义缓存
+
+缓存键为 (知识库集合, 权限范围, 归一化问题向量)：
+同一知识库集合、同一权限范围内，问题向量的余弦相似度不低于阈值即视为命中，
+返回缓存的最终回答与来源列表。不同权限范围的条目存放在不同分区，查找时只在本分区内比较，
+因此无权访问私有内容的用户不会命中由有权限用户生成的回答。
+知识库新增或删除文件时，按知识库ID使包含该知识库的所有分区失效。
+"""
+
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s。？?！!，,；;.]+$")
+
+
+def normalize_question(question: str) -> str:
+    """归一化问题：合并空白、转小写、去掉末尾标点"""
+    text = _WHITESPACE_RE.sub(" ", str(question)).strip().lower()
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+
+def make_scope(knowledge_ids: Iterable[str], permission_scope: str) -> Tuple[Tuple[str, ...], str]:
+    """生成缓存分区键：排序去重后的知识库ID元组 + 权限范围"""
+    return tuple(sorted({str(k) for k in knowledge_ids if k})), str(permission_scope)
+
+
+class SemanticResponseCache:
+    """问答结果语义缓存（进程内，线程安全，按分区使用扁平向量索引）"""
+
+    def __init__(self, max_size=1000, threshold=0.95, ttl=3600):
+        """
+        Args:
+            max_size: 缓存条目上限，超出后淘汰最久未使用的条目
+            threshold: 命中所需的最低余弦相似度
+            ttl: 条目有效期（秒），0表示不过期
+        """
+        self.max_size = max(1, max_size)
+        self.threshold = threshold
+        self.ttl = ttl
+
+        self.lock = threading.Lock()
+        # 条目ID -> 条目，按使用顺序排列
+        self.entries = OrderedDict()
+        # 分区键 -> {"ids": 条目ID列表, "matrix": 归一化向量矩阵（有增删时置为None，查找时重建）}
+        self.partitions = {}
+        self.next_id = 0
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0,
+                      "expired": 0, "invalidations": 0}
+
+    @staticmethod
+    def _normalize_vector(vector) -> Optional[np.ndarray]:
+        vec = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vec)
+        if not vec.size or norm == 0:
+            return None
+        return vec / norm
+
+    def lookup(self, scope, question: str, vector) -> Optional[Dict[str, Any]]:
+        """
+        在分区内查找相似问题的缓存回答
+
+        Args:
+            scope: make_scope 生成的分区键
+            question: 用户问题
+            vector: 问题向量，为空时只按归一化问题精确匹配
+
+        Returns:
+            命中时返回 {"question", "answer", "sources", "segments", "similarity", "created_at"}，否则返回None
+        """
+        normalized = normalize_question(question)
+        query_vec = self._normalize_vector(vector) if vector is not None else None
+        now = time.time()
+        with self.lock:
+            partition = self.partitions.get(scope)
+            best_id, best_score = None, -1.0
+            if partition and partition["ids"]:
+                self._drop_expired(partition, now)
+                for entry_id in partition["ids"]:
+                    if self.entries[entry_id]["question"] == normalized:
+                        best_id, best_score = entry_id, 1.0
+                        break
+                if best_id is None and query_vec is not None and partition["ids"]:
+                    matrix = self._get_matrix(partition)
+                    if matrix is not None and matrix.shape[1] == query_vec.shape[0]:
+                        sims = matrix @ query_vec
+                        idx = int(np.argmax(sims))
+                        best_id, best_score = partition["ids"][idx], float(sims[idx])
+
+            if best_id is None or best_score < self.threshold:
+                self.stats["misses"] += 1
+                return None
+
+            self.stats["hits"] += 1
+            self.entries.move_to_end(best_id)
+            entry = self.entries[best_id]
+            return {"question": entry["question"], "answer": entry["answer"],
+                    "sources": entry["sources"], "segments": entry["segments"],
+                    "similarity": round(best_score, 4), "created_at": entry["created_at"]}
+
+    def store(self, scope, question: str, vector, answer: str,
+              sources: Optional[List[Any]] = None, segments: Optional[List[Dict[str, Any]]] = None) -> bool:
+        """
+        写入缓存，同一分区内归一化问题相同的旧条目被替换
+
+        Args:
+            scope: make_scope 生成的分区键
+            question: 用户问题
+            vector: 问题向量
+            answer: 最终回答文本
+            sources: 来源列表
+            segments: 按输出顺序排列的回答片段 [{"type", "content"}]，缺省为整段文本
+
+        Returns:
+            是否写入
+        """
+        vec = self._normalize_vector(vector) if vector is not None else None
+        if vec is None or not answer:
+            return False
+        normalized = normalize_question(question)
+        with self.lock:
+            for entry_id in list(self.partitions.get(scope, {}).get("ids", [])):
+                if self.entries[entry_id]["question"] == normalized:
+                    self._remove(entry_id)
+            entry_id = self.next_id
+            self.next_id += 1
+            self.entries[entry_id] = {
+                "scope": scope,
+                "question": normalized,
+                "vector": vec,
+                "answer": answer,
+                "sources": sources or [],
+                "segments": segments or [{"type": "text", "content": answer}],
+                "created_at": time.time(),
+            }
+            partition = self.partitions.setdefault(scope, {"ids": [], "matrix": None})
+            partition["ids"].append(entry_id)
+            partition["matrix"] = None
+            self.stats["stores"] += 1
+            while len(self.entries) > self.max_size:
+                oldest_id = next(iter(self.entries))
+                self._remove(oldest_id)
+                self.stats["evictions"] += 1
+        return True
+
+    def invalidate_knowledge(self, knowledge_id: str) -> int:
+        """
+        使包含指定知识库的所有分区失效
+
+        Returns:
+            删除的条目数
+        """
+        knowledge_id = str(knowledge_id)
+        removed = 0
+        with self.lock:
+            for scope in [s for s in self.partitions if knowledge_id in s[0]]:
+                for entry_id in list(self.partitions[scope]["ids"]):
+                    self._remove(entry_id)
+                    removed += 1
+                self.partitions.pop(scope, None)
+            self.stats["invalidations"] += removed
+        if removed:
+            logger.info(f"知识库 {knowledge_id} 的问答缓存已失效: {removed} 条")
+        return removed
+
+    def clear(self):
+        """清空所有缓存"""
+        with self.lock:
+            self.stats["invalidations"] += len(self.entries)
+            self.entries.clear()
+            self.partitions.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计，包含命中率"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats["size"] = len(self.entries)
+            stats["partitions"] = len(self.partitions)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _get_matrix(self, partition) -> Optional[np.ndarray]:
+        if partition["matrix"] is None and partition["ids"]:
+            vectors = [self.entries[entry_id]["vector"] for entry_id in partition["ids"]]
+            if len({v.shape[0] for v in vectors}) != 1:
+                return None
+            partition["matrix"] = np.vstack(vectors)
+        return partition["matrix"]
+
+    def _drop_expired(self, partition, now):
+        if self.ttl <= 0:
+            return
+        for entry_id in list(partition["ids"]):
+            if now - self.entries[entry_id]["created_at"] > self.ttl:
+                self._remove(entry_id)
+                self.stats["expired"] += 1
+
+    def _remove(self, entry_id):
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return
+        partition = self.partitions.get(entry["scope"])
+        if partition is not None:
+            partition["ids"].remove(entry_id)
+            partition["matrix"] = None
+            if not partition["ids"]:
+                self.partitions.pop(entry["scope"], None)
+
+
+_response_cache: Optional[SemanticResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> SemanticResponseCache:
+    """获取进程内共享的问答结果语义缓存"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                from Config.retrieval_config import get_retrieval_config
+                config = get_retrieval_config()
+                _response_cache = SemanticResponseCache(max_size=config.response_cache_size,
+                                                        threshold=config.response_cache_threshold,
+                                                        ttl=config.response_cache_ttl)
+    return _response_cache
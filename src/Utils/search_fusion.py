@@ -0,0 +1,232 @@
+# -*- coding:utf-8 -*-
+"""
+多引擎搜索结果融合与去重
+
+1. 引擎内得分归一化（min-max 或 z-score），不同引擎的原始得分量纲不同，不能直接比较
+2. 融合方式：
+   - 加权RRF（Reciprocal Rank Fusion）：只按各引擎内的排名融合，与得分大小及归一化方式无关
+   - 加权CombSUM：按归一化后的得分加权求和，得分差距会影响融合结果
+   同一内容被多个引擎召回时得分累加
+3. 去重：稳定的内容哈希精确去重 + 字符shingle上的MinHash近重复折叠
+"""
+
+import re
+import math
+import hashlib
+
+import numpy as np
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# MinHash参数：哈希函数个数、字符shingle长度、梅森素数模数
+MINHASH_NUM_PERM = 64
+SHINGLE_SIZE = 4
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = np.random.RandomState(20240601)
+_PERM_A = _rng.randint(1, 1 << 31, size=MINHASH_NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 1 << 31, size=MINHASH_NUM_PERM, dtype=np.uint64)
+
+
+def result_text(result):
+    """取搜索结果中参与去重的文本：标题 + 内容，合并连续空白"""
+    text = f"{result.get('title', '')}\n{result.get('content', '')}"
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def content_hash(text):
+    """稳定的内容哈希（与进程无关，不受PYTHONHASHSEED影响）"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def minhash_signature(text):
+    """
+    计算文本字符shingle集合的MinHash签名
+
+    Returns:
+        np.ndarray: 长度为MINHASH_NUM_PERM的签名；文本为空时返回None
+    """
+    if not text:
+        return None
+    if len(text) <= SHINGLE_SIZE:
+        shingles = {text}
+    else:
+        shingles = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    # 取blake2b的前4字节作为shingle的基础哈希，保证 a*x+b 不溢出uint64
+    base = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles),
+        dtype=np.uint64, count=len(shingles))
+    hashed = (np.outer(base, _PERM_A) + _PERM_B) % np.uint64(_MERSENNE_PRIME)
+    return hashed.min(axis=0)
+
+
+def signature_similarity(sig_a, sig_b):
+    """两个MinHash签名估计的Jaccard相似度"""
+    if sig_a is None or sig_b is None:
+        return 0.0
+    return float(np.count_nonzero(sig_a == sig_b)) / MINHASH_NUM_PERM
+
+
+def normalize_scores(scores, method="minmax"):
+    """
+    引擎内得分归一化到[0, 1]
+
+    Args:
+        scores: 原始得分列表
+        method: minmax 或 zscore（z-score经logistic函数映射到[0, 1]）
+
+    Returns:
+        list: 归一化后的得分；得分全部相同时均为1.0
+    """
+    if not scores:
+        return []
+    if method == "zscore":
+        mean = sum(scores) / len(scores)
+        std = math.sqrt(sum((s - mean) ** 2 for s in scores) / len(scores))
+        if std == 0:
+            return [1.0] * len(scores)
+        return [1.0 / (1.0 + math.exp(-(s - mean) / std)) for s in scores]
+    low, high = min(scores), max(scores)
+    if high == low:
+        return [1.0] * len(scores)
+    return [(s - low) / (high - low) for s in scores]
+
+
+class NearDuplicateIndex:
+    """
+    内容去重索引
+    先按内容哈希精确匹配，再与已收录内容的MinHash签名比较，相似度达到阈值视为近重复
+    """
+
+    def __init__(self, threshold=0.85):
+        self.threshold = threshold
+        self.hash_to_group = {}
+        self.signatures = []
+
+    def find_or_add(self, text):
+        """
+        查找文本所属的内容组，不存在时新建
+
+        Returns:
+            tuple: (组编号, 是否新建)
+        """
+        key = content_hash(text)
+        group = self.hash_to_group.get(key)
+        if group is not None:
+            return group, False
+
+        signature = None
+        if self.threshold < 1:
+            signature = minhash_signature(text)
+            for group, other in enumerate(self.signatures):
+                if signature_similarity(signature, other) >= self.threshold:
+                    self.hash_to_group[key] = group
+                    return group, False
+
+        group = len(self.signatures)
+        self.signatures.append(signature)
+        self.hash_to_group[key] = group
+        return group, True
+
+
+def dedupe_results(results, threshold=0.85, score_key="combined_score"):
+    """
+    对搜索结果去重，每组近重复内容保留得分最高的一条
+
+    Args:
+        results: 搜索结果列表
+        threshold: MinHash相似度阈值，大于等于1时只做精确去重
+        score_key: 比较得分使用的字段，缺失时使用score
+
+    Returns:
+        list: 去重后的结果，按得分降序
+    """
+    index = NearDuplicateIndex(threshold)
+    best = []
+    for result in results:
+        group, is_new = index.find_or_add(result_text(result))
+        if is_new:
+            best.append(result)
+        elif _score_of(result, score_key) > _score_of(best[group], score_key):
+            best[group] = result
+    best.sort(key=lambda x: _score_of(x, score_key), reverse=True)
+    return best
+
+
+def _score_of(result, score_key):
+    score = result.get(score_key)
+    if score is None:
+        score = result.get("score", result.get("_score", 0))
+    return score or 0
+
+
+FUSION_METHODS = ("rrf", "combsum")
+
+
+def fuse_results(engine_results, weights, method="rrf", k=60, normalization="minmax", dedupe_threshold=0.85):
+    """
+    加权融合多个引擎的结果
+
+    每个引擎内先按原始得分归一化并排序，内容的融合得分为各引擎贡献之和：
+    rrf 为 权重 / (k + 排名)，combsum 为 权重 * 归一化得分；
+    被多个引擎召回的同一（或近重复）内容得分累加，只保留归一化得分最高的一条结果。
+
+    Args:
+        engine_results: {引擎名称: 结果列表}
+        weights: {引擎名称: 权重}，缺省为1.0
+        method: 融合方式，rrf 或 combsum
+        k: RRF平滑常数（仅rrf）
+        normalization: 引擎内得分归一化方式（combsum的得分；rrf只用于引擎内排序）
+        dedupe_threshold: 近重复折叠阈值
+
+    Returns:
+        list: 融合后的结果（写入combined_score、normalized_score与matched_engines字段），按combined_score降序
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"未知的融合方式: {method}")
+    index = NearDuplicateIndex(dedupe_threshold)
+    fused = []
+    for engine, results in engine_results.items():
+        if not results:
+            continue
+        weight = weights.get(engine, 1.0)
+        normalized = normalize_scores([_score_of(r, "score") for r in results], normalization)
+        ranked = sorted(zip(results, normalized), key=lambda x: x[1], reverse=True)
+        for rank, (result, norm_score) in enumerate(ranked, start=1):
+            if method == "rrf":
+                contribution = weight / (k + rank)
+            else:
+                contribution = weight * norm_score
+            group, is_new = index.find_or_add(result_text(result))
+            if is_new:
+                fused.append({"result": result, "normalized": norm_score,
+                              "score": contribution, "engines": [engine]})
+                continue
+            entry = fused[group]
+            entry["score"] += contribution
+            if engine not in entry["engines"]:
+                entry["engines"].append(engine)
+            if norm_score > entry["normalized"]:
+                entry["result"] = result
+                entry["normalized"] = norm_score
+
+    merged = []
+    for entry in fused:
+        result = entry["result"]
+        result["combined_score"] = entry["score"]
+        result["normalized_score"] = entry["normalized"]
+        result["matched_engines"] = entry["engines"]
+        merged.append(result)
+    merged.sort(key=lambda x: x["combined_score"], reverse=True)
+    return merged
+
+
+def weighted_rrf(engine_results, weights, k=60, normalization="minmax", dedupe_threshold=0.85):
+    """加权RRF融合，见 fuse_results"""
+    return fuse_results(engine_results, weights, method="rrf", k=k,
+                        normalization=normalization, dedupe_threshold=dedupe_threshold)
+
+
+def weighted_combsum(engine_results, weights, normalization="minmax", dedupe_threshold=0.85):
+    """加权CombSUM融合（归一化得分加权求和），见 fuse_results"""
+    return fuse_results(engine_results, weights, method="combsum",
+                        normalization=normalization, dedupe_threshold=dedupe_threshold)
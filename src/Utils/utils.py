@@ -41,5 +41,13 @@ def cos_sim(vector_a, vector_b):
     return sim
 
 
-
-
+def estimate_tokens(text):
+    """
+    粗略估算文本token数（不依赖分词器）
+    中日韩字符按1个token计，其余字符按4个字符1个token计
+    """
+    cjk = 0
+    for ch in text:
+        if '⺀' <= ch <= '鿿' or '가' <= ch <= '힯' or '豈' <= ch <= '﫿':
+            cjk += 1
+    return cjk + (len(text) - cjk + 3) // 4 + 1
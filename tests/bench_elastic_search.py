@@ -0,0 +1,107 @@
+# -*- coding:utf-8 -*-
+"""
+ES混合搜索压测：用注入固定延迟的模拟客户端（tests/elastic_stub.py）对比
+
+1. 改写前：全文与两路向量查询依次执行，每条结果单独 GET 父文档
+2. 改写后：三路查询合并为一次 msearch，父文档去重后一次 mget（冷缓存 / 热缓存）
+3. msearch 不可用时：三路查询在线程池中并发执行
+
+用法（需要 elasticsearch 客户端包）：
+    python tests/bench_elastic_search.py
+    python tests/bench_elastic_search.py --latency 0.05 --size 10 --queries 50
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), "src"))
+sys.path.insert(0, TESTS_DIR)
+
+from elastic_stub import FakeES, parent_docs
+
+
+def legacy_hybrid_search(db, index_name, query_vector, size):
+    """改写前的请求顺序：三次 search 依次执行，合并后逐条 get 父文档"""
+    text_hits = db.es.search(index=index_name, body={"query": {}, "size": size * 2})["hits"]["hits"]
+    vector_hits = []
+    for field in ("content_vector", "title_vector"):
+        body = {"knn": {"field": field, "query_vector": query_vector}, "size": size * 2}
+        vector_hits += db.es.search(index=index_name, body=body)["hits"]["hits"]
+    results = []
+    for hit in text_hits:
+        results.append(dict(hit["_source"], _id=hit["_id"]))
+    seen_ids = set()
+    vector_results = []
+    for hit in vector_hits:
+        if hit["_id"] not in seen_ids:
+            seen_ids.add(hit["_id"])
+            vector_results.append(dict(hit["_source"], _id=hit["_id"]))
+    merged = db._rrf_merge(results, vector_results, size)
+    for result in merged:
+        try:
+            db.es.get(index=index_name, id=db._parent_doc_id(result["parent_id"]))
+        except KeyError:
+            pass
+    return merged
+
+
+def measure(label, es, run, queries):
+    latencies = []
+    for i in range(queries):
+        start = time.perf_counter()
+        run(i)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    requests = len(es.calls) / queries
+    print(f"{label:<22} p50 {statistics.median(latencies) * 1000:7.1f}ms  "
+          f"p95 {latencies[int(len(latencies) * .95)] * 1000:7.1f}ms  {requests:.1f} requests/query")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ES混合搜索压测")
+    parser.add_argument("--latency", type=float, default=0.05, help="每个ES请求的延迟（秒）")
+    parser.add_argument("--size", type=int, default=10, help="返回结果数")
+    parser.add_argument("--parents", type=int, default=5, help="结果分属的父文档数")
+    parser.add_argument("--queries", type=int, default=20, help="每种方式的查询次数")
+    args = parser.parse_args()
+
+    from Db import elastic_db
+
+    elastic_db.is_elasticsearch_enabled = lambda: False
+    vector = [0.1] * 8
+
+    def make(**kwargs):
+        es = FakeES(latency=args.latency, docs=parent_docs(args.parents), hits=args.size * 2,
+                    parents=args.parents, **kwargs)
+        db = elastic_db.ElasticSearchDB()
+        db.enabled, db.es = True, es
+        return db, es
+
+    db, es = make()
+    measure("before (serial + get)", es, lambda i: legacy_hybrid_search(db, "idx", vector, args.size), args.queries)
+
+    db, es = make()
+    measure("msearch, cold parents", es,
+            lambda i: (db._invalidate_parent_cache("idx"), db._hybrid_search("idx", "kb", True, "q", vector, args.size)),
+            args.queries)
+
+    db, es = make()
+    db._hybrid_search("idx", "kb", True, "q", vector, args.size)
+    es.calls.clear()
+    measure("msearch, warm parents", es, lambda i: db._hybrid_search("idx", "kb", True, "q", vector, args.size),
+            args.queries)
+
+    db, es = make(msearch_error=AttributeError("msearch"))
+    db._hybrid_search("idx", "kb", True, "q", vector, args.size)
+    es.calls.clear()
+    measure("concurrent fallback", es,
+            lambda i: (db._invalidate_parent_cache("idx"), db._hybrid_search("idx", "kb", True, "q", vector, args.size)),
+            args.queries)
+
+
+if __name__ == "__main__":
+    main()
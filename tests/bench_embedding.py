@@ -0,0 +1,121 @@
+# -*- coding:utf-8 -*-
+"""
+向量化请求压测：用 aiohttp 模拟的 /v1/embeddings 接口（tests/embedding_stub_server.py）对比
+
+1. 文档批量向量化：同步 embed_documents（按批依次发送）与异步 aembed_documents（按批并发发送）
+2. 单条查询：单个请求的延迟，以及多线程并发 embed_query 在不同微批窗口下的总耗时与上游请求数
+
+用法（需要 openai、aiohttp）：
+    python tests/bench_embedding.py
+    python tests/bench_embedding.py --texts 2000 --latency 0.1 --threads 64
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), "src"))
+sys.path.insert(0, TESTS_DIR)
+
+from embedding_stub_server import EmbeddingStubServer
+
+
+def make_embeddings(server, **env):
+    from Config.embedding_config import EmbeddingConfig, EmbeddingsWrapper
+
+    os.environ.update({
+        "EMBEDDING_API_KEY": "bench",
+        "EMBEDDING_BASE_URL": server.base_url,
+        "EMBEDDING_MODEL_ID": "stub",
+        "EMBEDDING_MODEL_NAME": "stub",
+        "EMBEDDING_VECTOR_LENGTH": str(server.dimension),
+    })
+    os.environ.update({name: str(value) for name, value in env.items()})
+    return EmbeddingsWrapper(EmbeddingConfig())
+
+
+def bench_documents(server, args):
+    texts = [f"第{i}段文档内容" * 20 for i in range(args.texts)]
+    env = {"EMBEDDING_BATCH_SIZE": args.batch_size, "EMBEDDING_MAX_CONCURRENCY": args.concurrency,
+           "EMBEDDING_MICRO_BATCH_MS": 0}
+
+    server.reset()
+    embeddings = make_embeddings(server, **env)
+    start = time.perf_counter()
+    embeddings.embed_documents(texts)
+    sync_time = time.perf_counter() - start
+    sync_requests = len(server.requests)
+
+    server.reset()
+    start = time.perf_counter()
+    asyncio.run(embeddings.aembed_documents(texts))
+    async_time = time.perf_counter() - start
+    print(f"documents x{args.texts} (batch {args.batch_size}): "
+          f"sync {sync_time:.2f}s / {sync_requests} requests, "
+          f"async {async_time:.2f}s / {len(server.requests)} requests, peak concurrency {server.peak_active}")
+
+
+def bench_queries(server, args, window_ms):
+    embeddings = make_embeddings(server, EMBEDDING_MICRO_BATCH_MS=window_ms)
+
+    server.reset()
+    single = []
+    for i in range(20):
+        start = time.perf_counter()
+        embeddings.embed_query(f"单条问题{i}")
+        single.append(time.perf_counter() - start)
+
+    server.reset()
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.threads)
+
+    def worker(i):
+        barrier.wait()
+        for j in range(args.queries):
+            start = time.perf_counter()
+            embeddings.embed_query(f"并发问题{i}-{j}")
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    latencies.sort()
+    print(f"queries, micro batch {window_ms}ms: single p50 {statistics.median(single) * 1000:.0f}ms; "
+          f"{args.threads} threads x {args.queries}: wall {wall:.2f}s, "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.0f}ms, p95 {latencies[int(len(latencies) * .95)] * 1000:.0f}ms, "
+          f"{len(server.requests)} upstream requests")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量化请求压测")
+    parser.add_argument("--texts", type=int, default=1000, help="文档批量向量化的文本条数")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟接口每个请求的延迟（秒）")
+    parser.add_argument("--per-item-latency", type=float, default=0.0005, help="模拟接口每条文本的额外延迟（秒）")
+    parser.add_argument("--threads", type=int, default=32, help="并发查询线程数")
+    parser.add_argument("--queries", type=int, default=10, help="每个线程的查询数")
+    args = parser.parse_args()
+
+    server = EmbeddingStubServer(latency=args.latency, per_item_latency=args.per_item_latency).start()
+    try:
+        bench_documents(server, args)
+        for window_ms in (0, 5, 20):
+            bench_queries(server, args, window_ms)
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
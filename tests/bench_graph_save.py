@@ -0,0 +1,83 @@
+# -*- coding:utf-8 -*-
+"""
+图谱入库压测：用模拟的 py2neo Graph（tests/neo4j_stub.py，每次请求注入固定延迟）保存随机图谱，
+统计 Neo4j 往返次数、SQLite 写入耗时与总耗时；改写前每个结点、每条关系各一次往返
+
+用法（需要 py2neo 与 Sql 包的依赖）：
+    python tests/bench_graph_save.py
+    python tests/bench_graph_save.py --nodes 50000 --edges 200000 --latency 0.002
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), "src"))
+sys.path.insert(0, TESTS_DIR)
+
+from neo4j_stub import FakeNeo4jGraph, SyntheticGraph
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图谱入库压测")
+    parser.add_argument("--nodes", type=int, default=50000, help="结点数")
+    parser.add_argument("--edges", type=int, default=200000, help="关系数")
+    parser.add_argument("--rel-types", type=int, default=4, help="关系类型数")
+    parser.add_argument("--latency", type=float, default=0.002, help="每次Neo4j请求的延迟（秒）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.makedirs(os.path.join(work_dir, "conf", "sqlite"))
+        os.chdir(work_dir)
+        # 模块导入时按当前目录创建全局实例，需在切换目录之后导入
+        from Control import control_graph
+        from Db.neo4j_db import cSingleNeo4j
+        from Db.sqlite_db import cSingleSqlite
+
+        fake = FakeNeo4jGraph(latency=args.latency)
+        cSingleNeo4j.enabled, cSingleNeo4j.graph = True, fake
+        control_graph.is_neo4j_enabled = lambda: True
+        graph = SyntheticGraph(args.nodes, args.edges, rel_types=[f"REL_{i}" for i in range(args.rel_types)])
+        control_graph.read_graph.run_importer = lambda path: graph
+
+        # 只统计最外层事务（写入语句内部也会进入嵌套事务）
+        sqlite_time = [0.0]
+        depth = [0]
+        transaction = cSingleSqlite.transaction
+
+        @contextlib.contextmanager
+        def timed_transaction():
+            start = time.perf_counter()
+            depth[0] += 1
+            try:
+                with transaction() as conn:
+                    yield conn
+            finally:
+                depth[0] -= 1
+            if depth[0] == 0:
+                sqlite_time[0] += time.perf_counter() - start
+        cSingleSqlite.transaction = timed_transaction
+
+        controller = control_graph.CControl.__new__(control_graph.CControl)
+        start = time.perf_counter()
+        controller.save_graph(work_dir, "kb", "f1", "a.txt", "public")
+        total = time.perf_counter() - start
+
+        c = cSingleSqlite.conn.cursor()
+        c.execute("SELECT (SELECT COUNT(*) FROM graph_node), (SELECT COUNT(*) FROM graph_relation);")
+        node_rows, relation_rows = c.fetchone()
+        legacy = args.nodes + args.edges
+        print(f"{args.nodes} nodes / {args.edges} edges, {args.latency * 1000:.1f}ms per Neo4j request")
+        print(f"  neo4j round trips: {fake.round_trips} (before: ~{legacy}, "
+              f"~{legacy * args.latency:.0f}s of latency alone)")
+        print(f"  sqlite rows: {node_rows} nodes, {relation_rows} relations in {sqlite_time[0]:.2f}s")
+        print(f"  total: {total:.2f}s")
+        os.chdir(TESTS_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# -*- coding:utf-8 -*-
+"""
+RAG智能体首字延迟压测：每个请求新建智能体（改写前）与常驻注册表（改写后）对比
+
+请求流程中的意图识别与工具执行使用 tests/test_rag_agent_registry.py 中的桩LLM智能体，
+改写前的每个请求先真实构造一次 RagAgentRegistry（各智能体的LLM客户端、Milvus连接等），
+改写后所有请求共享进程内只创建一次的注册表。统计从发起请求到收到第一个数据块的耗时（TTFT）。
+
+用法（需要 langchain 等智能体依赖，以及可连接的大模型与Milvus配置，构造耗时才与线上一致）：
+    python tests/bench_rag_ttft.py
+    python tests/bench_rag_ttft.py --concurrency 20 --rounds 5
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), "src"))
+sys.path.insert(0, TESTS_DIR)
+
+
+def measure(label, rag_run, make_registry, concurrency, rounds):
+    """concurrency个线程同时发起请求，每个线程rounds次，返回各请求的TTFT"""
+    ttfts = []
+    totals = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency)
+
+    def client(n):
+        barrier.wait()
+        for i in range(rounds):
+            start = time.perf_counter()
+            first = None
+            for _ in rag_run.run_rag_agentic_stream(f"问题{n}-{i}", f"kb{n}", "user", registry=make_registry()):
+                if first is None:
+                    first = time.perf_counter() - start
+            with lock:
+                ttfts.append(first)
+                totals.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    # 智能体内部的进度输出不计入结果
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    ttfts.sort()
+    print(f"{label:<28} requests={len(ttfts)} ttft p50={statistics.median(ttfts) * 1000:7.1f}ms "
+          f"p95={ttfts[int(0.95 * (len(ttfts) - 1))] * 1000:7.1f}ms total p50={statistics.median(totals) * 1000:7.1f}ms")
+    return statistics.median(ttfts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG智能体首字延迟压测")
+    parser.add_argument("--concurrency", type=int, default=20, help="并发请求数")
+    parser.add_argument("--rounds", type=int, default=5, help="每个线程的请求次数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.makedirs(os.path.join(work_dir, "conf", "sqlite"))
+        os.chdir(work_dir)
+        # 模块导入时按当前目录创建SQLite全局实例，需在切换目录之后导入
+        from Agent import agentic_rag_run as rag_run
+        from test_rag_agent_registry import EchoToolAgent, IntentAgent
+
+        rag_run.cSingleSqlite.search_knowledge_base_by_knowledge_id = lambda knowledge_id: {"description": "测试知识库"}
+
+        def with_stub_llm(registry):
+            registry.enhanced_intent_agent = IntentAgent()
+            registry.tool_agent = EchoToolAgent()
+            return registry
+
+        start = time.perf_counter()
+        shared = with_stub_llm(rag_run.get_agent_registry())
+        print(f"registry created once in {(time.perf_counter() - start) * 1000:.1f}ms "
+              f"(includes dictionary warm-up)")
+
+        before = measure("before (agents per request)", rag_run,
+                         lambda: with_stub_llm(rag_run.RagAgentRegistry()), args.concurrency, args.rounds)
+        after = measure("after (warm registry)", rag_run, lambda: shared, args.concurrency, args.rounds)
+        print(f"ttft p50 saved per request: {(before - after) * 1000:.1f}ms")
+        os.chdir(TESTS_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+# -*- coding:utf-8 -*-
+"""
+测试公共配置：把 src 加入导入路径，并切换到临时工作目录
+（模块按相对路径 conf/... 打开数据库与文件，测试不能写到仓库目录下）
+"""
+
+import os
+import sys
+import tempfile
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+WORK_DIR = tempfile.mkdtemp(prefix="rag_tests_")
+os.makedirs(os.path.join(WORK_DIR, "conf", "sqlite"), exist_ok=True)
+os.chdir(WORK_DIR)
@@ -0,0 +1,95 @@
+# -*- coding:utf-8 -*-
+"""
+模拟 Elasticsearch 客户端，供混合搜索测试与压测使用
+
+每个请求按类型记录并可注入固定延迟，统计峰值并发请求数；
+search/msearch 按请求体中的 knn 字段区分三路查询，返回部分重叠的子文档。
+"""
+
+import threading
+import time
+
+
+class FakeIndices:
+    def exists(self, index):
+        return True
+
+
+class FakeES:
+    """按请求类型记录调用，可注入每次请求的延迟与 msearch 异常"""
+
+    def __init__(self, latency=0.0, msearch_error=None, docs=None, hits=4, parents=3):
+        """
+        Args:
+            latency: 每个请求的固定延迟（秒）
+            msearch_error: msearch 抛出的异常，为空时正常返回
+            docs: 父文档ID -> 父文档，供 mget/get 返回
+            hits: 每路查询返回的命中数
+            parents: 命中的子文档分属的父文档数
+        """
+        self.latency = latency
+        self.hits = hits
+        self.parents = parents
+        self.msearch_error = msearch_error
+        self.docs = docs if docs is not None else {}
+        self.calls = []
+        self.lock = threading.Lock()
+        self.active = self.peak = 0
+        self.indices = FakeIndices()
+
+    def _request(self, kind, payload):
+        with self.lock:
+            self.calls.append((kind, payload))
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.latency)
+        with self.lock:
+            self.active -= 1
+
+    def count(self, kind):
+        return len([call for call in self.calls if call[0] == kind])
+
+    def _hits(self, body):
+        # 三路结果部分重叠，子文档按序号轮流属于各父文档
+        leg = body["knn"]["field"] if "knn" in body else "text"
+        offset = {"text": 0, "content_vector": self.hits // 2, "title_vector": self.hits}[leg]
+        hits = []
+        for i in range(offset, offset + self.hits):
+            doc_id = f"kb_f{i % self.parents}_chunk_{i}"
+            hits.append({"_id": doc_id, "_score": 1.0 / (i + 1),
+                         "_source": {"doc_type": "child", "parent_id": doc_id, "content": f"{leg}-{i}"}})
+        return {"hits": {"hits": hits}}
+
+    def msearch(self, body):
+        self._request("msearch", body)
+        if self.msearch_error:
+            raise self.msearch_error
+        return {"responses": [self._hits(search) for search in body[1::2]]}
+
+    def search(self, index, body):
+        self._request("search", body)
+        return self._hits(body)
+
+    def mget(self, index, body):
+        self._request("mget", body["ids"])
+        return {"docs": [{"_id": doc_id, "found": doc_id in self.docs, "_source": self.docs.get(doc_id)}
+                         for doc_id in body["ids"]]}
+
+    def bulk(self, body):
+        self._request("bulk", body)
+        return {"errors": False, "items": body[::2]}
+
+    def get(self, index, id):
+        self._request("get", id)
+        if id not in self.docs:
+            raise KeyError(id)
+        return {"_id": id, "_source": self.docs[id]}
+
+    def delete(self, index, id):
+        self._request("delete", id)
+        return {"_shards": {"successful": 1}}
+
+
+def parent_docs(n):
+    """kb_f0 ... kb_f{n-1} 的父文档"""
+    return {f"kb_f{i}": {"title": f"文件{i}", "summary": f"摘要{i}", "full_content_length": 100 + i} for i in range(n)}
@@ -0,0 +1,108 @@
+# -*- coding:utf-8 -*-
+"""
+模拟OpenAI兼容的 /v1/embeddings 接口（aiohttp），供向量化测试与压测使用
+
+在后台线程的事件循环中运行，可配置每个请求的延迟与前若干个请求返回429，
+记录每个请求的文本条数与峰值并发请求数。
+"""
+
+import asyncio
+import threading
+import time
+
+from aiohttp import web
+
+
+class EmbeddingStubServer:
+    def __init__(self, dimension=8, latency=0.05, per_item_latency=0.0, fail_first=0):
+        """
+        Args:
+            dimension: 返回的向量维度
+            latency: 每个请求的固定延迟（秒）
+            per_item_latency: 每条文本额外增加的延迟（秒）
+            fail_first: 前多少个请求返回429
+        """
+        self.dimension = dimension
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+        self.fail_first = fail_first
+        self.lock = threading.Lock()
+        self.requests = []
+        self.request_times = []
+        self.failed = 0
+        self.active = 0
+        self.peak_active = 0
+        self.port = None
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def vector(self, text):
+        """文本对应的确定性向量，便于校验结果顺序"""
+        seed = sum(ord(ch) for ch in text)
+        return [float((seed + i) % 97) for i in range(self.dimension)]
+
+    async def _embeddings(self, request):
+        body = await request.json()
+        texts = body["input"]
+        if isinstance(texts, str):
+            texts = [texts]
+        with self.lock:
+            if self.failed < self.fail_first:
+                self.failed += 1
+                return web.json_response({"error": {"message": "rate limited", "type": "rate_limit"}}, status=429)
+            self.requests.append(len(texts))
+            self.request_times.append(time.perf_counter())
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+        try:
+            await asyncio.sleep(self.latency + self.per_item_latency * len(texts))
+        finally:
+            with self.lock:
+                self.active -= 1
+        return web.json_response({
+            "object": "list",
+            "model": body.get("model", "stub"),
+            "data": [{"object": "embedding", "index": i, "embedding": self.vector(text)}
+                     for i, text in enumerate(texts)],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    def start(self):
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            app = web.Application()
+            app.router.add_post("/v1/embeddings", self._embeddings)
+            self._runner = web.AppRunner(app, access_log=None)
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, "127.0.0.1", 0)
+            self._loop.run_until_complete(site.start())
+            self.port = site._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="embedding-stub", daemon=True)
+        self._thread.start()
+        started.wait(10)
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(10)
+
+    def reset(self):
+        with self.lock:
+            self.requests.clear()
+            self.request_times.clear()
+            self.failed = 0
+            self.peak_active = 0
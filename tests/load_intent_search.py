@@ -0,0 +1,174 @@
+# -*- coding:utf-8 -*-
+"""
+意图搜索四引擎压测：每次查询新建线程池（改写前）与共享有界线程池（改写后）对比
+
+用模拟引擎（每次调用随机延迟 --min-latency ~ --max-latency 秒，每 --stall-every 个查询中有一个的图数据引擎
+卡住 --stall 秒）代替 Milvus/ES/图数据/智能问数，--clients 个线程同时发起查询，每个线程 --rounds 次。
+统计查询耗时的 p50/p95 与进程峰值线程数，并检查改写后：
+1. 峰值线程数不超过 起始线程数 + 客户端线程数 + SEARCH_ENGINE_WORKER_NUM
+2. p95 低于改写前（卡住的图数据引擎按 SEARCH_GRAPH_TIMEOUT 被跳过）
+
+用法（需要 langchain 等智能体依赖）：
+    python tests/load_intent_search.py
+    python tests/load_intent_search.py --clients 50 --stall 20 --graph-timeout 1 --workers 16
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), "src"))
+
+
+class FakeEngines:
+    """模拟四个搜索引擎，按查询编号决定延迟与是否卡住"""
+
+    def __init__(self, min_latency, max_latency, stall, stall_every):
+        self.min_latency = min_latency
+        self.max_latency = max_latency
+        self.stall = stall
+        self.stall_every = stall_every
+
+    def _latency(self, query_text, engine):
+        return random.Random(f"{query_text}-{engine}").uniform(self.min_latency, self.max_latency)
+
+    def _results(self, query_text, engine, n=5):
+        return [{"title": f"{engine}-{query_text}-{i}", "content": f"{engine} 引擎返回的第{i}条内容：{query_text}",
+                 "score": 1.0 - i * 0.1, "search_engine": engine} for i in range(n)]
+
+    def milvus(self, state, query_text):
+        time.sleep(self._latency(query_text, "milvus"))
+        return self._results(query_text, "milvus")
+
+    def elasticsearch(self, state, query_text):
+        time.sleep(self._latency(query_text, "elasticsearch"))
+        return self._results(query_text, "elasticsearch")
+
+    def graph(self, state, query_text):
+        if state["query_index"] % self.stall_every == 0:
+            time.sleep(self.stall)
+        else:
+            time.sleep(self._latency(query_text, "graph"))
+        return self._results(query_text, "graph_data")
+
+    def table(self, state, query_text):
+        time.sleep(self._latency(query_text, "table"))
+        return self._results(query_text, "csv_excel", n=2)
+
+
+def legacy_search(agent, state, query_text):
+    """改写前的执行方式：每次查询新建4线程的线程池，等待所有引擎返回"""
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(search, state, query_text) for search in
+                   (agent.search_milvus, agent.search_elasticsearch, agent.search_graph_data, agent.search_csv_excel_data)]
+        combined_results = [result for future in futures for result in future.result()]
+    combined_results.sort(key=lambda x: x.get("score", 0), reverse=True)
+    return combined_results[:15]
+
+
+def run(label, search, clients, rounds):
+    """clients个线程同时查询，返回各查询耗时与峰值线程数"""
+    latencies = []
+    latencies_lock = threading.Lock()
+    barrier = threading.Barrier(clients)
+    peak = {"threads": threading.active_count()}
+    sampling = threading.Event()
+
+    def sample():
+        while not sampling.is_set():
+            peak["threads"] = max(peak["threads"], threading.active_count())
+            time.sleep(0.01)
+
+    def client(n):
+        barrier.wait()
+        for i in range(rounds):
+            query_index = n * rounds + i
+            start = time.perf_counter()
+            results = search({"knowledge_id": "kb", "user_id": "", "flag": True, "query_index": query_index},
+                             f"问题{query_index}")
+            elapsed = time.perf_counter() - start
+            assert results, f"{label}: 查询{query_index}没有结果"
+            with latencies_lock:
+                latencies.append(elapsed)
+
+    base_threads = threading.active_count()
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    start = time.perf_counter()
+    # 智能体内部的进度输出不计入结果
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    wall = time.perf_counter() - start
+    sampling.set()
+    sampler.join()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(f"{label:<8} queries={len(latencies)} wall={wall:.1f}s base_threads={base_threads} "
+          f"peak_threads={peak['threads']} p50={p50:.2f}s p95={p95:.2f}s")
+    return base_threads, peak["threads"], p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description="意图搜索四引擎压测")
+    parser.add_argument("--clients", type=int, default=50, help="并发查询数")
+    parser.add_argument("--rounds", type=int, default=2, help="每个客户端的查询次数")
+    parser.add_argument("--min-latency", type=float, default=0.05, help="引擎最小延迟（秒）")
+    parser.add_argument("--max-latency", type=float, default=0.3, help="引擎最大延迟（秒）")
+    parser.add_argument("--stall", type=float, default=5.0, help="卡住的图数据引擎调用耗时（秒）")
+    parser.add_argument("--stall-every", type=int, default=10, help="每多少个查询有一个图数据引擎卡住")
+    parser.add_argument("--graph-timeout", type=float, default=1.0, help="SEARCH_GRAPH_TIMEOUT（秒）")
+    parser.add_argument("--workers", type=int, default=16, help="SEARCH_ENGINE_WORKER_NUM")
+    args = parser.parse_args()
+
+    os.environ["SEARCH_GRAPH_TIMEOUT"] = str(args.graph_timeout)
+    os.environ["SEARCH_ENGINE_WORKER_NUM"] = str(args.workers)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.makedirs(os.path.join(work_dir, "conf", "sqlite"))
+        os.chdir(work_dir)
+        # 模块导入时按当前目录创建SQLite全局实例，需在切换目录之后导入
+        from Agent.AgenticRagAgent.intent_recognition_agent import IntentRecognitionAgent
+        from Control.control_retrieval import get_search_engine_executor
+
+        engines = FakeEngines(args.min_latency, args.max_latency, args.stall, args.stall_every)
+        agent = IntentRecognitionAgent()
+        agent.search_milvus = engines.milvus
+        agent.search_elasticsearch = engines.elasticsearch
+        agent.search_graph_data = engines.graph
+        agent.search_csv_excel_data = engines.table
+
+        print(f"{args.clients} clients x {args.rounds} queries, graph stalls {args.stall:.0f}s "
+              f"on 1/{args.stall_every} queries, SEARCH_GRAPH_TIMEOUT={args.graph_timeout}s, "
+              f"SEARCH_ENGINE_WORKER_NUM={args.workers}")
+        _, legacy_peak, legacy_p95 = run("before", lambda state, query_text: legacy_search(agent, state, query_text),
+                                         args.clients, args.rounds)
+        base_threads, peak, p95 = run("after", agent.search_triple_engines_with_graph, args.clients, args.rounds)
+        stats = get_search_engine_executor().get_stats()
+        print(f"search-engine pool: max_workers={stats['max_workers']} peak_running={stats['peak_running']} "
+              f"timeout={stats['timeout']} cancelled={stats['cancelled']}")
+
+        # 采样线程与客户端线程之外，只有共享线程池的线程
+        limit = base_threads + 1 + args.clients + args.workers
+        assert peak <= limit, f"峰值线程数 {peak} 超过上限 {limit}"
+        assert stats["peak_running"] <= args.workers
+        assert p95 < legacy_p95, f"p95 {p95:.2f}s 未低于改写前的 {legacy_p95:.2f}s"
+        print(f"OK: peak threads {peak} <= {limit} (before: {legacy_peak}), p95 {p95:.2f}s < {legacy_p95:.2f}s")
+        os.chdir(TESTS_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# -*- coding:utf-8 -*-
+"""
+SSE流式接口压测：Flask线程模式与ASGI桥接模式对比
+
+用模拟大模型（每个流 --chunks 个数据块、间隔 --delay 秒）代替聊天流水线，
+ASGI模式使用与线上相同的 Servers.sse_stream.iterate_in_thread 桥接。
+统计首字延迟（TTFB）与完整流耗时的 p50/p95、服务进程的峰值线程数与内存，
+以及提前断开的客户端是否关闭了流水线生成器。
+
+用法（需要 aiohttp、psutil、flask、uvicorn、starlette）：
+    python tests/load_sse_stream.py --mode asgi --streams 500
+    python tests/load_sse_stream.py --mode asgi --streams 500 --workers 64
+    python tests/load_sse_stream.py --mode flask --streams 500
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+EARLY_CLOSE_CLIENTS = 20
+
+
+def serve(mode, port, chunks, delay):
+    """压测用的服务进程：/stream 返回模拟大模型的SSE流，/closed 返回被关闭的生成器数"""
+    closed = {"count": 0}
+
+    def fake_llm():
+        try:
+            for _ in range(chunks):
+                time.sleep(delay)
+                yield {"choices": [{"delta": {"content": "x" * 20, "type": "text"}}]}
+        except GeneratorExit:
+            closed["count"] += 1
+            raise
+
+    def events():
+        for chunk in fake_llm():
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    if mode == "flask":
+        from flask import Flask, Response, stream_with_context
+
+        app = Flask(__name__)
+        app.add_url_rule("/stream", "stream",
+                         lambda: Response(stream_with_context(events()), mimetype="text/event-stream"))
+        app.add_url_rule("/closed", "closed", lambda: str(closed["count"]))
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        app.run(port=port, threaded=True)
+    else:
+        sys.path.insert(0, SRC_DIR)
+        import uvicorn
+        from starlette.applications import Starlette
+        from starlette.responses import PlainTextResponse, StreamingResponse
+        from starlette.routing import Route
+        from Servers.sse_stream import iterate_in_thread
+
+        async def stream(request):
+            return StreamingResponse(iterate_in_thread(events), media_type="text/event-stream")
+
+        async def closed_count(request):
+            return PlainTextResponse(str(closed["count"]))
+
+        app = Starlette(routes=[Route("/stream", stream), Route("/closed", closed_count)])
+        uvicorn.run(app, port=port, log_level="error", backlog=4096)
+
+
+def _quantile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))] if values else float("nan")
+
+
+async def load(args, process):
+    import aiohttp
+    import psutil
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = psutil.Process(process.pid)
+    peak = {"rss": 0, "threads": 0}
+    sampling = True
+
+    async def sample():
+        while sampling:
+            peak["rss"] = max(peak["rss"], server.memory_info().rss)
+            peak["threads"] = max(peak["threads"], server.num_threads())
+            await asyncio.sleep(0.05)
+
+    async def full_stream(session, latencies):
+        start = time.perf_counter()
+        first = None
+        async with session.get(f"{base_url}/stream") as response:
+            async for _ in response.content:
+                if first is None:
+                    first = time.perf_counter() - start
+        latencies.append((first, time.perf_counter() - start))
+
+    async def early_close(session):
+        async with session.get(f"{base_url}/stream") as response:
+            received = 0
+            async for _ in response.content:
+                received += 1
+                if received > 4:
+                    break
+
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=600)) as session:
+        for _ in range(100):
+            try:
+                async with session.get(f"{base_url}/closed") as response:
+                    await response.text()
+                break
+            except aiohttp.ClientError:
+                await asyncio.sleep(0.1)
+        base_threads = server.num_threads()
+        sampler = asyncio.create_task(sample())
+        latencies = []
+        start = time.perf_counter()
+        results = await asyncio.gather(*[full_stream(session, latencies) for _ in range(args.streams)],
+                                       return_exceptions=True)
+        wall = time.perf_counter() - start
+        errors = sum(isinstance(result, Exception) for result in results)
+        await asyncio.gather(*[early_close(session) for _ in range(EARLY_CLOSE_CLIENTS)])
+        await asyncio.sleep(2 * args.delay * args.chunks / 10 + 1)
+        async with session.get(f"{base_url}/closed") as response:
+            closed = await response.text()
+        sampling = False
+        await sampler
+
+    first_latencies = [first for first, _ in latencies]
+    totals = [total for _, total in latencies]
+    workers = args.workers or "default"
+    print(f"{args.mode} (SSE_WORKER_NUM={workers}): streams={args.streams} errors={errors} wall={wall:.1f}s "
+          f"base_threads={base_threads} peak_threads={peak['threads']} peak_rss={peak['rss'] / 2 ** 20:.0f}MB "
+          f"ttfb p50={_quantile(first_latencies, .5):.2f}s p95={_quantile(first_latencies, .95):.2f}s "
+          f"total p50={_quantile(totals, .5):.2f}s p95={_quantile(totals, .95):.2f}s "
+          f"early_closed_generators={closed}/{EARLY_CLOSE_CLIENTS}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE流式接口压测")
+    parser.add_argument("--mode", choices=("flask", "asgi"), default="asgi")
+    parser.add_argument("--streams", type=int, default=500, help="并发流数")
+    parser.add_argument("--chunks", type=int, default=40, help="每个流的数据块数")
+    parser.add_argument("--delay", type=float, default=0.05, help="数据块间隔（秒）")
+    parser.add_argument("--workers", type=int, default=0, help="SSE_WORKER_NUM，0表示使用默认配置")
+    parser.add_argument("--port", type=int, default=7199)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.mode, args.port, args.chunks, args.delay)
+        return
+
+    env = dict(os.environ)
+    if args.workers:
+        env["SSE_WORKER_NUM"] = str(args.workers)
+    else:
+        env.pop("SSE_WORKER_NUM", None)
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", "--mode", args.mode,
+                                "--port", str(args.port), "--chunks", str(args.chunks), "--delay", str(args.delay)],
+                               env=env)
+    try:
+        asyncio.run(load(args, process))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# -*- coding:utf-8 -*-
+"""
+模拟 py2neo 的 Graph 与 networkx 读出的图谱，供图谱入库测试与压测使用
+
+FakeNeo4jGraph 记录每次 run 的语句与参数行数（即一次网络往返），可注入固定延迟；
+SyntheticGraph 提供 nodes(data=True) / edges(data=True)，与 read_graph.run_importer 的返回值用法一致。
+"""
+
+import random
+import time
+
+
+class FakeResult:
+    def data(self):
+        return []
+
+
+class FakeNeo4jGraph:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.runs = []
+
+    def run(self, cypher_query, parameters=None):
+        rows = (parameters or {}).get("rows")
+        self.runs.append((cypher_query, len(rows) if rows is not None else None))
+        time.sleep(self.latency)
+        return FakeResult()
+
+    @property
+    def round_trips(self):
+        return len(self.runs)
+
+    def written_rows(self, keyword):
+        """语句中包含 keyword 的批量写入的总行数"""
+        return sum(rows or 0 for cypher_query, rows in self.runs if keyword in cypher_query)
+
+
+class SyntheticGraph:
+    """随机图谱：n_nodes 个实体、n_edges 条关系，关系类型在 rel_types 中轮换"""
+
+    def __init__(self, n_nodes, n_edges, rel_types=("RELATED_TO",), seed=0):
+        rng = random.Random(seed)
+        self._nodes = [(f"实体{i}", {"entity_type": "ORG" if i % 2 else "PERSON",
+                                    "description": f"描述{i}", "source_id": f"chunk-{i % 97}"})
+                       for i in range(n_nodes)]
+        self._edges = []
+        for i in range(n_edges):
+            data = {"description": f"关系{i}", "keywords": "k", "source_id": f"chunk-{i % 97}",
+                    "weight": float(i % 5 + 1)}
+            if rel_types:
+                data["type"] = rel_types[i % len(rel_types)]
+            self._edges.append((f"实体{rng.randrange(n_nodes)}", f"实体{rng.randrange(n_nodes)}", data))
+
+    def nodes(self, data=False):
+        return list(self._nodes) if data else [node_id for node_id, _ in self._nodes]
+
+    def edges(self, data=False):
+        return list(self._edges) if data else [(source, target) for source, target, _ in self._edges]
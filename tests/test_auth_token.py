@@ -0,0 +1,150 @@
+# -*- coding:utf-8 -*-
+"""用户认证：会话令牌的过期与篡改、登出撤销、修改权限/密码/删除用户后令牌与凭据缓存立即失效"""
+
+import time
+import uuid
+
+import pytest
+
+from Db.sqlite_db import cSingleSqlite
+from Utils import auth_token
+from Utils.auth_token import AuthManager, get_auth_manager
+
+
+def _new_user(permissions=""):
+    user_id = f"user_{uuid.uuid4().hex}"
+    user_info = {"user_id": user_id, "user_name": f"name_{user_id}", "password": "secret1",
+                 "permissions": permissions}
+    cSingleSqlite.insert_user(user_info)
+    return user_info
+
+
+def _lookup_counter():
+    calls = []
+
+    def lookup(user_name, password):
+        calls.append(user_name)
+        c = cSingleSqlite.conn.cursor()
+        c.execute("SELECT user_id, user_name, password, permissions FROM user_info WHERE user_name=?", (user_name,))
+        row = c.fetchone()
+        if row and row[2] == password:
+            return {"user_id": row[0], "user_name": row[1], "permissions": row[3]}
+        return None
+    return lookup, calls
+
+
+def test_token_round_trip_and_expiry(monkeypatch):
+    manager = AuthManager(token_ttl=60)
+    issued = manager.issue_token({"user_id": "u1", "user_name": "alice", "permissions": "admin"})
+    assert manager.verify_token(issued["token"]) == {"user_id": "u1", "user_name": "alice", "permissions": "admin"}
+
+    now = time.time()
+    monkeypatch.setattr(auth_token.time, "time", lambda: now + 61)
+    assert manager.verify_token(issued["token"]) is None
+
+
+def test_tampered_and_foreign_tokens_rejected():
+    manager = AuthManager()
+    token = manager.issue_token({"user_id": "u1", "user_name": "alice"})["token"]
+    body, signature = token.split(".")
+    forged_body = auth_token._b64encode(auth_token._b64decode(body).replace(b'"u1"', b'"u2"'))
+    assert manager.verify_token(f"{forged_body}.{signature}") is None
+    assert AuthManager().verify_token(token) is None
+    assert manager.verify_token("not-a-token") is None
+
+
+def test_logout_revokes_only_that_token():
+    manager = AuthManager()
+    first = manager.issue_token({"user_id": "u1", "user_name": "alice"})["token"]
+    second = manager.issue_token({"user_id": "u1", "user_name": "alice"})["token"]
+    assert manager.revoke_token(first)
+    assert manager.verify_token(first) is None
+    assert manager.verify_token(second) is not None
+
+
+def test_credential_cache_expires(monkeypatch):
+    user = _new_user()
+    manager = AuthManager(cache_ttl=30)
+    lookup, calls = _lookup_counter()
+    for _ in range(3):
+        assert manager.check_credentials(user["user_name"], "secret1", lookup)["user_id"] == user["user_id"]
+    assert len(calls) == 1
+
+    now = time.time()
+    monkeypatch.setattr(auth_token.time, "time", lambda: now + 31)
+    manager.check_credentials(user["user_name"], "secret1", lookup)
+    assert len(calls) == 2
+    # 失败结果不缓存
+    assert manager.check_credentials(user["user_name"], "wrong", lookup) is None
+    assert manager.check_credentials(user["user_name"], "wrong", lookup) is None
+    assert len(calls) == 4
+
+
+def test_permission_update_revokes_tokens_and_cached_credentials():
+    manager = get_auth_manager()
+    user = _new_user(permissions="reader")
+    other = _new_user(permissions="reader")
+    token = manager.issue_token(user)["token"]
+    other_token = manager.issue_token(other)["token"]
+    lookup, calls = _lookup_counter()
+    assert manager.check_credentials(user["user_name"], "secret1", lookup)["permissions"] == "reader"
+
+    assert cSingleSqlite.update_user_permissions(user["user_id"], "writer")
+    assert cSingleSqlite.query_user_permissions(user["user_id"]) == "writer"
+    assert manager.verify_token(token) is None
+    assert manager.verify_token(other_token) is not None
+    # 缓存已清除，重新读库得到新权限
+    assert manager.check_credentials(user["user_name"], "secret1", lookup)["permissions"] == "writer"
+    assert len(calls) == 2
+    # 重新登录签发的令牌有效
+    assert manager.verify_token(manager.issue_token({**user, "permissions": "writer"})["token"])["permissions"] == "writer"
+
+    assert not cSingleSqlite.update_user_permissions(f"user_{uuid.uuid4().hex}", "writer")
+
+
+def test_password_change_and_delete_revoke_tokens():
+    manager = get_auth_manager()
+    user = _new_user()
+    token = manager.issue_token(user)["token"]
+    assert cSingleSqlite.update_user_password(user["user_id"], "secret2")
+    assert manager.verify_token(token) is None
+
+    token = manager.issue_token(user)["token"]
+    assert cSingleSqlite.delete_user_by_user_id({"user_id": user["user_id"]})
+    assert manager.verify_token(token) is None
+    assert cSingleSqlite.query_user_permissions(user["user_id"]) is None
+
+
+@pytest.fixture
+def client():
+    run_server = pytest.importorskip("Servers.run_server")
+    return run_server.app.test_client()
+
+
+def test_update_permissions_route(client):
+    manager = get_auth_manager()
+    admin = _new_user(permissions="admin")
+    user = _new_user(permissions="reader")
+    user_token = manager.issue_token(user)["token"]
+
+    # 非管理员不能修改权限
+    response = client.post("/api/update_user_permissions",
+                           json={"target_user_id": admin["user_id"], "permissions": ""},
+                           headers={"Authorization": f"Bearer {user_token}"}).get_json()
+    assert not response["success"]
+    assert cSingleSqlite.query_user_permissions(admin["user_id"]) == "admin"
+
+    response = client.post("/api/update_user_permissions",
+                           json={"user_name": admin["user_name"], "password": "secret1",
+                                 "target_user_id": user["user_id"], "permissions": "writer"}).get_json()
+    assert response["success"]
+    assert cSingleSqlite.query_user_permissions(user["user_id"]) == "writer"
+    assert manager.verify_token(user_token) is None
+
+    # 管理员权限被撤销后，其仍未过期的令牌也不能再修改权限
+    admin_token = manager.issue_token(admin)["token"]
+    cSingleSqlite.conn.execute("UPDATE user_info SET permissions = '' WHERE user_id = ?", (admin["user_id"],))
+    response = client.post("/api/update_user_permissions",
+                           json={"target_user_id": user["user_id"], "permissions": "admin"},
+                           headers={"Authorization": f"Bearer {admin_token}"}).get_json()
+    assert not response["success"]
@@ -0,0 +1,169 @@
+# -*- coding:utf-8 -*-
+"""ES混合搜索：三路查询合并为一次msearch、msearch失败时并发执行、父文档mget去重与TTL缓存，以及写入删除后缓存失效"""
+
+import time
+
+import pytest
+
+elastic_db = pytest.importorskip("Db.elastic_db")
+
+from elastic_stub import FakeES, parent_docs
+
+
+@pytest.fixture
+def make_db(monkeypatch):
+    monkeypatch.setattr(elastic_db, "is_elasticsearch_enabled", lambda: False)
+
+    def make(es):
+        db = elastic_db.ElasticSearchDB()
+        db.enabled, db.es = True, es
+        db.create_index = lambda index_name, mappings=None: True
+        return db
+    return make
+
+
+def test_hybrid_search_uses_one_msearch_and_one_mget(make_db):
+    es = FakeES(docs=parent_docs(3))
+    results = make_db(es)._hybrid_search("idx", "kb", True, "年度报告", query_vector=[0.1, 0.2], size=5)
+
+    assert es.count("msearch") == 1 and es.count("search") == 0
+    searches = es.calls[0][1]
+    assert searches[0::2] == [{"index": "idx"}] * 3
+    assert [body.get("knn", {}).get("field") for body in searches[1::2]] == [None, "content_vector", "title_vector"]
+
+    # 5条结果只涉及3个父文档，一次 mget
+    assert es.count("mget") == 1
+    assert sorted(es.calls[1][1]) == ["kb_f0", "kb_f1", "kb_f2"]
+    assert len(results) == 5
+    for result in results:
+        parent = parent_docs(3)[result["_id"].split("_chunk_")[0]]
+        assert result["parent_title"] == parent["title"] and result["full_content_length"] == parent["full_content_length"]
+        assert "_rrf_score" in result
+
+
+def test_failed_vector_legs_fall_back_to_text(make_db):
+    es = FakeES(docs=parent_docs(3))
+    db = make_db(es)
+
+    def msearch(body):
+        es._request("msearch", body)
+        return {"responses": [es._hits(body[1]), {"error": "knn not supported"}, {"error": "knn not supported"}]}
+    es.msearch = msearch
+    results = db._hybrid_search("idx", "kb", False, "报告", query_vector=[0.1], size=3)
+    assert [result["_search_type"] for result in results] == ["text"] * 3
+    assert es.count("search") == 0
+
+
+def test_msearch_error_runs_legs_concurrently(make_db):
+    es = FakeES(latency=0.1, msearch_error=ConnectionError("timeout"), docs=parent_docs(3))
+    db = make_db(es)
+    start = time.perf_counter()
+    legs = db._multi_search("idx", [{"query": {}}, {"knn": {"field": "content_vector"}}, {"knn": {"field": "title_vector"}}])
+    elapsed = time.perf_counter() - start
+
+    assert [len(hits) for hits in legs] == [4, 4, 4]
+    assert es.count("search") == 3 and es.peak == 3
+    # msearch 本身耗时一次，三路查询并发再耗时一次
+    assert elapsed < 0.1 * 3
+    # 临时错误不关闭 msearch
+    assert db.msearch_supported
+    db._multi_search("idx", [{"query": {}}])
+    assert es.count("msearch") == 2
+
+
+def test_unsupported_msearch_is_skipped_afterwards(make_db):
+    error = Exception("bad request")
+    error.status_code = 400
+    es = FakeES(msearch_error=error)
+    db = make_db(es)
+    assert [len(hits) for hits in db._multi_search("idx", [{"query": {}}, {"query": {}}])] == [4, 4]
+    assert not db.msearch_supported
+
+    db._multi_search("idx", [{"query": {}}])
+    assert es.count("msearch") == 1 and es.count("search") == 3
+
+
+def test_failed_concurrent_leg_is_none(make_db):
+    es = FakeES(msearch_error=AttributeError("msearch"))
+    db = make_db(es)
+    search = es.search
+
+    def flaky(index, body):
+        if "knn" in body:
+            raise RuntimeError("knn failed")
+        return search(index, body)
+    es.search = flaky
+    legs = db._multi_search("idx", [{"query": {}}, {"knn": {"field": "content_vector"}}])
+    assert len(legs[0]) == 4 and legs[1] is None
+
+
+def test_parent_documents_deduplicated_and_cached(make_db):
+    es = FakeES(docs=parent_docs(3))
+    db = make_db(es)
+    ids = ["kb_f0_chunk_1", "kb_f0_chunk_2", "kb_f1_chunk_0", "kb_f1", "kb_missing_chunk_0"]
+    parents = db.get_parent_documents("idx", ids)
+    assert set(parents) == {"kb_f0", "kb_f1"}
+    assert es.calls == [("mget", ["kb_f0", "kb_f1", "kb_missing"])]
+
+    assert db.get_parent_documents("idx", ["kb_f0_chunk_9", "kb_f1_chunk_3"]) == parents
+    assert db.get_parent_document("idx", "kb_f0_chunk_5") == parent_docs(3)["kb_f0"]
+    assert es.count("mget") == 1
+    # 不存在的父文档不缓存，下次仍查询
+    db.get_parent_documents("idx", ["kb_missing_chunk_1"])
+    assert es.calls[-1] == ("mget", ["kb_missing"])
+    # 缓存按索引区分
+    db.get_parent_documents("other", ["kb_f0_chunk_1"])
+    assert es.calls[-1] == ("mget", ["kb_f0"])
+
+
+def test_parent_cache_expires(make_db, monkeypatch):
+    es = FakeES(docs=parent_docs(3))
+    db = make_db(es)
+    monkeypatch.setattr(elastic_db, "PARENT_CACHE_TTL", 0)
+    db.get_parent_documents("idx", ["kb_f0_chunk_1"])
+    db.get_parent_documents("idx", ["kb_f0_chunk_1"])
+    assert es.count("mget") == 2
+
+
+def test_parent_cache_evicts_least_recently_used(make_db, monkeypatch):
+    es = FakeES(docs=parent_docs(3))
+    db = make_db(es)
+    monkeypatch.setattr(elastic_db, "PARENT_CACHE_SIZE", 2)
+    for parent_id in ["kb_f0", "kb_f1", "kb_f0", "kb_f2"]:
+        db.get_parent_documents("idx", [parent_id])
+    assert list(db.parent_cache) == [("idx", "kb_f0"), ("idx", "kb_f2")]
+
+
+def test_bulk_index_invalidates_parent_cache(make_db):
+    es = FakeES(docs=parent_docs(3))
+    db = make_db(es)
+    db.get_parent_documents("idx", ["kb_f0", "kb_f1"])
+    es.docs["kb_f0"] = {"title": "新标题"}
+    assert db.bulk_index_documents("idx", [("kb_f0", {"title": "新标题"}), ("kb_f0_chunk_0", {"content": "x"})])
+
+    assert db.get_parent_document("idx", "kb_f0_chunk_0") == {"title": "新标题"}
+    assert es.calls[-1] == ("mget", ["kb_f0"])
+    # 未写入的父文档仍命中缓存
+    db.get_parent_document("idx", "kb_f1")
+    assert es.calls[-1] == ("mget", ["kb_f0"])
+
+
+def test_delete_invalidates_parent_cache(make_db):
+    es = FakeES(docs=parent_docs(3))
+    db = make_db(es)
+    db.get_parent_documents("idx", ["kb_f0", "kb_f1"])
+    db.get_parent_documents("other", ["kb_f2"])
+
+    es.docs.pop("kb_f0")
+    assert db.delete_document("idx", "kb_f0")
+    assert db.get_parent_document("idx", "kb_f0_chunk_0") is None
+    assert es.calls[-1] == ("mget", ["kb_f0"])
+
+    # 删除索引只清除该索引的缓存
+    es.indices.delete = lambda index: {"acknowledged": True}
+    assert db.delete_index("idx")
+    db.get_parent_documents("idx", ["kb_f1"])
+    assert es.calls[-1] == ("mget", ["kb_f1"])
+    mgets = es.count("mget")
+    db.get_parent_documents("other", ["kb_f2"])
+    assert es.count("mget") == mgets
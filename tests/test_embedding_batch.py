@@ -0,0 +1,124 @@
+# -*- coding:utf-8 -*-
+"""向量化请求：同步批量的打包与429重试、微批合并不增加单个请求的延迟、异步并发上限"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("aiohttp")
+
+from embedding_stub_server import EmbeddingStubServer
+from Config.embedding_config import EmbeddingConfig, EmbeddingsWrapper
+from Emb import embedding_batch
+from Emb.embedding_batch import MicroBatcher, pack_batches
+
+
+@pytest.fixture
+def stub():
+    server = EmbeddingStubServer(latency=0.02).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def make_embeddings(stub, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_API_KEY", "test")
+    monkeypatch.setenv("EMBEDDING_BASE_URL", stub.base_url)
+    monkeypatch.setenv("EMBEDDING_MODEL_ID", "stub")
+    monkeypatch.setenv("EMBEDDING_MODEL_NAME", "stub")
+    monkeypatch.setenv("EMBEDDING_VECTOR_LENGTH", str(stub.dimension))
+    monkeypatch.delenv("EMBEDDING_MICRO_BATCH_MS", raising=False)
+    # 重试等待缩短到毫秒级
+    monkeypatch.setattr(embedding_batch, "backoff_delay", lambda attempt, base=0.5, cap=10.0: 0.001)
+    monkeypatch.setattr("Config.embedding_config.backoff_delay", lambda attempt: 0.001)
+
+    def make(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        return EmbeddingsWrapper(EmbeddingConfig())
+    return make
+
+
+def test_micro_batching_off_by_default(make_embeddings):
+    assert make_embeddings().micro_batcher is None
+
+
+def test_embed_documents_packs_and_keeps_order(stub, make_embeddings):
+    embeddings = make_embeddings(EMBEDDING_BATCH_SIZE=4)
+    texts = [f"文本{i}" for i in range(10)] + ["", "  "]
+    result = embeddings.embed_documents(texts)
+    assert result == [stub.vector(f"文本{i}") for i in range(10)]
+    assert stub.requests == [4, 4, 2]
+
+
+def test_embed_documents_retries_rate_limit(stub, make_embeddings):
+    stub.fail_first = 2
+    embeddings = make_embeddings(EMBEDDING_MAX_RETRIES=3)
+    assert embeddings.embed_documents(["a", "b"]) == [stub.vector("a"), stub.vector("b")]
+    assert stub.failed == 2 and stub.requests == [2]
+
+
+def test_embed_documents_gives_up_after_max_retries(stub, make_embeddings):
+    stub.fail_first = 5
+    embeddings = make_embeddings(EMBEDDING_MAX_RETRIES=1)
+    with pytest.raises(Exception) as exc_info:
+        embeddings.embed_documents(["a"])
+    assert getattr(exc_info.value, "status_code", None) == 429
+    assert stub.failed == 2
+
+
+def test_embed_query_retries_rate_limit(stub, make_embeddings):
+    stub.fail_first = 1
+    assert make_embeddings().embed_query("问题") == stub.vector("问题")
+
+
+def test_single_micro_batched_query_is_not_delayed():
+    calls = []
+
+    def batch_fn(texts):
+        calls.append(list(texts))
+        return texts
+
+    batcher = MicroBatcher(batch_fn, window=0.5)
+    start = time.perf_counter()
+    assert batcher("q") == "q"
+    # 没有其他请求等待时不等待合并窗口
+    assert time.perf_counter() - start < 0.25
+    assert calls == [["q"]]
+
+
+def test_concurrent_queries_are_merged(stub, make_embeddings):
+    embeddings = make_embeddings(EMBEDDING_MICRO_BATCH_MS=20)
+    results = {}
+
+    def worker(i):
+        results[i] = embeddings.embed_query(f"问题{i}")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {i: stub.vector(f"问题{i}") for i in range(16)}
+    assert sum(stub.requests) == 16
+    assert len(stub.requests) < 16
+
+
+def test_aembed_documents_respects_concurrency_limit(stub, make_embeddings):
+    embeddings = make_embeddings(EMBEDDING_BATCH_SIZE=2, EMBEDDING_MAX_CONCURRENCY=3)
+    texts = [f"t{i}" for i in range(20)]
+    result = asyncio.run(embeddings.aembed_documents(texts))
+    assert result == [stub.vector(text) for text in texts]
+    assert len(stub.requests) == 10
+    assert stub.peak_active == 3
+
+
+def test_pack_batches_token_limit():
+    texts = ["中" * 30, "中" * 30, "中" * 30, "a"]
+    batches = pack_batches(texts, max_items=10, max_tokens=64)
+    assert batches == [[0, 1], [2, 3]]
+    # 单条超过上限时独占一批
+    assert pack_batches(["中" * 100, "a"], max_items=10, max_tokens=64) == [[0], [1]]
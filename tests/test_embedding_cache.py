@@ -0,0 +1,138 @@
+# -*- coding:utf-8 -*-
+"""Embedding缓存：内存LRU淘汰、SQLite磁盘缓存跨实例命中、批内去重、命中统计，以及多线程读写"""
+
+import threading
+
+import pytest
+
+from Emb.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings:
+    """按文本长度生成向量，记录每次请求的文本"""
+
+    model_name = "stub"
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _vector(self, text):
+        return [float(len(text)), 0.5, -1.0]
+
+    def embed_query(self, text):
+        with self.lock:
+            self.calls.append([text])
+        return self._vector(text)
+
+    def embed_documents(self, texts):
+        with self.lock:
+            self.calls.append(list(texts))
+        return [self._vector(text) for text in texts]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "cache" / "embedding_cache.sqlite")
+
+
+def test_lru_evicts_least_recently_used():
+    cache = EmbeddingCache("m", 3, max_size=2)
+    cache.put_many([("a", [1.0]), ("b", [2.0])])
+    assert cache.get_many(["a"]) == {"a": [1.0]}
+    cache.put_many([("c", [3.0])])
+
+    assert list(cache.memory) == ["a", "c"]
+    assert cache.get_many(["a", "b", "c"]) == {"a": [1.0], "c": [3.0]}
+    stats = cache.get_stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (3, 0, 1)
+    assert stats["memory_size"] == 2
+
+
+def test_key_depends_on_model_dimension_and_normalized_text():
+    cache = EmbeddingCache("m", 3)
+    assert cache.make_key("  你好\n 世界 ") == cache.make_key("你好 世界")
+    assert cache.make_key("你好") != EmbeddingCache("m", 4).make_key("你好")
+    assert cache.make_key("你好") != EmbeddingCache("other", 3).make_key("你好")
+
+
+def test_disk_tier_survives_new_instance(db_path):
+    first = EmbeddingCache("m", 3, db_path=db_path)
+    first.put_many([("a", [0.25, -1.5, 3.0])])
+
+    second = EmbeddingCache("m", 3, max_size=1, db_path=db_path)
+    assert second.get_many(["a", "b"]) == {"a": [0.25, -1.5, 3.0]}
+    # 磁盘命中后回填内存，第二次走内存
+    assert second.get_many(["a"]) == {"a": [0.25, -1.5, 3.0]}
+    stats = second.get_stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+
+    second.clear()
+    assert EmbeddingCache("m", 3, db_path=db_path).get_many(["a"]) == {}
+
+
+def test_disk_tier_large_batch(db_path):
+    cache = EmbeddingCache("m", 3, max_size=10, db_path=db_path)
+    cache.put_many([(str(i), [float(i)]) for i in range(1200)])
+    found = EmbeddingCache("m", 3, max_size=10, db_path=db_path).get_many([str(i) for i in range(1300)])
+    assert len(found) == 1200 and found["1199"] == [1199.0]
+
+
+def test_unwritable_disk_path_falls_back_to_memory(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("x")
+    cache = EmbeddingCache("m", 3, db_path=str(blocker / "cache.sqlite"))
+    assert not cache.disk_enabled
+    cache.put_many([("a", [1.0])])
+    assert cache.get_many(["a"]) == {"a": [1.0]}
+
+
+def test_batch_duplicates_requested_once(db_path):
+    inner = CountingEmbeddings()
+    embeddings = CachedEmbeddings(inner, EmbeddingCache("m", 3, db_path=db_path))
+
+    vectors = embeddings.embed_documents(["甲", "乙乙", " 甲 ", "", "乙乙", "丙丙丙"])
+    assert inner.calls == [["甲", "乙乙", "丙丙丙"]]
+    assert vectors == [inner._vector(text) for text in ["甲", "乙乙", "甲", "乙乙", "丙丙丙"]]
+
+    # 再次请求只发送未命中的文本
+    assert embeddings.embed_documents(["乙乙", "丁"]) == [inner._vector("乙乙"), inner._vector("丁")]
+    assert inner.calls[-1] == ["丁"]
+    assert embeddings.embed_query("甲") == inner._vector("甲")
+    assert len(inner.calls) == 2
+
+    stats = embeddings.get_cache_stats()
+    assert stats["batch_duplicates"] == 2
+    assert stats["misses"] == 4
+    assert stats["memory_hits"] == 2
+
+
+def test_embed_query_rejects_empty_text():
+    embeddings = CachedEmbeddings(CountingEmbeddings(), EmbeddingCache("m", 3))
+    with pytest.raises(ValueError):
+        embeddings.embed_query("  ")
+
+
+def test_concurrent_threads_share_disk_cache(db_path):
+    cache = EmbeddingCache("m", 3, max_size=50, db_path=db_path)
+    errors = []
+
+    def worker(n):
+        try:
+            for i in range(100):
+                key = f"{n}-{i}"
+                cache.put_many([(key, [float(i)])])
+                assert cache.get_many([key]) == {key: [float(i)]}
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    found = EmbeddingCache("m", 3, db_path=db_path).get_many([f"{n}-{i}" for n in range(8) for i in range(100)])
+    assert len(found) == 800
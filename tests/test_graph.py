@@ -0,0 +1,152 @@
+# -*- coding:utf-8 -*-
+"""表关系图：随机图上与改写前实现（逐次排序的Dijkstra、全排列求最优路线）结果一致，以及超过Held-Karp上限时近似路线的质量"""
+
+import itertools
+import random
+
+import pytest
+
+# Sql 包的 __init__ 导入向量库依赖
+graph = pytest.importorskip("Sql.Graph.graph")
+
+
+def _legacy_bfs(g, start_node, end_node):
+    queue = [[start_node]]
+    visited = {start_node}
+    while queue:
+        path = queue.pop(0)
+        if path[-1] == end_node:
+            return path
+        for neighbor_info in g.edges.get(path[-1], []):
+            if neighbor_info["node"] not in visited:
+                visited.add(neighbor_info["node"])
+                queue.append(path + [neighbor_info["node"]])
+    return None
+
+
+def _legacy_dijkstra(g, start_node, end_node):
+    """改写前的实现：每轮对优先队列整体排序，返回路径总权重"""
+    distances = {node: float("inf") for node in g.nodes}
+    distances[start_node] = 0
+    priority_queue = [(0, start_node)]
+    while priority_queue:
+        priority_queue.sort()
+        current_distance, current_node = priority_queue.pop(0)
+        if current_distance > distances[current_node]:
+            continue
+        if current_node == end_node:
+            return current_distance
+        for neighbor_info in g.edges.get(current_node, []):
+            distance = current_distance + neighbor_info["weight"]
+            if distance < distances[neighbor_info["node"]]:
+                distances[neighbor_info["node"]] = distance
+                priority_queue.append((distance, neighbor_info["node"]))
+    return None
+
+
+def _legacy_optimal(g, nodes_to_visit):
+    """改写前的实现：枚举必经节点的全部排列"""
+    best = None
+    for permutation in itertools.permutations(nodes_to_visit):
+        segments = [_legacy_dijkstra(g, a, b) for a, b in zip(permutation, permutation[1:])]
+        if None not in segments and (best is None or sum(segments) < best):
+            best = sum(segments)
+    return best
+
+
+def _random_graph(seed, n, connected=True, integer_weights=True):
+    rng = random.Random(seed)
+    names = [f"T{i:02d}" for i in range(n)]
+    pairs = set()
+    for i in range(1, n):
+        if connected or rng.random() < 0.7:
+            pairs.add((names[rng.randrange(i)], names[i]))
+    for _ in range(rng.randint(0, n)):
+        a, b = rng.sample(names, 2)
+        if (b, a) not in pairs:
+            pairs.add((a, b))
+    edges = [(a, b, rng.randint(1, 5) if integer_weights else round(rng.uniform(0.5, 5), 3)) for a, b in sorted(pairs)]
+    rng.shuffle(edges)
+
+    g = graph.Graph()
+    for name in names:
+        g.add_node(name)
+    for a, b, w in edges:
+        g.add_edge(a, b, w, f"{a}-{b}")
+    return g, names
+
+
+def _total(path):
+    return sum(step["weight"] for step in path)
+
+
+def _assert_walk(g, path, required):
+    for step, next_step in zip(path, path[1:]):
+        assert step["to"] == next_step["from"]
+    for step in path:
+        assert any(edge["node"] == step["to"] and edge["weight"] == step["weight"] for edge in g.edges[step["from"]])
+    assert set(required) <= {path[0]["from"]} | {step["to"] for step in path}
+
+
+def test_shortest_paths_match_legacy():
+    for seed in range(150):
+        g, names = _random_graph(seed, random.Random(seed).randint(2, 9), connected=seed % 4 != 0,
+                                 integer_weights=seed % 2 == 0)
+        for a in names:
+            for b in names:
+                assert g.bfs(a, b) == _legacy_bfs(g, a, b)
+                path = g.dijkstra(a, b)
+                expected = _legacy_dijkstra(g, a, b)
+                if expected is None:
+                    assert path is None
+                else:
+                    assert abs(_total(path) - expected) < 1e-9
+                    if path:
+                        _assert_walk(g, path, [a, b])
+
+
+def test_optimal_route_matches_legacy():
+    for seed in range(150):
+        rng = random.Random(10000 + seed)
+        n = rng.randint(2, 9)
+        g, names = _random_graph(seed, n, connected=seed % 4 != 0, integer_weights=seed % 2 == 0)
+        required = rng.sample(names, rng.randint(2, min(n, 6)))
+        path = g.find_optimal_path_for_nodes(required)
+        expected = _legacy_optimal(g, required)
+        if expected is None:
+            assert path is None
+        else:
+            assert abs(_total(path) - expected) < 1e-9
+            _assert_walk(g, path, required)
+
+
+def test_greedy_paths_cover_required_nodes():
+    for seed in range(100):
+        rng = random.Random(seed)
+        g, names = _random_graph(seed, rng.randint(2, 12), connected=seed % 3 != 0)
+        required = rng.sample(names, rng.randint(1, len(names)))
+        paths = g.find_paths_for_nodes(required)
+        assert set(required) <= {node for path in paths for node in path}
+        for path in paths:
+            for a, b in zip(path, path[1:]):
+                assert any(edge["node"] == b for edge in g.edges[a])
+
+
+def test_mst_order_within_twice_optimal(monkeypatch):
+    for seed in range(20):
+        g, names = _random_graph(seed, 40)
+        required = random.Random(seed).sample(names, 10)
+        exact = _total(g.find_optimal_path_for_nodes(required))
+        monkeypatch.setattr(graph, "HELD_KARP_MAX_NODES", 0)
+        approx = g.find_optimal_path_for_nodes(required)
+        monkeypatch.undo()
+        _assert_walk(g, approx, required)
+        assert exact - 1e-9 <= _total(approx) <= 2 * exact + 1e-9
+
+
+def test_index_rebuilt_after_new_edge():
+    g, _ = _random_graph(0, 2)
+    g.add_node("X")
+    assert g.dijkstra("T00", "X") is None
+    g.add_edge("T01", "X", 1, "T01-X")
+    assert g.dijkstra("T00", "X")[-1]["to"] == "X"
@@ -0,0 +1,219 @@
+# -*- coding:utf-8 -*-
+"""图检索chunk批量回填：IN查询按500个分批、chunk_id去重、LRU缓存在写入删除时失效，UNWIND合并查询后graph_data结构不变，以及批量回填与逐个查询的延迟对比"""
+
+import random
+import time
+import uuid
+
+import pytest
+
+from Db import sqlite_db
+from Db.sqlite_db import GRAPH_CHUNK_QUERY_BATCH, cSingleSqlite
+
+
+def _chunks(knowledge_id, n, file_id="f1"):
+    return [{"knowledge_id": knowledge_id, "file_id": file_id, "chunk_id": f"chunk-{i}",
+             "chunk_summary": f"标题{i}", "chunk_text": f"正文{i}", "file_name": "a.txt"} for i in range(n)]
+
+
+@pytest.fixture
+def knowledge_id():
+    return f"kb_{uuid.uuid4().hex}"
+
+
+@pytest.fixture
+def selects():
+    """记录当前线程连接上执行的graph_chunk查询"""
+    executed = []
+    conn = cSingleSqlite.get_thread_connection()
+    conn.set_trace_callback(lambda sql: executed.append(sql) if "FROM graph_chunk" in sql else None)
+    yield executed
+    conn.set_trace_callback(None)
+
+
+def test_ids_are_queried_in_batches(knowledge_id, selects):
+    n = GRAPH_CHUNK_QUERY_BATCH * 2 + 37
+    cSingleSqlite.insert_graph_chunk_batch(_chunks(knowledge_id, n))
+    ids = [f"chunk-{i}" for i in range(n)] + ["missing"]
+    result = cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ids)
+
+    assert len(selects) == 3
+    assert all(sql.count("'chunk-") <= GRAPH_CHUNK_QUERY_BATCH for sql in selects)
+    assert set(result) == set(ids) - {"missing"}
+    assert result["chunk-7"] == [{"knowledge_id": knowledge_id, "file_id": "f1", "chunk_id": "chunk-7",
+                                  "chunk_summary": "标题7", "chunk_text": "正文7", "file_name": "a.txt"}]
+
+
+def test_duplicate_ids_are_queried_once(knowledge_id, selects):
+    cSingleSqlite.insert_graph_chunk_batch(_chunks(knowledge_id, 3))
+    result = cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-1", "chunk-2", "chunk-1", "chunk-1"])
+    assert list(result) == ["chunk-1", "chunk-2"]
+    assert len(selects) == 1 and selects[0].count("'chunk-1'") == 1
+
+
+def test_other_knowledge_bases_are_not_returned(knowledge_id):
+    cSingleSqlite.insert_graph_chunk_batch(_chunks(knowledge_id, 2))
+    assert cSingleSqlite.query_graph_chunks_by_ids(f"kb_{uuid.uuid4().hex}", ["chunk-0", "chunk-1"]) == {}
+
+
+def test_cache_hits_skip_sqlite(knowledge_id, selects):
+    cSingleSqlite.insert_graph_chunk_batch(_chunks(knowledge_id, 4))
+    first = cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-0", "chunk-1"])
+    assert len(selects) == 1
+    assert cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-1", "chunk-0"]) == first
+    assert len(selects) == 1
+    # 只查询未命中的部分
+    cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-0", "chunk-3"])
+    assert len(selects) == 2 and "'chunk-0'" not in selects[1]
+
+
+def test_cache_invalidated_on_insert(knowledge_id):
+    cSingleSqlite.insert_graph_chunk_batch(_chunks(knowledge_id, 2))
+    assert len(cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-0"])["chunk-0"]) == 1
+
+    # 同一chunk_id的另一条记录（另一个文件）写入后应可见
+    cSingleSqlite.insert_graph_chunk(_chunks(knowledge_id, 1, file_id="f2")[0])
+    chunks = cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-0"])["chunk-0"]
+    assert sorted(chunk["file_id"] for chunk in chunks) == ["f1", "f2"]
+
+    cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-0"])
+    cSingleSqlite.insert_graph_chunk_batch(_chunks(knowledge_id, 1, file_id="f3"))
+    assert len(cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-0"])["chunk-0"]) == 3
+
+
+def test_cache_invalidated_on_delete(knowledge_id):
+    file_id = f"file_{uuid.uuid4().hex}"
+    cSingleSqlite.insert_graph_chunk_batch(_chunks(knowledge_id, 2, file_id=file_id))
+    assert set(cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-0", "chunk-1"])) == {"chunk-0", "chunk-1"}
+    cSingleSqlite.delete_graph_chunk_table(file_id)
+    assert cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-0", "chunk-1"]) == {}
+
+    cSingleSqlite.insert_graph_chunk_batch(_chunks(knowledge_id, 2))
+    assert cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-0"])
+    cSingleSqlite.delete_graph_chunk_by_knowledge_id({"knowledge_id": knowledge_id})
+    assert cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-0"]) == {}
+
+
+def test_cache_evicts_least_recently_used(knowledge_id, monkeypatch, selects):
+    monkeypatch.setattr(sqlite_db, "GRAPH_CHUNK_CACHE_SIZE", 2)
+    cSingleSqlite.clear_graph_chunk_cache()
+    cSingleSqlite.insert_graph_chunk_batch(_chunks(knowledge_id, 3))
+    cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-0"])
+    cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-1"])
+    cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-0"])
+    cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-2"])
+    assert len(cSingleSqlite.graph_chunk_cache) == 2
+    del selects[:]
+    cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-0", "chunk-2"])
+    assert selects == []
+    cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-1"])
+    assert len(selects) == 1
+
+
+def test_bulk_hydration_faster_than_per_id_queries(knowledge_id):
+    """合成图：2万个chunk，每个结点引用1~3个chunk，对比一次批量回填与改写前逐个source_id查询"""
+    cSingleSqlite.insert_graph_chunk_batch(_chunks(knowledge_id, 20000))
+    rng = random.Random(0)
+    source_ids = ["<SEP>".join(f"chunk-{rng.randrange(20000)}" for _ in range(rng.randint(1, 3))) for _ in range(600)]
+    chunk_ids = [chunk_id for source_id in source_ids for chunk_id in source_id.split("<SEP>")]
+
+    start = time.perf_counter()
+    for chunk_id in chunk_ids:
+        cSingleSqlite.query_graph_chunk_by_chunk_id_and_knowledge_id({"chunk_id": chunk_id, "knowledge_id": knowledge_id})
+    per_id = time.perf_counter() - start
+
+    cSingleSqlite.clear_graph_chunk_cache()
+    start = time.perf_counter()
+    result = cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, chunk_ids)
+    bulk = time.perf_counter() - start
+    assert set(result) == set(chunk_ids)
+    assert bulk < per_id
+
+    start = time.perf_counter()
+    cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, chunk_ids)
+    assert time.perf_counter() - start < bulk
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [1.0, float(len(text))]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+class FakeGraph:
+    """按 UNWIND 参数返回各实体的关系，记录执行的查询"""
+
+    def __init__(self, edges):
+        self.edges = edges
+        self.queries = []
+
+    def execute_query(self, param):
+        self.queries.append(param)
+        rows = []
+        for name in param["parameters"]["names"]:
+            for relation, end_name, source_id in self.edges.get(name, []):
+                rows.append({"name": name,
+                             "start_node": {"entity_id": name, "entity_type": "ORG", "description": f"{name}描述",
+                                            "file_path": "a.txt", "source_id": "chunk-0<SEP>chunk-1", "created_at": 1},
+                             "relation": {"description": relation, "keywords": "k", "file_path": "a.txt",
+                                          "source_id": source_id, "weight": 2.0},
+                             "end_node": {"entity_id": end_name, "entity_type": "PERSON", "description": "",
+                                          "file_path": "a.txt", "source_id": source_id}})
+        return rows
+
+
+@pytest.fixture
+def control_search(monkeypatch):
+    module = pytest.importorskip("Control.control_search")
+    from Config import neo4j_config
+    monkeypatch.setattr(neo4j_config, "is_neo4j_enabled", lambda: True)
+    monkeypatch.setattr(module.entity_relation_split_run, "entity_relation_split_run",
+                        lambda query: {"decomposed_query": {"entities": ["北京大学", "清华大学"], "keywords": []}})
+    monkeypatch.setattr(module.cSingleEmb, "embeddings", FakeEmbeddings(), raising=False)
+    # 候选实体排序不在本测试范围内
+    monkeypatch.setattr(module.utils, "cos_sim", lambda a, b: 1.0)
+    return module
+
+
+def test_unwind_query_keeps_graph_data_shape(control_search, knowledge_id, monkeypatch):
+    cSingleSqlite.insert_graph_chunk_batch(_chunks(knowledge_id, 3))
+    monkeypatch.setattr(control_search.cSingleSqlite, "query_graph_node_by_node_name",
+                        lambda param: [{"entity_name": param["entity_name"]}])
+    graph = FakeGraph({"北京大学": [("位于", "海淀区", "chunk-2"), ("校长", "某人", "chunk-2<SEP>missing")],
+                       "清华大学": [("位于", "海淀区", "chunk-1")]})
+    controller = control_search.CControl.__new__(control_search.CControl)
+    controller.graph_obj = graph
+    controller.check_knowledge_and_user = lambda knowledge_id, user_id: True
+
+    result = controller.query_graph_neo4j({"query": "北京大学和清华大学", "knowledge_id": knowledge_id, "user_id": "u"})
+    assert len(graph.queries) == 1
+    assert graph.queries[0]["parameters"] == {"names": ["北京大学", "清华大学"]}
+    assert "UNWIND $names" in graph.queries[0]["cypher_query"]
+
+    assert result["error_code"] == 0
+    data = result["data"]
+    assert [len(group) for group in data] == [2, 1]
+    first = data[0][0]
+    assert first["start_node"] == {"entity_name": "北京大学", "entity_type": "ORG", "description": "北京大学描述",
+                                   "file": "a.txt", "chunks": ["正文0", "正文1"], "titles": ["标题0", "标题1"]}
+    assert first["relation"] == {"description": "位于", "keywords": "k", "file_path": "a.txt", "weight": 2.0}
+    assert first["end_node"]["entity_name"] == "海淀区" and first["end_node"]["chunks"] == ["正文2"]
+    assert data[0][1]["end_node"]["chunks"] == ["正文2"]
+    assert data[1][0]["start_node"]["entity_name"] == "清华大学"
+    assert control_search.CControl.query_graph_neo4j(
+        controller, {"query": "x", "knowledge_id": knowledge_id, "user_id": "u"}, merge_result=True) == data
+
+
+def test_public_only_query_filters_permission(control_search, knowledge_id, monkeypatch):
+    monkeypatch.setattr(control_search.cSingleSqlite, "query_graph_node_by_node_name_public",
+                        lambda param: [{"entity_name": param["entity_name"]}])
+    graph = FakeGraph({})
+    controller = control_search.CControl.__new__(control_search.CControl)
+    controller.graph_obj = graph
+    controller.check_knowledge_and_user = lambda knowledge_id, user_id: False
+
+    result = controller.query_graph_neo4j({"query": "北京大学", "knowledge_id": knowledge_id, "user_id": "u"})
+    assert result == {"error_code": 0, "error_msg": "Success", "data": []}
+    assert "permission_level: 'public'" in graph.queries[0]["cypher_query"]
@@ -0,0 +1,122 @@
+# -*- coding:utf-8 -*-
+"""结点名称检索：3个字符以上走FTS5 trigram索引、更短时退回LIKE、参数化查询，以及graph_node增加主键后VACUUM不影响全文索引"""
+
+import sqlite3
+import uuid
+
+import pytest
+
+from Db.sqlite_db import GRAPH_NODE_FTS_MIN_LENGTH, KnowledgeBaseDB, cSingleSqlite
+
+pytestmark = pytest.mark.skipif(not cSingleSqlite.has_graph_node_fts(), reason="当前SQLite不支持FTS5 trigram")
+
+NAMES = ["北京市海淀区", "北京大学", "南京大学", "上海交通大学", "海淀公园", "Beijing Normal University"]
+
+
+def _node(knowledge_id, name, file_id="f"):
+    return {"entity_id": uuid.uuid4().hex, "knowledge_id": knowledge_id, "file_id": file_id, "entity_name": name,
+            "entity_type": "ORG", "source_id": "c1", "entity_description": "", "entity_source_file": ""}
+
+
+@pytest.fixture
+def knowledge_id():
+    knowledge_id = f"kb_{uuid.uuid4().hex}"
+    assert cSingleSqlite.insert_node_info_batch([_node(knowledge_id, name) for name in NAMES])
+    # 其他知识库的同名结点不应返回
+    cSingleSqlite.insert_node_info_batch([_node(f"kb_{uuid.uuid4().hex}", name) for name in NAMES])
+    return knowledge_id
+
+
+@pytest.fixture
+def statements():
+    """记录当前线程连接上执行的SQL"""
+    executed = []
+    conn = cSingleSqlite.get_thread_connection()
+    conn.set_trace_callback(executed.append)
+    yield executed
+    conn.set_trace_callback(None)
+
+
+def _search(knowledge_id, name, **kwargs):
+    return [row["entity_name"] for row in
+            cSingleSqlite.query_graph_node_by_node_name({"knowledge_id": knowledge_id, "entity_name": name, **kwargs})]
+
+
+def test_long_names_use_fts(knowledge_id, statements):
+    assert sorted(_search(knowledge_id, "京大学")) == ["北京大学", "南京大学"]
+    assert _search(knowledge_id, "normal univ") == ["Beijing Normal University"]
+    assert _search(knowledge_id, "交通大学", limit=1) == ["上海交通大学"]
+    assert any("graph_node_fts MATCH" in sql for sql in statements)
+    assert not any("LIKE" in sql for sql in statements)
+
+
+def test_short_names_fall_back_to_like(knowledge_id, statements):
+    assert len("海淀") < GRAPH_NODE_FTS_MIN_LENGTH
+    # LIKE按名称长度排序
+    assert _search(knowledge_id, "海淀") == ["海淀公园", "北京市海淀区"]
+    assert _search(knowledge_id, "大学", limit=2) == ["北京大学", "南京大学"]
+    assert any("LIKE" in sql for sql in statements)
+    assert not any("MATCH" in sql for sql in statements)
+
+
+def test_names_are_parameterized(knowledge_id):
+    assert _search(knowledge_id, "' OR '1'='1") == []
+    assert _search(knowledge_id, '北京"大学') == []
+    assert _search(knowledge_id, "%") == [] and _search(knowledge_id, "_") == []
+    assert _search(knowledge_id, "   ") == []
+
+
+def test_public_only_filters_by_file_permission():
+    knowledge_id = f"kb_{uuid.uuid4().hex}"
+    public_file, private_file = f"file_{uuid.uuid4().hex}", f"file_{uuid.uuid4().hex}"
+    for file_id, permission in ((public_file, "public"), (private_file, "private")):
+        cSingleSqlite.insert_file_basic_info({"knowledge_id": knowledge_id, "file_id": file_id, "file_name": file_id,
+                                              "file_path": "", "file_size": 0, "upload_time": "", "upload_user_id": "u",
+                                              "permission_level": permission})
+    cSingleSqlite.insert_node_info_batch([_node(knowledge_id, "公开的实体名称", public_file),
+                                          _node(knowledge_id, "私有的实体名称", private_file)])
+    for name in ("实体名称", "实体"):
+        rows = cSingleSqlite.query_graph_node_by_node_name_public({"knowledge_id": knowledge_id, "entity_name": name})
+        assert [row["entity_name"] for row in rows] == ["公开的实体名称"]
+
+
+def test_index_follows_updates_and_deletes(knowledge_id):
+    cSingleSqlite.conn.execute("UPDATE graph_node SET entity_name = '清华大学' WHERE knowledge_id = ? AND entity_name = '北京大学'",
+                               (knowledge_id,))
+    assert _search(knowledge_id, "北京大学") == []
+    assert _search(knowledge_id, "清华大学") == ["清华大学"]
+    cSingleSqlite.delete_graph_node_by_knowledge_id({"knowledge_id": knowledge_id})
+    assert _search(knowledge_id, "京大学") == []
+
+
+OLD_GRAPH_NODE = '''CREATE TABLE graph_node (entity_id TEXT NOT NULL, knowledge_id TEXT NOT NULL, file_id TEXT NOT NULL,
+                    entity_name TEXT NOT NULL, entity_type TEXT NOT NULL, source_id TEXT,
+                    entity_description TEXT, entity_source_file TEXT);'''
+
+
+def test_upgrade_keeps_fts_valid_after_vacuum(tmp_path, monkeypatch):
+    # v4之前的数据库：graph_node没有INTEGER主键，已建立全文索引
+    (tmp_path / "conf" / "sqlite").mkdir(parents=True)
+    conn = sqlite3.connect(tmp_path / "conf" / "sqlite" / "knowledge_base.sqlite")
+    conn.execute(OLD_GRAPH_NODE)
+    conn.execute("CREATE TABLE schema_version (version INTEGER PRIMARY KEY, description TEXT, applied_time TEXT);")
+    conn.executemany("INSERT INTO graph_node VALUES (?, 'kb', 'f', ?, 'ORG', '', '', '');",
+                     [(f"e{i}", f"实体{i:04d}号") for i in range(300)])
+    conn.commit()
+    conn.close()
+    monkeypatch.chdir(tmp_path)
+    db = KnowledgeBaseDB()
+
+    c = db.conn.cursor()
+    c.execute("PRAGMA table_info(graph_node);")
+    assert "node_id" in [row[1] for row in c.fetchall()]
+    assert db.get_schema_version() == db.get_migrations()[-1][0]
+    assert [row["entity_id"] for row in db.query_graph_node_by_node_name({"knowledge_id": "kb", "entity_name": "实体0150号"})] == ["e150"]
+
+    # 删除前面的行后VACUUM：没有INTEGER主键时rowid会被重新编号
+    db.conn.execute("DELETE FROM graph_node WHERE entity_id IN ('e0', 'e1', 'e2', 'e3', 'e4');")
+    db.get_thread_connection().execute("VACUUM;")
+    for i in (5, 150, 299):
+        rows = db.query_graph_node_by_node_name({"knowledge_id": "kb", "entity_name": f"实体{i:04d}号"})
+        assert [row["entity_id"] for row in rows] == [f"e{i}"]
+    c.execute("INSERT INTO graph_node_fts(graph_node_fts) VALUES ('integrity-check');")
@@ -0,0 +1,139 @@
+# -*- coding:utf-8 -*-
+"""图谱批量入库：SQLite结点/关系/chunk表的批量写入与事务回滚，Neo4j按UNWIND分批写入，save_graph的往返次数与写入行数"""
+
+import math
+import sqlite3
+import uuid
+
+import pytest
+
+from Db.sqlite_db import cSingleSqlite
+from neo4j_stub import FakeNeo4jGraph, SyntheticGraph
+
+
+def _count(table, knowledge_id):
+    c = cSingleSqlite.conn.cursor()
+    c.execute(f"SELECT COUNT(*) FROM {table} WHERE knowledge_id = ?;", (knowledge_id,))
+    return c.fetchone()[0]
+
+
+@pytest.fixture
+def knowledge_id():
+    return f"kb_{uuid.uuid4().hex}"
+
+
+def _nodes(knowledge_id, n):
+    return [{"entity_id": f"e{i}", "knowledge_id": knowledge_id, "file_id": "f1", "entity_name": f"实体{i}",
+             "entity_type": "ORG", "source_id": "c1", "entity_description": f"描述{i}", "entity_source_file": "a.txt"}
+            for i in range(n)]
+
+
+def _relations(knowledge_id, n):
+    return [{"knowledge_id": knowledge_id, "file_id": "f1", "file_name": "a.txt", "relation_source_id": "c1",
+             "relation_type": "RELATED_TO", "start_node": f"实体{i}", "end_node": f"实体{i + 1}", "weight": 2.5,
+             "description": f"关系{i}", "keywords": "k"} for i in range(n)]
+
+
+def test_insert_node_info_batch(knowledge_id):
+    assert cSingleSqlite.insert_node_info_batch(_nodes(knowledge_id, 300))
+    assert _count("graph_node", knowledge_id) == 300
+    c = cSingleSqlite.conn.cursor()
+    c.execute("SELECT entity_id, entity_name, entity_type, entity_description FROM graph_node "
+              "WHERE knowledge_id = ? AND entity_id = 'e7';", (knowledge_id,))
+    assert c.fetchone() == ("e7", "实体7", "ORG", "描述7")
+    assert cSingleSqlite.insert_node_info_batch([])
+
+
+def test_insert_graph_relation_batch_keeps_weight(knowledge_id):
+    assert cSingleSqlite.insert_graph_relation_batch(_relations(knowledge_id, 200))
+    assert _count("graph_relation", knowledge_id) == 200
+    c = cSingleSqlite.conn.cursor()
+    c.execute("SELECT start_node, end_node, weight, relation_type FROM graph_relation "
+              "WHERE knowledge_id = ? AND description = '关系3';", (knowledge_id,))
+    assert c.fetchone() == ("实体3", "实体4", 2.5, "RELATED_TO")
+
+
+def test_insert_graph_chunk_batch(knowledge_id):
+    chunks = [{"knowledge_id": knowledge_id, "file_id": "f1", "chunk_id": f"chunk-{i}", "chunk_summary": "标题",
+               "chunk_text": f"正文{i}", "file_name": "a.txt"} for i in range(50)]
+    assert cSingleSqlite.insert_graph_chunk_batch(chunks)
+    assert _count("graph_chunk", knowledge_id) == 50
+    assert cSingleSqlite.query_graph_chunks_by_ids(knowledge_id, ["chunk-9"])["chunk-9"][0]["chunk_text"] == "正文9"
+
+
+def test_batches_roll_back_together(knowledge_id, monkeypatch):
+    """save_graph 在一个事务中写结点与关系，关系写入失败时结点也不保留"""
+    def broken(params):
+        cSingleSqlite.conn.cursor().execute("INSERT INTO no_such_table VALUES (1);")
+    monkeypatch.setattr(cSingleSqlite, "insert_graph_relation_batch", broken)
+    with pytest.raises(sqlite3.DatabaseError):
+        with cSingleSqlite.transaction():
+            assert cSingleSqlite.insert_node_info_batch(_nodes(knowledge_id, 10))
+            cSingleSqlite.insert_graph_relation_batch(_relations(knowledge_id, 10))
+    assert _count("graph_node", knowledge_id) == 0
+
+
+@pytest.fixture
+def neo4j(monkeypatch):
+    neo4j_db = pytest.importorskip("Db.neo4j_db")
+    fake = FakeNeo4jGraph()
+    monkeypatch.setattr(neo4j_db.cSingleNeo4j, "enabled", True)
+    monkeypatch.setattr(neo4j_db.cSingleNeo4j, "graph", fake)
+    return fake
+
+
+@pytest.mark.parametrize("n, batch_size", [(0, 100), (1, 100), (100, 100), (250, 100)])
+def test_run_batches_one_request_per_batch(neo4j, n, batch_size):
+    from Db.neo4j_db import cSingleNeo4j
+    rows = [{"entity_id": str(i)} for i in range(n)]
+    assert cSingleNeo4j.run_batches("UNWIND $rows AS r MERGE (n {entity_id: r.entity_id})", rows, batch_size) == math.ceil(n / batch_size)
+    assert [count for _, count in neo4j.runs] == [min(batch_size, n - i) for i in range(0, n, batch_size)]
+
+
+def test_run_batches_disabled(neo4j, monkeypatch):
+    from Db.neo4j_db import cSingleNeo4j
+    monkeypatch.setattr(cSingleNeo4j, "enabled", False)
+    assert cSingleNeo4j.run_batches("UNWIND $rows AS r RETURN r", [{}]) == 0
+    assert neo4j.runs == []
+
+
+@pytest.fixture
+def control_graph(neo4j, monkeypatch):
+    module = pytest.importorskip("Control.control_graph")
+    monkeypatch.setattr(module, "is_neo4j_enabled", lambda: True)
+    monkeypatch.setattr(module, "BATCH_SIZE_NODES", 100)
+    monkeypatch.setattr(module, "BATCH_SIZE_EDGES", 100)
+    return module
+
+
+def _save(control_graph, monkeypatch, graph, knowledge_id):
+    monkeypatch.setattr(control_graph.read_graph, "run_importer", lambda path: graph)
+    controller = control_graph.CControl.__new__(control_graph.CControl)
+    return controller.save_graph("/tmp/graph", knowledge_id, "f1", "a.txt", "public")
+
+
+def test_save_graph_round_trips(control_graph, neo4j, monkeypatch, knowledge_id):
+    graph = SyntheticGraph(350, 1200, rel_types=("RELATED_TO", "PART_OF", "a`b"))
+    assert _save(control_graph, monkeypatch, graph, knowledge_id)
+
+    # 1次建索引 + 结点4批 + 三种关系各4批
+    assert neo4j.round_trips == 1 + 4 + 3 * 4
+    assert neo4j.written_rows("MERGE (n:Entity") == 350
+    assert neo4j.written_rows("MERGE (a)-[rel:") == 1200
+    assert any("`a``b`" in cypher_query for cypher_query, _ in neo4j.runs)
+    assert _count("graph_node", knowledge_id) == 350
+    assert _count("graph_relation", knowledge_id) == 1200
+
+
+def test_save_graph_skips_dangling_edges(control_graph, neo4j, monkeypatch, knowledge_id):
+    graph = SyntheticGraph(10, 20, rel_types=())
+    graph._edges.append(("实体0", "不存在", {"description": "悬空"}))
+    assert _save(control_graph, monkeypatch, graph, knowledge_id)
+    assert neo4j.written_rows("MERGE (a)-[rel:`RELATED_TO`]") == 20
+    assert _count("graph_relation", knowledge_id) == 20
+
+
+def test_save_graph_disabled(control_graph, neo4j, monkeypatch, knowledge_id):
+    monkeypatch.setattr(control_graph, "is_neo4j_enabled", lambda: False)
+    assert _save(control_graph, monkeypatch, SyntheticGraph(5, 5), knowledge_id) is None
+    assert neo4j.runs == [] and _count("graph_node", knowledge_id) == 0
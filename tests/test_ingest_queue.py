@@ -0,0 +1,161 @@
+# -*- coding:utf-8 -*-
+"""入库队列：重启后的部分数据清理、重复文件检查、失败重试退避与从未完成阶段继续，以及多线程吞吐"""
+
+import threading
+import time
+import uuid
+
+import pytest
+
+from Control.control_ingest import CControl as ControlIngest
+from Db.sqlite_db import cSingleSqlite
+
+
+def _wait_for(predicate, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def ingest():
+    ingest_obj = ControlIngest()
+    ingest_obj.poll_interval = 0.05
+    yield ingest_obj
+    ingest_obj.stop(timeout=5)
+
+
+def test_requeued_job_cleans_up_started_stage(ingest):
+    """进程重启后重新排队的任务 retries 仍为0，已开始但未完成的阶段也要先清理"""
+    user_id = f"user_{uuid.uuid4().hex}"
+    job_id = f"job_{uuid.uuid4().hex}"
+    assert cSingleSqlite.insert_ingest_job({"job_id": job_id, "knowledge_id": "kb", "file_id": "f",
+                                            "user_id": user_id, "payload": {"file_path": "a.txt"}})
+    # 模拟上次进程在parsing阶段中途退出
+    cSingleSqlite.update_ingest_job(job_id, status="parsing",
+                                    context={"started_stages": ["parsing"]})
+
+    seen = {}
+
+    def handler(job):
+        seen[job["job_id"]] = (job["retries"], ingest.stage_started(job, "parsing"),
+                               ingest.stage_started(job, "embedding"))
+        ingest.enter_stage(job, "parsing")
+        ingest.complete_stage(job, "parsing")
+        return {"error_code": 0}
+
+    ingest.start(handler)
+    assert _wait_for(lambda: job_id in seen)
+    assert seen[job_id] == (0, True, False)
+    assert _wait_for(lambda: ingest.get_job(job_id)["status"] == "done")
+
+
+def test_active_job_blocks_duplicate_file(ingest):
+    """文件信息在异步解析时才写入，排队中的同名文件也视为已存在"""
+    user_id = f"user_{uuid.uuid4().hex}"
+    assert not ingest.has_active_file(user_id, "report.pdf")
+    job_id = ingest.submit({"knowledge_id": "kb", "file_id": "f1", "user_id": user_id,
+                            "file_path": "conf/file/f1/report.pdf"})
+    assert job_id
+    assert ingest.has_active_file(user_id, "report.pdf")
+    assert not ingest.has_active_file(user_id, "other.pdf")
+    assert not ingest.has_active_file(f"user_{uuid.uuid4().hex}", "report.pdf")
+    cSingleSqlite.update_ingest_job(job_id, status="done")
+    assert not ingest.has_active_file(user_id, "report.pdf")
+
+
+def test_retry_waits_for_backoff(ingest):
+    """失败后按退避时间重新排队，等待期间不会被取出，重试从未完成的阶段继续"""
+    user_id = f"user_{uuid.uuid4().hex}"
+    ingest.get_retry_delay = lambda retries: 0.4 * (2 ** retries)
+    attempts = []
+
+    def handler(job):
+        attempts.append((time.perf_counter(), job["status"], job["retries"]))
+        if "parsing" not in job["context"].get("completed_stages", []):
+            ingest.enter_stage(job, "parsing")
+            ingest.complete_stage(job, "parsing")
+        ingest.enter_stage(job, "embedding")
+        if len(attempts) < 3:
+            raise RuntimeError("embedding service down")
+        ingest.complete_stage(job, "embedding")
+        return {"error_code": 0}
+
+    ingest.start(handler)
+    job_id = ingest.submit({"knowledge_id": "kb", "file_id": "f", "user_id": user_id, "file_path": "a.txt"})
+    assert _wait_for(lambda: len(attempts) == 1)
+    queued = cSingleSqlite.query_ingest_job_by_job_id(job_id)
+    assert queued["status"] == "queued" and queued["not_before"] > time.time()
+    assert _wait_for(lambda: ingest.get_job(job_id)["status"] == "done")
+
+    assert [(status, retries) for _, status, retries in attempts] == [("parsing", 0), ("embedding", 1), ("embedding", 2)]
+    assert attempts[1][0] - attempts[0][0] >= 0.4
+    assert attempts[2][0] - attempts[1][0] >= 0.8
+
+
+def test_retry_delay_is_capped():
+    from Config.ingest_config import IngestConfig
+    config = IngestConfig()
+    config.retry_backoff, config.retry_backoff_max = 5.0, 30.0
+    assert [config.get_retry_delay(n) for n in range(5)] == [5.0, 10.0, 20.0, 30.0, 30.0]
+
+
+def test_claim_resumes_from_first_unfinished_stage(ingest):
+    user_id = f"user_{uuid.uuid4().hex}"
+    job_id = f"job_{uuid.uuid4().hex}"
+    assert cSingleSqlite.insert_ingest_job({"job_id": job_id, "knowledge_id": "kb", "file_id": "f",
+                                            "user_id": user_id, "payload": {"file_path": "a.txt"}})
+    cSingleSqlite.update_ingest_job(job_id, context={"completed_stages": ["parsing", "embedding"]})
+    seen = []
+
+    def handler(job):
+        seen.append((job["status"], cSingleSqlite.query_ingest_job_by_job_id(job["job_id"])["status"]))
+        return {"error_code": 0}
+
+    ingest.start(handler)
+    assert _wait_for(lambda: ingest.get_job(job_id)["status"] == "done")
+    assert seen == [("graphing", "graphing")]
+
+
+def _run_jobs(worker_num, job_num, latency):
+    """用固定耗时的处理函数跑完 job_num 个任务，返回耗时与各任务的执行次数"""
+    ingest = ControlIngest()
+    ingest.poll_interval = 0.05
+    ingest.worker_num = worker_num
+    user_id = f"user_{uuid.uuid4().hex}"
+    calls = []
+    calls_lock = threading.Lock()
+
+    def handler(job):
+        for stage in ("parsing", "embedding", "graphing"):
+            ingest.enter_stage(job, stage)
+            ingest.complete_stage(job, stage)
+        time.sleep(latency)
+        with calls_lock:
+            calls.append(job["job_id"])
+        return {"error_code": 0}
+
+    ingest.start(handler)
+    try:
+        start = time.perf_counter()
+        job_ids = [ingest.submit({"knowledge_id": "kb", "file_id": f"f{i}", "user_id": user_id,
+                                  "file_path": f"{i}.txt"}) for i in range(job_num)]
+        assert all(job_ids)
+        assert _wait_for(lambda: cSingleSqlite.count_active_ingest_jobs(user_id=user_id) == 0, timeout=60)
+        elapsed = time.perf_counter() - start
+    finally:
+        ingest.stop(timeout=5)
+    assert sorted(calls) == sorted(job_ids)
+    return elapsed
+
+
+def test_ingest_throughput():
+    """处理耗时固定时，多个工作线程并发消费的吞吐明显高于单线程，且每个任务只执行一次"""
+    job_num, latency = 40, 0.05
+    single = _run_jobs(1, job_num, latency)
+    parallel = _run_jobs(4, job_num, latency)
+    assert single >= job_num * latency
+    assert single / parallel >= 2.5
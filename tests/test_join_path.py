@@ -0,0 +1,142 @@
+# -*- coding:utf-8 -*-
+"""表关联路径：有向权重（外键反向关联权重更高）、近似Steiner树的正确性与近似比，删除关联关系后的缓存失效"""
+
+import itertools
+import random
+import uuid
+
+import pytest
+
+from Db.sqlite_db import cSingleSqlite
+
+# Sql 包的 __init__ 导入向量库依赖
+join_path = pytest.importorskip("Sql.Graph.join_path")
+INF, ShortestPathIndex, prim_forest = join_path.INF, join_path.ShortestPathIndex, join_path.prim_forest
+steiner_arborescence, tree_paths = join_path.steiner_arborescence, join_path.tree_paths
+
+
+def _fk_schema(fks, tables):
+    """外键 from -> to 权重1.0，反向权重2.0（与关联图的建图规则一致）"""
+    adjacency = {table: {} for table in tables}
+    for from_table, to_table in fks:
+        adjacency[from_table][to_table] = min(1.0, adjacency[from_table].get(to_table, INF))
+        adjacency[to_table][from_table] = min(2.0, adjacency[to_table].get(from_table, INF))
+    return adjacency
+
+
+def _assert_arborescence(adjacency, root, terminals, edges):
+    parents = {}
+    for u, v, w in edges:
+        assert adjacency[u][v] == w
+        assert v not in parents, "每个节点只有一个父节点"
+        parents[v] = u
+    assert root not in parents
+    for node in parents:
+        seen = set()
+        while node != root:
+            assert node not in seen
+            seen.add(node)
+            node = parents[node]
+    assert set(terminals) - {root} <= set(parents)
+
+
+def test_reverse_foreign_key_weight_is_kept():
+    # orders.customer_id -> customers，orders.product_id -> products
+    adjacency = _fk_schema([("orders", "customers"), ("orders", "products")],
+                           ["orders", "customers", "products"])
+    index = ShortestPathIndex(adjacency)
+    assert index.distance("orders", "customers") == 1.0
+    assert index.distance("customers", "orders") == 2.0
+
+    edges, total = steiner_arborescence(index, ["customers", "products"])
+    assert edges == [("customers", "orders", 2.0), ("orders", "products", 1.0)]
+    assert total == 3.0
+    assert tree_paths(edges, "customers", ["products"]) == {"products": ["customers", "orders", "products"]}
+
+
+def test_forward_direction_preferred():
+    # b -> a、a -> c、c -> d 都是外键：同一对表两个方向的距离不同，树沿外键方向展开
+    adjacency = _fk_schema([("b", "a"), ("a", "c"), ("c", "d")], ["a", "b", "c", "d"])
+    index = ShortestPathIndex(adjacency, precompute=True)
+    assert index.distance("a", "b") == 2.0
+    assert index.distance("b", "a") == 1.0
+    edges, total = steiner_arborescence(index, ["b", "d"])
+    assert [(u, v) for u, v, _ in edges] == [("b", "a"), ("a", "c"), ("c", "d")]
+    assert total == 3.0
+
+
+def test_disconnected_terminals_form_a_forest():
+    adjacency = _fk_schema([("a", "b"), ("c", "d")], ["a", "b", "c", "d"])
+    edges, _ = steiner_arborescence(ShortestPathIndex(adjacency), ["a", "b", "c", "d", "missing"])
+    assert sorted((u, v) for u, v, _ in edges) == [("a", "b"), ("c", "d")]
+
+
+def _exact_undirected(adjacency, terminals):
+    others = [node for node in adjacency if node not in terminals]
+    best = INF
+    for k in range(len(others) + 1):
+        for extra in itertools.combinations(others, k):
+            nodes = set(terminals) | set(extra)
+            edges = prim_forest(list(nodes), lambda x: [(y, w) for y, w in adjacency[x].items() if y in nodes])
+            if len(edges) == len(nodes) - 1:
+                best = min(best, sum(w for _, _, w in edges))
+    return best
+
+
+def test_undirected_ratio_within_bound():
+    for trial in range(150):
+        rng = random.Random(trial)
+        n = rng.randint(5, 9)
+        names = [f"t{i}" for i in range(n)]
+        adjacency = {name: {} for name in names}
+        pairs = [(names[i], names[rng.randrange(i)]) for i in range(1, n)]
+        pairs += [tuple(rng.sample(names, 2)) for _ in range(rng.randint(0, n))]
+        for a, b in pairs:
+            w = rng.choice([1.0, 2.0, 3.0])
+            adjacency[a][b] = adjacency[b][a] = w
+        terminals = rng.sample(names, rng.randint(2, min(5, n)))
+
+        edges, total = steiner_arborescence(ShortestPathIndex(adjacency, precompute=trial % 2 == 0), terminals)
+        _assert_arborescence(adjacency, terminals[0], terminals, edges)
+        assert total <= 2 * (1 - 1 / len(terminals)) * _exact_undirected(adjacency, terminals) + 1e-9
+
+
+def test_directed_trees_are_valid_and_bounded():
+    for trial in range(300):
+        rng = random.Random(trial)
+        n = rng.randint(4, 30)
+        names = [f"t{i}" for i in range(n)]
+        fks = [(names[i], names[rng.randrange(i)]) for i in range(1, n)]
+        fks += [tuple(rng.sample(names, 2)) for _ in range(rng.randint(0, 2 * n))]
+        adjacency = _fk_schema(fks, names)
+        index = ShortestPathIndex(adjacency)
+        terminals = rng.sample(names, rng.randint(2, min(8, n)))
+        root = terminals[0]
+
+        edges, total = steiner_arborescence(index, terminals)
+        _assert_arborescence(adjacency, root, terminals, edges)
+        distances = [index.distance(root, t) for t in terminals[1:]]
+        # 不少于到最远目标的最短距离，不多于到各目标最短距离之和
+        assert max(distances) <= total <= sum(distances)
+        for target, path in tree_paths(edges, root, terminals).items():
+            assert sum(adjacency[u][v] for u, v in zip(path, path[1:])) >= index.distance(root, target)
+
+
+def test_delete_relation_invalidates_only_its_source():
+    control_sql = pytest.importorskip("Control.control_sql")
+    sql_id, other_id, rel_id = (f"sql_{uuid.uuid4().hex}", f"sql_{uuid.uuid4().hex}", f"rel_{uuid.uuid4().hex}")
+    assert cSingleSqlite.insert_rel_sql({"rel_id": rel_id, "sql_id": sql_id, "from_table": "orders",
+                                         "from_col": "customer_id", "to_table": "customers", "to_col": "id"})
+    with control_sql._schema_graph_lock:
+        before = {key: control_sql._schema_graph_version(key) for key in (sql_id, other_id)}
+
+    control = control_sql.CControl.__new__(control_sql.CControl)
+    control.db_obj = cSingleSqlite
+    assert control.delete_sql_rel({"rel_id": rel_id})["success"]
+    assert cSingleSqlite.query_rel_sql_by_rel_id(rel_id) is None
+    assert not control.delete_sql_rel({"rel_id": rel_id})["success"]
+
+    with control_sql._schema_graph_lock:
+        after = {key: control_sql._schema_graph_version(key) for key in (sql_id, other_id)}
+    assert after[sql_id] != before[sql_id]
+    assert after[other_id] == before[other_id]
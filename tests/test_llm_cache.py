@@ -0,0 +1,134 @@
+# -*- coding:utf-8 -*-
+"""LLM响应缓存：温度识别、命中/未命中、单飞合并（使用计数的桩LLM）"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from Utils.llm_cache import LLMResponseCache, describe_llm, make_cache_key
+
+
+class CountingLLM:
+    """计数的桩LLM：与ChatTongyi一样没有temperature字段，温度保存在model_kwargs中"""
+
+    def __init__(self, temperature=0.0, delay=0.0):
+        self.model_name = "stub-model"
+        self.model_kwargs = {"temperature": temperature}
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def invoke(self, prompt):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return SimpleNamespace(content=f"answer to: {str(prompt).strip()}",
+                               usage_metadata={"total_tokens": 100})
+
+
+class Bound:
+    """llm.bind(...) 返回的包装对象"""
+
+    def __init__(self, bound, **kwargs):
+        self.bound = bound
+        self.kwargs = kwargs
+
+
+def test_describe_llm_reads_model_kwargs_temperature():
+    assert describe_llm(CountingLLM(temperature=0)) == ("stub-model", 0.0, {})
+    model, temperature, bound_kwargs = describe_llm(Bound(CountingLLM(temperature=0.7), enable_thinking=False))
+    assert (model, temperature, bound_kwargs) == ("stub-model", 0.7, {"enable_thinking": False})
+    assert describe_llm(Bound(CountingLLM(temperature=0.7), temperature=0))[1] == 0.0
+
+
+def test_hit_and_miss():
+    cache = LLMResponseCache(max_size=16, ttl=0)
+    llm = CountingLLM()
+
+    def call(prompt):
+        key = make_cache_key(*describe_llm(llm), prompt)
+        return cache.get_or_call(key, lambda: {"text": llm.invoke(prompt).content, "tokens": 100})
+
+    assert call("总结以下讨论")[1] == "miss"
+    # 只有空白差异的提示命中同一条目
+    assert call("总结以下讨论  \n")[1] == "hit"
+    assert call("验证以下声明")[1] == "miss"
+    assert llm.calls == 2
+    assert cache.get_stats()["hits"] == 1
+
+
+def test_concurrent_identical_prompts_coalesce():
+    cache = LLMResponseCache(max_size=16, ttl=0)
+    llm = CountingLLM(delay=0.2)
+    key = make_cache_key(*describe_llm(llm), "同一个提示")
+    sources = []
+    barrier = threading.Barrier(8)
+
+    def worker():
+        barrier.wait()
+        result, source = cache.get_or_call(key, lambda: {"text": llm.invoke("同一个提示").content, "tokens": 100})
+        sources.append(source)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert llm.calls == 1
+    assert sorted(sources).count("miss") == 1
+    assert sources.count("coalesced") + sources.count("hit") == 7
+
+
+def test_base_agent_uses_cache(monkeypatch):
+    base_agent = pytest.importorskip("Roles.personnel.base_agent")
+    cache = LLMResponseCache(max_size=16, ttl=0)
+    monkeypatch.setattr(base_agent, "get_llm_cache", lambda: cache)
+
+    def make_agent(llm):
+        return base_agent.BaseAgent("agent", "role", [], base_agent.WorkingStyle.STEADY_CONSERVATIVE,
+                                    [], "", llm_instance=llm)
+
+    # 温度为0（在model_kwargs中）默认使用缓存
+    llm = CountingLLM(temperature=0)
+    agent = make_agent(llm)
+    assert agent._invoke_llm_with_retry("总结") == agent._invoke_llm_with_retry("总结")
+    assert llm.calls == 1
+    assert agent.get_llm_cache_stats()["hits"] == 1
+
+    # 温度非0时默认不缓存，调用时显式开启后缓存
+    llm = CountingLLM(temperature=0.7)
+    agent = make_agent(llm)
+    agent._invoke_llm_with_retry("发言")
+    agent._invoke_llm_with_retry("发言")
+    assert llm.calls == 2
+    agent._invoke_llm_with_retry("验证", llm_cache=True)
+    agent._invoke_llm_with_retry("验证", llm_cache=True)
+    assert llm.calls == 3
+
+
+def test_base_agent_stats_under_concurrency(monkeypatch):
+    base_agent = pytest.importorskip("Roles.personnel.base_agent")
+    cache = LLMResponseCache(max_size=256, ttl=0)
+    monkeypatch.setattr(base_agent, "get_llm_cache", lambda: cache)
+    llm = CountingLLM(temperature=0)
+    agent = base_agent.BaseAgent("agent", "role", [], base_agent.WorkingStyle.STEADY_CONSERVATIVE,
+                                 [], "", llm_instance=llm)
+    barrier = threading.Barrier(16)
+
+    def worker():
+        barrier.wait()
+        for i in range(200):
+            agent._invoke_llm_with_retry(f"提示{i % 20}")
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stats = agent.get_llm_cache_stats()
+    assert stats["hits"] + stats["coalesced"] + stats["misses"] == 16 * 200
+    assert stats["misses"] == llm.calls == 20
+    assert stats["saved_tokens"] == 100 * (16 * 200 - 20)
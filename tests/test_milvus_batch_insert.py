@@ -0,0 +1,133 @@
+# -*- coding:utf-8 -*-
+"""文件入库批量写向量：标题只向量化一次、文本块按批向量化并按批插入，请求次数与文本块数量的关系"""
+
+import math
+
+import pytest
+
+control_milvus = pytest.importorskip("Control.control_milvus")
+
+
+class CountingEmbeddings:
+    def __init__(self, dim=8):
+        self.dim = dim
+        self.query_calls = []
+        self.document_calls = []
+
+    def _vector(self, text):
+        return [float(len(text))] * self.dim
+
+    def embed_query(self, text):
+        self.query_calls.append(text)
+        return self._vector(text)
+
+    def embed_documents(self, texts):
+        self.document_calls.append(list(texts))
+        return [self._vector(text) for text in texts]
+
+    @property
+    def round_trips(self):
+        return len(self.query_calls) + len(self.document_calls)
+
+
+class RecordingService:
+    def __init__(self, exists=True):
+        self.exists = exists
+        self.inserts = []
+        self.created = []
+
+    def has_collection(self, collection_name):
+        return self.exists
+
+    def has_partition(self, collection_name, partition_name):
+        return True
+
+    def create_collection(self, collection_name, schema, index_params=None):
+        self.created.append((collection_name, schema))
+        self.exists = True
+
+    def create_partition(self, collection_name, partition_name):
+        pass
+
+    def insert(self, collection_name, data, partition_name=None):
+        self.inserts.append((collection_name, data, partition_name))
+
+
+def _controller(service):
+    controller = control_milvus.CControl.__new__(control_milvus.CControl)
+    controller.enabled = True
+    controller.milvus_service = service
+    return controller
+
+
+def _param(chunks):
+    return {"knowledge_partition": "file_1", "knowledge_collection": "kb_1", "title": "年度报告",
+            "data": chunks, "permission_level": "public"}
+
+
+@pytest.mark.parametrize("n, batch_size", [(1, 64), (64, 64), (150, 64), (300, 32)])
+def test_round_trips_scale_with_batches(n, batch_size):
+    embeddings, service = CountingEmbeddings(), RecordingService()
+    chunks = [f"第{i}段" for i in range(n)]
+    assert _controller(service).add_texts(_param(chunks), embeddings, {}, batch_size=batch_size) == n
+
+    batches = math.ceil(n / batch_size)
+    assert embeddings.query_calls == ["年度报告"]
+    assert len(embeddings.document_calls) == batches
+    assert len(service.inserts) == batches
+    # 逐块写入时每块要向量化正文与标题各一次，共 2n 次
+    assert embeddings.round_trips == batches + 1
+
+
+def test_columns_stay_aligned_and_empty_chunks_skipped():
+    embeddings, service = CountingEmbeddings(), RecordingService()
+    chunks = ["a", "", "bb", "   ", "ccc", None, "dddd"]
+    assert _controller(service).add_texts(_param(chunks), embeddings, {}, batch_size=3) == 4
+
+    contents, content_vectors = [], []
+    for collection_name, data, partition_name in service.inserts:
+        assert (collection_name, partition_name) == ("kb_1", "file_1")
+        doc_ids, titles, texts, title_vectors, vectors, permissions = data
+        assert len({len(column) for column in data}) == 1
+        assert set(titles) == {"年度报告"} and set(permissions) == {"public"}
+        assert all(vector == embeddings._vector("年度报告") for vector in title_vectors)
+        contents += texts
+        content_vectors += vectors
+    assert contents == ["a", "bb", "ccc", "dddd"]
+    assert content_vectors == [embeddings._vector(text) for text in contents]
+
+
+def test_progress_reported_per_batch():
+    progress = []
+    _controller(RecordingService()).add_texts(_param([str(i) for i in range(10)]), CountingEmbeddings(), {},
+                                              batch_size=4, progress_callback=lambda done, total: progress.append((done, total)))
+    assert progress == [(4, 10), (8, 10), (10, 10)]
+
+
+def test_new_collection_uses_title_vector_dimension(monkeypatch):
+    dims = []
+    monkeypatch.setattr(control_milvus, "remember_embedding_dimension", dims.append)
+    embeddings, service = CountingEmbeddings(dim=12), RecordingService(exists=False)
+    _controller(service).add_texts(_param(["x", "y"]), embeddings, {}, batch_size=8)
+    assert len(service.created) == 1 and dims == [12]
+    # 不再为探测维度额外向量化
+    assert embeddings.query_calls == ["年度报告"]
+
+
+def test_mismatched_vector_count_is_rejected():
+    class DroppingEmbeddings(CountingEmbeddings):
+        def embed_documents(self, texts):
+            return super().embed_documents(texts)[:-1]
+
+    service = RecordingService()
+    with pytest.raises(ValueError):
+        _controller(service).add_texts(_param(["a", "b"]), DroppingEmbeddings(), {}, batch_size=8)
+    assert service.inserts == []
+
+
+def test_disabled_milvus_skips_embedding():
+    embeddings = CountingEmbeddings()
+    controller = _controller(None)
+    controller.enabled = False
+    assert controller.add_texts(_param(["a"]), embeddings, {}) == 0
+    assert embeddings.round_trips == 0
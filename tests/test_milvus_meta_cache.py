@@ -0,0 +1,195 @@
+# -*- coding:utf-8 -*-
+"""Milvus元数据缓存：重复写入不再查询集合/分区元数据，创建删除时同步更新；向量维度持久化，冷启动不再探测"""
+
+import json
+import uuid
+
+import pytest
+
+from Config.embedding_config import EmbeddingConfig
+
+
+class CountingEmbeddings:
+    def __init__(self, dim=8):
+        self.dim = dim
+        self.calls = []
+
+    def embed_query(self, text):
+        self.calls.append(text)
+        return [0.1] * self.dim
+
+
+@pytest.fixture
+def embedding_env(monkeypatch, tmp_path):
+    for name, value in {"EMBEDDING_API_KEY": "test", "EMBEDDING_BASE_URL": "http://127.0.0.1:9",
+                        "EMBEDDING_MODEL_ID": "stub", "EMBEDDING_MODEL_NAME": "stub",
+                        "EMBEDDING_VECTOR_LENGTH": "8",
+                        "EMBEDDING_DIM_CACHE_PATH": str(tmp_path / "embedding_dim.json")}.items():
+        monkeypatch.setenv(name, value)
+    return tmp_path / "embedding_dim.json"
+
+
+def test_dimension_probed_once_and_persisted(embedding_env):
+    embeddings = CountingEmbeddings(dim=8)
+    config = EmbeddingConfig()
+    assert config.get_dimension(embeddings) == 8
+    assert config.get_dimension(embeddings) == 8
+    assert len(embeddings.calls) == 1
+    assert json.loads(embedding_env.read_text()) == {"stub@8": 8}
+
+    # 新进程（新的配置实例）直接读文件
+    assert EmbeddingConfig().get_dimension(embeddings) == 8
+    assert len(embeddings.calls) == 1
+
+
+def test_remembered_dimension_skips_probe(embedding_env, monkeypatch):
+    EmbeddingConfig().remember_dimension(1024)
+    embeddings = CountingEmbeddings()
+    assert EmbeddingConfig().get_dimension(embeddings) == 1024
+    assert embeddings.calls == []
+
+    # 模型变化时重新探测
+    monkeypatch.setenv("EMBEDDING_MODEL_NAME", "other")
+    assert EmbeddingConfig().get_dimension(embeddings) == 8
+    assert len(embeddings.calls) == 1
+
+
+class FakeField:
+    def __init__(self, name, dtype, dim=None):
+        self.name, self.dtype, self.params = name, dtype, {"dim": dim} if dim else {}
+        self.is_primary = self.auto_id = False
+
+
+class FakePartition:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeMilvus:
+    """按集合名保存服务端状态，统计元数据请求次数"""
+
+    def __init__(self, data_type):
+        self.data_type = data_type
+        self.server = {}
+        self.rpcs = {"has_collection": 0, "describe": 0, "list_partitions": 0}
+        self.inserts = 0
+        self.fail_drop = False
+        milvus = self
+
+        class Collection:
+            def __init__(self, name, schema=None, using="default"):
+                milvus.rpcs["describe"] += 1
+                if schema is not None:
+                    milvus.server[name] = {"schema": schema, "partitions": {"_default"}}
+                self.name = name
+                self.schema = milvus.server[name]["schema"]
+
+            @property
+            def partitions(self):
+                milvus.rpcs["list_partitions"] += 1
+                return [FakePartition(name) for name in milvus.server[self.name]["partitions"]]
+
+            def create_partition(self, name):
+                milvus.server[self.name]["partitions"].add(name)
+
+            def drop_partition(self, name):
+                if milvus.fail_drop:
+                    raise RuntimeError("partition not found")
+                milvus.server[self.name]["partitions"].discard(name)
+
+            def create_index(self, **kwargs):
+                pass
+
+            def load(self):
+                pass
+
+            def insert(self, data, partition_name=None):
+                milvus.inserts += 1
+
+        class Utility:
+            @staticmethod
+            def has_collection(name, using="default"):
+                milvus.rpcs["has_collection"] += 1
+                return name in milvus.server
+
+            @staticmethod
+            def drop_collection(name, using="default"):
+                milvus.server.pop(name, None)
+
+        self.Collection, self.utility = Collection, Utility
+
+    def schema(self, dim):
+        class Schema:
+            fields = [FakeField("id", self.data_type.INT64), FakeField("title_embedding", self.data_type.FLOAT_VECTOR, dim),
+                      FakeField("content_embedding", self.data_type.FLOAT_VECTOR, dim)]
+        return Schema()
+
+
+@pytest.fixture
+def milvus(monkeypatch):
+    milvus_db = pytest.importorskip("Db.milvus_db")
+    fake = FakeMilvus(milvus_db.DataType)
+    monkeypatch.setattr(milvus_db, "Collection", fake.Collection)
+    monkeypatch.setattr(milvus_db, "utility", fake.utility)
+    monkeypatch.setattr(milvus_db.MilvusService, "release_partition", lambda self, c, p: None)
+    alias = f"test_{uuid.uuid4().hex}"
+
+    def service():
+        obj = milvus_db.MilvusService.__new__(milvus_db.MilvusService)
+        obj.enabled, obj.alias = True, alias
+        obj.meta_cache = milvus_db.get_meta_cache(alias)
+        return obj
+    fake.service = service
+    return fake
+
+
+def test_repeated_add_text_makes_no_metadata_calls(milvus, monkeypatch):
+    control_milvus = pytest.importorskip("Control.control_milvus")
+    monkeypatch.setattr(control_milvus.CControl, "get_schema", lambda self, dim: milvus.schema(dim))
+    milvus.server["kb"] = {"schema": milvus.schema(8), "partitions": {"_default", "file_1"}}
+
+    embeddings = CountingEmbeddings()
+    for i in range(5):
+        # 每次请求新建控制器与服务实例，元数据缓存按连接别名共享
+        controller = control_milvus.CControl.__new__(control_milvus.CControl)
+        controller.enabled, controller.milvus_service = True, milvus.service()
+        controller.add_text({"knowledge_partition": "file_1", "knowledge_collection": "kb", "title": "标题",
+                             "data": f"正文{i}", "permission_level": "public"}, embeddings, {})
+    assert milvus.rpcs == {"has_collection": 1, "describe": 1, "list_partitions": 1}
+    assert milvus.inserts == 5
+    # 每次只向量化正文和标题，不再探测维度
+    assert len(embeddings.calls) == 10 and "foo" not in embeddings.calls
+
+
+def test_create_collection_and_partition_update_cache(milvus):
+    service = milvus.service()
+    service.create_collection("kb", milvus.schema(16), {})
+    service.create_partition("kb", "file_1")
+    before = dict(milvus.rpcs)
+    other = milvus.service()
+    assert other.has_collection("kb") and other.has_partition("kb", "file_1")
+    assert not other.has_partition("kb", "file_2")
+    assert other.get_dim("kb") == 16 and other.get_dim("kb") == 16
+    assert milvus.rpcs == before
+
+
+def test_drops_invalidate_cache(milvus):
+    service = milvus.service()
+    service.create_collection("kb", milvus.schema(8), {})
+    service.create_partition("kb", "file_1")
+    service.drop_partition("kb", "file_1")
+    assert not service.has_partition("kb", "file_1")
+
+    # 删除失败时清除缓存，下次访问从服务端重新加载
+    service.create_partition("kb", "file_2")
+    milvus.fail_drop = True
+    with pytest.raises(RuntimeError):
+        service.drop_partition("kb", "file_2")
+    assert "kb" not in service.meta_cache.exists
+    listed = milvus.rpcs["list_partitions"]
+    assert service.has_partition("kb", "file_2")
+    assert milvus.rpcs["list_partitions"] == listed + 1
+
+    service.drop_collection("kb")
+    assert not service.has_collection("kb")
+    assert service.get_dim("kb") is None
@@ -0,0 +1,133 @@
+# -*- coding:utf-8 -*-
+"""常驻RAG智能体注册表：进程内只创建一次、请求间不重建智能体、并发请求的状态互不影响，注册表中的智能体不保存请求状态"""
+
+import ast
+import os
+import threading
+import time
+
+import pytest
+
+AGENT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "Agent", "AgenticRagAgent")
+# 注册表持有的智能体：所在文件 -> 类名
+REGISTRY_AGENTS = {
+    "enhanced_intent_agent.py": "EnhancedIntentAgent",
+    "tool_agent.py": "ToolAgent",
+    "redundancy_fusion_agent.py": "RedundancyFusionAgent",
+    "reflection_agent.py": "ReflectionAgent",
+    "orchestrator_agent.py": "OrchestratorAgent",
+    "result_evaluator_agent.py": "ResultEvaluatorAgent",
+    "artifact_handler.py": "ArtifactHandler",
+}
+
+
+def _self_assignments(function):
+    for node in ast.walk(function):
+        targets = []
+        if isinstance(node, ast.Assign):
+            targets = node.targets
+        elif isinstance(node, (ast.AugAssign, ast.AnnAssign)):
+            targets = [node.target]
+        for target in targets:
+            for item in ast.walk(target):
+                if isinstance(item, ast.Attribute) and isinstance(item.value, ast.Name) and item.value.id == "self":
+                    yield item.attr, node.lineno
+
+
+@pytest.mark.parametrize("file_name, class_name", sorted(REGISTRY_AGENTS.items()))
+def test_registry_agents_keep_no_request_state(file_name, class_name):
+    with open(os.path.join(AGENT_DIR, file_name), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    classes = [node for node in tree.body if isinstance(node, ast.ClassDef) and node.name == class_name]
+    assert classes, class_name
+    assigned = [(function.name, attr, line)
+                for function in classes[0].body if isinstance(function, ast.FunctionDef) and function.name != "__init__"
+                for attr, line in _self_assignments(function)]
+    assert assigned == []
+
+
+@pytest.fixture
+def rag_run(monkeypatch):
+    module = pytest.importorskip("Agent.agentic_rag_run")
+    monkeypatch.setattr(module, "_agent_registry", None)
+    monkeypatch.setattr(module.cSingleSqlite, "search_knowledge_base_by_knowledge_id",
+                        lambda knowledge_id: {"description": "测试知识库"})
+
+    def forbid(*args, **kwargs):
+        raise AssertionError("请求处理过程中不应新建智能体")
+    for class_name in REGISTRY_AGENTS.values():
+        monkeypatch.setattr(module, class_name, forbid)
+    return module
+
+
+def test_registry_created_once_under_concurrency(rag_run, monkeypatch):
+    created, warmed = [], []
+
+    class CountingRegistry:
+        def __init__(self):
+            time.sleep(0.05)
+            created.append(self)
+
+        def warm_up(self):
+            warmed.append(self)
+    monkeypatch.setattr(rag_run, "RagAgentRegistry", CountingRegistry)
+
+    results = []
+    barrier = threading.Barrier(16)
+
+    def worker():
+        barrier.wait()
+        results.append(rag_run.get_agent_registry())
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1 and warmed == created
+    assert all(registry is created[0] for registry in results)
+
+
+class IntentAgent:
+    def analyze_intent(self, query, knowledge_description, chat_history=None):
+        # 让并发请求交错执行
+        time.sleep(0.01)
+        return {"action": "tool", "tool_name": "echo", "core_intent": query}
+
+
+class EchoToolAgent:
+    def execute_tool_by_intent(self, intent_result, query, knowledge_id):
+        time.sleep(0.01)
+        return {"success": True, "tool_name": "echo", "formatted_content": f"{knowledge_id}:{intent_result['core_intent']}"}
+
+
+class FakeRegistry:
+    def __init__(self):
+        self.enhanced_intent_agent = IntentAgent()
+        self.tool_agent = EchoToolAgent()
+        self.redundancy_fusion_agent = self.reflection_agent = self.orchestrator_agent = None
+        self.evaluator_agent = self.artifact_handler = None
+
+
+def test_concurrent_requests_share_agents_without_mixing_state(rag_run):
+    registry = FakeRegistry()
+    outputs = {}
+    barrier = threading.Barrier(8)
+
+    def worker(i):
+        barrier.wait()
+        chunks = list(rag_run.run_rag_agentic_stream(f"问题{i}", f"kb{i}", "user", registry=registry))
+        outputs[i] = chunks
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for i, chunks in outputs.items():
+        delta = chunks[0]["choices"][0]["delta"]
+        assert delta["content"] == f"kb{i}:问题{i}"
+        assert delta["intent_analysis"]["core_intent"] == f"问题{i}"
+        assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+    assert len(outputs) == 8
@@ -0,0 +1,118 @@
+# -*- coding:utf-8 -*-
+"""问答语义缓存：分区隔离（跨用户、跨权限不泄露）与只缓存大模型实际生成的回答"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from Utils.response_cache import SemanticResponseCache, make_scope
+
+VECTOR = [1.0, 0.0, 0.0]
+
+
+def _store(cache, scope, answer):
+    cache.store(scope, "年假有几天？", VECTOR, answer, [{"title": answer}],
+                [{"type": "text", "content": answer}])
+
+
+def test_owner_answer_not_visible_to_other_users_or_public():
+    cache = SemanticResponseCache(threshold=0.9, ttl=0)
+    alice = make_scope(["kb1"], "owner:alice")
+    _store(cache, alice, "私有回答")
+
+    assert cache.lookup(alice, "年假有几天", VECTOR)["answer"] == "私有回答"
+    assert cache.lookup(make_scope(["kb1"], "owner:bob"), "年假有几天", VECTOR) is None
+    assert cache.lookup(make_scope(["kb1"], "public"), "年假有几天", VECTOR) is None
+    assert cache.lookup(make_scope(["kb2"], "owner:alice"), "年假有几天", VECTOR) is None
+
+
+def test_public_answer_not_visible_to_owner_scope():
+    cache = SemanticResponseCache(threshold=0.9, ttl=0)
+    _store(cache, make_scope(["kb1"], "public"), "公共回答")
+    assert cache.lookup(make_scope(["kb1"], "owner:alice"), "年假有几天", VECTOR) is None
+
+
+def test_invalidate_knowledge_drops_all_scopes():
+    cache = SemanticResponseCache(threshold=0.9, ttl=0)
+    scopes = [make_scope(["kb1"], "owner:alice"), make_scope(["kb1"], "public"),
+              make_scope(["kb1", "kb2"], "owner:bob")]
+    for scope in scopes:
+        _store(cache, scope, "回答")
+    _store(cache, make_scope(["kb3"], "public"), "其他知识库")
+
+    assert cache.invalidate_knowledge("kb1") == 3
+    assert all(cache.lookup(scope, "年假有几天", VECTOR) is None for scope in scopes)
+    assert cache.lookup(make_scope(["kb3"], "public"), "年假有几天", VECTOR) is not None
+
+
+# 以下用例驱动 chat_with_rag，需要完整的运行环境
+def _chunk(_id, content, _type="text", **delta):
+    return {"id": _id, "choices": [{"index": 0, "delta": dict(delta, content=content, type=_type),
+                                    "finish_reason": None}]}
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    control_chat = pytest.importorskip("Control.control_chat")
+    agentic_rag_run = control_chat.agentic_rag_run
+
+    calls = []
+    streams = {}
+
+    def fake_stream(query, knowledge_id, user_id, chat_history, flag, registry=None):
+        calls.append((user_id, flag))
+        yield from streams.get(flag, [])
+
+    monkeypatch.setattr(agentic_rag_run, "run_rag_agentic_stream", fake_stream)
+
+    obj = control_chat.CControl.__new__(control_chat.CControl)
+    obj.retrieval_obj = SimpleNamespace(config=SimpleNamespace(response_cache_enabled=True,
+                                                               response_cache_replay_chars=50))
+    obj.response_cache = SemanticResponseCache(threshold=0.9, ttl=0)
+    obj.rag_agents = None
+    obj._embed_question = lambda query: VECTOR
+    # 只有owner有该知识库的权限
+    obj.check_knowledge_and_user = lambda knowledge_id, user_id: user_id == "owner"
+    return obj, calls, streams, agentic_rag_run
+
+
+def _ask(obj, user_id):
+    return list(obj.chat_with_rag({"knowledge_id": "kb1", "user_id": user_id, "query": "年假有几天？"}))
+
+
+def test_private_answer_not_replayed_to_users_without_permission(chat):
+    obj, calls, streams, rag = chat
+    streams[True] = [_chunk("artifacts_1", "", "artifacts", artifacts=[{"title": "私有文件"}]),
+                     _chunk(f"{rag.ANSWER_CHUNK_PREFIX}1", "私有内容：15天")]
+    streams[False] = [_chunk(f"{rag.ANSWER_CHUNK_PREFIX}2", "公共内容：5天")]
+
+    _ask(obj, "owner")
+    _ask(obj, "owner")
+    assert calls == [("owner", True)]
+
+    chunks = _ask(obj, "guest")
+    assert calls[-1] == ("guest", False)
+    assert all("私有" not in str(chunk) for chunk in chunks)
+
+    # 其他无权限用户命中公共范围的缓存
+    chunks = _ask(obj, "guest2")
+    assert len(calls) == 2
+    assert "公共内容" in str(chunks)
+
+
+def test_fallback_answer_is_not_cached(chat):
+    obj, calls, streams, rag = chat
+    streams[True] = [_chunk("artifacts_1", "", "artifacts", artifacts=[{"title": "文件"}]),
+                     _chunk(f"{rag.FALLBACK_CHUNK_PREFIX}1", "已找到 3 条相关信息，但生成回答时出现问题。请稍后重试。")]
+    _ask(obj, "owner")
+    _ask(obj, "owner")
+    assert len(calls) == 2
+    assert obj.response_cache.get_stats()["stores"] == 0
+
+
+def test_tool_output_is_not_cached(chat):
+    obj, calls, streams, rag = chat
+    streams[True] = [_chunk("tool_result_1", "工具结果")]
+    _ask(obj, "owner")
+    _ask(obj, "owner")
+    assert len(calls) == 2
@@ -0,0 +1,108 @@
+# -*- coding:utf-8 -*-
+"""多路检索并发：总耗时约等于最慢的检索源、超时的检索源被跳过并标记timeout、出错的检索源不影响其他结果，以及提前返回"""
+
+import time
+
+import pytest
+
+from Control.control_retrieval import (CControl, InstrumentedExecutor, STATUS_EARLY_RETURN, STATUS_ERROR,
+                                       STATUS_OK, STATUS_TIMEOUT)
+
+
+def delayed(delay, result):
+    def run(query):
+        time.sleep(delay)
+        return [dict(item, query=query) for item in result]
+    return run
+
+
+@pytest.fixture
+def control():
+    executor = InstrumentedExecutor(8, thread_name_prefix="test-retrieval")
+    yield CControl(executor=executor)
+    executor.pool.shutdown(wait=True)
+
+
+def test_latency_is_max_of_sources(control):
+    sources = {"graph": (delayed(0.3, [{"id": "g"}]), ("q",)),
+               "vector": (delayed(0.2, [{"id": "v"}]), ("q",)),
+               "es": (delayed(0.1, [{"id": "e"}]), ("q",))}
+    start = time.perf_counter()
+    results, metadata = control.run_sources(sources, timeouts={"graph": 2, "vector": 2, "es": 2})
+    elapsed = time.perf_counter() - start
+
+    # 串行执行需要0.6秒
+    assert 0.3 <= elapsed < 0.45
+    assert results == {"graph": [{"id": "g", "query": "q"}], "vector": [{"id": "v", "query": "q"}],
+                       "es": [{"id": "e", "query": "q"}]}
+    assert {name: item["status"] for name, item in metadata["sources"].items()} == dict.fromkeys(sources, STATUS_OK)
+    assert metadata["skipped"] == []
+    assert metadata["sources"]["es"]["elapsed"] < metadata["sources"]["graph"]["elapsed"]
+    assert control.executor.get_stats()["peak_running"] == 3
+
+
+def test_timeout_source_is_skipped(control):
+    sources = {"graph": (delayed(1.0, [{"id": "g"}]), ("q",)),
+               "vector": (delayed(0.05, [{"id": "v"}]), ("q",))}
+    start = time.perf_counter()
+    results, metadata = control.run_sources(sources, timeouts={"graph": 0.2, "vector": 1.0},
+                                            defaults={"graph": {"empty": True}})
+    elapsed = time.perf_counter() - start
+
+    assert 0.2 <= elapsed < 0.4
+    assert results["vector"] == [{"id": "v", "query": "q"}]
+    assert results["graph"] == {"empty": True}
+    assert metadata["sources"]["graph"]["status"] == STATUS_TIMEOUT
+    assert metadata["sources"]["vector"]["status"] == STATUS_OK
+    assert metadata["skipped"] == ["graph"]
+    assert control.executor.get_stats()["timeout"] == 1
+
+
+def test_missing_timeout_uses_largest(control):
+    sources = {"graph": (delayed(0.1, []), ("q",)), "other": (delayed(0.5, []), ("q",))}
+    results, metadata = control.run_sources(sources, timeouts={"graph": 0.3})
+    assert metadata["sources"]["other"]["status"] == STATUS_TIMEOUT
+    assert results["other"] == []
+
+
+def test_failed_source_is_reported(control):
+    def fail(query):
+        raise RuntimeError("neo4j down")
+    results, metadata = control.run_sources({"graph": (fail, ("q",)), "vector": (delayed(0.05, [{"id": "v"}]), ("q",))},
+                                            timeouts={"graph": 1, "vector": 1})
+    assert metadata["sources"]["graph"] == {"status": STATUS_ERROR, "elapsed": metadata["sources"]["graph"]["elapsed"],
+                                            "error_msg": "neo4j down"}
+    assert results["graph"] == [] and results["vector"] == [{"id": "v", "query": "q"}]
+    assert metadata["skipped"] == ["graph"]
+
+
+def test_early_return_stops_waiting(control, monkeypatch):
+    monkeypatch.setattr(control.config, "early_return_hits", 2)
+    monkeypatch.setattr(control.config, "early_return_score", 0.8)
+    good = [{"id": 1, "score": 0.9}, {"id": 2, "score": 0.85}, {"id": 3, "score": 0.1}]
+    sources = {"graph": (delayed(1.0, [{"id": "g"}]), ("q",)), "vector": (delayed(0.05, good), ("q",))}
+    start = time.perf_counter()
+    results, metadata = control.run_sources(sources, timeouts={"graph": 2, "vector": 2},
+                                            early_return=control.vector_early_return())
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.3
+    assert len(results["vector"]) == 3 and results["graph"] == []
+    assert metadata["sources"]["graph"]["status"] == STATUS_EARLY_RETURN
+    assert metadata["skipped"] == ["graph"]
+
+
+def test_early_return_needs_enough_good_hits(control, monkeypatch):
+    monkeypatch.setattr(control.config, "early_return_hits", 2)
+    monkeypatch.setattr(control.config, "early_return_score", 0.8)
+    weak = [{"id": 1, "score": 0.9}, {"id": 2, "score": 0.5}]
+    sources = {"graph": (delayed(0.2, [{"id": "g"}]), ("q",)), "vector": (delayed(0.05, weak), ("q",))}
+    results, metadata = control.run_sources(sources, timeouts={"graph": 2, "vector": 2},
+                                            early_return=control.vector_early_return())
+    assert results["graph"] == [{"id": "g", "query": "q"}]
+    assert metadata["skipped"] == []
+
+
+def test_early_return_disabled_by_default(control, monkeypatch):
+    monkeypatch.setattr(control.config, "early_return_hits", 0)
+    assert control.vector_early_return() is None
@@ -0,0 +1,109 @@
+# -*- coding:utf-8 -*-
+"""多引擎结果融合：RRF只看排名，CombSUM按归一化得分加权；融合为空时的引擎回退链"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from Utils.search_fusion import fuse_results, weighted_combsum, weighted_rrf
+
+
+def _engines():
+    # milvus中第一条遥遥领先，elasticsearch中两条得分接近
+    return {
+        "milvus": [{"title": "A", "content": "alpha", "score": 0.99},
+                   {"title": "B", "content": "bravo", "score": 0.10},
+                   {"title": "C", "content": "charlie", "score": 0.05}],
+        "elasticsearch": [{"title": "B", "content": "bravo", "score": 10.1},
+                          {"title": "D", "content": "delta", "score": 10.0},
+                          {"title": "E", "content": "echo", "score": 1.0}],
+    }
+
+
+def _order(results):
+    return [r["title"] for r in results]
+
+
+def test_rrf_ignores_score_normalization():
+    weights = {"milvus": 1.0, "elasticsearch": 1.0}
+    minmax = weighted_rrf(_engines(), weights, normalization="minmax", dedupe_threshold=1)
+    zscore = weighted_rrf(_engines(), weights, normalization="zscore", dedupe_threshold=1)
+    assert _order(minmax) == _order(zscore)
+    assert [r["combined_score"] for r in minmax] == [r["combined_score"] for r in zscore]
+
+
+def test_combsum_uses_normalized_scores():
+    weights = {"milvus": 1.0, "elasticsearch": 1.0}
+    results = weighted_combsum(_engines(), weights, normalization="minmax", dedupe_threshold=1)
+    scores = {r["title"]: r["combined_score"] for r in results}
+    # B: milvus (0.10-0.05)/0.94 + elasticsearch 1.0
+    assert scores["B"] == pytest.approx(1.0 + 0.05 / 0.94)
+    assert scores["A"] == pytest.approx(1.0)
+    assert scores["D"] == pytest.approx(9.0 / 9.1)
+    assert scores["C"] == 0 and scores["E"] == 0
+    assert _order(results)[:3] == ["B", "A", "D"]
+    assert sorted(results[0]["matched_engines"]) == ["elasticsearch", "milvus"]
+
+    # 得分分布改变时CombSUM结果随之改变，RRF不变
+    zscore = weighted_combsum(_engines(), weights, normalization="zscore", dedupe_threshold=1)
+    assert [r["combined_score"] for r in zscore] != [r["combined_score"] for r in results]
+
+
+def test_combsum_weights():
+    results = weighted_combsum(_engines(), {"milvus": 3.0, "elasticsearch": 1.0}, dedupe_threshold=1)
+    assert _order(results)[0] == "A"
+
+
+def test_unknown_fusion_method():
+    with pytest.raises(ValueError):
+        fuse_results(_engines(), {}, method="borda")
+
+
+@pytest.fixture
+def intent_agent():
+    module = pytest.importorskip("Agent.AgenticRagAgent.intent_recognition_agent")
+    from Control.control_retrieval import CControl as ControlRetrieval, get_search_engine_executor
+    from Config.retrieval_config import get_retrieval_config
+
+    agent = module.IntentRecognitionAgent.__new__(module.IntentRecognitionAgent)
+    agent.retrieval_obj = ControlRetrieval(get_search_engine_executor())
+    agent.retrieval_config = get_retrieval_config()
+    agent.calls = []
+    return agent
+
+
+def _engine(agent, name, results):
+    def search(state, query_text):
+        agent.calls.append(name)
+        if isinstance(results, Exception):
+            raise results
+        return list(results)
+    return search
+
+
+def test_empty_fusion_falls_back_to_milvus_when_milvus_skipped(intent_agent):
+    agent = intent_agent
+    milvus_results = [{"title": "M", "content": "m", "score": 0.5}]
+
+    def flaky_milvus(state, query_text):
+        # 多引擎并发搜索时Milvus失败，单引擎回退时恢复
+        agent.calls.append("milvus")
+        if agent.calls.count("milvus") == 1:
+            raise RuntimeError("milvus down")
+        return list(milvus_results)
+
+    agent.search_milvus = flaky_milvus
+    agent.search_elasticsearch = _engine(agent, "elasticsearch", [])
+    agent.search_graph_data = _engine(agent, "graph_data", [])
+    agent.search_csv_excel_data = _engine(agent, "csv_excel_data", [])
+    results = agent.search_triple_engines_with_graph({"knowledge_id": "kb"}, "q")
+    assert _order(results) == ["M"]
+    assert agent.calls.count("milvus") == 2
+
+
+def test_empty_results_do_not_repeat_searches(intent_agent):
+    agent = intent_agent
+    for name in ("milvus", "elasticsearch", "graph_data", "csv_excel_data"):
+        setattr(agent, f"search_{name}", _engine(agent, name, []))
+    assert agent.search_triple_engines_with_graph({"knowledge_id": "kb"}, "q") == []
+    assert sorted(agent.calls) == sorted(["milvus", "elasticsearch", "graph_data", "csv_excel_data"])
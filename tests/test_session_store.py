@@ -0,0 +1,161 @@
+# -*- coding:utf-8 -*-
+"""会话列表：摘要索引分页、历史会话补建、新建会话登记，以及列表只读取摘要（往返次数固定）"""
+
+import time
+import uuid
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+redis = pytest.importorskip("redis")
+
+from Control.control_sessions import CControl as ControlSessions
+from Db.redis_db import cRedisDB
+from Db.sqlite_db import cSingleSqlite
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(cRedisDB, "client", client)
+    return ControlSessions()
+
+
+@pytest.fixture
+def round_trips(monkeypatch):
+    """统计发往Redis的往返次数：单条命令与整个pipeline各算一次"""
+    counter = {"count": 0}
+    execute_command = redis.Redis.execute_command
+    execute = redis.client.Pipeline.execute
+
+    def count_command(self, *args, **kwargs):
+        counter["count"] += 1
+        return execute_command(self, *args, **kwargs)
+
+    def count_pipeline(self, *args, **kwargs):
+        counter["count"] += 1
+        return execute(self, *args, **kwargs)
+
+    monkeypatch.setattr(redis.Redis, "execute_command", count_command)
+    monkeypatch.setattr(redis.client.Pipeline, "execute", count_pipeline)
+    return counter
+
+
+def _chat(sessions, user_id, session_id, session_name, text):
+    sessions.save_chat_history(user_id, session_id, session_name,
+                               [{"type": "text", "content": text}],
+                               [{"type": "text", "content": f"回复：{text}"}])
+
+
+def test_paginated_listing_ordered_by_last_update(sessions):
+    user_id = f"user_{uuid.uuid4().hex}"
+    session_ids = [f"s_{i}_{uuid.uuid4().hex}" for i in range(5)]
+    for i, session_id in enumerate(session_ids):
+        _chat(sessions, user_id, session_id, f"会话{i}", f"问题{i}")
+        time.sleep(0.002)
+    # 最早的会话有新消息后排到最前
+    _chat(sessions, user_id, session_ids[0], "会话0", "追问")
+
+    first = sessions.get_sessions_by_user_id(user_id, page=1, page_size=2)
+    assert first["total"] == 5 and first["page"] == 1 and first["page_size"] == 2
+    assert [s["session_id"] for s in first["sessions"]] == [session_ids[0], session_ids[4]]
+    top = first["sessions"][0]
+    assert top["session_name"] == "会话0"
+    assert top["last_message"] == "回复：追问"
+    assert top["message_count"] == 2
+    assert set(top) == {"session_id", "session_name", "last_message", "updated_at", "message_count"}
+
+    last = sessions.get_sessions_by_user_id(user_id, page=3, page_size=2)
+    assert [s["session_id"] for s in last["sessions"]] == [session_ids[1]]
+
+
+def test_new_session_listed_before_first_message(sessions):
+    user_id = f"user_{uuid.uuid4().hex}"
+    session_id = f"s_{uuid.uuid4().hex}"
+    assert sessions.create_session_info(user_id, session_id, "新会话", "")
+
+    result = sessions.get_sessions_by_user_id(user_id)
+    assert result["total"] == 1
+    assert result["sessions"][0]["session_name"] == "新会话"
+    assert result["sessions"][0]["message_count"] == 0
+
+    _chat(sessions, user_id, session_id, "新会话", "你好")
+    summary = sessions.get_sessions_by_user_id(user_id)["sessions"][0]
+    assert summary["message_count"] == 1 and summary["last_message"] == "回复：你好"
+
+
+def test_backfill_sessions_written_before_summaries(sessions):
+    user_id = f"user_{uuid.uuid4().hex}"
+    old_id, empty_id = f"s_old_{uuid.uuid4().hex}", f"s_empty_{uuid.uuid4().hex}"
+    for session_id, name in ((old_id, "旧会话"), (empty_id, "空会话")):
+        cSingleSqlite.save_session_info({"user_id": user_id, "session_id": session_id, "session_name": name})
+    # 摘要功能上线前只写了聊天记录
+    cRedisDB.client.zadd(f"chat_history:{old_id}", {
+        '{"timestamp": 4102444800, "query": "旧问题", "response": "旧回答"}': 4102444800})
+
+    result = sessions.get_sessions_by_user_id(user_id)
+    assert result["total"] == 2
+    by_id = {s["session_id"]: s for s in result["sessions"]}
+    assert [s["session_id"] for s in result["sessions"]] == [old_id, empty_id]
+    assert by_id[old_id]["last_message"] == "旧回答" and by_id[old_id]["message_count"] == 1
+    assert by_id[empty_id]["session_name"] == "空会话" and by_id[empty_id]["message_count"] == 0
+    assert by_id[empty_id]["updated_at"] > 0
+
+
+def test_listing_reads_summaries_only(sessions, round_trips):
+    user_id = f"user_{uuid.uuid4().hex}"
+    for i in range(30):
+        session_id = f"s_{i}_{uuid.uuid4().hex}"
+        for j in range(5):
+            _chat(sessions, user_id, session_id, f"会话{i}", "很长的消息" * 200)
+    sessions.get_sessions_by_user_id(user_id)  # 首次访问补建索引
+
+    round_trips["count"] = 0
+    result = sessions.get_sessions_by_user_id(user_id, page=1, page_size=20)
+    assert len(result["sessions"]) == 20
+    # 一次读取索引，一次批量读取摘要，与会话数和聊天记录条数无关
+    assert round_trips["count"] == 2
+    assert all(len(s["last_message"]) <= 100 for s in result["sessions"])
+
+
+def test_delete_session_removes_summary_and_index(sessions):
+    user_id = f"user_{uuid.uuid4().hex}"
+    keep_id, drop_id = f"s_keep_{uuid.uuid4().hex}", f"s_drop_{uuid.uuid4().hex}"
+    _chat(sessions, user_id, keep_id, "保留", "a")
+    _chat(sessions, user_id, drop_id, "删除", "b")
+
+    # 与删除会话接口一致：先删Redis中的聊天记录与摘要，再删会话表
+    sessions.delete_session_messages_by_id(drop_id)
+    cSingleSqlite.delete_sessions_by_session_id(drop_id)
+    result = sessions.get_sessions_by_user_id(user_id)
+    assert [s["session_id"] for s in result["sessions"]] == [keep_id]
+    assert not cRedisDB.client.exists(f"chat_history:{drop_id}", f"chat_summary:{drop_id}")
+
+
+def test_redis_unavailable_falls_back_to_sqlite(monkeypatch):
+    user_id = f"user_{uuid.uuid4().hex}"
+    session_ids = [f"s_{i}_{uuid.uuid4().hex}" for i in range(3)]
+    for i, session_id in enumerate(session_ids):
+        cSingleSqlite.save_session_info({"user_id": user_id, "session_id": session_id, "session_name": f"会话{i}"})
+        cSingleSqlite.conn.execute("UPDATE session SET session_create_time = ? WHERE session_id = ?",
+                                   (f"2026-01-0{i + 1} 00:00:00", session_id))
+    # 连接不上的Redis
+    monkeypatch.setattr(cRedisDB, "client", redis.Redis(host="127.0.0.1", port=1, socket_connect_timeout=0.1))
+
+    result = ControlSessions().get_sessions_by_user_id(user_id, page=1, page_size=2)
+    assert result["total"] == 3
+    assert [s["session_id"] for s in result["sessions"]] == [session_ids[2], session_ids[1]]
+    assert result["sessions"][0]["session_name"] == "会话2" and result["sessions"][0]["message_count"] == 0
+
+
+def test_session_list_route_keeps_messages(sessions):
+    run_server = pytest.importorskip("Servers.run_server")
+    user_id = f"user_{uuid.uuid4().hex}"
+    session_id = f"s_{uuid.uuid4().hex}"
+    sessions.create_session_info(user_id, session_id, "会话", "")
+
+    response = run_server.app.test_client().post("/api/get_user_session_messages",
+                                                 json={"user_id": user_id}).get_json()
+    assert response["success"]
+    assert response["messages"] == [{"session_id": session_id, "session_name": "会话", "session_desc": ""}]
+    assert response["total"] == 1 and response["sessions"][0]["session_id"] == session_id
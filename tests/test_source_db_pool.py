@@ -0,0 +1,204 @@
+# -*- coding:utf-8 -*-
+"""外部数据源连接池：连接复用、上限与等待超时、失效/过期连接回收、归还时回滚，以及按连接信息重建连接池"""
+
+import threading
+import time
+
+import pytest
+
+from Db import source_db_pool
+from Db.source_db_pool import SourceConnectionPool, SourcePoolTimeout
+
+
+class FakeConnection:
+    def __init__(self, alive=True):
+        self.closed = False
+        self.alive = alive
+        self.fail_rollback = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        if self.fail_rollback:
+            raise RuntimeError("rollback failed")
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql):
+        if not self.conn.alive:
+            raise RuntimeError("server has gone away")
+
+    def fetchall(self):
+        return [(1,)]
+
+    def close(self):
+        pass
+
+
+def _pool(**kwargs):
+    created = []
+
+    def connect():
+        conn = FakeConnection()
+        created.append(conn)
+        return conn
+    kwargs.setdefault("ping_interval", 60)
+    return SourceConnectionPool(connect, "postgresql", **kwargs), created
+
+
+def test_connections_are_reused_and_rolled_back():
+    pool, created = _pool()
+    for _ in range(5):
+        with pool.connection() as conn:
+            assert conn is created[0]
+    assert len(created) == 1
+    assert created[0].rollbacks == 5
+    stats = pool.get_stats()
+    assert (stats["connects"], stats["reuses"], stats["idle"], stats["in_use"]) == (1, 4, 1, 0)
+
+
+def test_checkout_waits_and_times_out_when_full():
+    pool, created = _pool(max_size=2, checkout_timeout=0.1)
+    first, second = pool.acquire(), pool.acquire()
+    start = time.time()
+    with pytest.raises(SourcePoolTimeout):
+        pool.acquire()
+    assert time.time() - start >= 0.1
+    assert pool.get_stats()["timeouts"] == 1
+
+    # 归还后等待中的请求拿到同一个连接
+    threading.Timer(0.05, pool.release, args=(first,)).start()
+    pool.checkout_timeout = 2
+    assert pool.acquire() is first
+    assert len(created) == 2
+    pool.release(second)
+
+
+def test_concurrent_checkouts_never_exceed_max_size():
+    pool, created = _pool(max_size=4)
+    lock = threading.Lock()
+    active, peak = [0], [0]
+
+    def worker():
+        for _ in range(20):
+            with pool.connection():
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(0.001)
+                with lock:
+                    active[0] -= 1
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] <= 4
+    assert len(created) <= 4
+    assert pool.get_stats()["in_use"] == 0
+
+
+def test_dead_connections_are_replaced():
+    pool, created = _pool(ping_interval=0)
+    with pool.connection():
+        pass
+    created[0].alive = False
+    with pool.connection() as conn:
+        assert conn is created[1]
+    assert created[0].closed
+    assert pool.get_stats()["discarded"] == 1
+
+    # 已关闭的连接不需要ping
+    created[1].closed = True
+    pings = pool.get_stats()["pings"]
+    with pool.connection() as conn:
+        assert conn is created[2]
+    assert pool.get_stats()["pings"] == pings
+
+
+def test_recent_connections_skip_ping():
+    pool, created = _pool(ping_interval=60)
+    with pool.connection():
+        pass
+    created[0].alive = False
+    with pool.connection() as conn:
+        assert conn is created[0]
+    assert pool.get_stats()["pings"] == 0
+
+
+def test_idle_and_lifetime_eviction(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(source_db_pool.time, "time", lambda: now[0])
+    pool, created = _pool(min_size=1, max_idle=10, max_lifetime=100)
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(first)
+    pool.release(second)
+
+    # 空闲超时的连接被回收，保留 min_size 个
+    now[0] += 11
+    pool.evict_idle()
+    assert pool.get_stats()["idle"] == 1
+    assert sum(conn.closed for conn in created) == 1
+
+    # 超过最长存活时间的连接不再复用
+    now[0] += 100
+    with pool.connection() as conn:
+        assert conn is created[2]
+    assert all(conn.closed for conn in created[:2])
+
+
+def test_failed_rollback_discards_connection():
+    pool, created = _pool()
+    conn = pool.acquire()
+    conn.fail_rollback = True
+    pool.release(conn)
+    assert conn.closed
+    assert pool.get_stats()["idle"] == 0
+
+
+def test_close_closes_idle_and_returned_connections():
+    pool, created = _pool()
+    idle, in_use = pool.acquire(), pool.acquire()
+    pool.release(idle)
+    pool.close()
+    assert idle.closed and not in_use.closed
+    pool.release(in_use)
+    assert in_use.closed
+    with pytest.raises(Exception, match="已关闭"):
+        pool.acquire()
+
+
+def test_registry_rebuilds_pool_on_connection_change(monkeypatch):
+    opened = []
+
+    def fake_open(ip, port, sql_type, sql_name, user, password, **kwargs):
+        opened.append((password, kwargs))
+        return FakeConnection(), sql_type
+    monkeypatch.setattr(source_db_pool, "open_source_connection", fake_open)
+
+    args = ("db.local", 5432, "postgresql", "sales", "reader")
+    pool = source_db_pool.get_source_pool("pool_test", *args, "pw1")
+    assert source_db_pool.get_source_pool("pool_test", *args, "pw1") is pool
+    with pool.connection():
+        pass
+    assert opened[0][1]["read_only"] is True
+
+    rebuilt = source_db_pool.get_source_pool("pool_test", *args, "pw2")
+    assert rebuilt is not pool and pool.closed
+    assert "pool_test" in source_db_pool.get_source_pool_stats()
+    # 指纹不保存明文密码
+    assert "pw2" not in repr(source_db_pool._pools["pool_test"][0])
+
+    assert source_db_pool.close_source_pool("pool_test")
+    assert rebuilt.closed
+    assert not source_db_pool.close_source_pool("pool_test")
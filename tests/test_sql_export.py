@@ -0,0 +1,119 @@
+# -*- coding:utf-8 -*-
+"""查询结果流式导出CSV：分批写入的内存占用、行数上限截断、失败清理，以及导出文件的归属校验与过期清理"""
+
+import csv
+import os
+import sqlite3
+import time
+import tracemalloc
+
+import pytest
+
+from Db import source_db_export
+from Db.source_db_export import (cleanup_expired_exports, new_export_path, resolve_export_file,
+                                 stream_query_to_csv)
+
+ROWS = 200000
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE orders (id INTEGER, customer TEXT, amount REAL);")
+    conn.executemany("INSERT INTO orders VALUES (?, ?, ?);",
+                     ((i, f"customer_{i % 1000}", i * 0.5) for i in range(ROWS)))
+    yield conn
+    conn.close()
+
+
+def _read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_stream_writes_all_rows_with_bounded_memory(conn, tmp_path):
+    csv_path = str(tmp_path / "out" / "orders.csv")
+    tracemalloc.start()
+    try:
+        result = stream_query_to_csv(conn, "sqlite", "SELECT id, customer, amount FROM orders ORDER BY id",
+                                     csv_path, ["id", "customer", "amount"], batch_size=1000)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert result["rows"] == ROWS and not result["truncated"]
+    assert result["preview"][:2] == [[0, "customer_0", 0.0], [1, "customer_1", 0.5]]
+    assert len(result["preview"]) == 10
+    # 整体读取 20 万行约需数十MB，分批写入只与批大小有关
+    assert peak < 5 * 2 ** 20, peak
+
+    rows = _read_csv(csv_path)
+    assert rows[0] == ["id", "customer", "amount"]
+    assert len(rows) == ROWS + 1
+    assert rows[-1] == [str(ROWS - 1), f"customer_{(ROWS - 1) % 1000}", str((ROWS - 1) * 0.5)]
+
+
+def test_stream_truncates_at_max_rows(conn, tmp_path):
+    csv_path = str(tmp_path / "orders.csv")
+    result = stream_query_to_csv(conn, "sqlite", "SELECT id FROM orders ORDER BY id", csv_path, ["id"],
+                                 batch_size=300, preview_rows=3, max_rows=1000)
+    assert result == {"rows": 1000, "preview": [[0], [1], [2]], "truncated": True}
+    assert len(_read_csv(csv_path)) == 1001
+
+
+def test_failed_query_removes_partial_file(conn, tmp_path):
+    def explode(value):
+        if value == 5000:
+            raise ValueError("boom")
+        return value
+
+    conn.create_function("explode", 1, explode)
+    csv_path = str(tmp_path / "orders.csv")
+    with pytest.raises(sqlite3.OperationalError):
+        stream_query_to_csv(conn, "sqlite", "SELECT explode(id) FROM orders ORDER BY id", csv_path, ["id"],
+                            batch_size=1000)
+    assert not os.path.exists(csv_path)
+
+
+def test_only_select_uses_named_cursor():
+    assert source_db_export._is_select("  (SELECT 1)")
+    assert source_db_export._is_select("WITH t AS (SELECT 1) SELECT * FROM t")
+    assert not source_db_export._is_select("SHOW TABLES")
+
+
+def test_export_files_are_owner_scoped(tmp_path):
+    export_dir = str(tmp_path / "exports")
+    alice_path = new_export_path(export_dir, "alice") + ".csv"
+    bob_path = new_export_path(export_dir, "bob") + ".csv"
+    assert os.path.dirname(alice_path) != os.path.dirname(bob_path)
+    assert "alice" not in alice_path
+
+    assert resolve_export_file(export_dir, "alice", alice_path) == os.path.abspath(alice_path)
+    assert resolve_export_file(export_dir, "alice", bob_path) is None
+    assert resolve_export_file(export_dir, "bob", bob_path) == os.path.abspath(bob_path)
+    traversal = os.path.join(os.path.dirname(alice_path), "..", os.path.basename(bob_path))
+    assert resolve_export_file(export_dir, "alice", traversal) is None
+    assert resolve_export_file(export_dir, "alice", alice_path[:-4] + ".txt") is None
+    assert resolve_export_file(export_dir, "", alice_path) is None
+
+
+def test_cleanup_removes_expired_exports(tmp_path, monkeypatch):
+    export_dir = tmp_path / "exports"
+    user_dir = export_dir / "owner"
+    user_dir.mkdir(parents=True)
+    old, fresh, other = user_dir / "old.csv", user_dir / "fresh.csv", user_dir / "keep.txt"
+    for path in (old, fresh, other):
+        path.write_text("id\n1\n")
+    past = time.time() - 7200
+    os.utime(old, (past, past))
+    os.utime(other, (past, past))
+
+    assert cleanup_expired_exports(str(export_dir), ttl=3600, force=True) == 1
+    assert not old.exists() and fresh.exists() and other.exists()
+
+    # 非强制清理受执行间隔限制
+    os.utime(fresh, (past, past))
+    monkeypatch.setattr(source_db_export, "_last_cleanup", time.time())
+    assert cleanup_expired_exports(str(export_dir), ttl=3600) == 0
+    assert fresh.exists()
+    assert cleanup_expired_exports(str(export_dir), ttl=0, force=True) == 0
@@ -0,0 +1,44 @@
+# -*- coding:utf-8 -*-
+"""数据源表结构的增量保存与列关联关系"""
+
+import uuid
+
+from Db.sqlite_db import cSingleSqlite
+
+
+def _table(table_id, schema_hash, col_name):
+    return {"table_id": table_id, "table_name": "orders", "table_description": "",
+            "schema_hash": schema_hash,
+            "columns": [{"col_id": f"col_{uuid.uuid4().hex}", "col_name": col_name,
+                         "col_type": "int", "col_info": {"col_name": col_name}}],
+            "foreign_keys": []}
+
+
+def _table_row(table_id):
+    c = cSingleSqlite.conn.cursor()
+    c.execute("SELECT schema_hash, create_time, update_time FROM table_sql WHERE table_id = ?;", (table_id,))
+    return c.fetchone()
+
+
+def test_save_sql_schema_keeps_create_time():
+    sql_id = f"sql_{uuid.uuid4().hex}"
+    table_id = f"table_{uuid.uuid4().hex}"
+    assert cSingleSqlite.save_sql_schema(sql_id, [_table(table_id, "h1", "id")])
+    cSingleSqlite.conn.execute("UPDATE table_sql SET create_time = '2020-01-01 00:00:00' WHERE table_id = ?;",
+                               (table_id,))
+
+    assert cSingleSqlite.save_sql_schema(sql_id, [_table(table_id, "h2", "order_id")])
+    schema_hash, create_time, update_time = _table_row(table_id)
+    assert schema_hash == "h2"
+    assert create_time == "2020-01-01 00:00:00"
+    assert update_time != create_time
+    assert cSingleSqlite.query_table_schema_hashes(sql_id) == {"orders": {"table_id": table_id, "schema_hash": "h2"}}
+
+
+def test_query_rel_by_rel_id():
+    sql_id, rel_id = f"sql_{uuid.uuid4().hex}", f"rel_{uuid.uuid4().hex}"
+    assert cSingleSqlite.insert_rel_sql({"rel_id": rel_id, "sql_id": sql_id, "from_table": "orders",
+                                         "from_col": "customer_id", "to_table": "customers", "to_col": "id"})
+    rel = cSingleSqlite.query_rel_sql_by_rel_id(rel_id)
+    assert rel["sql_id"] == sql_id and rel["from_table"] == "orders"
+    assert cSingleSqlite.query_rel_sql_by_rel_id("missing") is None
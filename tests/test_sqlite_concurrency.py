@@ -0,0 +1,102 @@
+# -*- coding:utf-8 -*-
+"""KnowledgeBaseDB 的事务语义与多线程读写压力测试"""
+
+import sqlite3
+import threading
+import time
+import uuid
+
+import pytest
+
+from Db.sqlite_db import cSingleSqlite
+
+READERS = 32
+WRITERS = 4
+DURATION = 2.0
+
+
+def test_transaction_commits_all_statements():
+    user_id = f"user_{uuid.uuid4().hex}"
+    with cSingleSqlite.transaction():
+        for i in range(3):
+            cSingleSqlite.save_session_info({"user_id": user_id, "session_id": f"{user_id}_{i}"})
+    assert len(cSingleSqlite.search_session_by_user_id(user_id)) == 3
+
+
+def test_transaction_rolls_back_swallowed_error():
+    """方法内部捕获了异常，事务结束时仍整体回滚"""
+    user_id = f"user_{uuid.uuid4().hex}"
+    with pytest.raises(sqlite3.DatabaseError):
+        with cSingleSqlite.transaction():
+            assert cSingleSqlite.save_session_info({"user_id": user_id, "session_id": f"{user_id}_0"})
+            try:
+                cSingleSqlite.conn.execute("INSERT INTO table_not_exists VALUES (1);")
+            except sqlite3.OperationalError:
+                pass
+    assert cSingleSqlite.search_session_by_user_id(user_id) == []
+
+
+def test_executemany_is_atomic():
+    cSingleSqlite.conn.execute("CREATE TABLE IF NOT EXISTS test_batch (id INTEGER PRIMARY KEY, value TEXT);")
+    base = int(time.time() * 1000) * 10
+    rows = [(base + 1, "a"), (base + 2, "b"), (base + 1, "duplicate")]
+    with pytest.raises(sqlite3.IntegrityError):
+        cSingleSqlite.conn.executemany("INSERT INTO test_batch (id, value) VALUES (?, ?);", rows)
+    c = cSingleSqlite.conn.cursor()
+    c.execute("SELECT COUNT(*) FROM test_batch WHERE id IN (?, ?);", (base + 1, base + 2))
+    assert c.fetchone()[0] == 0
+
+
+def test_concurrent_readers_and_writers():
+    """32个读线程、4个写线程并发访问，不出现异常，写入结果完整，并输出吞吐"""
+    user_id = f"user_{uuid.uuid4().hex}"
+    stop = threading.Event()
+    errors = []
+    counts = {"read": 0, "write": 0}
+    counts_lock = threading.Lock()
+    written = []
+
+    def reader():
+        n = 0
+        try:
+            while not stop.is_set():
+                cSingleSqlite.search_session_by_user_id(user_id)
+                n += 1
+        except Exception as e:
+            errors.append(e)
+        with counts_lock:
+            counts["read"] += n
+
+    def writer(index):
+        n = 0
+        try:
+            while not stop.is_set():
+                session_id = f"{user_id}_{index}_{n}"
+                # 写入两条后删除一条，多语句写入放在一个事务内
+                with cSingleSqlite.transaction():
+                    assert cSingleSqlite.save_session_info({"user_id": user_id, "session_id": session_id})
+                    assert cSingleSqlite.save_session_info({"user_id": user_id, "session_id": session_id + "_tmp"})
+                    cSingleSqlite.delete_sessions_by_session_id(session_id + "_tmp")
+                written.append(session_id)
+                n += 1
+        except Exception as e:
+            errors.append(e)
+        with counts_lock:
+            counts["write"] += n
+
+    threads = [threading.Thread(target=reader) for _ in range(READERS)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(WRITERS)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(DURATION)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    assert errors == []
+    sessions = {s["session_id"] for s in cSingleSqlite.search_session_by_user_id(user_id)}
+    assert sessions == set(written)
+    print(f"\n{READERS} readers / {WRITERS} writers: "
+          f"{counts['read'] / elapsed:.0f} reads/s, {counts['write'] / elapsed:.0f} write transactions/s")
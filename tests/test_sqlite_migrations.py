@@ -0,0 +1,119 @@
+# -*- coding:utf-8 -*-
+"""数据库迁移：版本记录、失败回滚、多进程同时启动只执行一次，以及热点查询走索引"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from Db.sqlite_db import cSingleSqlite, LOOKUP_INDEXES
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# 模块内按条件查询/删除的热点语句，参数用占位值
+HOT_QUERIES = [
+    ("SELECT * FROM graph_chunk WHERE knowledge_id = ? AND chunk_id = ?", ("kb", "c")),
+    ("SELECT * FROM col_sql WHERE table_id = ? AND col_name = ?", ("t", "c")),
+    ("SELECT * FROM session WHERE user_id = ?", ("u",)),
+    ("SELECT * FROM session WHERE session_id = ?", ("s",)),
+    ("SELECT file_name FROM file_basic_info WHERE knowledge_id = ? AND permission_level = 'public'", ("kb",)),
+    ("SELECT * FROM file_basic_info WHERE file_name = ? AND upload_user_id = ?", ("f", "u")),
+    ("SELECT * FROM user_info WHERE user_name = ?", ("u",)),
+    ("SELECT * FROM ingest_job WHERE status = ? ORDER BY create_time LIMIT 1", ("queued",)),
+    ("SELECT * FROM ingest_job WHERE knowledge_id = ? AND user_id = ? ORDER BY create_time", ("kb", "u")),
+    ("SELECT * FROM rel_sql WHERE sql_id = ?", ("s",)),
+    ("SELECT * FROM table_sql WHERE sql_id = ? AND table_name = ?", ("s", "t")),
+    ("DELETE FROM graph_node WHERE file_id = ?", ("f",)),
+    ("DELETE FROM graph_relation WHERE file_id = ?", ("f",)),
+]
+
+
+def test_all_migrations_recorded():
+    versions = [version for version, _, _ in cSingleSqlite.get_migrations()]
+    c = cSingleSqlite.conn.cursor()
+    c.execute("SELECT version FROM schema_version ORDER BY version;")
+    assert [row[0] for row in c.fetchall()] == versions
+    assert cSingleSqlite.get_schema_version() == versions[-1]
+
+    # 再次执行不重复记录
+    assert cSingleSqlite.run_migrations()
+    c.execute("SELECT COUNT(*) FROM schema_version;")
+    assert c.fetchone()[0] == len(versions)
+
+
+def test_lookup_indexes_exist():
+    c = cSingleSqlite.conn.cursor()
+    c.execute("SELECT name FROM sqlite_master WHERE type = 'index';")
+    names = {row[0] for row in c.fetchall()}
+    assert {index_name for index_name, _, _ in LOOKUP_INDEXES} <= names
+
+
+@pytest.mark.parametrize("sql, params", HOT_QUERIES)
+def test_hot_queries_use_index(sql, params):
+    c = cSingleSqlite.conn.cursor()
+    c.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+    plan = " | ".join(row[-1] for row in c.fetchall())
+    assert "USING INDEX" in plan or "USING COVERING INDEX" in plan, plan
+    assert "SCAN" not in plan.replace("SCAN CONSTANT ROW", ""), plan
+    assert "TEMP B-TREE" not in plan, plan
+
+
+def test_failed_migration_rolls_back(monkeypatch):
+    current = cSingleSqlite.get_schema_version()
+    migrations = cSingleSqlite.get_migrations()
+
+    def broken(c):
+        c.execute("CREATE INDEX idx_should_not_exist ON session (session_name);")
+        raise RuntimeError("migration failed")
+
+    monkeypatch.setattr(cSingleSqlite, "get_migrations",
+                        lambda: migrations + [(current + 1, "失败的迁移", broken)])
+    assert cSingleSqlite.run_migrations() is False
+    assert cSingleSqlite.get_schema_version() == current
+    c = cSingleSqlite.conn.cursor()
+    c.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'idx_should_not_exist';")
+    assert c.fetchone()[0] == 0
+
+
+def test_concurrent_startup_applies_each_migration_once(tmp_path):
+    os.makedirs(tmp_path / "conf" / "sqlite")
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    processes = [subprocess.Popen([sys.executable, "-c", "import Db.sqlite_db"], cwd=tmp_path, env=env,
+                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+                 for _ in range(4)]
+    outputs = [process.communicate(timeout=120)[0] for process in processes]
+    assert all(process.returncode == 0 for process in processes), outputs
+    assert not any("数据库迁移失败" in output for output in outputs), outputs
+
+    import sqlite3
+    conn = sqlite3.connect(tmp_path / "conf" / "sqlite" / "knowledge_base.sqlite")
+    try:
+        versions = [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version;")]
+    finally:
+        conn.close()
+    assert versions == [version for version, _, _ in cSingleSqlite.get_migrations()]
+
+
+def test_user_name_index_excludes_password(tmp_path, monkeypatch):
+    c = cSingleSqlite.conn.cursor()
+    c.execute("PRAGMA index_info(idx_user_info_user_name);")
+    assert [row[2] for row in c.fetchall()] == ["user_name"]
+
+    # 已执行过v1的旧数据库：索引包含password列，升级后重建
+    import sqlite3
+    from Db.sqlite_db import KnowledgeBaseDB
+    os.makedirs(tmp_path / "conf" / "sqlite")
+    conn = sqlite3.connect(tmp_path / "conf" / "sqlite" / "knowledge_base.sqlite")
+    conn.execute("CREATE TABLE user_info (user_id TEXT PRIMARY KEY, user_name TEXT, password TEXT, permissions TEXT);")
+    conn.execute("CREATE INDEX idx_user_info_user_name ON user_info (user_name, password);")
+    conn.execute("CREATE TABLE schema_version (version INTEGER PRIMARY KEY, description TEXT, applied_time TEXT);")
+    conn.executemany("INSERT INTO schema_version VALUES (?, '', '');", [(version,) for version in range(1, 6)])
+    conn.commit()
+    conn.close()
+    monkeypatch.chdir(tmp_path)
+    db = KnowledgeBaseDB()
+    c = db.conn.cursor()
+    c.execute("PRAGMA index_info(idx_user_info_user_name);")
+    assert [row[2] for row in c.fetchall()] == ["user_name"]
+    assert db.get_schema_version() == cSingleSqlite.get_migrations()[-1][0]
@@ -0,0 +1,176 @@
+# -*- coding:utf-8 -*-
+"""ASGI模式的SSE桥接：有界线程数与满载时拒绝新流、并发流的首字延迟、背压、客户端断开时关闭流水线生成器"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from Config.server_config import ServerConfig
+from Servers import sse_stream
+from Servers.sse_stream import iterate_in_thread
+
+CHUNKS = 10
+CHUNK_DELAY = 0.02
+
+
+class FakeLLM:
+    """按固定间隔产生数据块的同步生成器，记录被关闭的次数"""
+
+    def __init__(self, chunks=CHUNKS, delay=CHUNK_DELAY):
+        self.chunks = chunks
+        self.delay = delay
+        self.produced = 0
+        self.closed = 0
+        self.lock = threading.Lock()
+
+    def stream(self):
+        try:
+            for i in range(self.chunks):
+                time.sleep(self.delay)
+                with self.lock:
+                    self.produced += 1
+                yield f"data: {i}\n\n"
+        except GeneratorExit:
+            with self.lock:
+                self.closed += 1
+            raise
+
+
+async def _consume(make_iterator, executor=None, queue_size=None):
+    start = time.perf_counter()
+    first, items = None, []
+    async for item in iterate_in_thread(make_iterator, executor=executor, queue_size=queue_size):
+        if first is None:
+            first = time.perf_counter() - start
+        items.append(item)
+    return first, time.perf_counter() - start, items
+
+
+def test_default_worker_num_is_bounded(monkeypatch):
+    monkeypatch.delenv("SSE_WORKER_NUM", raising=False)
+    monkeypatch.delenv("SSE_MAX_WAITING_STREAMS", raising=False)
+    config = ServerConfig()
+    assert 20 <= config.sse_worker_num <= 128
+    assert config.sse_max_waiting > 0
+
+
+def test_saturated_when_running_and_waiting_streams_reach_limit(monkeypatch):
+    config = sse_stream.get_server_config()
+    monkeypatch.setattr(config, "sse_worker_num", 2)
+    monkeypatch.setattr(config, "sse_max_waiting", 1)
+    assert not sse_stream.is_saturated()
+    sse_stream._track_stream(3)
+    try:
+        assert sse_stream.is_saturated()
+        sse_stream._track_stream(-1)
+        assert not sse_stream.is_saturated()
+    finally:
+        sse_stream._track_stream(-2)
+
+
+def test_saturated_server_rejects_new_stream(monkeypatch):
+    asgi = pytest.importorskip("Servers.run_asgi_server")
+    monkeypatch.setattr(asgi, "is_saturated", lambda: True)
+    llm = FakeLLM()
+    events = llm.stream()
+    next(events)
+
+    class FakeRequest:
+        headers = {}
+    response = asgi.sse_response(FakeRequest(), events, None)
+    assert response.status_code == 503
+    # 已创建的流水线生成器被关闭
+    assert llm.closed == 1
+
+
+def test_twenty_concurrent_streams_first_chunk_latency():
+    """默认线程数下20个并发流都不排队：首字延迟约等于一个数据块的生成时间"""
+    llm = FakeLLM()
+    executor = ThreadPoolExecutor(max_workers=ServerConfig().sse_worker_num)
+
+    async def run():
+        return await asyncio.gather(*[_consume(llm.stream, executor=executor) for _ in range(20)])
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        executor.shutdown(wait=True)
+    first_latencies = sorted(first for first, _, _ in results)
+    assert all(len(items) == CHUNKS for _, _, items in results)
+    # 排队时首字延迟至少是一整个流的时间（CHUNKS * CHUNK_DELAY）
+    assert first_latencies[-1] < CHUNKS * CHUNK_DELAY
+    assert max(total for _, total, _ in results) < 2 * CHUNKS * CHUNK_DELAY
+
+
+def test_streams_beyond_worker_num_queue():
+    llm = FakeLLM(chunks=5)
+    executor = ThreadPoolExecutor(max_workers=2)
+
+    async def run():
+        return await asyncio.gather(*[_consume(llm.stream, executor=executor) for _ in range(4)])
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        executor.shutdown(wait=True)
+    first_latencies = sorted(first for first, _, _ in results)
+    assert all(len(items) == 5 for _, _, items in results)
+    assert first_latencies[-1] >= 5 * CHUNK_DELAY
+
+
+def test_backpressure_pauses_pipeline():
+    llm = FakeLLM(chunks=50, delay=0)
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    async def run():
+        stream = iterate_in_thread(llm.stream, executor=executor, queue_size=4)
+        await stream.__anext__()
+        await asyncio.sleep(0.2)
+        produced = llm.produced
+        await stream.aclose()
+        return produced
+
+    try:
+        produced = asyncio.run(run())
+    finally:
+        executor.shutdown(wait=True)
+    # 读取了1个，缓冲4个，流水线线程停在下一个数据块之前
+    assert produced <= 6
+    assert llm.closed == 1
+
+
+def test_disconnect_closes_pipeline_generators():
+    llm = FakeLLM(chunks=100)
+    executor = ThreadPoolExecutor(max_workers=20)
+
+    async def early_close():
+        stream = iterate_in_thread(llm.stream, executor=executor)
+        for _ in range(3):
+            await stream.__anext__()
+        await stream.aclose()
+
+    async def run():
+        await asyncio.gather(*[early_close() for _ in range(20)])
+
+    try:
+        asyncio.run(run())
+    finally:
+        executor.shutdown(wait=True)
+    assert llm.closed == 20
+    assert llm.produced < 20 * 100
+
+
+def test_pipeline_error_is_raised():
+    def broken():
+        yield "data: 0\n\n"
+        raise ValueError("boom")
+
+    async def run():
+        return await _consume(broken)
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
+    assert sse_stream._active_streams == 0
@@ -0,0 +1,182 @@
+# -*- coding:utf-8 -*-
+"""智能问数表格路由：画像向量入库时计算并写回文件、按相似度筛选文件、SQL缓存与大模型并发上限"""
+
+import json
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from Agent.AgenticRagAgent import table_router
+from Agent.AgenticRagAgent.table_router import PROFILE_TABLE, TableRouter, normalize_question
+
+VOCAB = ["销售", "金额", "员工", "工资", "库存", "商品"]
+
+
+class KeywordEmbeddings:
+    """按关键词出现次数生成向量，统计向量化调用"""
+    model_name = "keyword"
+
+    def __init__(self):
+        self.documents = []
+        self.queries = []
+
+    def _vector(self, text):
+        return [float(text.count(word)) for word in VOCAB] + [0.01]
+
+    def embed_documents(self, texts):
+        self.documents.append(list(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return self._vector(text)
+
+
+def _make_file(path, tables):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE _table_metadata (table_name TEXT, sheet_name TEXT, description TEXT)")
+    conn.execute("CREATE TABLE _column_metadata (table_name TEXT, column_name TEXT, description TEXT, sample_values TEXT)")
+    for table_name, description, columns in tables:
+        conn.execute("INSERT INTO _table_metadata VALUES (?, ?, ?)", (table_name, table_name, description))
+        for column_name, column_description in columns:
+            conn.execute("INSERT INTO _column_metadata VALUES (?, ?, ?, ?)",
+                         (table_name, column_name, column_description, json.dumps(["a", "b"])))
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+@pytest.fixture
+def files(tmp_path):
+    return {
+        "sales": _make_file(tmp_path / "sales.sqlite", [
+            ("orders", "销售订单", [("amount", "销售金额"), ("sku", "商品编号")]),
+            ("refunds", "退款记录", [("refund", "退款金额")])]),
+        "hr": _make_file(tmp_path / "hr.sqlite", [("staff", "员工信息", [("salary", "员工工资")])]),
+        "stock": _make_file(tmp_path / "stock.sqlite", [("inventory", "库存", [("qty", "商品库存数量")])]),
+    }
+
+
+@pytest.fixture
+def router(monkeypatch):
+    def make(**config):
+        for name, value in config.items():
+            monkeypatch.setattr(table_router.get_retrieval_config(), name, value)
+        obj = TableRouter()
+        obj.embeddings = KeywordEmbeddings()
+        return obj
+    return make
+
+
+def _candidates(files):
+    return [{"file_id": name, "file_name": f"{name}.xlsx", "sqlite_path": path} for name, path in files.items()]
+
+
+def test_profiles_are_stored_in_file_and_reused(router, files):
+    first = router()
+    entry = first.get_profiles(files["sales"])
+    assert entry["names"] == ["orders", "refunds"]
+    assert len(first.embeddings.documents) == 1
+    # 同一进程内直接使用缓存
+    assert first.get_profiles(files["sales"]) is entry
+    assert len(first.embeddings.documents) == 1
+
+    conn = sqlite3.connect(files["sales"])
+    assert conn.execute(f"SELECT COUNT(*) FROM {PROFILE_TABLE}").fetchone()[0] == 2
+    conn.close()
+
+    # 新进程读取文件中保存的画像，不再向量化
+    second = router()
+    assert second.get_profiles(files["sales"])["vectors"].shape == (2, len(VOCAB) + 1)
+    assert second.embeddings.documents == []
+
+
+def test_changed_table_is_reembedded_alone(router, files):
+    router().build_profiles(files["sales"])
+    conn = sqlite3.connect(files["sales"])
+    conn.execute("UPDATE _table_metadata SET description = '退款与销售退货' WHERE table_name = 'refunds'")
+    conn.commit()
+    conn.close()
+
+    fresh = router()
+    fresh.get_profiles(files["sales"])
+    assert len(fresh.embeddings.documents) == 1
+    assert len(fresh.embeddings.documents[0]) == 1 and "退款与销售退货" in fresh.embeddings.documents[0][0]
+
+
+def test_route_selects_most_relevant_files(router, files):
+    obj = router(table_router_top_k=1, table_router_min_score=0.2)
+    selected = obj.route("上个月员工工资总额是多少", _candidates(files))
+    assert [c["file_id"] for c in selected] == ["hr"]
+    assert selected[0]["ranked_tables"] == ["staff"]
+
+    selected = obj.route("各商品销售金额排名", _candidates(files), top_k=2)
+    assert [c["file_id"] for c in selected] == ["sales", "stock"]
+    assert selected[0]["ranked_tables"][0] == "orders"
+    assert selected[0]["route_score"] >= selected[1]["route_score"]
+
+
+def test_route_keeps_best_file_below_threshold(router, files):
+    obj = router(table_router_min_score=0.99)
+    selected = obj.route("销售", _candidates(files))
+    assert [c["file_id"] for c in selected] == ["sales"]
+
+
+def test_route_falls_back_to_order_when_query_embedding_fails(router, files):
+    obj = router(table_router_top_k=2)
+    obj.route("预热", _candidates(files))
+
+    def fail(text):
+        raise RuntimeError("embedding service down")
+    obj.embeddings.embed_query = fail
+    selected = obj.route("销售金额", _candidates(files))
+    assert [c["file_id"] for c in selected] == ["sales", "hr"]
+
+
+def test_missing_files_are_skipped(router, files, tmp_path):
+    candidates = _candidates(files) + [{"file_id": "gone", "sqlite_path": str(tmp_path / "gone.sqlite")}]
+    assert "gone" not in [c["file_id"] for c in router(table_router_top_k=5).route("库存", candidates)]
+
+
+def test_sql_cache_normalizes_questions_and_evicts(router):
+    obj = router(table_sql_cache_size=2)
+    obj.put_cached_sql("fp", "销售 金额  是多少？", {"sql": "SELECT 1"})
+    assert normalize_question(" 销售 金额 是多少 ") == "销售 金额 是多少"
+    assert obj.get_cached_sql("fp", "销售 金额 是多少") == {"sql": "SELECT 1"}
+    assert obj.get_cached_sql("other", "销售 金额 是多少") is None
+
+    obj.put_cached_sql("fp", "q2", {"sql": "SELECT 2"})
+    obj.get_cached_sql("fp", "销售 金额 是多少")
+    obj.put_cached_sql("fp", "q3", {"sql": "SELECT 3"})
+    assert obj.get_cached_sql("fp", "q2") is None
+    assert obj.get_cached_sql("fp", "销售金额是多少") is None
+    assert obj.get_cached_sql("fp", "销售 金额 是多少") is not None
+
+    disabled = router(table_sql_cache_size=0)
+    disabled.put_cached_sql("fp", "q", {"sql": "SELECT 1"})
+    assert disabled.get_cached_sql("fp", "q") is None
+
+
+def test_llm_calls_bounded_by_semaphore(router):
+    obj = router(table_llm_concurrency=2)
+    lock = threading.Lock()
+    active, peak = [0], [0]
+
+    class SlowLLM:
+        def invoke(self, prompt):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            return prompt
+
+    threads = [threading.Thread(target=obj.invoke_llm, args=(SlowLLM(), str(i))) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2